@@ -0,0 +1,113 @@
+"""Сравнение отбора по дате: функции над столбцом против полуинтервала [start, end).
+
+Создаёт временную SQLite-базу со схемой проекта, заполняет её строками
+за несколько лет и для каждого запроса печатает план (EXPLAIN QUERY PLAN)
+и среднее время выполнения.
+
+    python -m benchmarks.bench_date_ranges [--rows 200000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, select, func, extract, insert
+
+from bot.models import Base, Arrival, Expense, Packaging, Shipment
+from bot.services.periods import month_period
+
+
+def _fill(conn, rows: int):
+    start = datetime(2021, 1, 1)
+    span = int((datetime(2025, 12, 31) - start).total_seconds())
+    dates = [start + timedelta(seconds=random.randrange(span)) for _ in range(rows)]
+
+    conn.execute(insert(Arrival), [
+        {"raw_product_id": 1, "amount": 100, "user_id": 1, "date": d} for d in dates
+    ])
+    conn.execute(insert(Packaging), [
+        {"product_id": 1, "raw_product_id": 1, "amount": 10, "used_raw_material": 30,
+         "user_id": 1, "date": d, "total_material_cost": 5.0} for d in dates
+    ])
+    conn.execute(insert(Expense), [
+        {"amount": 100, "purpose": "bench", "source": "касса", "user_id": 1, "date": d} for d in dates
+    ])
+    conn.execute(insert(Shipment), [{"user_id": 1, "timestamp": d} for d in dates])
+
+
+def _plan(conn, stmt) -> str:
+    compiled = stmt.compile(dialect=conn.dialect)
+    params = compiled.construct_params()
+    positional = tuple(params[name] for name in compiled.positiontup)
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), positional).all()
+    return "; ".join(row[-1] for row in rows)
+
+
+def _timing(conn, stmt, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(stmt).all()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def _cases():
+    period = month_period(2024, 3)
+    return [
+        (
+            "Фасовка за месяц (get_packaging_stats)",
+            select(func.sum(Packaging.amount)).where(
+                extract("year", Packaging.date) == 2024, extract("month", Packaging.date) == 3),
+            select(func.sum(Packaging.amount)).where(period.where(Packaging.date)),
+        ),
+        (
+            "Приходы за месяц (get_arrivals_for_month, дашборд)",
+            select(func.count(Arrival.id)).where(extract("month", Arrival.date) == 3),
+            select(func.count(Arrival.id)).where(period.where(Arrival.date)),
+        ),
+        (
+            "Выпуск по месяцу (strftime)",
+            select(func.sum(Packaging.used_raw_material)).where(
+                func.strftime("%Y-%m", Packaging.date) == "2024-03"),
+            select(func.sum(Packaging.used_raw_material)).where(period.where(Packaging.date)),
+        ),
+        (
+            "Расходы за месяц",
+            select(func.sum(Expense.amount)).where(
+                extract("year", Expense.date) == 2024, extract("month", Expense.date) == 3),
+            select(func.sum(Expense.amount)).where(period.where(Expense.date)),
+        ),
+        (
+            "Отгрузки за месяц",
+            select(func.count(Shipment.id)).where(extract("month", Shipment.timestamp) == 3),
+            select(func.count(Shipment.id)).where(period.where(Shipment.timestamp)),
+        ),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000, help="строк в каждой таблице")
+    parser.add_argument("--repeat", type=int, default=20, help="повторов каждого запроса")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            _fill(conn, args.rows)
+            conn.exec_driver_sql("ANALYZE")
+
+        with engine.connect() as conn:
+            for title, old, new in _cases():
+                old_ms = _timing(conn, old, args.repeat)
+                new_ms = _timing(conn, new, args.repeat)
+                print(f"\n{title}")
+                print(f"  было:  {old_ms:8.2f} мс  {_plan(conn, old)}")
+                print(f"  стало: {new_ms:8.2f} мс  {_plan(conn, new)}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
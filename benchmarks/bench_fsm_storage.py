@@ -0,0 +1,95 @@
+"""Задержка работы с состоянием FSM на одно обновление бота.
+
+Каждое обновление повторяет то, что делают aiogram и обработчики диалога
+отгрузки: блокировка ключа, чтение состояния (FSM middleware), чтение
+данных, update_data и set_state. Сравниваются MemoryStorage (прежнее
+поведение, без сохранения), DatabaseStorage без объединения записей
+(SimpleEventIsolation: запрос на каждое обращение) и DatabaseStorage
+с CoalescingEventIsolation (одно чтение и одна запись на обновление).
+База — временный файл SQLite с настройками из конфигурации.
+
+    python -m benchmarks.bench_fsm_storage [--users 50] [--updates 20]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.fsm.shipment import ShipmentStates
+from bot.fsm.storage import DatabaseStorage
+from bot.models import Base
+from bot.models.database import create_engine_from_config
+
+
+async def _update(storage, isolation, key: StorageKey, step: int):
+    async with isolation.lock(key):
+        await storage.get_state(key)
+        data = await storage.get_data(key)
+        items = data.get("items", [])
+        items.append([step % 7 + 1, step])
+        await storage.update_data(key, {"items": items, "selected_product_id": step % 7 + 1})
+        await storage.set_state(key, ShipmentStates.adding_more)
+
+
+async def _user(storage, isolation, user_id: int, updates: int, timings: list):
+    key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+    for step in range(updates):
+        started = time.perf_counter()
+        await _update(storage, isolation, key, step)
+        timings.append((time.perf_counter() - started) * 1000)
+    await storage.set_state(key, None)
+    await storage.set_data(key, {})
+
+
+async def _run(name: str, storage, isolation, users: int, updates: int):
+    timings = []
+    started = time.perf_counter()
+    await asyncio.gather(*(_user(storage, isolation, user_id, updates, timings) for user_id in range(1, users + 1)))
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    stats = getattr(storage, "stats", None)
+    per_update = (f"{stats['reads'] / len(timings):>6.2f} {stats['writes'] / len(timings):>6.2f}"
+                  if stats else f"{'-':>6} {'-':>6}")
+    print(f"{name:<24} {statistics.mean(timings):>8.2f} {timings[len(timings) // 2]:>8.2f} "
+          f"{timings[int(len(timings) * 0.95)]:>8.2f} {len(timings) / elapsed:>10.0f} {per_update}")
+
+
+async def main_async(users: int, updates: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine_from_config(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}", echo=False)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+        read_factory = async_sessionmaker(
+            engine.execution_options(isolation_level="AUTOCOMMIT"), expire_on_commit=False, class_=AsyncSession
+        )
+
+        print(f"Пользователей: {users}, обновлений на пользователя: {updates}")
+        print(f"{'хранилище':<24} {'сред, мс':>8} {'p50, мс':>8} {'p95, мс':>8} {'обновл/с':>10} "
+              f"{'чтений':>6} {'записей':>6}")
+        await _run("memory", MemoryStorage(), SimpleEventIsolation(), users, updates)
+
+        storage = DatabaseStorage(factory, read_factory)
+        await _run("db, без объединения", storage, SimpleEventIsolation(), users, updates)
+
+        storage = DatabaseStorage(factory, read_factory)
+        await _run("db, с объединением", storage, storage.isolation(), users, updates)
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50, help="одновременных диалогов")
+    parser.add_argument("--updates", type=int, default=20, help="обновлений в каждом диалоге")
+    args = parser.parse_args()
+    asyncio.run(main_async(args.users, args.updates))
+
+
+if __name__ == "__main__":
+    main()
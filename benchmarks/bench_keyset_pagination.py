@@ -0,0 +1,91 @@
+"""Сравнение постраничного вывода: OFFSET + COUNT(*) против keyset (web.pagination).
+
+Создаёт временную SQLite-базу со схемой проекта, заполняет таблицу приходов
+и для нескольких глубин печатает время получения страницы списка так, как
+это делал /arrivals раньше (COUNT(*) и OFFSET), и по курсору (date, id).
+
+    python -m benchmarks.bench_keyset_pagination [--rows 1000000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, select, func, insert, tuple_
+
+from bot.models import Base, Arrival
+
+PAGE_SIZE = 15
+CHUNK = 50_000
+
+
+def _fill(conn, rows: int):
+    start = datetime(2015, 1, 1)
+    span = int((datetime(2025, 12, 31) - start).total_seconds())
+    for offset in range(0, rows, CHUNK):
+        conn.execute(insert(Arrival), [
+            {"raw_product_id": 1, "amount": 100, "user_id": 1,
+             "date": start + timedelta(seconds=random.randrange(span))}
+            for _ in range(min(CHUNK, rows - offset))
+        ])
+
+
+def _ordered():
+    return select(Arrival).order_by(Arrival.date.desc(), Arrival.id.desc())
+
+
+def _offset_page(depth: int):
+    return [
+        select(func.count(Arrival.id)),
+        _ordered().offset(depth).limit(PAGE_SIZE),
+    ]
+
+
+def _keyset_page(cursor):
+    return [
+        _ordered().where(tuple_(Arrival.date, Arrival.id) < tuple_(*cursor)).limit(PAGE_SIZE),
+    ]
+
+
+def _timing(conn, statements, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for stmt in statements:
+            conn.execute(stmt).all()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="строк в таблице приходов")
+    parser.add_argument("--repeat", type=int, default=5, help="повторов каждого запроса")
+    args = parser.parse_args()
+
+    depths = (PAGE_SIZE, 10_000, 100_000, args.rows // 2, args.rows - PAGE_SIZE)
+    depths = sorted({depth for depth in depths if 0 < depth < args.rows})
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            _fill(conn, args.rows)
+            conn.exec_driver_sql("ANALYZE")
+
+        with engine.connect() as conn:
+            print(f"Строк: {args.rows}, страница: {PAGE_SIZE}")
+            print(f"{'глубина':>10} {'OFFSET+COUNT, мс':>18} {'keyset, мс':>12}")
+            for depth in depths:
+                # Курсор — ключ последней строки предыдущей страницы (как в ссылке "Дальше")
+                last = conn.execute(
+                    select(Arrival.date, Arrival.id).order_by(Arrival.date.desc(), Arrival.id.desc())
+                    .offset(depth - 1).limit(1)
+                ).one()
+                offset_ms = _timing(conn, _offset_page(depth), args.repeat)
+                keyset_ms = _timing(conn, _keyset_page(tuple(last)), args.repeat)
+                print(f"{depth:>10} {offset_ms:>18.2f} {keyset_ms:>12.2f}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Задержка списания материала: FIFO против скользящей средней.
+
+Один материал с --lots открытыми партиями (по умолчанию 10 000), каждое
+списание — --take штук в отдельной транзакции, как при фасовке. FIFO
+берёт партии из кэша, но копирует их список при каждом списании (и
+читает все партии из БД, если кэш пуст); скользящая средняя меняет
+только строку material_stock. База — временный файл
+SQLite с настройками из конфигурации.
+
+    python -m benchmarks.bench_material_valuation [--lots 10000] [--ops 500] [--take 3]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.models import Base, Material, MaterialMovement, MaterialStock
+from bot.models.database import create_engine_from_config
+from bot.services.material_lots import clear_open_lots
+from bot.services.material_service import VALUATION_AVERAGE, VALUATION_FIFO, consume_material
+
+LOT_SIZE = 2
+
+
+async def _fill(factory, method: str, lots: int):
+    async with factory() as session:
+        await session.execute(insert(Material), [{"id": 1, "name": "Мешок", "valuation_method": method}])
+        await session.execute(insert(MaterialMovement), [
+            {"material_id": 1, "type": "in", "quantity": LOT_SIZE, "unit": "шт", "unit_price": 1.0 + i % 10 / 10,
+             "remaining_quantity": LOT_SIZE}
+            for i in range(lots)
+        ])
+        await session.execute(insert(MaterialStock), [
+            {"material_id": 1, "quantity": lots * LOT_SIZE, "value": sum(LOT_SIZE * (1.0 + i % 10 / 10) for i in range(lots))}
+        ])
+        await session.commit()
+
+
+async def _measure(name: str, factory, ops: int, take: float):
+    timings = []
+    for packaging_id in range(1, ops + 1):
+        async with factory() as session:
+            started = time.perf_counter()
+            await consume_material(session, 1, take, packaging_id)
+            await session.commit()
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(f"{name:<22} {statistics.mean(timings):>8.2f} {timings[len(timings) // 2]:>8.2f} "
+          f"{timings[int(len(timings) * 0.95)]:>8.2f}")
+
+
+async def main_async(lots: int, ops: int, take: float):
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Партий: {lots}, списаний: {ops} по {take:g} шт")
+        print(f"{'способ':<22} {'сред, мс':>8} {'p50, мс':>8} {'p95, мс':>8}")
+        for method in (VALUATION_FIFO, VALUATION_AVERAGE):
+            clear_open_lots()
+            engine = create_engine_from_config(f"sqlite+aiosqlite:///{os.path.join(tmp, method + '.db')}", echo=False)
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            await _fill(factory, method, lots)
+            await _measure(method, factory, ops, take)
+            await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lots", type=int, default=10000, help="открытых партий материала")
+    parser.add_argument("--ops", type=int, default=500, help="списаний")
+    parser.add_argument("--take", type=float, default=3, help="штук за одно списание")
+    args = parser.parse_args()
+    asyncio.run(main_async(args.lots, args.ops, args.take))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Задержка записи одной фасовки: несколько коммитов против record_packaging.
+
+"До" повторяет прежний порядок веб-формы добавления фасовки: коммит
+фасовки вместе с остатками, затем списание наклеек и материала по FIFO
+и отдельный коммит стоимости (в самой старой версии коммитов было ещё
+больше). "После" — record_packaging: проверка остатков одним запросом и
+одна транзакция. База — временный файл SQLite; --synchronous FULL
+показывает цену fsync на каждый коммит.
+
+    python -m benchmarks.bench_packaging_write [--packagings 500] [--synchronous NORMAL]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.models import (
+    Base, Material, MaterialMovement, MaterialStock, Packaging, Product, ProductStorage, RawMaterialStorage,
+    RawProduct, User,
+)
+from bot.models.database import create_engine_from_config, sqlite_pragmas_from_config
+from bot.services.material_service import consume_material
+from bot.services.packaging_service import record_packaging
+from bot.services.storage import change_product_stock, change_raw_stock
+
+AMOUNT = 10
+BAGS_PER_PACKAGING = 10
+
+
+async def _fill(factory, packagings: int):
+    supply = packagings * AMOUNT * 2
+    async with factory() as session:
+        await session.execute(insert(User), [{"id": 1, "telegram_id": 1, "full_name": "Оператор", "role": "operator"}])
+        await session.execute(insert(RawProduct), [{"id": 1, "name": "Пеллеты 6мм"}])
+        await session.execute(insert(RawMaterialStorage), [{"raw_product_id": 1, "amount": supply * 15}])
+        await session.execute(insert(Product), [{"id": 1, "name": "Мешок 15 кг", "weight": 15, "raw_product_id": 1}])
+        await session.execute(insert(ProductStorage), [{"product_id": 1, "amount": 0}])
+        await session.execute(insert(Material), [{"id": 1, "name": "Наклейка"}, {"id": 2, "name": "Мешок"}])
+        # Много мелких партий — списание затрагивает несколько партий, как в жизни
+        await session.execute(insert(MaterialMovement), [
+            {"material_id": material_id, "type": "in", "quantity": 25, "unit": "шт", "unit_price": 1.0,
+             "remaining_quantity": 25}
+            for material_id in (1, 2) for _ in range(supply // 25 + 1)
+        ])
+        await session.execute(insert(MaterialStock), [
+            {"material_id": 1, "quantity": (supply // 25 + 1) * 25}, {"material_id": 2, "quantity": (supply // 25 + 1) * 25},
+        ])
+        await session.commit()
+
+
+async def _legacy(session):
+    packaging = Packaging(product_id=1, raw_product_id=1, amount=AMOUNT, used_raw_material=AMOUNT * 15, user_id=1)
+    session.add(packaging)
+    await session.flush()
+    await change_raw_stock(session, 1, -AMOUNT * 15)
+    await change_product_stock(session, 1, AMOUNT)
+    await session.commit()
+    cost = await consume_material(session, 1, AMOUNT, packaging.id)
+    cost += await consume_material(session, 2, BAGS_PER_PACKAGING, packaging.id)
+    packaging.total_material_cost = cost
+    await session.commit()
+
+
+async def _unit_of_work(session):
+    await record_packaging(session, 1, 1, AMOUNT, {2: BAGS_PER_PACKAGING})
+
+
+async def _measure(name: str, factory, write, packagings: int):
+    timings = []
+    for _ in range(packagings):
+        async with factory() as session:
+            started = time.perf_counter()
+            await write(session)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(f"{name:<22} {statistics.mean(timings):>8.2f} {timings[len(timings) // 2]:>8.2f} "
+          f"{timings[int(len(timings) * 0.95)]:>8.2f}")
+
+
+async def main_async(packagings: int, synchronous: str):
+    with tempfile.TemporaryDirectory() as tmp:
+        pragmas = {**sqlite_pragmas_from_config(), "synchronous": synchronous}
+        print(f"Фасовок: {packagings}, PRAGMA synchronous={synchronous}")
+        print(f"{'вариант':<22} {'сред, мс':>8} {'p50, мс':>8} {'p95, мс':>8}")
+        for name, write in (("несколько коммитов", _legacy), ("record_packaging", _unit_of_work)):
+            engine = create_engine_from_config(
+                f"sqlite+aiosqlite:///{os.path.join(tmp, name.replace(' ', '_') + '.db')}",
+                echo=False, pragmas=pragmas,
+            )
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            await _fill(factory, packagings)
+            await _measure(name, factory, write, packagings)
+            await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--packagings", type=int, default=500, help="фасовок в каждом варианте")
+    parser.add_argument("--synchronous", default="NORMAL", help="PRAGMA synchronous (NORMAL или FULL)")
+    args = parser.parse_args()
+    asyncio.run(main_async(args.packagings, args.synchronous))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Одновременная запись (бот) и чтение (веб) одного файла SQLite.
+
+Запускает два процесса на одной временной базе: писатель добавляет приходы
+через bot.services.arrival.add_arrival, читатель выполняет запросы дашборда.
+Сравниваются настройки SQLite по умолчанию и настройки из конфигурации
+(WAL, synchronous=NORMAL, busy_timeout и т.д.).
+
+    python -m benchmarks.bench_sqlite_concurrency [--seconds 10] [--readers 2]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import select, func, desc
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.models import Base, Arrival, RawProduct, RawMaterialStorage, User, DailyRawRollup
+from bot.models.database import create_engine_from_config, sqlite_pragmas_from_config
+from bot.services.arrival import add_arrival
+from bot.services.periods import month_period
+
+TELEGRAM_ID = 1
+
+
+def _factory(url: str, pragmas: dict):
+    engine = create_engine_from_config(url, echo=False, pragmas=pragmas)
+    return engine, async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+
+async def _prepare(url: str, pragmas: dict):
+    engine, factory = _factory(url, pragmas)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with factory() as session:
+        raw = RawProduct(name="Пеллеты 6мм")
+        session.add_all([User(telegram_id=TELEGRAM_ID, full_name="bench", role="admin"), raw])
+        await session.flush()
+        session.add(RawMaterialStorage(raw_product_id=raw.id, amount=0))
+        await session.commit()
+    await engine.dispose()
+
+
+async def _writer(url: str, pragmas: dict, seconds: float) -> dict:
+    engine, factory = _factory(url, pragmas)
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            async with factory() as session:
+                await add_arrival(session, TELEGRAM_ID, 1, 10)
+            latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            errors += 1
+    await engine.dispose()
+    return {"latencies": latencies, "errors": errors}
+
+
+async def _reader(url: str, pragmas: dict, seconds: float) -> dict:
+    engine, factory = _factory(url, pragmas)
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            async with factory() as session:
+                await session.execute(select(RawMaterialStorage))
+                await session.execute(
+                    select(func.sum(DailyRawRollup.arrivals_count))
+                    .where(month_period().where(DailyRawRollup.day))
+                )
+                await session.execute(select(Arrival).order_by(desc(Arrival.date)).limit(15))
+            latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            errors += 1
+    await engine.dispose()
+    return {"latencies": latencies, "errors": errors}
+
+
+def _run(role: str, url: str, pragmas: dict, seconds: float, queue):
+    worker = _writer if role == "writer" else _reader
+    queue.put((role, asyncio.run(worker(url, pragmas, seconds))))
+
+
+def _report(title: str, results: list, seconds: float):
+    print(f"\n{title}")
+    for role in ("writer", "reader"):
+        latencies = [x for r, res in results if r == role for x in res["latencies"]]
+        errors = sum(res["errors"] for r, res in results if r == role)
+        if not latencies:
+            print(f"  {role}: нет успешных операций, ошибок блокировки: {errors}")
+            continue
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+        print(
+            f"  {role}: {len(latencies) / seconds:8.1f} оп/с, "
+            f"медиана {statistics.median(latencies) * 1000:6.2f} мс, p95 {p95:7.2f} мс, "
+            f"ошибок блокировки: {errors}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=10.0, help="длительность каждого прогона")
+    parser.add_argument("--readers", type=int, default=2, help="число процессов-читателей")
+    args = parser.parse_args()
+
+    variants = [
+        ("SQLite по умолчанию (journal_mode=DELETE, synchronous=FULL)", {}),
+        ("Настройки из конфигурации", sqlite_pragmas_from_config()),
+    ]
+    for title, pragmas in variants:
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+            asyncio.run(_prepare(url, pragmas))
+
+            queue = multiprocessing.Queue()
+            roles = ["writer"] + ["reader"] * args.readers
+            processes = [
+                multiprocessing.Process(target=_run, args=(role, url, pragmas, args.seconds, queue))
+                for role in roles
+            ]
+            for process in processes:
+                process.start()
+            results = [queue.get() for _ in processes]
+            for process in processes:
+                process.join()
+            _report(title, results, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
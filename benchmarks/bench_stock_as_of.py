@@ -0,0 +1,91 @@
+"""Остатки на прошедшую дату: сумма по всему журналу против снимок + сутки журнала.
+
+Журнал заполняется историей за --days дней по --per-day движений в день
+(сырьё и продукция вперемешку). "Без снимков" — тот же запрос stock_on_day
+до fill_snapshots (суммируется весь журнал до даты), "со снимками" — после.
+Печатаются задержки запроса на случайные дни истории.
+
+    python -m benchmarks.bench_stock_as_of [--days 365 730 1460] [--per-day 200]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.models import Base, Product, RawProduct, StockMovement
+from bot.models.database import create_engine_from_config
+from bot.services.stock_ledger import PRODUCT, RAW, fill_snapshots, snapshot_time, stock_on_day
+
+ITEMS = 10
+QUERIES = 50
+
+
+async def _fill(factory, days: int, per_day: int, first_day: date):
+    async with factory() as session:
+        await session.execute(insert(RawProduct), [{"id": i, "name": f"Сырьё {i}"} for i in range(1, ITEMS + 1)])
+        await session.execute(insert(Product), [
+            {"id": i, "name": f"Продукт {i}", "weight": 15, "raw_product_id": i} for i in range(1, ITEMS + 1)
+        ])
+        rng = random.Random(1)
+        for day in range(days):
+            start = snapshot_time(first_day + timedelta(days=day))
+            await session.execute(insert(StockMovement), [
+                {"kind": rng.choice((RAW, PRODUCT)), "item_id": rng.randint(1, ITEMS), "delta": rng.randint(-5, 10),
+                 "balance": 0, "source": "bench", "created_at": start + timedelta(seconds=n * 86400 // per_day)}
+                for n in range(per_day)
+            ])
+        await session.commit()
+
+
+async def _measure(name: str, factory, days: list[date]):
+    timings = []
+    async with factory() as session:
+        for day in days:
+            started = time.perf_counter()
+            await stock_on_day(session, day)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(f"  {name:<14} {statistics.mean(timings):>8.2f} {timings[len(timings) // 2]:>8.2f} "
+          f"{timings[int(len(timings) * 0.95)]:>8.2f}")
+
+
+async def main_async(history: list[int], per_day: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        for days in history:
+            engine = create_engine_from_config(f"sqlite+aiosqlite:///{os.path.join(tmp, f'{days}.db')}", echo=False)
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            first_day = date(2020, 1, 1)
+            await _fill(factory, days, per_day, first_day)
+            rng = random.Random(2)
+            query_days = [first_day + timedelta(days=rng.randrange(days)) for _ in range(QUERIES)]
+
+            print(f"История {days} дней, {days * per_day} движений")
+            print(f"  {'вариант':<14} {'сред, мс':>8} {'p50, мс':>8} {'p95, мс':>8}")
+            await _measure("без снимков", factory, query_days)
+            async with factory() as session:
+                started = time.perf_counter()
+                taken = await fill_snapshots(session, until=first_day + timedelta(days=days))
+                print(f"  снимков: {taken} за {time.perf_counter() - started:.1f} с")
+            await _measure("со снимками", factory, query_days)
+            await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, nargs="+", default=[365, 730, 1460], help="длина истории, дней")
+    parser.add_argument("--per-day", type=int, default=200, help="движений в день")
+    args = parser.parse_args()
+    asyncio.run(main_async(args.days, args.per_day))
+
+
+if __name__ == "__main__":
+    main()
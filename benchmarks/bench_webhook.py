@@ -0,0 +1,121 @@
+"""Нагрузка на webhook синтетическими обновлениями Telegram.
+
+По умолчанию поднимает локальный сервер bot.webhook с диспетчером, чей
+обработчик просто ждёт --handler-ms (без обращений к Telegram), отправляет
+--updates сообщений от --chats пользователей и печатает время ответа
+сервера и сводку UpdateProcessor (ожидание до начала обработки и полное
+время). С --url отправляет обновления уже запущенному боту
+(BOT_MODE=webhook) и печатает его /metrics.
+
+    python -m benchmarks.bench_webhook [--updates 2000] [--chats 100] [--handler-ms 20]
+    python -m benchmarks.bench_webhook --url http://127.0.0.1:8081/telegram/webhook --secret ...
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from aiohttp import ClientSession, web
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def _update(update_id: int, chat_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Тест"},
+            "text": "/start",
+        },
+    }
+
+
+async def _local_server(args):
+    from aiogram import Bot, Dispatcher, Router
+
+    from bot.webhook import UpdateProcessor, create_webhook_app
+
+    router = Router()
+
+    @router.message()
+    async def handler(message):
+        await asyncio.sleep(args.handler_ms / 1000)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    processor = UpdateProcessor(dp, Bot(token="42:BENCH"), max_concurrent=args.max_concurrent,
+                                max_pending=args.updates)
+    runner = web.AppRunner(create_webhook_app(processor, "/hook", args.secret))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    port = runner.addresses[0][1]
+    return runner, processor, f"http://127.0.0.1:{port}/hook"
+
+
+async def _post_all(url: str, args) -> list:
+    headers = {SECRET_HEADER: args.secret} if args.secret else {}
+    queue = asyncio.Queue()
+    for update_id in range(1, args.updates + 1):
+        queue.put_nowait(update_id)
+    timings, statuses = [], {}
+
+    async def sender(session):
+        while not queue.empty():
+            update_id = queue.get_nowait()
+            started = time.perf_counter()
+            async with session.post(url, json=_update(update_id, update_id % args.chats + 1),
+                                    headers=headers) as response:
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+            timings.append((time.perf_counter() - started) * 1000)
+
+    async with ClientSession() as session:
+        await asyncio.gather(*(sender(session) for _ in range(args.connections)))
+    print(f"Ответы сервера: {statuses}")
+    return sorted(timings)
+
+
+async def main_async(args):
+    runner = processor = None
+    url = args.url
+    if not url:
+        runner, processor, url = await _local_server(args)
+
+    started = time.perf_counter()
+    timings = await _post_all(url, args)
+    sent = time.perf_counter() - started
+    print(f"Отправлено {len(timings)} обновлений за {sent:.2f} с "
+          f"({len(timings) / sent:.0f}/с), ответ p50 {timings[len(timings) // 2]:.2f} мс, "
+          f"p95 {timings[int(len(timings) * 0.95)]:.2f} мс")
+
+    if processor is not None:
+        await processor.drain(timeout=60)
+        print(f"Обработано за {time.perf_counter() - started:.2f} с")
+        metrics = processor.metrics.as_dict()
+        await runner.cleanup()
+        await processor.bot.session.close()
+    else:
+        headers = {SECRET_HEADER: args.secret} if args.secret else {}
+        async with ClientSession() as session:
+            async with session.get(f"{url}/metrics", headers=headers) as response:
+                metrics = await response.json()
+    print(json.dumps(metrics, ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", help="адрес webhook запущенного бота (по умолчанию — локальный сервер)")
+    parser.add_argument("--secret", default="bench-secret", help="X-Telegram-Bot-Api-Secret-Token")
+    parser.add_argument("--updates", type=int, default=2000, help="всего обновлений")
+    parser.add_argument("--chats", type=int, default=100, help="разных чатов")
+    parser.add_argument("--connections", type=int, default=40, help="одновременных HTTP-запросов (как у Telegram)")
+    parser.add_argument("--handler-ms", type=float, default=20, help="время обработчика локального сервера")
+    parser.add_argument("--max-concurrent", type=int, default=50, help="WEBHOOK_MAX_CONCURRENT локального сервера")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import os
 from pathlib import Path
 
 from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
 
 load_dotenv()
 
@@ -27,8 +28,69 @@ if db_path and db_path.startswith("sqlite+aiosqlite:///"):
         DATABASE_URL = f"sqlite+aiosqlite:///{absolute_path}"
     else:
         DATABASE_URL = db_path
+elif db_path and db_path.startswith(("postgres://", "postgresql://")):
+    # Для PostgreSQL используем асинхронный драйвер asyncpg
+    DATABASE_URL = "postgresql+asyncpg://" + db_path.split("://", 1)[1]
 else:
     DATABASE_URL = db_path
 
-# Для отладки
-print(f"Database path: {DATABASE_URL}")
\ No newline at end of file
+# Для отладки (без пароля — вывод попадает в логи)
+print(f"Database path: {make_url(DATABASE_URL).render_as_string(hide_password=True) if DATABASE_URL else None}")
+
+
+def _env_bool(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+# Настройки движка БД
+DB_ECHO = _env_bool("DB_ECHO")  # логирование всех SQL-запросов
+DB_AUTO_MIGRATE = _env_bool("DB_AUTO_MIGRATE", "1")  # применять миграции Alembic при запуске
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # отрицательное значение — в КиБ
+SQLITE_FOREIGN_KEYS = _env_bool("SQLITE_FOREIGN_KEYS")
+
+# Пул соединений (PostgreSQL и другие серверные СУБД; для SQLite не используется)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # секунд ожидания свободного соединения
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # пересоздавать соединения старше N секунд
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", "1")  # проверять соединение перед выдачей из пула
+
+# Кеш пользователей и ролей (бот и веб-панель)
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))  # секунд
+# Как часто сверять версию кеша с БД (изменения из другого процесса видны не позже)
+USER_CACHE_VERSION_CHECK_SECONDS = float(os.getenv("USER_CACHE_VERSION_CHECK_SECONDS", "5"))
+
+# Очередь уведомлений администраторам
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "25"))  # сообщений в секунду на весь бот
+NOTIFY_CHAT_RATE = float(os.getenv("NOTIFY_CHAT_RATE", "1"))  # сообщений в секунду в один чат
+NOTIFY_CHAT_BURST = int(os.getenv("NOTIFY_CHAT_BURST", "3"))  # сколько сообщений в чат можно отправить подряд
+NOTIFY_DIGEST_SECONDS = float(os.getenv("NOTIFY_DIGEST_SECONDS", "10"))  # окно сбора изменений в одну сводку
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_RETRY_BASE_SECONDS = float(os.getenv("NOTIFY_RETRY_BASE_SECONDS", "5"))  # задержка повтора удваивается
+NOTIFY_POLL_SECONDS = float(os.getenv("NOTIFY_POLL_SECONDS", "30"))  # проверка очереди (строки из других процессов)
+NOTIFY_RETENTION_DAYS = int(os.getenv("NOTIFY_RETENTION_DAYS", "7"))  # сколько хранить отправленные
+
+# Журнал изменений (audit_log): записи копятся в памяти и пишутся пачками
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))  # записать, как только набралось N записей
+AUDIT_FLUSH_MS = int(os.getenv("AUDIT_FLUSH_MS", "1000"))  # или не реже чем раз в T миллисекунд
+AUDIT_MAX_BUFFER = int(os.getenv("AUDIT_MAX_BUFFER", "100000"))  # при недоступной БД старые записи отбрасываются
+
+# Состояния диалогов бота (FSM)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "db")  # db — таблица fsm_states, memory — только в памяти процесса
+FSM_STATE_TTL_HOURS = int(os.getenv("FSM_STATE_TTL_HOURS", "48"))  # брошенные диалоги старше удаляются
+
+# Получение обновлений: polling (по умолчанию) или webhook (сервер aiohttp)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # внешний адрес, например https://bot.example.com (без пути)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8081"))
+WEBHOOK_MAX_CONCURRENT = int(os.getenv("WEBHOOK_MAX_CONCURRENT", "50"))  # обработчиков одновременно на процесс
+WEBHOOK_CHAT_CONCURRENCY = int(os.getenv("WEBHOOK_CHAT_CONCURRENCY", "1"))  # в одном чате (1 — строго по порядку)
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "1000"))  # сверх — 503, Telegram повторит позже
+WEBHOOK_DRAIN_SECONDS = float(os.getenv("WEBHOOK_DRAIN_SECONDS", "30"))  # ожидание обработчиков при остановке
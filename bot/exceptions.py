@@ -1,3 +1,16 @@
 class InvalidDataError(Exception):
     """Некорректные данные"""
-    pass
\ No newline at end of file
+    pass
+
+class InsufficientStockError(ValueError):
+    """Остатка на складе не хватает для списания"""
+
+    def __init__(self, item: str, requested: int, available: int):
+        self.item = item
+        self.requested = requested
+        self.available = available
+        super().__init__(f"Недостаточно на складе: {item} (нужно {requested}, есть {available})")
+
+
+class InsufficientMaterialError(InsufficientStockError):
+    """Не хватает упаковочного материала (наклеек, мешков и т.п.)"""
@@ -8,3 +8,4 @@ class StatisticsStates(StatesGroup):
     wait_arrivals_period = State()
     waiting_shipments_start_date = State()
     waiting_shipments_end_date = State()
+    wait_stock_date = State()
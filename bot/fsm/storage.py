@@ -0,0 +1,288 @@
+"""Хранилище состояний FSM в БД (таблица fsm_states).
+
+Состояние и данные диалога — одна строка на ключ (бот, чат, пользователь),
+поэтому незавершённые приход, фасовка и отгрузка переживают перезапуск,
+а несколько процессов бота видят одни и те же диалоги.
+
+Запись объединяется в пределах обработки одного события: DatabaseStorage
+работает вместе с CoalescingEventIsolation (Dispatcher(events_isolation=
+storage.isolation())). Пока событие обрабатывается, состояние читается
+из БД один раз, все set_state/set_data/update_data меняют копию в памяти,
+а по окончании обработки строка записывается одной командой — и только
+если состояние или данные действительно изменились (сравниваются
+сериализованные данные, так что учитываются и изменения вложенных
+объектов на месте). События одного ключа в процессе обрабатываются по
+очереди.
+
+Между процессами запись идёт с проверкой версии строки (compare-and-set
+по fsm_states.version). Если за время обработки события диалог изменил
+другой процесс, строка перечитывается и изменения события (новое
+состояние, изменённые и удалённые ключи данных) накладываются на свежие
+данные, поэтому параллельные события одного чата в разных процессах не
+затирают друг друга целиком; при изменении одного ключа остаётся значение
+последнего записавшего.
+
+Данные хранятся компактным JSON; datetime, date и Decimal сохраняются
+с пометкой типа. Данные, которые нельзя сериализовать (например, объекты
+обработчиков админки), остаются в памяти процесса, как в MemoryStorage.
+
+Строки, не менявшиеся дольше FSM_STATE_TTL_HOURS, — брошенные диалоги —
+удаляет delete_expired_states (ежечасно из планировщика).
+"""
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, DefaultKeyBuilder, KeyBuilder, StorageKey
+from sqlalchemy import and_, delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import FSM_STATE_TTL_HOURS
+from bot.models.database import async_read_session, async_session
+from bot.models.fsm_state import FsmState
+
+logger = logging.getLogger(__name__)
+
+_UNSAVED = object()  # снимок записи, которой нет в БД (данные только в памяти)
+SAVE_ATTEMPTS = 5  # попыток записи при параллельных изменениях из других процессов
+
+# Записи, прочитанные и изменённые при обработке текущего события: ключ -> _Entry
+_scope: ContextVar[Optional[dict]] = ContextVar("fsm_scope", default=None)
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"$d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"$dec": str(value)}
+    raise TypeError(f"{type(value).__name__} не сериализуется в JSON")
+
+
+def _decode(obj: dict):
+    if len(obj) == 1:
+        (tag, value), = obj.items()
+        if tag == "$dt":
+            return datetime.fromisoformat(value)
+        if tag == "$d":
+            return date.fromisoformat(value)
+        if tag == "$dec":
+            return Decimal(value)
+    return obj
+
+
+def dumps(data: dict) -> Optional[str]:
+    """Компактный JSON данных диалога (None для пустых). TypeError — данные не сериализуются."""
+    if not data:
+        return None
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_encode)
+
+
+def loads(text: Optional[str]) -> dict:
+    return json.loads(text, object_hook=_decode) if text else {}
+
+
+class _Entry:
+    __slots__ = ("state", "data", "saved", "version")
+
+    def __init__(self, state: Optional[str], data: dict, saved, version: Optional[int] = None):
+        self.state = state
+        self.data = data
+        self.saved = saved  # (state, JSON) в том виде, в каком запись лежит в БД
+        self.version = version  # версия строки в БД (None — строки нет)
+
+
+def _merge(entry: _Entry, fresh: tuple):
+    """Накладывает изменения записи (относительно entry.saved) на свежую строку (state, JSON)."""
+    base_state, base_text = (None, None) if entry.saved is _UNSAVED else entry.saved
+    base = loads(base_text)
+    state = entry.state if entry.state != base_state else fresh[0]
+    data = loads(fresh[1])
+    for name in base.keys() - entry.data.keys():
+        data.pop(name, None)
+    for name, value in entry.data.items():
+        if name not in base or base[name] != value:
+            data[name] = value
+    return state, data
+
+
+class DatabaseStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_states."""
+
+    def __init__(self, session_factory=async_session, read_session_factory=async_read_session,
+                 key_builder: Optional[KeyBuilder] = None):
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._local: dict[str, _Entry] = {}  # записи с несериализуемыми данными
+        self.stats = {"reads": 0, "writes": 0}
+
+    def isolation(self) -> "CoalescingEventIsolation":
+        return CoalescingEventIsolation(self)
+
+    async def _entry(self, key: StorageKey) -> tuple[str, _Entry]:
+        name = self.key_builder.build(key)
+        scope = _scope.get()
+        if scope is not None and name in scope:
+            return name, scope[name]
+        entry = self._local.get(name)
+        if entry is None:
+            async with self.read_session_factory() as session:
+                row = (await session.execute(
+                    select(FsmState.state, FsmState.data, FsmState.version).where(FsmState.key == name)
+                )).one_or_none()
+            self.stats["reads"] += 1
+            state, text, version = row if row else (None, None, None)
+            entry = _Entry(state, loads(text), (state, text), version)
+        if scope is not None:
+            scope[name] = entry
+        return name, entry
+
+    async def _changed(self, name: str, entry: _Entry):
+        if _scope.get() is None:
+            await self.save({name: entry})
+
+    def _current(self, name: str, entry: _Entry):
+        """Снимок (state, JSON) записи или _UNSAVED, если данные не сериализуются."""
+        try:
+            text = dumps(entry.data)
+        except TypeError as e:
+            if name not in self._local:
+                logger.warning(f"FSM data for {name} is kept in memory only: {e}")
+            self._local[name] = entry
+            return _UNSAVED
+        self._local.pop(name, None)
+        return entry.state, text
+
+    @staticmethod
+    def _write(session: AsyncSession, name: str, entry: _Entry, current):
+        """Команда записи снимка current при неизменной версии строки."""
+        matches = and_(FsmState.key == name, FsmState.version == entry.version)
+        if current is _UNSAVED or current == (None, None):
+            if entry.version is None:
+                return None
+            return delete(FsmState).where(matches)
+        state, text = current
+        if entry.version is not None:
+            return update(FsmState).where(matches).values(
+                state=state, data=text, updated_at=datetime.utcnow(), version=entry.version + 1,
+            )
+        dialect_insert = postgresql.insert if session.get_bind().dialect.name == "postgresql" else sqlite.insert
+        return dialect_insert(FsmState).values(
+            key=name, state=state, data=text, updated_at=datetime.utcnow(), version=1,
+        ).on_conflict_do_nothing(index_elements=["key"])
+
+    async def save(self, entries: dict):
+        """Записывает изменившиеся записи одной транзакцией.
+
+        Запись, которую за это время изменил другой процесс, перечитывается,
+        изменения накладываются на свежие данные (_merge) и запись повторяется.
+        """
+        pending = {}
+        for name, entry in entries.items():
+            current = self._current(name, entry)
+            if current != entry.saved:
+                pending[name] = (entry, current)
+        attempts = 0
+        while pending:
+            attempts += 1
+            conflicts = []
+            async with self.session_factory() as session:
+                for name, (entry, current) in pending.items():
+                    statement = self._write(session, name, entry, current)
+                    if statement is not None and (await session.execute(statement)).rowcount == 0:
+                        conflicts.append(name)
+                        continue
+                    entry.saved = current
+                    entry.version = None if statement is None or statement.is_delete else (entry.version or 0) + 1
+                    self.stats["writes"] += statement is not None
+                if conflicts:
+                    rows = (await session.execute(
+                        select(FsmState.key, FsmState.state, FsmState.data, FsmState.version)
+                        .where(FsmState.key.in_(conflicts))
+                    )).all()
+                await session.commit()
+            if not conflicts:
+                return
+            if attempts >= SAVE_ATTEMPTS:
+                logger.warning(f"FSM state for {', '.join(conflicts)} was not saved: concurrent updates")
+                return
+            fresh = {key: ((state, text), version) for key, state, text, version in rows}
+            retry = {}
+            for name in conflicts:
+                entry, _ = pending[name]
+                snapshot, version = fresh.get(name, ((None, None), None))
+                entry.state, entry.data = _merge(entry, snapshot)
+                entry.saved, entry.version = snapshot, version
+                current = self._current(name, entry)
+                if current != entry.saved:
+                    retry[name] = (entry, current)
+            pending = retry
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        name, entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        await self._changed(name, entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, entry = await self._entry(key)
+        return entry.state
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        name, entry = await self._entry(key)
+        entry.data = dict(data)
+        await self._changed(name, entry)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, entry = await self._entry(key)
+        return dict(entry.data)
+
+    async def close(self) -> None:
+        pass
+
+
+class CoalescingEventIsolation(BaseEventIsolation):
+    """События одного ключа — по очереди; изменения состояния за событие — одной записью в конце."""
+
+    def __init__(self, storage: DatabaseStorage):
+        self.storage = storage
+        self._locks: dict[str, list] = {}  # ключ -> [Lock, число ожидающих]
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey):
+        name = self.storage.key_builder.build(key)
+        holder = self._locks.setdefault(name, [asyncio.Lock(), 0])
+        holder[1] += 1
+        try:
+            async with holder[0]:
+                scope = {}
+                token = _scope.set(scope)
+                try:
+                    yield
+                finally:
+                    _scope.reset(token)
+                    await self.storage.save(scope)
+        finally:
+            holder[1] -= 1
+            if not holder[1]:
+                del self._locks[name]
+
+    async def close(self) -> None:
+        self._locks.clear()
+
+
+async def delete_expired_states(session: AsyncSession, ttl_hours: int = FSM_STATE_TTL_HOURS) -> int:
+    """Удаляет состояния диалогов, не менявшиеся дольше ttl_hours. Возвращает число удалённых."""
+    result = await session.execute(
+        delete(FsmState).where(FsmState.updated_at < datetime.utcnow() - timedelta(hours=ttl_hours))
+    )
+    await session.commit()
+    return result.rowcount
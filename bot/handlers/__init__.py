@@ -4,7 +4,7 @@ from aiogram import Dispatcher
 
 
 def register_handlers(dp: Dispatcher):
-    from bot.handlers import start, admin, info, arrival, expense, packaging, statistics, shipment
+    from bot.handlers import start, admin, info, arrival, expense, packaging, statistics, shipment, export
     from bot.handlers.adminka import add_handlers, edit_handlers, cancel_handlers
     dp.include_router(start.router)
     dp.include_router(admin.router)
@@ -14,6 +14,7 @@ def register_handlers(dp: Dispatcher):
     dp.include_router(packaging.router)
     dp.include_router(statistics.router)
     dp.include_router(shipment.router)
+    dp.include_router(export.router)
     dp.include_router(add_handlers.router)
     dp.include_router(edit_handlers.router)
     dp.include_router(cancel_handlers.router)
@@ -16,9 +16,11 @@ from bot.fsm.admin import AddRecordStates
 from bot.keyboards.admin import admin_menu, record_actions_keyboard, table_actions_keyboard, cancel_keyboard, \
     db_management_keyboard, back_to_table_keyboard
 from bot.keyboards.users import get_user_list_keyboard
+from bot.middlewares.db import db_metrics
 from bot.services.auth import get_user_role, update_user_role, get_all_users, is_admin
 from bot.services.db_service import DBService
 from bot.services.role_service import get_all_roles
+from bot.services.user_cache import cache_stats
 from bot.services.wrapers import admin_required
 
 logger = logging.getLogger(__name__)
@@ -50,6 +52,30 @@ async def admin_panel(message: types.Message, session: AsyncSession):
     await message.answer("🔧 Панель администратора", reply_markup=admin_menu())
 
 
+@router.message(Command("cache_stats"))
+@admin_required
+async def show_cache_stats(message: types.Message, session: AsyncSession):
+    """Счётчики кеша пользователей в процессе бота."""
+    stats = cache_stats()
+    await message.answer(
+        "🗄 Кеш пользователей\n"
+        f"Попаданий: {stats['hits']}, промахов: {stats['misses']} ({stats['hit_rate']:.0%})\n"
+        f"Записей: {stats['size']}, сбросов: {stats['invalidations']}, версия: {stats['version']}"
+    )
+
+
+@router.message(Command("db_stats"))
+@admin_required
+async def show_db_stats(message: types.Message, session: AsyncSession):
+    """Сколько обновлений бота действительно обращались к БД."""
+    stats = db_metrics.as_dict()
+    await message.answer(
+        "🗃 Сессии БД\n"
+        f"Обновлений: {stats['updates']}, с запросами к БД: {stats['db_used']} ({stats['db_used_ratio']:.0%})\n"
+        f"Открыто сессий: {stats['sessions_opened']}, только для чтения: {stats['read_sessions_opened']}"
+    )
+
+
 @router.message(F.text == "🔧 Панель администратора")
 @admin_required
 async def admin_panel(message: types.Message, session: AsyncSession):
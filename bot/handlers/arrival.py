@@ -3,6 +3,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from bot.exceptions import InsufficientStockError
 from bot.fsm.arrival import ArrivalState
 from bot.keyboards.arrival import (
     arrival_types_keyboard, confirm_arrival_keyboard, arrival_main_keyboard
@@ -120,7 +121,12 @@ async def view_arrivals_handler(callback: CallbackQuery, session: AsyncSession):
 async def delete_arrival_handler(callback: CallbackQuery, session: AsyncSession):
     print("=== HANDLER DELETE CALLED ===")
     arrival_id = int(callback.data.split(":")[1])
-    await delete_arrival(session, arrival_id)
+    try:
+        await delete_arrival(session, arrival_id)
+    except InsufficientStockError as e:
+        await callback.answer(f"❌ Нельзя удалить: сырьё уже израсходовано (на складе {e.available} кг)",
+                              show_alert=True)
+        return
     await callback.message.answer(f"✅ Приход {arrival_id} успешно удалён!")
     await callback.answer()
 
@@ -162,7 +168,11 @@ async def set_arrival_amount_edit_handler(message: Message, state: FSMContext, s
         return
     data = await state.get_data()
     arrival_id = data['arrival_id']
-    arrival = await update_arrival_amount(session, arrival_id, new_amount)
+    try:
+        arrival = await update_arrival_amount(session, arrival_id, new_amount)
+    except InsufficientStockError as e:
+        await message.answer(f"❌ Сырьё уже израсходовано: уменьшить приход можно не больше чем на {e.available} кг.")
+        return
     if arrival:
         await message.answer(f"✅ Количество прихода ID={arrival_id} изменено на {new_amount} кг.")
     else:
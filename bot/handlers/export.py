@@ -0,0 +1,55 @@
+import os
+import tempfile
+from datetime import datetime
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import FSInputFile, Message
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.services.export import EXPORTS, export_filename, write_export, xlsx_available
+from bot.services.periods import days_period
+from bot.services.wrapers import staff_required
+
+router = Router()
+
+
+def export_help() -> str:
+    kinds = "\n".join(f"• {kind} — {spec.title}" for kind, spec in EXPORTS.items())
+    return (
+        "📤 Выгрузка истории операций:\n"
+        "/export <вид> [ДД.ММ.ГГГГ ДД.ММ.ГГГГ]\n\n"
+        f"Виды:\n{kinds}\n\n"
+        "Без дат выгружается вся история."
+    )
+
+
+@router.message(Command("export"))
+@staff_required
+async def export_history(message: Message, command: CommandObject, session: AsyncSession,
+                         read_session: AsyncSession):
+    """Отправляет выгрузку истории операций файлом (XLSX, если доступен openpyxl, иначе CSV)"""
+    args = (command.args or "").split()
+    if not args or args[0] not in EXPORTS or len(args) not in (1, 3):
+        await message.answer(export_help())
+        return
+
+    kind, period = args[0], None
+    if len(args) == 3:
+        try:
+            start_date = datetime.strptime(args[1], "%d.%m.%Y").date()
+            end_date = datetime.strptime(args[2], "%d.%m.%Y").date()
+        except ValueError:
+            await message.answer("❌ Неверный формат даты. Используйте ДД.ММ.ГГГГ")
+            return
+        period = days_period(start_date, end_date)
+
+    fmt = "xlsx" if xlsx_available() else "csv"
+    # Файл пишется на диск порциями строк и отправляется целиком
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    try:
+        with os.fdopen(fd, "wb") as fileobj:
+            await write_export(read_session, kind, fmt, fileobj, period)
+        await message.answer_document(FSInputFile(path, filename=export_filename(kind, fmt, period)))
+    finally:
+        os.remove(path)
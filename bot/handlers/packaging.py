@@ -3,11 +3,11 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from bot.exceptions import InsufficientStockError, InvalidDataError
 from bot.fsm.packaging import PackagingStates
 from bot.keyboards.packaging import packaging_main_keyboard, raw_materials_keyboard
-from bot.models import Product
-from bot.services.packaging_service import calculate_packaging_ratio, get_raw_materials, \
-    get_products_for_raw_material, save_packaging, update_stock_after_packaging, get_raw_material_availability
+from bot.services.packaging_planner import plan_packaging
+from bot.services.packaging_service import get_raw_materials, get_products_for_raw_material, record_packaging
 from bot.services.user_service import get_user
 from bot.services.wrapers import restrict_anonymous
 
@@ -61,23 +61,21 @@ async def select_raw_material(
 
     # Получаем продукты из этого сырья
     products = await get_products_for_raw_material(session, raw_product_id)
-    if len(products) != 2:
-        await callback.message.answer(
-            "Для данного сырья должно быть ровно 2 вида продукции!"
-        )
+    if not products:
+        await callback.message.answer("Для данного сырья нет продукции!")
         await state.clear()
         return
 
-    product_names = [p.name for p, _ in products]
+    # Порядок — как в планировщике (по id), в нём же вводится пропорция
+    product_names = [p.name for p, _ in sorted(products, key=lambda row: row[0].id)]
 
-    await state.update_data(
-        raw_product_id=raw_product_id,
-        product_names=product_names
-    )
+    await state.update_data(raw_product_id=raw_product_id)
     await state.set_state(PackagingStates.waiting_for_ratio)
+    example = "/".join(["1"] * len(product_names))
     await callback.message.answer(
-        f"Продукция для фасовки: {product_names[0]} и {product_names[1]}\n"
-        f"Введите соотношение фасовки в формате X/Y (например 2/1):"
+        f"Продукция для фасовки: {', '.join(product_names)}\n"
+        f"Введите соотношение пачек через / в этом порядке (например {example}) "
+        f"или «макс» для наибольшего выпуска:"
     )
 
 
@@ -88,38 +86,30 @@ async def process_ratio(
         session: AsyncSession,
         state: FSMContext
 ):
-    """Обработка введенной пропорции и вывод результата"""
+    """Обработка введенной пропорции и вывод плана фасовки"""
     data = await state.get_data()
-    raw_product_id = data["raw_product_id"]
-    product_names = data["product_names"]
+    text = (message.text or "").strip()
+    ratio = None if text.lower() in ("макс", "max") else text
 
-    # Получаем остаток сырья
-    raw_materials = await get_raw_materials(session)
-    raw_amount = next((amt for rp, amt in raw_materials if rp.id == raw_product_id), 0)
+    try:
+        plan = await plan_packaging(session, data["raw_product_id"], ratio=ratio)
+    except ValueError as e:
+        await message.answer(str(e))
+        return
 
-    if raw_amount <= 0:
+    if plan.raw_available <= 0:
         await message.answer("На складе нет данного сырья!")
         await state.clear()
         return
 
-    # Рассчитываем пропорцию
-    result, error = await calculate_packaging_ratio(
-        session,
-        raw_product_id,
-        message.text,
-        raw_amount
-    )
-
-    if error:
-        await message.answer(error)
-        return
-
-    await message.answer(
-        f"Для расфасовки в соответствии с пропорцией {message.text}:\n"
-        f"🔹 {product_names[0]} - {result[product_names[0]]} пачек\n"
-        f"🔹 {product_names[1]} - {result[product_names[1]]} пачек\n\n"
-        f"Будет использовано {result['used_raw']} кг сырья"
-    )
+    header = f"в соответствии с пропорцией {text}" if ratio else "с наибольшим выпуском"
+    lines = [f"🔹 {product.name} - {packs} пачек" for product, packs in zip(plan.products, plan.packs)]
+    lines.append(f"\nБудет использовано {plan.used_raw} из {plan.raw_available} кг сырья")
+    for name, available, required in plan.resources[1:]:
+        lines.append(f"{name}: потребуется {required:g} из {available:g}")
+    if plan.limit:
+        lines.append(f"Ограничивает: {plan.limit}")
+    await message.answer(f"Для расфасовки {header}:\n" + "\n".join(lines))
     await state.clear()
 
 
@@ -205,40 +195,21 @@ async def process_packaging_amount(
             raise ValueError
 
         data = await state.get_data()
-        product = await session.get(Product, data['product_id'])
-        required_raw = amount * product.weight
-
-        # Получаем информацию о доступности сырья
-        current_amount, is_available, max_packs = await get_raw_material_availability(
-            session,
-            data['raw_product_id'],
-            product_weight=product.weight,
-            required_amount=required_raw
-        )
-
-        if not is_available:
-            await message.answer(
-                f"❌ Недостаточно сырья на складе!\n"
-                f"Требуется: {required_raw} кг\n"
-                f"Доступно: {current_amount} кг\n"
-                f"Максимально можно расфасовать: {max_packs} пачек по {product.weight} кг"
-            )
-            return
-
-        user_id = await get_user(session, message.from_user.id)
-        print(user_id)
-        # Дальнейшая обработка фасовки...
-        packaging = await save_packaging(
-            session,
-            user_id.id,
-            product.id,
-            product.raw_product_id,
-            amount,
-            required_raw)
-        await update_stock_after_packaging(session, product.id, product.raw_product_id, amount, required_raw)
+        user = await get_user(session, message.from_user.id)
+        # Фасовка, остатки и наклейки — одной транзакцией (как в веб-панели)
+        await record_packaging(session, user.id, data['product_id'], amount)
 
         await message.answer("Фасовка добавлена")
         await state.clear()
 
+    except InsufficientStockError as e:
+        await message.answer(
+            f"❌ Недостаточно на складе: {e.item}\n"
+            f"Требуется: {e.requested:g}\n"
+            f"Доступно: {e.available:g}"
+        )
+    except InvalidDataError as e:
+        await message.answer(f"❌ {e}")
+        await state.clear()
     except ValueError:
         await message.answer("Введите корректное количество (целое положительное число).")
@@ -3,10 +3,12 @@ from aiogram import types, F
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from bot.exceptions import InsufficientStockError, InvalidDataError
 from bot.fsm.shipment import ShipmentStates
 from bot.keyboards.shipment import shipment_main_keyboard, shipment_product_keyboard, shipment_add_more_keyboard
-from bot.services.shipment import get_available_products, create_shipment, add_product_to_shipment, \
-    get_shipment_products, get_user_shipments, complete_shipment
+from bot.services.shipment import get_available_products, create_shipment_with_items, get_shipment_products, \
+    get_user_shipments
+from bot.services.user_service import get_user
 from bot.services.wrapers import restrict_anonymous
 
 router = Router()
@@ -28,18 +30,14 @@ async def show_shipment_menu(message: types.Message, session: AsyncSession):
 @router.callback_query(F.data == "add_shipment")
 @restrict_anonymous
 async def start_adding_shipment(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession):
-    # Создаем новую отгрузку в БД сразу при старте
-    shipment = await create_shipment(session, callback.from_user.id)
-
-    # Сохраняем ID созданной отгрузки в состояние
-    await state.update_data(shipment_id=shipment.id)
+    # Позиции копятся в состоянии, в БД отгрузка записывается целиком при завершении
+    await state.update_data(items=[])
     await state.set_state(ShipmentStates.waiting_for_product)
 
     # Показываем список товаров
-
     await callback.message.answer(
         "Выберите товар для добавления в отгрузку:",
-        reply_markup=await  shipment_product_keyboard(session)
+        reply_markup=await shipment_product_keyboard(session)
     )
     await callback.answer()
 
@@ -67,28 +65,14 @@ async def process_quantity(message: types.Message, state: FSMContext, session: A
         return
 
     data = await state.get_data()
-    shipment_id = data["shipment_id"]
-    product_id = data["selected_product_id"]
-
-    # Добавляем товар в существующую отгрузку
-    await add_product_to_shipment(session, shipment_id, product_id, quantity)
+    items = data.get("items", []) + [[data["selected_product_id"], quantity]]
+    await state.update_data(items=items)
 
-    # Проверяем, есть ли уже товары в отгрузке (кроме только что добавленного)
-    products = await get_shipment_products(session, shipment_id)
-
-    if len(products) >= 1:  # Если есть хотя бы один товар (текущий)
-        await state.set_state(ShipmentStates.waiting_for_more_products)
-        await message.answer(
-            "Товар добавлен. Хотите добавить еще товар в эту отгрузку?",
-            reply_markup=shipment_add_more_keyboard()
-        )
-    else:
-        # Если это первый товар, спрашиваем про добавление следующего
-        await state.set_state(ShipmentStates.waiting_for_more_products)
-        await message.answer(
-            "Товар добавлен. Добавить еще товар в эту отгрузку?",
-            reply_markup=shipment_add_more_keyboard()
-        )
+    await state.set_state(ShipmentStates.waiting_for_more_products)
+    await message.answer(
+        "Товар добавлен. Хотите добавить еще товар в эту отгрузку?",
+        reply_markup=shipment_add_more_keyboard()
+    )
 
 
 @router.callback_query(F.data == "add_more", ShipmentStates.waiting_for_more_products)
@@ -107,19 +91,33 @@ async def add_more_products(callback: types.CallbackQuery, state: FSMContext, se
 @restrict_anonymous
 async def finish_shipment(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
-    shipment_id = data["shipment_id"]
+    user = await get_user(session, callback.from_user.id)
+
+    try:
+        shipment = await create_shipment_with_items(session, user.id, data.get("items", []))
+    except InsufficientStockError as e:
+        # Остаток мог измениться, пока собиралась отгрузка
+        await state.clear()
+        await callback.message.answer(
+            f"❌ Отгрузка не сохранена: недостаточно товара «{e.item}» "
+            f"(нужно {e.requested}, на складе {e.available})."
+        )
+        await callback.answer()
+        return
+    except InvalidDataError as e:
+        await state.clear()
+        await callback.message.answer(f"❌ Отгрузка не сохранена: {e}")
+        await callback.answer()
+        return
 
     # Получаем все товары в отгрузке для отображения итога
-    products = await get_shipment_products(session, shipment_id)
+    products = await get_shipment_products(session, shipment.id)
 
     # Формируем итоговое сообщение
     total_text = "✅ Отгрузка завершена!\n\nСостав отгрузки:\n"
     for item in products:
         total_text += f"• {item.product.name}: {item.quantity} шт.\n"
 
-    # Завершаем отгрузку (если нужно отметить её как завершенную)
-    await complete_shipment(session, shipment_id)
-
     await state.clear()
     await callback.message.answer(total_text)
     await callback.answer()
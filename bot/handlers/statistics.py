@@ -15,15 +15,16 @@ from bot.services.statistics import (
     get_user_expenses,
     get_all_expenses, get_detailed_expenses, get_shipments_period_stats, get_shipments_month_stats
 )
+from bot.services.stock_ledger import stock_on_day
 from bot.services.user_service import get_user
 from bot.services.wrapers import staff_required
 
 router = Router()
 
 
-def format_stock_info(stock_data: Dict) -> str:
+def format_stock_info(stock_data: Dict, title: str = "📦 Остатки на складе:") -> str:
     """Форматирует информацию о складе в читаемый текст"""
-    text = "📦 Остатки на складе:\n"
+    text = f"{title}\n"
 
     if stock_data.get("raw_materials"):
         text += "\n🧶 Сырье:\n"
@@ -53,22 +54,50 @@ async def show_statistics_menu(message: Message, session: AsyncSession):
 
 @router.callback_query(F.data == "statistics:stock")
 @staff_required
-async def handle_stock_stats(callback: CallbackQuery, session: AsyncSession):
+async def handle_stock_stats(callback: CallbackQuery, session: AsyncSession, read_session: AsyncSession):
     """Обрабатывает запрос статистики остатков"""
     try:
-        stock_data = await get_stock_info(session)
+        stock_data = await get_stock_info(read_session)
         response_text = format_stock_info(stock_data)
         await callback.message.answer(response_text)
     except Exception as e:
         await callback.message.answer(f"⚠️ Ошибка при получении данных: {str(e)}")
 
 
+@router.callback_query(F.data == "statistics:stock_as_of")
+@staff_required
+async def start_stock_as_of(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    """Запрашивает дату для остатков на прошедший день"""
+    await callback.answer()
+    await callback.message.answer("Введите дату в формате ДД.ММ.ГГГГ — покажу остатки на конец этого дня:")
+    await state.set_state(StatisticsStates.wait_stock_date)
+
+
+@router.message(StatisticsStates.wait_stock_date)
+@staff_required
+async def process_stock_as_of(message: Message, state: FSMContext, session: AsyncSession,
+                              read_session: AsyncSession):
+    """Остатки на конец введённого дня (по журналу остатков)"""
+    try:
+        day = datetime.strptime(message.text.strip(), "%d.%m.%Y").date()
+    except ValueError:
+        await message.answer("Неверный формат даты. Попробуйте снова.")
+        return
+    try:
+        stock_data = await stock_on_day(read_session, day)
+        await message.answer(format_stock_info(stock_data, f"📦 Остатки на конец {day.strftime('%d.%m.%Y')}:"))
+    except Exception as e:
+        await message.answer(f"⚠️ Ошибка при получении данных: {str(e)}")
+    finally:
+        await state.clear()
+
+
 @router.callback_query(F.data == "statistics:packed_month")
 @staff_required
-async def handle_packed_month(callback: CallbackQuery, session: AsyncSession):
+async def handle_packed_month(callback: CallbackQuery, session: AsyncSession, read_session: AsyncSession):
     """Обрабатывает запрос статистики фасовки за месяц"""
     try:
-        stats = await get_packaging_stats(session, period="month")
+        stats = await get_packaging_stats(read_session, period="month")
         await callback.message.answer(
             f"📊 Расфасовано за текущий месяц:\n"
             f"• Пачки 3кг: {stats['packs_3kg']} шт.\n"
@@ -172,10 +201,10 @@ async def process_arrivals_period(message: Message, state: FSMContext, session:
 
 @router.callback_query(F.data == "statistics:arrivals_month")
 @staff_required
-async def handle_arrivals_month(callback: CallbackQuery, session: AsyncSession):
+async def handle_arrivals_month(callback: CallbackQuery, session: AsyncSession, read_session: AsyncSession):
     """Обрабатывает запрос статистики приходов за месяц"""
     try:
-        arrivals = await get_arrivals_stats(session, period="month")
+        arrivals = await get_arrivals_stats(read_session, period="month")
 
         if not arrivals:
             await callback.message.answer("📥 Нет данных о приходах за текущий месяц", reply_markup=statistics_keyboard())
@@ -207,10 +236,10 @@ async def handle_user_expenses(callback: CallbackQuery, session: AsyncSession):
 
 @router.callback_query(F.data == "statistics:expenses_all")
 @staff_required
-async def handle_all_expenses(callback: CallbackQuery, session: AsyncSession):
+async def handle_all_expenses(callback: CallbackQuery, session: AsyncSession, read_session: AsyncSession):
     """Обрабатывает запрос всех расходов"""
     try:
-        expenses = await get_all_expenses(session)
+        expenses = await get_all_expenses(read_session)
 
         if not expenses:
             await callback.message.answer("📜 Нет данных о расходах")
@@ -231,10 +260,10 @@ async def handle_all_expenses(callback: CallbackQuery, session: AsyncSession):
 
 @router.callback_query(F.data == "statistics:expenses_detailed")
 @staff_required
-async def handle_detailed_expenses(callback: CallbackQuery, session: AsyncSession):
+async def handle_detailed_expenses(callback: CallbackQuery, session: AsyncSession, read_session: AsyncSession):
     """Обрабатывает запрос детализированного списка расходов"""
     try:
-        expenses = await get_detailed_expenses(session)
+        expenses = await get_detailed_expenses(read_session)
 
         if not expenses:
             await callback.message.answer("📜 Нет данных о расходах")
@@ -265,12 +294,13 @@ async def handle_detailed_expenses(callback: CallbackQuery, session: AsyncSessio
 @staff_required
 async def handle_shipments_month(
         callback: CallbackQuery,
-        session: AsyncSession
+        session: AsyncSession,
+        read_session: AsyncSession
 ):
     """Обработка запроса статистики отгрузок за месяц"""
     await callback.answer()
 
-    shipments = await get_shipments_month_stats(session)
+    shipments = await get_shipments_month_stats(read_session)
 
     if not shipments:
         await callback.message.answer("Нет данных об отгрузках за текущий месяц.")
@@ -1,5 +1,3 @@
-import asyncio
-
 from aiogram import Bot
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -8,30 +6,17 @@ from bot.services.statistics import get_stock_info
 
 
 async def send_daily_stock_report(bot: Bot, session: AsyncSession):
-    """Отправляет отчет об остатках с правильным управлением сессией"""
+    """Ставит отчет об остатках в очередь уведомлений администраторам"""
     try:
-        from bot.services.db_service import get_admin_ids
+        from bot.context import app_context
 
-        # Получаем данные внутри активной сессии
         stock_data = await get_stock_info(session)
-        admin_ids = await get_admin_ids(session)
-
-        if not admin_ids:
-            print("Нет администраторов для отправки отчета")
-            return
-
         report_text = await _format_daily_report(stock_data)
 
-        for admin_id in admin_ids:
-            try:
-                await bot.send_message(
-                    admin_id,
-                    report_text,
-                    parse_mode="HTML"
-                )
-                await asyncio.sleep(0.3)  # Защита от флуда
-            except Exception as e:
-                print(f"Ошибка отправки admin {admin_id}: {str(e)}")
+        # Отправкой с ограничением частоты занимается воркер уведомлений
+        queued = await app_context.notification_service.enqueue(session, report_text, parse_mode="HTML")
+        if not queued:
+            print("Нет администраторов для отправки отчета")
 
     except Exception as e:
         print(f"Ошибка формирования отчета: {str(e)}")
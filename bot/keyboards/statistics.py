@@ -6,6 +6,7 @@ def statistics_keyboard() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
 
     builder.button(text="📦 Остатки", callback_data="statistics:stock")
+    builder.button(text="🗓 Остатки на дату", callback_data="statistics:stock_as_of")
     builder.button(text="🚚 Отгружено (мес)", callback_data="statistics:shipments_month")
     builder.button(text="📆 Отгружено (период)", callback_data="statistics:shipments_period")
     builder.button(text="📊 Фасовка (мес)", callback_data="statistics:packed_month")
@@ -17,5 +18,5 @@ def statistics_keyboard() -> InlineKeyboardMarkup:
     builder.button(text="📋 Детали расходов", callback_data="statistics:expenses_detailed")
     builder.button(text="❌ Закрыть", callback_data="statistics:close")
 
-    builder.adjust(2, 2, 2, 2, 2, 1)
+    builder.adjust(2, 2, 2, 2, 2, 1, 1)
     return builder.as_markup()
\ No newline at end of file
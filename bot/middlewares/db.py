@@ -1,12 +1,96 @@
+"""Сессии БД для обработчиков бота.
+
+Сессия открывается только при первом обращении к ней: обновления, которые
+не работают с БД (закрытие меню, отмена), не создают сессию и не занимают
+соединение. Обработчики, которым нужно только чтение, могут объявить
+параметр read_session — сессию без транзакции (AUTOCOMMIT).
+"""
 from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from bot.models.database import async_session, async_read_session
+
+
+@event.listens_for(Session, "after_begin")
+def _mark_db_used(session, transaction, connection):
+    session.info["db_used"] = True
+
+
+class LazySession:
+    """Заместитель AsyncSession: настоящая сессия создаётся при первом обращении."""
+
+    def __init__(self, session_factory):
+        self._session_factory = session_factory
+        self._session = None
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    @property
+    def used_db(self) -> bool:
+        """Выполнялись ли запросы (бралось ли соединение из пула)."""
+        return self._session is not None and self._session.sync_session.info.get("db_used", False)
+
+    def _get(self):
+        if self._session is None:
+            self._session = self._session_factory()
+        return self._session
 
-from bot.models.database import async_session
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+class DBMetrics:
+    """Сколько обновлений действительно работали с БД."""
+
+    def __init__(self):
+        self.updates = 0
+        self.sessions_opened = 0
+        self.read_sessions_opened = 0
+        self.db_used = 0
+
+    def record(self, session: LazySession, read_session: LazySession):
+        self.updates += 1
+        self.sessions_opened += session.opened
+        self.read_sessions_opened += read_session.opened
+        self.db_used += session.used_db or read_session.used_db
+
+    def as_dict(self) -> dict:
+        return {
+            "updates": self.updates,
+            "sessions_opened": self.sessions_opened,
+            "read_sessions_opened": self.read_sessions_opened,
+            "db_used": self.db_used,
+            "db_used_ratio": round(self.db_used / self.updates, 3) if self.updates else 0.0,
+        }
+
+
+db_metrics = DBMetrics()
 
 
 class DBMiddleware(BaseMiddleware):
+    def __init__(self, session_factory=async_session, read_session_factory=async_read_session,
+                 metrics: DBMetrics = db_metrics):
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory
+        self.metrics = metrics
+
     async def __call__(self, handler, event, data):
-        async with async_session() as session:  # Используем вашу async_session
-            data["session"] = session
-            data['kwargs'] = data.get('kwargs', {})
-            data['kwargs']['session'] = session
+        session = LazySession(self.session_factory)
+        read_session = LazySession(self.read_session_factory)
+        data["session"] = session
+        data["read_session"] = read_session
+        data['kwargs'] = data.get('kwargs', {})
+        data['kwargs']['session'] = session
+        try:
             return await handler(event, data)
+        finally:
+            self.metrics.record(session, read_session)
+            await read_session.close()
+            await session.close()
@@ -11,9 +11,19 @@ from bot.models.storage import ProductStorage, RawMaterialStorage
 from bot.models.user import User
 from bot.models.material import Material
 from bot.models.material_movement import MaterialMovement
+from bot.models.material_stock import MaterialStock
 from bot.models.packaging_material import PackagingMaterial
-from bot.models.cost_calculation import CostCalculation
+from bot.models.cost_calculation import CostAllocation, CostCalculation
+from bot.models.rollups import DailyProductRollup, DailyRawRollup, DailyExpenseRollup
+from bot.models.cache_version import CacheVersion
+from bot.models.notification import NotificationOutbox
+from bot.models.audit_log import AuditLog
+from bot.models.fsm_state import FsmState
+from bot.models.stock_ledger import StockMovement, StockSnapshot
 
-async def create_tables():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+# Обработчики событий сессии, поддерживающие сводные таблицы и версии кеша
+# пользователей, должны быть зарегистрированы в каждом процессе, который
+# пишет в БД (бот и веб)
+import bot.services.rollups  # noqa: E402,F401
+import bot.services.stock_ledger  # noqa: E402,F401
+import bot.services.user_cache  # noqa: E402,F401
@@ -13,7 +13,7 @@ class Arrival(Base):
     type = Column(String, nullable=True)
     raw_product_id = Column(Integer, ForeignKey("raw_products.id"), nullable=False)
     amount = Column(Integer, nullable=False)
-    date = Column(DateTime, default=datetime.utcnow)
+    date = Column(DateTime, default=datetime.utcnow, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
     user = relationship("User", back_populates="arrivals")
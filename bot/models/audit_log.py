@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, JSON, Index
+
+from bot.models.base import Base
+
+
+class AuditLog(Base):
+    """История изменений данных.
+
+    changes — компактный JSON: для create/delete значения столбцов,
+    для update только изменённые столбцы в виде [старое, новое].
+    """
+    __tablename__ = "audit_log"
+    __table_args__ = (
+        Index("ix_audit_log_entity", "entity_type", "entity_id", "timestamp"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    timestamp = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    actor_id = Column(BigInteger, nullable=True)  # Telegram ID автора изменения
+    actor_name = Column(String, nullable=True)
+    action = Column(String, nullable=False)  # create / update / delete
+    entity_type = Column(String, nullable=False)  # имя таблицы
+    entity_id = Column(Integer, nullable=True)
+    changes = Column(JSON, nullable=True)
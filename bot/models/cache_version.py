@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, DateTime
+
+from bot.models.base import Base
+
+
+class CacheVersion(Base):
+    """Версия набора данных, закешированного в процессах бота и веба.
+
+    Увеличивается при каждом изменении данных; процесс, увидевший новую
+    версию, сбрасывает свой кеш.
+    """
+    __tablename__ = "cache_versions"
+
+    name = Column(String, primary_key=True)  # например, "users"
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
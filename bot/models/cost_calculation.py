@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, Float, Date, DateTime
+from sqlalchemy import Boolean, Column, Integer, Float, Date, DateTime, ForeignKey, Index
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from bot.models.base import Base
 
@@ -11,4 +12,40 @@ class CostCalculation(Base):
     total_overhead_cost = Column(Float)
     total_produced_kg = Column(Float)
     cost_per_kg = Column(Float)
-    calculated_at = Column(DateTime, default=func.now())
\ No newline at end of file
+    calculated_at = Column(DateTime, default=func.now())
+    # Закрытый месяц: итоги заморожены и не пересчитываются
+    closed = Column(Boolean, nullable=False, default=False, server_default="0")
+    # Версия данных "costs" (cache_versions), по которой сделан расчёт
+    data_version = Column(Integer)
+
+    allocations = relationship(
+        "CostAllocation", back_populates="calculation", cascade="all, delete-orphan", lazy="selectin",
+        order_by="CostAllocation.product_id",
+    )
+
+    __table_args__ = (
+        Index("ix_cost_calculations_period", "period_start", "period_end"),
+    )
+
+
+class CostAllocation(Base):
+    """Себестоимость продукта в расчёте: материалы фасовки + доля накладных по выпуску (кг)"""
+    __tablename__ = "cost_allocations"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    calculation_id = Column(Integer, ForeignKey("cost_calculations.id", ondelete="CASCADE"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    produced_kg = Column(Float, nullable=False, default=0.0)
+    packed_units = Column(Integer, nullable=False, default=0)
+    material_cost = Column(Float, nullable=False, default=0.0)
+    overhead_cost = Column(Float, nullable=False, default=0.0)
+
+    calculation = relationship("CostCalculation", back_populates="allocations")
+    product = relationship("Product", lazy="joined")
+
+    @property
+    def total_cost(self) -> float:
+        return self.material_cost + self.overhead_cost
+
+    @property
+    def cost_per_unit(self) -> float:
+        return self.total_cost / self.packed_units if self.packed_units else 0.0
@@ -1,14 +1,92 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 
-from bot.config import DATABASE_URL
-from bot.models.base import Base
+from bot.config import (
+    DATABASE_URL,
+    DB_ECHO,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_MMAP_SIZE,
+    SQLITE_CACHE_SIZE,
+    SQLITE_FOREIGN_KEYS,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+)
 
 # DATABASE_URL = "sqlite+aiosqlite:///bot/warehouse_bot.db"  # Или ваша БД
 
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+def sqlite_pragmas_from_config() -> dict:
+    """PRAGMA для каждого нового соединения SQLite (из настроек окружения)."""
+    return {
+        # WAL: чтение (веб) не блокируется записью (бот) и наоборот
+        "journal_mode": SQLITE_JOURNAL_MODE,
+        # В режиме WAL NORMAL безопасен и не делает fsync на каждый коммит
+        "synchronous": SQLITE_SYNCHRONOUS,
+        # Сколько ждать освобождения блокировки вместо ошибки "database is locked"
+        "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+        "mmap_size": SQLITE_MMAP_SIZE,
+        "cache_size": SQLITE_CACHE_SIZE,
+        "foreign_keys": "ON" if SQLITE_FOREIGN_KEYS else "OFF",
+    }
+
+
+def pool_settings_from_config() -> dict:
+    """Параметры пула соединений для серверных СУБД (из настроек окружения)."""
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        # Сервер и балансировщики закрывают простаивающие соединения
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def create_engine_from_config(url: str = DATABASE_URL, *, echo: bool = DB_ECHO,
+                              pragmas: dict = None, **kwargs) -> AsyncEngine:
+    """Создаёт движок БД; для SQLite применяет PRAGMA к каждому соединению,
+    для остальных СУБД настраивает пул соединений.
+
+    pragmas — явный набор PRAGMA (пустой словарь — настройки SQLite по умолчанию).
+    Явно переданные kwargs имеют приоритет над настройками пула из конфигурации.
+    """
+    if make_url(url).get_backend_name() != "sqlite" and "poolclass" not in kwargs:
+        kwargs = {**pool_settings_from_config(), **kwargs}
+    engine = create_async_engine(url, echo=echo, **kwargs)
+    if engine.dialect.name == "sqlite":
+        pragmas = sqlite_pragmas_from_config() if pragmas is None else pragmas
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    return engine
+
+
+engine = create_engine_from_config()
 async_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+# Сессии только для чтения: без транзакции, каждый запрос фиксируется сразу
+# (SQLite не держит блокировку между запросами отчёта)
+async_read_session = async_sessionmaker(
+    engine.execution_options(isolation_level="AUTOCOMMIT"), expire_on_commit=False, class_=AsyncSession
+)
+
 
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)  # Создание таблиц
+    """Проверяет версию схемы БД и при необходимости применяет миграции."""
+    from bot.models.migrations import ensure_schema
+    await ensure_schema(engine)
+
+
+async def close_db():
+    """Закрывает соединения пула (при остановке бота или веб-приложения)."""
+    await engine.dispose()
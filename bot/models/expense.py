@@ -11,10 +11,10 @@ class Expense(Base):
     __tablename__ = "expenses"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    amount = Column(Integer, nullable=False)  # Сумма расхода
+    amount = Column(Float, nullable=False)  # Сумма расхода (дробная: закупки материалов)
     purpose = Column(String, nullable=False)  # Назначение расхода
     source = Column(String, nullable=False)  # Источник: "собственные средства" или "касса"
-    date = Column(DateTime, default=datetime.utcnow)  # Дата расхода
+    date = Column(DateTime, default=datetime.utcnow, index=True)  # Дата расхода
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)  # ID пользователя
     category = Column(
         String)
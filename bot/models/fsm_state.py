@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, Text, DateTime
+
+from bot.models.base import Base
+
+
+class FsmState(Base):
+    """Состояние диалога бота (FSM): переживает перезапуск и общее для всех процессов бота.
+
+    Строки без изменений дольше FSM_STATE_TTL_HOURS (брошенные диалоги) удаляются по расписанию.
+    """
+    __tablename__ = "fsm_states"
+
+    key = Column(String, primary_key=True)  # fsm:<bot_id>:<chat_id>:<user_id>:<destiny>
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=True)  # компактный JSON; NULL — пустые данные
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    version = Column(Integer, nullable=False, default=0, server_default="0")  # растёт при каждой записи
@@ -4,4 +4,6 @@ from bot.models.base import Base
 class Material(Base):
     __tablename__ = "materials"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String, nullable=False, unique=True)
\ No newline at end of file
+    name = Column(String, nullable=False, unique=True)
+    # Оценка списания: 'fifo' — по партиям, 'average' — по скользящей средней
+    valuation_method = Column(String, nullable=False, default="fifo", server_default="fifo")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from bot.models.base import Base
@@ -13,9 +13,21 @@ class MaterialMovement(Base):
     unit_price = Column(Float)  # цена за единицу при приходе
     remaining_quantity = Column(Float)  # остаток для списания (только для приходов)
     date = Column(DateTime, default=func.now())
-    expense_id = Column(Integer, ForeignKey("expenses.id"))
-    packaging_id = Column(Integer, ForeignKey("packaging.id"))
+    expense_id = Column(Integer, ForeignKey("expenses.id"), index=True)
+    packaging_id = Column(Integer, ForeignKey("packaging.id"), index=True)
+    # Для расхода — партия (приход), из которой списано; по ней расход отменяется
+    source_movement_id = Column(Integer, ForeignKey("material_movements.id"))
 
     material = relationship("Material")
     expense = relationship("Expense", foreign_keys=[expense_id])
-    packaging = relationship("Packaging", foreign_keys=[packaging_id])
\ No newline at end of file
+    packaging = relationship("Packaging", foreign_keys=[packaging_id])
+
+    __table_args__ = (
+        # Индекс открытых партий для списания по FIFO
+        Index(
+            "ix_material_movements_fifo",
+            "material_id", "type", "date",
+            sqlite_where=remaining_quantity > 0,
+            postgresql_where=remaining_quantity > 0,
+        ),
+    )
@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from sqlalchemy.orm import relationship
+
+from bot.models.base import Base
+
+
+class MaterialStock(Base):
+    """Текущий остаток материала (поддерживается при каждом движении)"""
+    __tablename__ = "material_stock"
+
+    material_id = Column(Integer, ForeignKey("materials.id", ondelete="CASCADE"), primary_key=True)
+    quantity = Column(Float, nullable=False, default=0.0)
+    value = Column(Float, nullable=False, default=0.0, server_default="0")  # стоимость остатка
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    material = relationship("Material")
@@ -0,0 +1,78 @@
+"""Проверка версии схемы БД при запуске.
+
+Вместо create_all по всем моделям сравнивается одна строка alembic_version
+с последней ревизией в migrations/versions. Если схема отстаёт, миграции
+применяются автоматически (DB_AUTO_MIGRATE) или запуск прерывается.
+"""
+import logging
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from bot.config import DB_AUTO_MIGRATE
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent.parent / "alembic.ini"
+
+# Ключ блокировки PostgreSQL: бот и веб-панель не мигрируют одновременно
+_MIGRATION_LOCK_ID = 7300101
+
+
+def alembic_config() -> Config:
+    return Config(str(ALEMBIC_INI))
+
+
+def head_revision() -> str:
+    """Последняя ревизия миграций (читается из файлов, без обращения к БД)."""
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+
+def _current_revision(sync_conn) -> str | None:
+    return MigrationContext.configure(sync_conn).get_current_revision()
+
+
+async def get_db_revision(engine: AsyncEngine) -> str | None:
+    """Текущая ревизия схемы в БД (None — миграции ещё не применялись)."""
+    async with engine.connect() as conn:
+        return await conn.run_sync(_current_revision)
+
+
+def _upgrade(sync_conn):
+    config = alembic_config()
+    config.attributes["connection"] = sync_conn
+    command.upgrade(config, "head")
+
+
+async def upgrade_db(engine: AsyncEngine):
+    """Применяет все недостающие миграции."""
+    async with engine.connect() as conn:
+        is_postgres = conn.dialect.name == "postgresql"
+        if is_postgres:
+            await conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _MIGRATION_LOCK_ID})
+            await conn.commit()
+        try:
+            await conn.run_sync(_upgrade)
+        finally:
+            if is_postgres:
+                await conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _MIGRATION_LOCK_ID})
+                await conn.commit()
+
+
+async def ensure_schema(engine: AsyncEngine, auto_migrate: bool = DB_AUTO_MIGRATE):
+    """Проверяет, что схема БД соответствует последней миграции."""
+    head = head_revision()
+    current = await get_db_revision(engine)
+    if current == head:
+        return
+    if not auto_migrate:
+        raise RuntimeError(
+            f"Схема БД устарела (ревизия {current}, требуется {head}). Выполните: alembic upgrade head"
+        )
+    logger.info("Обновление схемы БД: %s -> %s", current, head)
+    await upgrade_db(engine)
@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Index
+
+from bot.models.base import Base
+
+
+class NotificationOutbox(Base):
+    """Очередь исходящих уведомлений в Telegram.
+
+    Обработчики только добавляют строки; отправкой занимается фоновый
+    воркер NotificationService. Неотправленные строки переживают перезапуск.
+    """
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        Index("ix_notification_outbox_due", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column(BigInteger, nullable=False)
+    text = Column(Text, nullable=False)
+    parse_mode = Column(String, nullable=True)
+    digest_key = Column(String, nullable=True)  # строки с одним ключом объединяются в сводку
+    status = Column(String, nullable=False, default="pending")  # pending / sending / sent / failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
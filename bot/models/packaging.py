@@ -13,7 +13,7 @@ class Packaging(Base):
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     amount = Column(Integer, nullable=False, server_default="0")
     used_raw_material = Column(Integer, nullable=False)
-    date = Column(DateTime, default=datetime.utcnow)
+    date = Column(DateTime, default=datetime.utcnow, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     raw_product_id = Column(Integer, ForeignKey("raw_products.id"), nullable=False)  # Связь с сырьем
     total_material_cost = Column(Float, default=0.0)
@@ -5,7 +5,7 @@ from bot.models.base import Base
 class PackagingMaterial(Base):
     __tablename__ = "packaging_materials"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    packaging_id = Column(Integer, ForeignKey("packaging.id"), nullable=False)
+    packaging_id = Column(Integer, ForeignKey("packaging.id"), nullable=False, index=True)
     material_id = Column(Integer, ForeignKey("materials.id"), nullable=False)
     quantity = Column(Float, nullable=False)
     unit = Column(String, nullable=False)
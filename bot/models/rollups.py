@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Integer, Float, String, Date, ForeignKey
+
+from bot.models.base import Base
+
+
+class DailyProductRollup(Base):
+    """Дневные итоги по продукции: фасовка и отгрузки"""
+    __tablename__ = "daily_product_rollups"
+
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    packed_units = Column(Integer, nullable=False, default=0)  # расфасовано пачек
+    used_raw_kg = Column(Integer, nullable=False, default=0)  # израсходовано сырья, кг
+    material_cost = Column(Float, nullable=False, default=0.0)  # стоимость материалов фасовки
+    shipped_units = Column(Integer, nullable=False, default=0)  # отгружено пачек
+
+
+class DailyRawRollup(Base):
+    """Дневные итоги по сырью: поступления и расход на фасовку"""
+    __tablename__ = "daily_raw_rollups"
+
+    day = Column(Date, primary_key=True)
+    raw_product_id = Column(Integer, ForeignKey("raw_products.id", ondelete="CASCADE"), primary_key=True)
+    arrived_kg = Column(Integer, nullable=False, default=0)
+    arrivals_count = Column(Integer, nullable=False, default=0)
+    used_kg = Column(Integer, nullable=False, default=0)
+
+
+class DailyExpenseRollup(Base):
+    """Дневные итоги расходов по категориям (пустая строка — без категории)"""
+    __tablename__ = "daily_expense_rollups"
+
+    day = Column(Date, primary_key=True)
+    category = Column(String, primary_key=True)
+    amount = Column(Float, nullable=False, default=0.0)
+    expenses_count = Column(Integer, nullable=False, default=0)
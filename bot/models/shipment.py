@@ -10,7 +10,7 @@ class Shipment(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)  # Кто отгрузил
-    timestamp = Column(DateTime, default=func.now())  # Время отгрузки
+    timestamp = Column(DateTime, default=func.now(), index=True)  # Время отгрузки
 
     user = relationship("User", back_populates="shipments")
     shipment_items = relationship("ShipmentItem", back_populates="shipment")  # Связь через промежуточную таблицу
@@ -21,7 +21,7 @@ class ShipmentItem(Base):
     __tablename__ = "shipment_items"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    shipment_id = Column(Integer, ForeignKey("shipments.id"), nullable=False)
+    shipment_id = Column(Integer, ForeignKey("shipments.id"), nullable=False, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     quantity = Column(Integer, nullable=False)  # Количество единиц данного продукта в отгрузке
 
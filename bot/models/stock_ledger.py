@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, DateTime, Index
+
+from bot.models.base import Base
+
+
+class StockMovement(Base):
+    """Журнал изменений остатков сырья и продукции (строки только добавляются)"""
+    __tablename__ = "stock_movements"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)  # "raw" — сырьё (кг), "product" — продукция (пачки)
+    item_id = Column(Integer, nullable=False)  # raw_products.id или products.id
+    delta = Column(Integer, nullable=False)
+    balance = Column(Integer, nullable=False)  # остаток после изменения
+    source = Column(String, nullable=True)  # arrival, packaging, shipment, import, admin, opening
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        Index("ix_stock_movements_item", "kind", "item_id", "created_at"),
+    )
+
+
+class StockSnapshot(Base):
+    """Остатки на момент taken_at (полночь UTC), посчитанные по журналу"""
+    __tablename__ = "stock_snapshots"
+
+    taken_at = Column(DateTime, primary_key=True)
+    kind = Column(String, primary_key=True)
+    item_id = Column(Integer, primary_key=True)
+    amount = Column(Integer, nullable=False)
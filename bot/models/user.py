@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, BigInteger, String
 from sqlalchemy.orm import relationship
 
 from bot.models.base import Base
@@ -8,7 +8,8 @@ class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True, nullable=False)
+    # Telegram ID больше 2^31; в SQLite INTEGER и так 64-битный, тип схемы не меняется
+    telegram_id = Column(BigInteger().with_variant(Integer, "sqlite"), unique=True, nullable=False)
     full_name = Column(String, nullable=False)
     role = Column(String, default="anonymous")
     username = Column(String, unique=True, nullable=True)
@@ -1,11 +1,13 @@
 from datetime import datetime
 
-from sqlalchemy import select, extract
+from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from bot.exceptions import InsufficientStockError
 from bot.models.arrival import Arrival
 from bot.models.rawProduct import RawProduct
+from bot.services.periods import month_period
 from bot.services.storage import update_stock_arrival
 from bot.services.user_service import get_user
 
@@ -76,11 +78,9 @@ async def get_arrival_by_id(session: AsyncSession, id: int) -> Arrival | None:
 
 async def get_arrivals_for_month(session: AsyncSession, user_id: int):
     """Получение приходов за текущий месяц"""
-    current_month = datetime.utcnow().month
     result = await session.execute(
         select(Arrival).filter(
-            extract('month', Arrival.date) == current_month,  # Используем extract для получения месяца
-
+            month_period().where(Arrival.date),  # диапазон дат текущего месяца (с учётом года)
         )
     )
     return result.scalars().all()
@@ -94,7 +94,12 @@ async def delete_arrival(session: AsyncSession, arrival_id: int):
         print(
             f"DEBUG DELETE: arrival_id={arrival_id}, raw_product_id={arrival.raw_product_id}, delta={-arrival.amount}")
         delta = -arrival.amount
-        await update_stock_arrival(session, arrival.raw_product_id, delta)
+        try:
+            await update_stock_arrival(session, arrival.raw_product_id, delta)
+        except InsufficientStockError:
+            # Сырьё из прихода уже израсходовано на фасовку
+            await session.rollback()
+            raise
         await session.delete(arrival)
         await session.commit()
     return arrival
@@ -111,7 +116,7 @@ async def update_arrival_amount(session: AsyncSession, arrival_id: int, new_amou
         await update_stock_arrival(session, arrival.raw_product_id, delta)
         await session.commit()
         return arrival
-    except SQLAlchemyError:
+    except (SQLAlchemyError, InsufficientStockError):
         await session.rollback()
         raise
 
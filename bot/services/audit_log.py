@@ -0,0 +1,147 @@
+"""Журнал изменений audit_log.
+
+Изменения собираются обработчиками событий сессии (bot.services.change_tracking)
+и после коммита передаются в AuditWriter. Писатель копит записи в памяти
+и вставляет их отдельной сессией пачками — по AUDIT_BATCH_SIZE записей или
+раз в AUDIT_FLUSH_MS, — так что транзакция пользователя журнал не ждёт.
+Записи, не успевшие попасть в БД до аварийного завершения процесса,
+теряются; при штатной остановке буфер дописывается.
+
+Чтение — постранично по ключу (timestamp, id) без OFFSET: стоимость
+страницы не зависит от того, насколько далеко она от начала журнала.
+"""
+import asyncio
+import logging
+from contextlib import suppress
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import AUDIT_BATCH_SIZE, AUDIT_FLUSH_MS, AUDIT_MAX_BUFFER
+from bot.models.audit_log import AuditLog
+from bot.models.database import async_session
+
+logger = logging.getLogger(__name__)
+
+HIDDEN_COLUMNS = {"hashed_password"}  # не попадают в журнал
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def compact_changes(action: str, data: dict) -> dict:
+    """Данные изменения в виде, пригодном для столбца JSON."""
+    if action == "update":
+        return {key: [_jsonable(old), _jsonable(new)]
+                for key, (old, new) in data.items() if key not in HIDDEN_COLUMNS}
+    return {key: _jsonable(value) for key, value in data.items() if key not in HIDDEN_COLUMNS}
+
+
+class AuditWriter:
+    """Фоновая пакетная запись журнала изменений."""
+
+    def __init__(self, session_factory=async_session, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_ms: int = AUDIT_FLUSH_MS, max_buffer: int = AUDIT_MAX_BUFFER):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.max_buffer = max_buffer
+        self._buffer: list[dict] = []
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"written": 0, "batches": 0, "dropped": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def submit(self, records: list[dict]):
+        """Добавляет записи в буфер (не обращается к БД). Без запущенного писателя ничего не делает."""
+        if not self.running or not records:
+            return
+        self._buffer.extend(records)
+        overflow = len(self._buffer) - self.max_buffer
+        if overflow > 0:
+            del self._buffer[:overflow]
+            self.stats["dropped"] += overflow
+            logger.error(f"Audit buffer overflow, dropped {overflow} records")
+        if len(self._buffer) >= self.batch_size:
+            self._full.set()
+
+    async def start(self):
+        if not self.running:
+            self._full = asyncio.Event()  # событие — в цикле, где работает писатель
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает писателя и дописывает буфер."""
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._full.wait(), self.flush_ms / 1000)
+            self._full.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Записывает буфер пачками по batch_size."""
+        while self._buffer:
+            batch = self._buffer[:self.batch_size]
+            try:
+                async with self.session_factory() as session:
+                    await session.execute(insert(AuditLog.__table__), batch)
+                    await session.commit()
+            except Exception as e:
+                # Записи остаются в буфере до следующей попытки
+                logger.error(f"Audit write error: {e}", exc_info=True)
+                return
+            del self._buffer[:len(batch)]
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+
+
+audit_writer = AuditWriter()
+
+
+def encode_cursor(entry: AuditLog) -> str:
+    return f"{entry.timestamp.isoformat()}_{entry.id}"
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    timestamp, entry_id = cursor.rsplit("_", 1)
+    return datetime.fromisoformat(timestamp), int(entry_id)
+
+
+async def get_audit_page(
+    session: AsyncSession,
+    entity_type: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+) -> tuple[list[AuditLog], Optional[str]]:
+    """Страница журнала от новых к старым и курсор следующей страницы (None — последняя)."""
+    query = select(AuditLog)
+    if entity_type:
+        query = query.where(AuditLog.entity_type == entity_type)
+        if entity_id is not None:
+            query = query.where(AuditLog.entity_id == entity_id)
+    if cursor:
+        query = query.where(tuple_(AuditLog.timestamp, AuditLog.id) < tuple_(*decode_cursor(cursor)))
+    query = query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(limit + 1)
+    entries = list((await session.execute(query)).scalars())
+    next_cursor = encode_cursor(entries[limit - 1]) if len(entries) > limit else None
+    return entries[:limit], next_cursor
@@ -3,7 +3,6 @@ from sqlalchemy.future import select
 
 from bot.constants.roles import ANONYMOUS, ADMIN
 from bot.models.user import User
-from bot.services.wrapers import role_cache
 
 
 async def get_user_by_telegram_id(session: AsyncSession, telegram_id: int) -> User | None:
@@ -32,12 +31,7 @@ async def update_user_role(session: AsyncSession, telegram_id: int, new_role: st
         return False
 
     user.role = new_role
-    await session.commit()
-
-    if telegram_id in role_cache:
-        # Вариант 1: Обновляем только роль
-        role_cache[telegram_id].role = new_role
-
+    await session.commit()  # кеш пользователей сбрасывается по версии (bot.services.user_cache)
     return True
 
 async def get_all_users(session: AsyncSession):
@@ -0,0 +1,347 @@
+"""Массовый импорт исторических приходов сырья, расходов и закупок материалов.
+
+Файл (CSV или XLSX) читается построчно дважды. Первый проход только
+проверяет строки: названия сырья и материалов сопоставляются с id по
+словарю, загруженному одним запросом. Если есть ошибки, ничего не
+записывается. Второй проход вставляет строки порциями по IMPORT_CHUNK
+(insert списком — executemany), каждая порция в своей транзакции вместе с
+суммарными приращениями складов, material_stock и сводных таблиц по каждому
+ключу, а не по строке. Остатки партий материалов и ссылки расходов на
+партии пересчитываются по FIFO один раз в конце (rebalance_open_lots).
+"""
+import csv
+import io
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Callable, Iterator, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.models import Arrival, Expense, Material, MaterialMovement, RawProduct
+from bot.services.change_tracking import insert_audited
+from bot.services.expense import EXPENSE_CATEGORIES, EXPENSE_SOURCES
+from bot.services.material_service import apply_stock_delta, rebalance_open_lots
+from bot.services.rollups import RollupDeltas, apply_rollup_deltas
+from bot.services.stock_ledger import SOURCE_IMPORT
+from bot.services.storage import change_raw_stock
+
+IMPORT_CHUNK = 1000  # строк в одной транзакции
+MAX_ERRORS = 50  # после стольких ошибок проверка прекращается
+
+
+class RowError(ValueError):
+    """Ошибка в строке файла импорта."""
+
+
+class _Semicolon(csv.excel):
+    delimiter = ";"
+
+
+class ImportSpec(NamedTuple):
+    title: str
+    columns: dict  # поле -> заголовок столбца
+    optional: tuple  # поля, столбцы которых можно не указывать
+
+
+IMPORTS = {
+    "arrivals": ImportSpec(
+        "Приходы сырья",
+        {"date": "Дата", "raw_product": "Сырьё", "amount": "Количество, кг"},
+        (),
+    ),
+    "expenses": ImportSpec(
+        "Расходы",
+        {"date": "Дата", "amount": "Сумма", "category": "Категория", "purpose": "Назначение", "source": "Источник"},
+        ("category", "source"),
+    ),
+    "purchases": ImportSpec(
+        "Закупки материалов",
+        {"date": "Дата", "material": "Материал", "quantity": "Количество", "unit": "Ед.",
+         "unit_price": "Цена за ед.", "amount": "Сумма"},
+        ("amount",),
+    ),
+}
+
+
+class ImportReport:
+    """Итог импорта: число проверенных и записанных строк и ошибки (номер строки, текст)."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.rows = 0
+        self.inserted = 0
+        self.errors: list[tuple[int, str]] = []
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def get_import(kind: str) -> ImportSpec:
+    if kind not in IMPORTS:
+        raise ValueError(f"Неизвестный импорт: {kind}")
+    return IMPORTS[kind]
+
+
+def file_format(filename: str) -> str:
+    return "xlsx" if filename.lower().endswith(".xlsx") else "csv"
+
+
+def _csv_rows(fileobj) -> Iterator[list]:
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+        except csv.Error:
+            dialect = _Semicolon
+        yield from csv.reader(text, dialect)
+    finally:
+        text.detach()  # файл закрывает вызывающий
+
+
+def _xlsx_rows(fileobj) -> Iterator[list]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+
+def iter_records(fileobj, fmt: str, spec: ImportSpec) -> Iterator[tuple[int, dict]]:
+    """Строки файла в виде (номер строки, {поле: значение}); первая строка — заголовки."""
+    fileobj.seek(0)
+    rows = _xlsx_rows(fileobj) if fmt == "xlsx" else _csv_rows(fileobj)
+    header = next(rows, None)
+    if header is None:
+        raise RowError("Файл пуст")
+    positions = {str(title or "").strip().casefold(): index for index, title in enumerate(header)}
+    columns = {}
+    for field, title in spec.columns.items():
+        index = positions.get(title.casefold())
+        if index is None and field not in spec.optional:
+            raise RowError(f"Нет столбца «{title}»")
+        columns[field] = index
+
+    for line, row in enumerate(rows, start=2):
+        if not any(value not in (None, "") for value in row):
+            continue
+        yield line, {
+            field: row[index] if index is not None and index < len(row) else None
+            for field, index in columns.items()
+        }
+
+
+def _text(value, title: str, required: bool = True) -> Optional[str]:
+    value = str(value).strip() if value is not None else ""
+    if not value:
+        if required:
+            raise RowError(f"Не заполнено поле «{title}»")
+        return None
+    return value
+
+
+def _number(value, title: str, required: bool = True) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = _text(value, title, required)
+    if text is None:
+        return None
+    try:
+        return float(text.replace("\xa0", "").replace(" ", "").replace(",", "."))
+    except ValueError:
+        raise RowError(f"«{title}»: не число ({text})")
+
+
+def _positive(value, title: str, required: bool = True) -> Optional[float]:
+    number = _number(value, title, required)
+    if number is not None and number <= 0:
+        raise RowError(f"«{title}»: должно быть больше нуля")
+    return number
+
+
+def _date(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    text = _text(value, "Дата")
+    for fmt in ("%d.%m.%Y %H:%M", "%d.%m.%Y", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise RowError(f"«Дата»: неверный формат ({text}), нужен ДД.ММ.ГГГГ")
+
+
+class _Lookup:
+    """Названия -> id, загруженные одним запросом на таблицу."""
+
+    def __init__(self, ids: dict, title: str):
+        self.ids = ids
+        self.title = title
+
+    @classmethod
+    async def load(cls, session: AsyncSession, model, title: str) -> "_Lookup":
+        result = await session.execute(select(model.id, model.name))
+        return cls({name.strip().casefold(): model_id for model_id, name in result.all()}, title)
+
+    def __call__(self, value) -> int:
+        name = _text(value, self.title)
+        try:
+            return self.ids[name.casefold()]
+        except KeyError:
+            raise RowError(f"«{self.title}»: «{name}» не найдено в справочнике")
+
+
+# Категорию можно указать ключом или названием
+_CATEGORY_KEYS = {
+    **{key: key for key, _ in EXPENSE_CATEGORIES},
+    **{label.casefold(): key for key, label in EXPENSE_CATEGORIES},
+}
+
+
+def _arrival(record: dict, lookup: _Lookup, user_id: int) -> dict:
+    amount = _positive(record["amount"], "Количество, кг")
+    if amount != int(amount):
+        raise RowError("«Количество, кг»: нужно целое число")
+    return {"date": _date(record["date"]), "raw_product_id": lookup(record["raw_product"]),
+            "amount": int(amount), "user_id": user_id}
+
+
+def _expense(record: dict, lookup, user_id: int) -> dict:
+    category = _text(record["category"], "Категория", required=False)
+    if category is not None:
+        if category.casefold() not in _CATEGORY_KEYS:
+            raise RowError(f"«Категория»: неизвестная категория «{category}»")
+        category = _CATEGORY_KEYS[category.casefold()]
+    source = _text(record["source"], "Источник", required=False) or EXPENSE_SOURCES[0]
+    if source.casefold() not in EXPENSE_SOURCES:
+        raise RowError(f"«Источник»: должен быть один из: {', '.join(EXPENSE_SOURCES)}")
+    return {"date": _date(record["date"]), "amount": round(_positive(record["amount"], "Сумма"), 2),
+            "category": category, "purpose": _text(record["purpose"], "Назначение"),
+            "source": source.casefold(), "user_id": user_id}
+
+
+def _purchase(record: dict, lookup: _Lookup, user_id: int) -> dict:
+    quantity = round(_positive(record["quantity"], "Количество"), 2)
+    unit_price = _number(record["unit_price"], "Цена за ед.")
+    if unit_price < 0:
+        raise RowError("«Цена за ед.»: не может быть отрицательной")
+    amount = _positive(record["amount"], "Сумма", required=False)
+    return {"date": _date(record["date"]), "material_id": lookup(record["material"]), "quantity": quantity,
+            "unit": _text(record["unit"], "Ед."), "unit_price": round(unit_price, 2),
+            "amount": round(amount, 2) if amount is not None else None, "user_id": user_id}
+
+
+_CONVERTERS: dict[str, Callable] = {"arrivals": _arrival, "expenses": _expense, "purchases": _purchase}
+
+
+async def _load_lookup(session: AsyncSession, kind: str):
+    if kind == "arrivals":
+        return await _Lookup.load(session, RawProduct, "Сырьё")
+    if kind == "purchases":
+        return await _Lookup.load(session, Material, "Материал")
+    return None
+
+
+def _validated(fileobj, fmt: str, kind: str, lookup, user_id: int, report: ImportReport) -> Iterator[dict]:
+    """Проверенные строки; ошибки копятся в report (не больше MAX_ERRORS)."""
+    convert = _CONVERTERS[kind]
+    try:
+        for line, record in iter_records(fileobj, fmt, get_import(kind)):
+            report.rows += 1
+            try:
+                yield convert(record, lookup, user_id)
+            except RowError as error:
+                report.errors.append((line, str(error)))
+                if len(report.errors) >= MAX_ERRORS:
+                    return
+    except RowError as error:
+        report.errors.append((1, str(error)))
+
+
+async def _insert_chunk(session: AsyncSession, kind: str, rows: list[dict]):
+    """Вставляет порцию строк и суммарные приращения остатков и сводных таблиц."""
+    deltas = RollupDeltas()
+    if kind == "arrivals":
+        await insert_audited(session, Arrival, rows)
+        raw_totals = defaultdict(int)
+        for row in rows:
+            raw_totals[row["raw_product_id"]] += row["amount"]
+            deltas.arrival(row, 1)
+        for raw_product_id, amount in raw_totals.items():
+            await change_raw_stock(session, raw_product_id, amount, source=SOURCE_IMPORT)
+
+    elif kind == "expenses":
+        await insert_audited(session, Expense, rows)
+        for row in rows:
+            deltas.expense(row, 1)
+
+    else:
+        # Как purchase_material: приходная партия и, если указана сумма, расход в финансах
+        await insert_audited(session, MaterialMovement, [
+            {"material_id": row["material_id"], "type": 'in', "quantity": row["quantity"], "unit": row["unit"],
+             "unit_price": row["unit_price"], "remaining_quantity": row["quantity"], "date": row["date"]}
+            for row in rows
+        ])
+        expenses = [
+            {"amount": row["amount"], "purpose": f"Закупка материала (ID={row['material_id']})",
+             "source": EXPENSE_SOURCES[0], "category": "packaging_material", "material_id": row["material_id"],
+             "quantity": row["quantity"], "unit": row["unit"], "user_id": row["user_id"], "date": row["date"]}
+            for row in rows if row["amount"]
+        ]
+        if expenses:
+            await insert_audited(session, Expense, expenses)
+            for expense in expenses:
+                deltas.expense(expense, 1)
+        material_totals = defaultdict(lambda: [0.0, 0.0])
+        for row in rows:
+            material_totals[row["material_id"]][0] += row["quantity"]
+            material_totals[row["material_id"]][1] += row["quantity"] * (row["unit_price"] or 0)
+        for material_id, (quantity, value) in material_totals.items():
+            await apply_stock_delta(session, material_id, quantity, value)
+
+    await apply_rollup_deltas(session, deltas)
+
+
+async def import_file(session: AsyncSession, kind: str, fileobj, fmt: str, user_id: int,
+                      dry_run: bool = False) -> ImportReport:
+    """Импортирует строки вида kind из двоичного файла fileobj (fmt — "csv" или "xlsx").
+
+    user_id — автор записей (users.id). При ошибках в файле ничего не
+    записывается; dry_run — только проверка.
+    """
+    get_import(kind)
+    report = ImportReport(kind)
+    lookup = await _load_lookup(session, kind)
+    for _ in _validated(fileobj, fmt, kind, lookup, user_id, report):
+        pass
+    if report.errors or dry_run:
+        return report
+
+    chunk, material_ids = [], set()
+    for row in _validated(fileobj, fmt, kind, lookup, user_id, ImportReport(kind)):
+        chunk.append(row)
+        if kind == "purchases":
+            material_ids.add(row["material_id"])
+        if len(chunk) >= IMPORT_CHUNK:
+            await _insert_chunk(session, kind, chunk)
+            await session.commit()
+            report.inserted += len(chunk)
+            chunk = []
+    if chunk:
+        await _insert_chunk(session, kind, chunk)
+        await session.commit()
+        report.inserted += len(chunk)
+
+    if material_ids:
+        await rebalance_open_lots(session, sorted(material_ids))
+        await session.commit()
+    return report
+
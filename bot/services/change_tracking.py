@@ -0,0 +1,200 @@
+"""Отслеживание изменений данных: уведомления администраторам и журнал.
+
+Декоратор track_changes (бот) и get_current_user (веб) кладут в
+session.info автора изменений. После каждого flush обработчик события
+берёт старые и новые значения столбцов из истории атрибутов объектов
+сессии (без дополнительных SELECT):
+- если декоратор указал отслеживаемую модель, одной вставкой ставит в
+  очередь уведомлений запись об изменениях этого flush — в той же
+  транзакции, что и сами изменения: при откате уведомление тоже не уходит;
+- изменения AUDITED_MODELS после коммита передаёт писателю audit_log.
+
+Записи в обход ORM (insert/update/delete списком) в истории атрибутов не
+видны — такие места сами передают изменения в журнал через audit_bulk
+или вставляют строки через insert_audited; записи так же уходят писателю
+после коммита и отбрасываются при откате.
+"""
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import event, insert, inspect
+from sqlalchemy.orm import Session
+
+from bot.context import app_context
+from bot.models import (
+    User, Product, RawProduct, Material, Arrival, Expense, Packaging, PackagingMaterial,
+    Shipment, ShipmentItem, MaterialMovement, CostCalculation,
+)
+from bot.services.audit_log import audit_writer, compact_changes
+from bot.services.notification_service import CHANGES_DIGEST
+
+ACTOR_KEY = "change_actor"
+
+# Исходные данные; складские остатки, сводные таблицы и служебные таблицы
+# пересчитываются из них и в журнал не пишутся
+AUDITED_MODELS = (
+    User, Product, RawProduct, Material, Arrival, Expense, Packaging, PackagingMaterial,
+    Shipment, ShipmentItem, MaterialMovement, CostCalculation,
+)
+
+
+class ChangeActor(NamedTuple):
+    """Кто и с какой сущностью работает в текущем обработчике."""
+    telegram_id: int
+    full_name: str
+    entity_name: str | None = None  # для уведомлений: что отслеживает обработчик
+    model: type | None = None
+
+
+class Change(NamedTuple):
+    action: str  # create / update / delete
+    entity: object
+    entity_id: int | None
+    data: dict  # значения столбцов; для update — {столбец: (старое, новое)}
+
+
+def _column_keys(obj) -> list[str]:
+    return [attr.key for attr in inspect(obj).mapper.column_attrs]
+
+
+def _loaded_values(obj) -> dict:
+    """Загруженные значения столбцов (незагруженные не запрашиваются)."""
+    loaded = inspect(obj).dict
+    return {key: loaded[key] for key in _column_keys(obj) if key in loaded}
+
+
+def _changed_values(obj) -> dict:
+    attrs = inspect(obj).attrs
+    changes = {}
+    for key in _column_keys(obj):
+        history = attrs[key].history
+        if not history.has_changes():
+            continue
+        old = history.deleted[0] if history.deleted else None
+        new = history.added[0] if history.added else None
+        if old != new:
+            changes[key] = (old, new)
+    return changes
+
+
+def collect_changes(session: Session, models: tuple) -> list[Change]:
+    """Изменения объектов models в текущем flush (вызывать из after_flush)."""
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, models):
+            changes.append(Change("create", obj, obj.id, _loaded_values(obj)))
+    for obj in session.dirty:
+        if isinstance(obj, models) and session.is_modified(obj):
+            data = _changed_values(obj)
+            if data:
+                changes.append(Change("update", obj, obj.id, data))
+    for obj in session.deleted:
+        if isinstance(obj, models):
+            changes.append(Change("delete", obj, obj.id, _loaded_values(obj)))
+    return changes
+
+
+def audit_records(actor: ChangeActor | None, changes: list[Change]) -> list[dict]:
+    now = datetime.utcnow()
+    return [
+        {
+            "timestamp": now,
+            "actor_id": actor.telegram_id if actor else None,
+            "actor_name": actor.full_name if actor else None,
+            "action": change.action,
+            "entity_type": change.entity.__tablename__,
+            "entity_id": change.entity_id,
+            "changes": compact_changes(change.action, change.data),
+        }
+        for change in changes
+    ]
+
+
+def format_changes(actor: ChangeActor, changes: list[Change]) -> str:
+    """Текст уведомления об изменениях одного flush"""
+    lines = [
+        f"👤 Пользователь: {actor.full_name} (ID: {actor.telegram_id})",
+        f"🕒 Время: {datetime.now().strftime('%d.%m.%Y %H:%M')}",
+    ]
+    for change in changes:
+        lines.append(f"⚡ Действие: {change.action} {actor.entity_name}"
+                     + (f" #{change.entity_id}" if change.entity_id else ""))
+        if change.action == "update":
+            lines.append("📝 Изменения:")
+            lines.extend(f"  - {field}: {old} → {new}" for field, (old, new) in change.data.items())
+        elif change.action == "create":
+            lines.append("📌 Данные:")
+            lines.extend(f"  - {k}: {v}" for k, v in change.data.items())
+        else:
+            lines.append("🗑 Удалено:")
+            lines.extend(f"  - {k}: {v}" for k, v in change.data.items())
+    return "\n".join(lines)
+
+
+def audit_enabled() -> bool:
+    """Пишется ли журнал (чтобы не собирать данные для него впустую)."""
+    return audit_writer.running
+
+
+def audit_bulk(session, model, action: str, entries) -> None:
+    """Журнал изменений model, записанных в обход ORM.
+
+    entries — [(id, данные)]: значения столбцов, для update —
+    {столбец: (старое, новое)}.
+    """
+    if not audit_writer.running:
+        return
+    changes = [Change(action, model, entity_id, data) for entity_id, data in entries]
+    if changes:
+        session.info.setdefault("audit_records", []).extend(audit_records(session.info.get(ACTOR_KEY), changes))
+
+
+async def insert_audited(session, model, rows: list[dict]):
+    """insert(model) списком; при включённом журнале — с RETURNING id и записями create."""
+    if not rows:
+        return
+    if not audit_writer.running:
+        await session.execute(insert(model), rows)
+        return
+    ids = (await session.execute(insert(model).returning(model.id, sort_by_parameter_order=True), rows)).scalars()
+    audit_bulk(session, model, "create", zip(ids, rows))
+
+
+@event.listens_for(Session, "after_flush")
+def _record_changes(session, flush_context):
+    actor = session.info.get(ACTOR_KEY)
+    notify_model = actor.model if actor else None
+    models = AUDITED_MODELS if audit_writer.running else ()
+    if notify_model is not None and notify_model not in models:
+        models = (*models, notify_model)
+    if not models:
+        return
+    changes = collect_changes(session, models)
+    if not changes:
+        return
+
+    audited = [change for change in changes if isinstance(change.entity, AUDITED_MODELS)]
+    if audit_writer.running and audited:
+        session.info.setdefault("audit_records", []).extend(audit_records(actor, audited))
+
+    tracked = [change for change in changes if notify_model and isinstance(change.entity, notify_model)]
+    if tracked:
+        notifications = app_context.notification_service
+        statement = notifications.outbox_insert(format_changes(actor, tracked), digest_key=CHANGES_DIGEST)
+        session.execute(statement)
+        session.info["changes_queued"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    if session.info.pop("changes_queued", False):
+        app_context.notification_service.wake()
+    records = session.info.pop("audit_records", None)
+    if records:
+        audit_writer.submit(records)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changes(session):
+    session.info.pop("changes_queued", None)
+    session.info.pop("audit_records", None)
@@ -1,44 +1,254 @@
-from datetime import date
-from sqlalchemy import select, func, and_
+"""Себестоимость продукции за период.
+
+Итоги берутся из дневных сводных таблиц: они обновляются в той же
+транзакции, что и фасовки и расходы, поэтому уже включают текущий
+(неполный) день. За один проход по сводкам получаются выпуск и стоимость
+материалов по каждому продукту и сумма расходов; накладные расходы
+распределяются по продуктам пропорционально выпуску (кг).
+
+Закрытый месяц (close_month) заморожен: его итоги и распределение
+хранятся в CostCalculation(closed=True) и берутся оттуда, даже если
+данные месяца потом изменятся. Период расчёта делится на закрытые месяцы,
+целиком входящие в него, и открытые дни; по сводкам считаются только
+открытые.
+
+Повторный расчёт того же периода при неизменных данных (версия "costs"
+в cache_versions) возвращает уже сохранённый CostCalculation, а не
+создаёт новую запись.
+"""
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+
+from sqlalchemy import func, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
-from bot.models.expense import Expense
-from bot.models.packaging import Packaging
-from bot.models.cost_calculation import CostCalculation
 
-async def calculate_full_cost(session: AsyncSession, period_start: date, period_end: date):
-    # Суммируем все накладные расходы (все категории) за период
-    overhead = await session.execute(
-        select(func.coalesce(func.sum(Expense.amount), 0))
-        .where(and_(Expense.date >= period_start, Expense.date <= period_end))
+from bot.exceptions import InvalidDataError
+from bot.models.cache_version import CacheVersion
+from bot.models.cost_calculation import CostAllocation, CostCalculation
+from bot.models.rollups import DailyExpenseRollup, DailyProductRollup
+from bot.services.counters import increment
+from bot.services.periods import Period, days_period, month_period, today
+from bot.services.rollups import COSTS_VERSION
+
+MONTH_NOT_FINISHED = "Месяц ещё не закончился"
+MONTH_ALREADY_CLOSED = "Месяц уже закрыт"
+
+
+class ProductCost(NamedTuple):
+    product_id: int
+    produced_kg: float
+    packed_units: int
+    material_cost: float
+    overhead_cost: float
+
+    @property
+    def total_cost(self) -> float:
+        return self.material_cost + self.overhead_cost
+
+
+class CostTotals(NamedTuple):
+    period: Period
+    material_cost: float
+    overhead: float
+    produced_kg: float
+    products: list[ProductCost]
+    closed: bool  # период целиком состоит из закрытых месяцев
+
+    @property
+    def total_cost(self) -> float:
+        return self.material_cost + self.overhead
+
+    @property
+    def cost_per_kg(self) -> float:
+        return self.total_cost / self.produced_kg if self.produced_kg else 0.0
+
+
+async def cost_data_version(session: AsyncSession) -> int:
+    return await session.scalar(select(CacheVersion.version).where(CacheVersion.name == COSTS_VERSION)) or 0
+
+
+async def _bump_version(session: AsyncSession):
+    await increment(session, CacheVersion, {"name": COSTS_VERSION}, {"version": 1}, updated_at=datetime.utcnow())
+
+
+async def _closed_months(session: AsyncSession, period: Period) -> list[CostCalculation]:
+    result = await session.execute(
+        select(CostCalculation)
+        .where(
+            CostCalculation.closed.is_(True),
+            CostCalculation.period_start >= period.start,
+            CostCalculation.period_end <= period.last_day,
+        )
+        .order_by(CostCalculation.period_start)
+    )
+    return list(result.scalars().all())
+
+
+def _open_parts(period: Period, closed: list[CostCalculation]) -> list[Period]:
+    """Части периода вне закрытых месяцев."""
+    parts, start = [], period.start
+    for calc in closed:
+        if calc.period_start > start:
+            parts.append(Period(start, calc.period_start))
+        start = calc.period_end + timedelta(days=1)
+    if start < period.end:
+        parts.append(Period(start, period.end))
+    return parts
+
+
+def _allocate(products: dict, overhead: float, produced_kg: float) -> list[ProductCost]:
+    """Накладные расходы — по продуктам пропорционально выпуску."""
+    return [
+        ProductCost(product_id, kg, units, round(material, 2),
+                    round(overhead * kg / produced_kg, 2) if produced_kg else 0.0)
+        for product_id, (kg, units, material) in sorted(products.items())
+    ]
+
+
+async def compute_costs(session: AsyncSession, period: Period) -> CostTotals:
+    """Итоги и распределение по продуктам за период (закрытые месяцы — из сохранённых расчётов)."""
+    closed = await _closed_months(session, period)
+    parts = _open_parts(period, closed)
+
+    material = overhead = produced_kg = 0.0
+    products: dict[int, list] = {}
+    allocated: dict[int, list] = {}  # продукт -> [кг, пачки, материалы, накладные]
+    for calc in closed:
+        material += calc.total_material_cost or 0
+        overhead += calc.total_overhead_cost or 0
+        produced_kg += calc.total_produced_kg or 0
+        for row in calc.allocations:
+            item = allocated.setdefault(row.product_id, [0.0, 0, 0.0, 0.0])
+            item[0] += row.produced_kg
+            item[1] += row.packed_units
+            item[2] += row.material_cost
+            item[3] += row.overhead_cost
+
+    open_allocation = []
+    if parts:
+        rows = (await session.execute(
+            select(
+                DailyProductRollup.product_id,
+                func.sum(DailyProductRollup.used_raw_kg),
+                func.sum(DailyProductRollup.packed_units),
+                func.sum(DailyProductRollup.material_cost),
+            )
+            .where(or_(*(part.where(DailyProductRollup.day) for part in parts)))
+            .group_by(DailyProductRollup.product_id)
+        )).all()
+        open_overhead = (await session.scalar(
+            select(func.coalesce(func.sum(DailyExpenseRollup.amount), 0))
+            .where(or_(*(part.where(DailyExpenseRollup.day) for part in parts)))
+        )) or 0.0
+        for product_id, kg, units, cost in rows:
+            if kg or units or cost:
+                products[product_id] = [kg or 0, units or 0, cost or 0.0]
+        open_kg = sum(kg for kg, _, _ in products.values())
+        open_allocation = _allocate(products, open_overhead, open_kg)
+        material += sum(cost for _, _, cost in products.values())
+        overhead += open_overhead
+        produced_kg += open_kg
+
+    for row in open_allocation:
+        item = allocated.setdefault(row.product_id, [0.0, 0, 0.0, 0.0])
+        item[0] += row.produced_kg
+        item[1] += row.packed_units
+        item[2] += row.material_cost
+        item[3] += row.overhead_cost
+
+    return CostTotals(
+        period=period,
+        material_cost=round(material, 2),
+        overhead=round(overhead, 2),
+        produced_kg=produced_kg,
+        products=[
+            ProductCost(product_id, kg, units, round(cost, 2), round(share, 2))
+            for product_id, (kg, units, cost, share) in sorted(allocated.items())
+        ],
+        closed=not parts,
     )
-    total_overhead = overhead.scalar()
 
-    # Общий выпуск в кг (по израсходованному сырью)
-    prod = await session.execute(
-        select(func.coalesce(func.sum(Packaging.used_raw_material), 0))
-        .where(and_(Packaging.date >= period_start, Packaging.date <= period_end))
+
+def _calculation(totals: CostTotals, **fields) -> CostCalculation:
+    return CostCalculation(
+        period_start=totals.period.start,
+        period_end=totals.period.last_day,
+        total_material_cost=totals.material_cost,
+        total_overhead_cost=totals.overhead,
+        total_produced_kg=totals.produced_kg,
+        cost_per_kg=totals.cost_per_kg,
+        allocations=[
+            CostAllocation(product_id=row.product_id, produced_kg=row.produced_kg, packed_units=row.packed_units,
+                           material_cost=row.material_cost, overhead_cost=row.overhead_cost)
+            for row in totals.products
+        ],
+        **fields,
     )
-    total_kg = prod.scalar()
-    if total_kg == 0:
-        return None  # нечего оценивать
 
-    # Прямые материальные затраты из фасовок
-    mat_cost = await session.execute(
-        select(func.coalesce(func.sum(Packaging.total_material_cost), 0))
-        .where(and_(Packaging.date >= period_start, Packaging.date <= period_end))
+
+async def calculate_full_cost(session: AsyncSession, period_start: date, period_end: date):
+    """Расчёт себестоимости за период (обе даты включительно); None — выпуска не было.
+
+    Если такой же период уже считался по тем же данным, возвращает
+    сохранённый расчёт.
+    """
+    period = days_period(period_start, period_end)
+    version = await cost_data_version(session)
+    existing = await session.scalar(
+        select(CostCalculation)
+        .where(
+            CostCalculation.period_start == period.start,
+            CostCalculation.period_end == period.last_day,
+            or_(CostCalculation.closed.is_(True), CostCalculation.data_version == version),
+        )
+        .order_by(CostCalculation.closed.desc(), CostCalculation.id.desc())
+        .limit(1)
     )
-    total_material_cost = mat_cost.scalar()
+    if existing is not None:
+        return existing if existing.total_produced_kg else None
+
+    totals = await compute_costs(session, period)
+    if not totals.produced_kg:
+        return None  # нечего оценивать
+    calc = _calculation(totals, data_version=version)
+    session.add(calc)
+    await session.commit()
+    return calc
+
+
+async def month_costs(session: AsyncSession, year: int, month: int) -> CostTotals:
+    """Итоги месяца: закрытого — из сохранённого расчёта, открытого — по сводкам."""
+    return await compute_costs(session, month_period(year, month))
 
-    cost_per_kg = (total_material_cost + total_overhead) / total_kg
 
-    calc = CostCalculation(
-        period_start=period_start,
-        period_end=period_end,
-        total_material_cost=total_material_cost,
-        total_overhead_cost=total_overhead,
-        total_produced_kg=total_kg,
-        cost_per_kg=cost_per_kg
+async def get_closed_months(session: AsyncSession) -> list[CostCalculation]:
+    result = await session.execute(
+        select(CostCalculation).where(CostCalculation.closed.is_(True)).order_by(CostCalculation.period_start.desc())
     )
+    return list(result.scalars().all())
+
+
+async def close_month(session: AsyncSession, year: int, month: int) -> CostCalculation:
+    """Закрывает завершённый месяц: фиксирует его итоги и распределение по продуктам."""
+    period = month_period(year, month)
+    if period.end > today():
+        raise InvalidDataError(MONTH_NOT_FINISHED)
+    if await _closed_months(session, period):
+        raise InvalidDataError(MONTH_ALREADY_CLOSED)
+    totals = await compute_costs(session, period)
+    calc = _calculation(totals, closed=True, data_version=await cost_data_version(session))
     session.add(calc)
+    await _bump_version(session)  # открытые расчёты, включающие этот месяц, больше не актуальны
+    await session.commit()
+    return calc
+
+
+async def reopen_month(session: AsyncSession, calc_id: int) -> bool:
+    """Открывает закрытый месяц; его итоги снова считаются по текущим данным."""
+    calc = await session.get(CostCalculation, calc_id)
+    if calc is None or not calc.closed:
+        return False
+    await session.delete(calc)
+    await _bump_version(session)
     await session.commit()
-    return calc
\ No newline at end of file
+    return True
@@ -0,0 +1,108 @@
+"""Атомарное приращение счётчиков в агрегатных таблицах."""
+from collections import defaultdict
+
+from sqlalchemy import update, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+
+def _upsert(dialect: str, model, keys: dict, deltas: dict, values: dict):
+    """INSERT ... ON CONFLICT DO UPDATE для SQLite и PostgreSQL, иначе None."""
+    if dialect not in ("sqlite", "postgresql"):
+        return None
+    table = model.__table__
+    dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+    stmt = dialect_insert(table).values(**keys, **deltas, **values)
+    return stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={
+            **{name: table.c[name] + stmt.excluded[name] for name in deltas},
+            **{name: stmt.excluded[name] for name in values},
+        },
+    )
+
+
+def _upsert_many(dialect: str, model, key_names: tuple, delta_names: tuple):
+    """То же, что _upsert, с параметрами строк (для executemany)."""
+    if dialect not in ("sqlite", "postgresql"):
+        return None
+    table = model.__table__
+    dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+    stmt = dialect_insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=list(key_names),
+        set_={name: table.c[name] + stmt.excluded[name] for name in delta_names},
+    )
+
+
+def _groups(rows) -> dict:
+    """Строки (keys, deltas) по наборам столбцов: одна команда на каждый набор."""
+    groups = defaultdict(list)
+    for keys, deltas in rows:
+        groups[(tuple(keys), tuple(deltas))].append({**keys, **deltas})
+    return groups
+
+
+def _update(model, keys: dict, deltas: dict, values: dict):
+    table = model.__table__
+    return (
+        update(table)
+        .where(*(table.c[name] == value for name, value in keys.items()))
+        .values(**{name: table.c[name] + delta for name, delta in deltas.items()}, **values)
+    )
+
+
+async def increment(session: AsyncSession, model, keys: dict, deltas: dict, **values):
+    """Прибавляет deltas к строке model с ключом keys, создавая строку при отсутствии.
+
+    values — дополнительные поля, которые перезаписываются при каждом вызове
+    (например, время обновления).
+    """
+    stmt = _upsert(session.get_bind().dialect.name, model, keys, deltas, values)
+    if stmt is not None:
+        await session.execute(stmt)
+        return
+
+    # Прочие СУБД: сначала пытаемся обновить, затем вставляем
+    result = await session.execute(_update(model, keys, deltas, values))
+    if result.rowcount == 0:
+        await session.execute(insert(model.__table__).values(**keys, **deltas, **values))
+
+
+def increment_sync(session: Session, model, keys: dict, deltas: dict, **values):
+    """То же, что increment, для синхронной сессии (обработчики событий ORM)."""
+    stmt = _upsert(session.get_bind().dialect.name, model, keys, deltas, values)
+    if stmt is not None:
+        session.execute(stmt)
+        return
+
+    result = session.execute(_update(model, keys, deltas, values))
+    if result.rowcount == 0:
+        session.execute(insert(model.__table__).values(**keys, **deltas, **values))
+
+
+async def increment_many(session: AsyncSession, model, rows):
+    """increment для многих строк [(keys, deltas), ...]: executemany вместо команды на строку."""
+    dialect = session.get_bind().dialect.name
+    for (key_names, delta_names), params in _groups(rows).items():
+        stmt = _upsert_many(dialect, model, key_names, delta_names)
+        if stmt is not None:
+            await session.execute(stmt, params)
+            continue
+        for row in params:
+            await increment(session, model, {name: row[name] for name in key_names},
+                            {name: row[name] for name in delta_names})
+
+
+def increment_many_sync(session: Session, model, rows):
+    """То же, что increment_many, для синхронной сессии (обработчики событий ORM)."""
+    dialect = session.get_bind().dialect.name
+    for (key_names, delta_names), params in _groups(rows).items():
+        stmt = _upsert_many(dialect, model, key_names, delta_names)
+        if stmt is not None:
+            session.execute(stmt, params)
+            continue
+        for row in params:
+            increment_sync(session, model, {name: row[name] for name in key_names},
+                           {name: row[name] for name in delta_names})
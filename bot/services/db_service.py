@@ -1,9 +1,9 @@
 # ------------------- Файл services/db_service.py -------------------
 import logging
-from sqlite3 import IntegrityError
 from typing import List
 
 from sqlalchemy import select, desc, inspect, exists
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.constants.roles import ADMIN
@@ -2,6 +2,19 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from bot.models.expense import Expense
 
+# Категории расходов: (ключ в БД, название)
+EXPENSE_CATEGORIES = [
+    ("raw_material_purchase", "Закупка сырья (опилки)"),
+    ("packaging_material", "Упаковочные материалы"),
+    ("fuel", "Топливо"),
+    ("salary", "Зарплата"),
+    ("rent", "Аренда"),
+    ("electricity", "Электричество"),
+    ("repair", "Ремонт/модернизация"),
+    ("other", "Прочее"),
+]
+EXPENSE_SOURCES = ("собственные средства", "касса")
+
 async def add_expense(session: AsyncSession, user_id: int, amount: int, purpose: str, source: str):
     expense = Expense(user_id=user_id, amount=amount, purpose=purpose, source=source)
     session.add(expense)
@@ -0,0 +1,205 @@
+"""Выгрузка истории операций в CSV и XLSX.
+
+Строки читаются курсором на стороне сервера (AsyncSession.stream с
+yield_per) порциями по EXPORT_CHUNK и сразу пишутся в выходной поток, так
+что расход памяти не зависит от длины периода. Для XLSX нужен openpyxl
+(книга пишется в режиме write_only во временный файл); без него доступен
+только CSV.
+"""
+import csv
+import io
+from datetime import date, datetime
+from typing import AsyncIterator, Callable, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from bot.models import (
+    Arrival, Expense, Material, MaterialMovement, Packaging, PackagingMaterial, Product, RawProduct,
+    Shipment, ShipmentItem, User,
+)
+from bot.services.periods import Period
+
+EXPORT_CHUNK = 1000  # строк за одно чтение из курсора
+CSV_DELIMITER = ";"  # так файл сразу открывается в Excel с русскими настройками
+
+
+class ExportSpec(NamedTuple):
+    title: str
+    headers: tuple
+    query: Callable[[Optional[Period]], object]
+
+
+def _in_period(query, column, period: Optional[Period]):
+    if period is not None:
+        query = query.where(period.where(column))
+    return query
+
+
+def _expenses(period):
+    employee = aliased(User)
+    query = (
+        select(
+            Expense.id, Expense.date, Expense.amount, Expense.category, Expense.purpose, Expense.source,
+            Material.name, Expense.quantity, Expense.unit, employee.full_name, Expense.packaging_id,
+            User.full_name,
+        )
+        .join(User, User.id == Expense.user_id)
+        .outerjoin(Material, Material.id == Expense.material_id)
+        .outerjoin(employee, employee.id == Expense.employee_id)
+        .order_by(Expense.date, Expense.id)
+    )
+    return _in_period(query, Expense.date, period)
+
+
+def _arrivals(period):
+    query = (
+        select(Arrival.id, Arrival.date, RawProduct.name, Arrival.amount, User.full_name)
+        .join(RawProduct, RawProduct.id == Arrival.raw_product_id)
+        .join(User, User.id == Arrival.user_id)
+        .order_by(Arrival.date, Arrival.id)
+    )
+    return _in_period(query, Arrival.date, period)
+
+
+def _packaging(period):
+    # Одна строка на каждый материал фасовки (фасовка без материалов — одна строка)
+    query = (
+        select(
+            Packaging.id, Packaging.date, Product.name, RawProduct.name, Packaging.amount,
+            Packaging.used_raw_material, Packaging.total_material_cost, User.full_name,
+            Material.name, PackagingMaterial.quantity, PackagingMaterial.unit, PackagingMaterial.cost,
+        )
+        .join(Product, Product.id == Packaging.product_id)
+        .join(RawProduct, RawProduct.id == Packaging.raw_product_id)
+        .join(User, User.id == Packaging.user_id)
+        .outerjoin(PackagingMaterial, PackagingMaterial.packaging_id == Packaging.id)
+        .outerjoin(Material, Material.id == PackagingMaterial.material_id)
+        .order_by(Packaging.date, Packaging.id, PackagingMaterial.id)
+    )
+    return _in_period(query, Packaging.date, period)
+
+
+def _shipments(period):
+    # Одна строка на каждую позицию отгрузки
+    query = (
+        select(Shipment.id, Shipment.timestamp, User.full_name, Product.name, ShipmentItem.quantity)
+        .join(User, User.id == Shipment.user_id)
+        .outerjoin(ShipmentItem, ShipmentItem.shipment_id == Shipment.id)
+        .outerjoin(Product, Product.id == ShipmentItem.product_id)
+        .order_by(Shipment.timestamp, Shipment.id, ShipmentItem.id)
+    )
+    return _in_period(query, Shipment.timestamp, period)
+
+
+def _material_movements(period):
+    query = (
+        select(
+            MaterialMovement.id, MaterialMovement.date, Material.name, MaterialMovement.type,
+            MaterialMovement.quantity, MaterialMovement.unit, MaterialMovement.unit_price,
+            MaterialMovement.remaining_quantity, MaterialMovement.expense_id, MaterialMovement.packaging_id,
+        )
+        .join(Material, Material.id == MaterialMovement.material_id)
+        .order_by(MaterialMovement.date, MaterialMovement.id)
+    )
+    return _in_period(query, MaterialMovement.date, period)
+
+
+EXPORTS = {
+    "expenses": ExportSpec(
+        "Расходы",
+        ("ID", "Дата", "Сумма", "Категория", "Назначение", "Источник", "Материал", "Количество",
+         "Ед.", "Сотрудник", "Фасовка", "Автор"),
+        _expenses,
+    ),
+    "arrivals": ExportSpec("Приходы", ("ID", "Дата", "Сырьё", "Количество, кг", "Автор"), _arrivals),
+    "packaging": ExportSpec(
+        "Фасовка",
+        ("ID", "Дата", "Продукция", "Сырьё", "Пачек", "Сырья, кг", "Стоимость материалов", "Автор",
+         "Материал", "Количество материала", "Ед.", "Стоимость материала"),
+        _packaging,
+    ),
+    "shipments": ExportSpec("Отгрузки", ("ID", "Дата", "Автор", "Продукция", "Количество"), _shipments),
+    "material_movements": ExportSpec(
+        "Движения материалов",
+        ("ID", "Дата", "Материал", "Тип", "Количество", "Ед.", "Цена за ед.", "Остаток партии",
+         "Расход", "Фасовка"),
+        _material_movements,
+    ),
+}
+
+
+def get_export(kind: str) -> ExportSpec:
+    if kind not in EXPORTS:
+        raise ValueError(f"Неизвестная выгрузка: {kind}")
+    return EXPORTS[kind]
+
+
+async def iter_row_chunks(session: AsyncSession, kind: str, period: Optional[Period] = None) -> AsyncIterator[list]:
+    """Строки выгрузки порциями по EXPORT_CHUNK (курсор на стороне сервера)."""
+    query = get_export(kind).query(period).execution_options(yield_per=EXPORT_CHUNK)
+    result = await session.stream(query)
+    async for rows in result.partitions():
+        yield rows
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.strftime("%d.%m.%Y %H:%M")
+    if isinstance(value, date):
+        return value.strftime("%d.%m.%Y")
+    return value
+
+
+async def iter_csv(session: AsyncSession, kind: str, period: Optional[Period] = None) -> AsyncIterator[bytes]:
+    """CSV (UTF-8 с BOM) частями — по одной на порцию строк."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=CSV_DELIMITER)
+    buffer.write("\ufeff")  # BOM: Excel распознаёт UTF-8
+    writer.writerow(get_export(kind).headers)
+    async for rows in iter_row_chunks(session, kind, period):
+        writer.writerows([_csv_value(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def xlsx_available() -> bool:
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+async def write_xlsx(session: AsyncSession, kind: str, fileobj, period: Optional[Period] = None):
+    """Пишет выгрузку в fileobj в формате XLSX (нужен openpyxl)."""
+    from openpyxl import Workbook
+
+    spec = get_export(kind)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(spec.title)
+    sheet.append(spec.headers)
+    async for rows in iter_row_chunks(session, kind, period):
+        for row in rows:
+            sheet.append(list(row))
+    workbook.save(fileobj)
+
+
+async def write_export(session: AsyncSession, kind: str, fmt: str, fileobj, period: Optional[Period] = None):
+    """Пишет выгрузку kind в двоичный fileobj в формате fmt ("csv" или "xlsx")."""
+    if fmt == "xlsx":
+        await write_xlsx(session, kind, fileobj, period)
+    elif fmt == "csv":
+        async for chunk in iter_csv(session, kind, period):
+            fileobj.write(chunk)
+    else:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+
+
+def export_filename(kind: str, fmt: str, period: Optional[Period] = None) -> str:
+    suffix = f"_{period.start:%Y%m%d}-{period.last_day:%Y%m%d}" if period else ""
+    return f"{kind}{suffix}.{fmt}"
@@ -0,0 +1,132 @@
+"""Кэш открытых партий материалов для списания по FIFO.
+
+Для каждого материала хранится упорядоченный по дате список приходных
+партий с ненулевым остатком. Изменения, сделанные в транзакции, попадают
+в кэш только после успешного коммита; при откате они отбрасываются.
+"""
+from typing import NamedTuple
+
+from cachetools import TTLCache
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from bot.models.material_movement import MaterialMovement
+
+# Остаток меньше этого значения считаем нулевым
+LOT_EPSILON = 1e-9
+
+# material_id -> список открытых партий (TTL ограничивает рассинхронизацию
+# с изменениями, сделанными другими процессами: бот и веб работают отдельно)
+_open_lots = TTLCache(maxsize=1000, ttl=300)
+
+_TOUCHED_KEY = "material_lots_touched"
+_STAGED_KEY = "material_lots_staged"
+_INVALIDATE_KEY = "material_lots_invalidate"
+
+
+class OpenLot(NamedTuple):
+    id: int
+    remaining: float
+    unit: str
+    unit_price: float
+
+
+async def load_open_lots(session: AsyncSession, material_id: int) -> list[OpenLot]:
+    """Читает открытые партии материала из БД (по индексу ix_material_movements_fifo)."""
+    result = await session.execute(
+        select(
+            MaterialMovement.id,
+            MaterialMovement.remaining_quantity,
+            MaterialMovement.unit,
+            MaterialMovement.unit_price,
+        )
+        .where(
+            MaterialMovement.material_id == material_id,
+            MaterialMovement.type == 'in',
+            MaterialMovement.remaining_quantity > 0,
+        )
+        .order_by(MaterialMovement.date, MaterialMovement.id)
+    )
+    return [
+        OpenLot(lot_id, remaining, unit, unit_price or 0.0)
+        for lot_id, remaining, unit, unit_price in result.all()
+        if remaining > LOT_EPSILON
+    ]
+
+
+async def get_open_lots(session: AsyncSession, material_id: int) -> tuple[list[OpenLot], bool]:
+    """Возвращает открытые партии материала и признак того, что они взяты из кэша.
+
+    Если материал уже менялся в текущей транзакции, кэш не используется:
+    актуальное состояние есть только в БД.
+    """
+    if material_id in _touched(session):
+        return await load_open_lots(session, material_id), False
+
+    lots = _open_lots.get(material_id)
+    if lots is not None:
+        return list(lots), True
+
+    lots = await load_open_lots(session, material_id)
+    _open_lots[material_id] = tuple(lots)
+    return lots, False
+
+
+def stage_open_lots(session: AsyncSession, material_id: int, lots: list[OpenLot]):
+    """Запоминает состояние партий после списания; в кэш оно попадёт при коммите."""
+    _touched(session).add(material_id)
+    session.info.setdefault(_STAGED_KEY, {})[material_id] = tuple(lots)
+
+
+def invalidate_open_lots(session: AsyncSession, material_ids):
+    """Помечает материалы, партии которых изменены в обход stage_open_lots."""
+    _touched(session).update(material_ids)
+    session.info.setdefault(_INVALIDATE_KEY, set()).update(material_ids)
+
+
+def clear_open_lots():
+    """Полностью очищает кэш партий."""
+    _open_lots.clear()
+
+
+def _touched(session) -> set:
+    return session.info.setdefault(_TOUCHED_KEY, set())
+
+
+def _clear(session):
+    for key in (_TOUCHED_KEY, _STAGED_KEY, _INVALIDATE_KEY):
+        session.info.pop(key, None)
+
+
+@event.listens_for(Session, "before_flush")
+def _track_movement_changes(session, flush_context, instances):
+    """Любое ORM-изменение движений материала сбрасывает кэш этого материала."""
+    material_ids = {
+        obj.material_id
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(obj, MaterialMovement) and obj.material_id is not None
+    }
+    if material_ids:
+        _touched(session).update(material_ids)
+        session.info.setdefault(_INVALIDATE_KEY, set()).update(material_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_on_commit(session):
+    invalidate = session.info.get(_INVALIDATE_KEY, set())
+    for material_id, lots in session.info.get(_STAGED_KEY, {}).items():
+        if material_id not in invalidate:
+            _open_lots[material_id] = lots
+    for material_id in invalidate:
+        _open_lots.pop(material_id, None)
+    _clear(session)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_on_rollback(session, transaction):
+    # after_commit уже отработал; здесь остаются только данные отменённых транзакций
+    if transaction.parent is None:
+        for material_id in session.info.get(_TOUCHED_KEY, ()):
+            _open_lots.pop(material_id, None)
+        _clear(session)
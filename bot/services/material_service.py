@@ -1,8 +1,32 @@
-from sqlalchemy import select, func
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import bindparam, select, func, insert, update, case, delete
 from sqlalchemy.ext.asyncio import AsyncSession
+from bot.models.material import Material
 from bot.models.material_movement import MaterialMovement
+from bot.models.material_stock import MaterialStock
 from bot.models.packaging_material import PackagingMaterial
 from bot.models.expense import Expense
+from bot.services.change_tracking import audit_bulk, audit_enabled, insert_audited
+from bot.services.counters import increment, increment_many
+from bot.services.material_lots import (
+    LOT_EPSILON,
+    OpenLot,
+    get_open_lots,
+    invalidate_open_lots,
+    load_open_lots,
+    stage_open_lots,
+)
+
+STICKER_MATERIAL = "Наклейка"  # списывается автоматически, по одной на пачку
+
+# Способы оценки списания (Material.valuation_method)
+VALUATION_FIFO = "fifo"  # по партиям, в порядке прихода
+VALUATION_AVERAGE = "average"  # по скользящей средней: material_stock.value / quantity
+VALUATION_METHODS = (VALUATION_FIFO, VALUATION_AVERAGE)
+
 
 async def get_available_inventory(session: AsyncSession, material_id: int):
     """Возвращает список приходных записей с ненулевым остатком, отсортированных по дате."""
@@ -13,56 +37,442 @@ async def get_available_inventory(session: AsyncSession, material_id: int):
             MaterialMovement.type == 'in',
             MaterialMovement.remaining_quantity > 0
         )
-        .order_by(MaterialMovement.date)
+        .order_by(MaterialMovement.date, MaterialMovement.id)
     )
     return result.scalars().all()
 
-async def consume_material(session: AsyncSession, material_id: int, needed_qty: float, packaging_id: int):
-    """Списывает нужное количество материала по FIFO, записывает стоимость в PackagingMaterial.
-    Возвращает общую стоимость списанного материала."""
-    total_cost = 0.0
-    remaining = needed_qty
-    inventory = await get_available_inventory(session, material_id)
 
-    for batch in inventory:
-        if remaining <= 0:
-            break
-        take = min(batch.remaining_quantity, remaining)
-        cost = round(take * batch.unit_price, 2)
-        total_cost += cost
+async def apply_stock_delta(session: AsyncSession, material_id: int, delta: float, value: float = 0.0):
+    """Изменяет текущий остаток материала и его стоимость в material_stock (в рамках текущей транзакции)."""
+    if delta or value:
+        await increment(
+            session, MaterialStock,
+            keys={"material_id": material_id},
+            deltas={"quantity": delta, "value": round(value, 2)},
+            updated_at=datetime.utcnow(),
+        )
 
-        # Создаём запись расхода материала
-        out_movement = MaterialMovement(
-            material_id=material_id,
-            type='out',
-            quantity=take,
-            unit=batch.unit,
-            date=func.now(),
-            packaging_id=packaging_id
+
+async def get_material_stock(session: AsyncSession):
+    """Материалы с текущими остатками: список (Material, остаток)."""
+    result = await session.execute(
+        select(Material, func.coalesce(MaterialStock.quantity, 0).label("stock"))
+        .outerjoin(MaterialStock, MaterialStock.material_id == Material.id)
+        .order_by(Material.id)
+    )
+    return result.all()
+
+
+async def reconcile_material_stock(session: AsyncSession, fix: bool = True):
+    """Сверяет material_stock с движениями материалов.
+
+    Возвращает список расхождений (material_id, название, в таблице, по движениям).
+    При fix=True перестраивает таблицу по движениям.
+    """
+    movement_totals = (
+        select(
+            MaterialMovement.material_id,
+            func.sum(
+                case(
+                    (MaterialMovement.type == 'in', MaterialMovement.quantity),
+                    else_=-MaterialMovement.quantity
+                )
+            ).label("actual")
         )
-        session.add(out_movement)
+        .group_by(MaterialMovement.material_id)
+        .subquery()
+    )
+    result = await session.execute(
+        select(
+            Material.id,
+            Material.name,
+            func.coalesce(MaterialStock.quantity, 0),
+            func.coalesce(movement_totals.c.actual, 0),
+        )
+        .outerjoin(MaterialStock, MaterialStock.material_id == Material.id)
+        .outerjoin(movement_totals, movement_totals.c.material_id == Material.id)
+        .order_by(Material.id)
+    )
+    rows = result.all()
+    drift = [row for row in rows if abs(row[2] - row[3]) > 0.005]
 
-        # Создаём запись в packaging_materials
-        pm = PackagingMaterial(
-            packaging_id=packaging_id,
-            material_id=material_id,
-            quantity=take,
-            unit=batch.unit,
-            cost=cost
+    if fix:
+        # Стоимость остатка: приходы за вычетом стоимости списанного
+        purchased = dict((await session.execute(
+            select(MaterialMovement.material_id, func.sum(MaterialMovement.quantity * func.coalesce(MaterialMovement.unit_price, 0)))
+            .where(MaterialMovement.type == 'in')
+            .group_by(MaterialMovement.material_id)
+        )).all())
+        consumed = dict((await session.execute(
+            select(PackagingMaterial.material_id, func.sum(PackagingMaterial.cost)).group_by(PackagingMaterial.material_id)
+        )).all())
+        now = datetime.utcnow()
+        await session.execute(delete(MaterialStock))
+        if rows:
+            await session.execute(insert(MaterialStock), [
+                {"material_id": material_id, "quantity": actual, "updated_at": now,
+                 "value": round((purchased.get(material_id) or 0) - (consumed.get(material_id) or 0), 2)}
+                for material_id, _, _, actual in rows
+            ])
+        await session.commit()
+
+    return drift
+
+
+async def rebalance_open_lots(session: AsyncSession, material_ids):
+    """Заново распределяет израсходованное количество по партиям материалов по FIFO.
+
+    Нужна после вставки приходов задним числом: списанное количество (сумма
+    приходов минус сумма остатков) снимается с самых ранних партий, а расходы
+    FIFO-материалов (в порядке дат) перепривязываются к этим партиям — с
+    разбиением строки, если расход приходится на несколько партий, — чтобы
+    отмена списания вернула количество туда, откуда оно теперь списано.
+    Стоимость уже записанных списаний не пересчитывается. Коммит — за вызывающим.
+    """
+    methods = dict((await session.execute(
+        select(Material.id, Material.valuation_method).where(Material.id.in_(material_ids))
+    )).all())
+    for material_id in material_ids:
+        result = await session.execute(
+            select(MaterialMovement.id, MaterialMovement.quantity, MaterialMovement.remaining_quantity)
+            .where(MaterialMovement.material_id == material_id, MaterialMovement.type == 'in')
+            .order_by(MaterialMovement.date, MaterialMovement.id)
         )
-        session.add(pm)
+        lots = result.all()
+        consumed = sum(quantity - (remaining or 0) for _, quantity, remaining in lots)
+        changed, audited, used = [], [], deque()
+        for lot_id, quantity, remaining in lots:
+            take = min(quantity, max(consumed, 0))
+            consumed -= take
+            if take > LOT_EPSILON:
+                used.append([lot_id, take])
+            rest = quantity - take if quantity - take > LOT_EPSILON else 0
+            if abs(rest - (remaining or 0)) > LOT_EPSILON:
+                changed.append({"id": lot_id, "remaining_quantity": rest})
+                audited.append((lot_id, {"remaining_quantity": (remaining, rest)}))
+        if changed:
+            await session.execute(update(MaterialMovement), changed)
+            audit_bulk(session, MaterialMovement, "update", audited)
+        if methods.get(material_id) != VALUATION_AVERAGE:
+            await _relink_out_rows(session, material_id, used)
+    invalidate_open_lots(session, material_ids)
+
+
+def take_from_lots(lots: deque, quantity: float) -> list[tuple]:
+    """Снимает quantity с очереди партий [[партия, количество], ...] по FIFO.
+
+    Возвращает части [(партия, количество), ...]; то, на что партий не
+    хватило, — частью без партии (None).
+    """
+    pieces, rest = [], quantity
+    while rest > LOT_EPSILON and lots:
+        lot = lots[0]
+        take = min(lot[1], rest)
+        pieces.append((lot[0], take))
+        lot[1] -= take
+        rest -= take
+        if lot[1] <= LOT_EPSILON:
+            lots.popleft()
+    if rest > LOT_EPSILON or not pieces:
+        pieces.append((None, rest))
+    return pieces
 
-        # Уменьшаем остаток партии
-        batch.remaining_quantity -= take
+
+def split_out_row(row, pieces: list[tuple]):
+    """Строки для перепривязки расхода к партиям pieces ([(партия, количество), ...]).
+
+    row — (id, material_id, quantity, unit, packaging_id, date, source_movement_id).
+    Первая часть остаётся в исходной строке, остальные становятся новыми
+    расходами той же фасовки и даты. Возвращает (изменение исходной строки
+    или None, новые строки); в изменении есть и старые значения — для журнала.
+    """
+    movement_id, material_id, quantity, unit, packaging_id, day, source_id = row
+    (first_lot, first_quantity), rest = pieces[0], pieces[1:]
+    changed = None
+    if first_lot != source_id or abs(first_quantity - quantity) > LOT_EPSILON:
+        changed = {"movement_id": movement_id, "source": first_lot, "quantity": first_quantity,
+                   "old_source": source_id, "old_quantity": quantity}
+    inserted = [
+        {"material_id": material_id, "type": 'out', "quantity": take, "unit": unit, "packaging_id": packaging_id,
+         "date": day, "source_movement_id": lot_id}
+        for lot_id, take in rest
+    ]
+    return changed, inserted
+
+
+async def write_out_links(session: AsyncSession, changed: list[dict], inserted: list[dict]):
+    """Записывает результат split_out_row: изменённые расходы и новые строки расходов."""
+    if changed:
+        movements = MaterialMovement.__table__
+        await session.execute(
+            update(movements)
+            .where(movements.c.id == bindparam("movement_id"))
+            .values(source_movement_id=bindparam("source"), quantity=bindparam("quantity")),
+            [{"movement_id": row["movement_id"], "source": row["source"], "quantity": row["quantity"]}
+             for row in changed],
+        )
+        audit_bulk(session, MaterialMovement, "update", [
+            (row["movement_id"], {"source_movement_id": (row["old_source"], row["source"]),
+                                  "quantity": (row["old_quantity"], row["quantity"])})
+            for row in changed
+        ])
+    await insert_audited(session, MaterialMovement, inserted)
+
+
+async def _relink_out_rows(session: AsyncSession, material_id: int, used: deque):
+    """Привязывает расходы материала (в порядке дат) к партиям в порядке их списания."""
+    result = await session.execute(
+        select(MaterialMovement.id, MaterialMovement.material_id, MaterialMovement.quantity, MaterialMovement.unit,
+               MaterialMovement.packaging_id, MaterialMovement.date, MaterialMovement.source_movement_id)
+        .where(MaterialMovement.material_id == material_id, MaterialMovement.type == 'out')
+        .order_by(MaterialMovement.date, MaterialMovement.id)
+    )
+    changed, inserted = [], []
+    for row in result.all():
+        row_changed, row_inserted = split_out_row(row, take_from_lots(used, row.quantity))
+        if row_changed:
+            changed.append(row_changed)
+        inserted += row_inserted
+    await write_out_links(session, changed, inserted)
+
+
+def _plan_fifo(lots: list[OpenLot], needed_qty: float):
+    """Распределяет нужное количество по партиям. Возвращает (план, нехватка)."""
+    plan = []
+    remaining = needed_qty
+    for lot in lots:
+        if remaining <= 0:
+            break
+        take = min(lot.remaining, remaining)
+        plan.append((lot, take))
         remaining -= take
+    return plan, round(remaining, 2)
+
+
+async def _lots_changed(session: AsyncSession, plan) -> bool:
+    """Проверяет, что затрагиваемые партии из кэша не изменились в БД."""
+    result = await session.execute(
+        select(MaterialMovement.id, MaterialMovement.remaining_quantity)
+        .where(MaterialMovement.id.in_([lot.id for lot, _ in plan]))
+    )
+    actual = dict(result.all())
+    return any(
+        abs((actual.get(lot.id) or 0) - lot.remaining) > LOT_EPSILON
+        for lot, _ in plan
+    )
+
+
+async def consume_material(session: AsyncSession, material_id: int, needed_qty: float, packaging_id: int,
+                           method: Optional[str] = None):
+    """Списывает нужное количество материала способом оценки материала (FIFO или
+    скользящая средняя), записывает стоимость в PackagingMaterial.
+    method — Material.valuation_method, если вызывающий уже прочитал его (иначе читается здесь).
+    Возвращает общую стоимость списанного материала."""
+    if method is None:
+        method = await session.scalar(select(Material.valuation_method).where(Material.id == material_id))
+    if method == VALUATION_AVERAGE:
+        return await _consume_average(session, material_id, needed_qty, packaging_id)
+    return await _consume_fifo(session, material_id, needed_qty, packaging_id)
+
+
+async def _consume_average(session: AsyncSession, material_id: int, needed_qty: float, packaging_id: int):
+    """Списание по скользящей средней: цена — стоимость остатка / количество.
+
+    Партии не перебираются и их остатки не меняются — только пара
+    (количество, стоимость) в material_stock.
+    """
+    stock = (await session.execute(
+        select(MaterialStock.quantity, MaterialStock.value).where(MaterialStock.material_id == material_id)
+    )).one_or_none()
+    quantity, value = stock if stock else (0.0, 0.0)
+    if quantity + 0.005 < needed_qty:
+        raise ValueError(f"Недостаточно материала (id={material_id}) на складе. Не хватает {round(needed_qty - quantity, 2)}")
+    # Последняя партия списывается по всей оставшейся стоимости — без копеек в остатке
+    cost = round(value if quantity - needed_qty < 0.005 else needed_qty * value / quantity, 2)
+
+    result = await session.execute(
+        update(MaterialStock)
+        .where(MaterialStock.material_id == material_id, MaterialStock.quantity >= needed_qty - 0.005)
+        .values(quantity=MaterialStock.quantity - needed_qty, value=MaterialStock.value - cost,
+                updated_at=datetime.utcnow())
+    )
+    if result.rowcount == 0:  # остаток успели списать параллельно
+        raise ValueError(f"Недостаточно материала (id={material_id}) на складе")
 
-    remaining = round(remaining, 2)
-    if remaining > 0.005:  # всё, что меньше 0.005, считаем нулём
-        raise ValueError(f"Недостаточно материала (id={material_id}) на складе. Не хватает {remaining}")
+    unit = await session.scalar(
+        select(MaterialMovement.unit)
+        .where(MaterialMovement.material_id == material_id, MaterialMovement.type == 'in')
+        .order_by(MaterialMovement.id.desc())
+        .limit(1)
+    )
+    await insert_audited(session, MaterialMovement, [{
+        "material_id": material_id, "type": 'out', "quantity": needed_qty, "unit": unit or "шт",
+        "packaging_id": packaging_id,
+    }])
+    await insert_audited(session, PackagingMaterial, [{
+        "packaging_id": packaging_id, "material_id": material_id, "quantity": needed_qty, "unit": unit or "шт",
+        "cost": cost,
+    }])
+    return cost
+
+
+async def _consume_fifo(session: AsyncSession, material_id: int, needed_qty: float, packaging_id: int):
+    """Списание по FIFO: с самых ранних открытых партий."""
+    lots, from_cache = await get_open_lots(session, material_id)
+    plan, shortage = _plan_fifo(lots, needed_qty)
+
+    # Кэш мог устареть (приход в другом процессе, ручная правка) — перечитываем партии
+    if from_cache and (shortage > 0.005 or await _lots_changed(session, plan)):
+        lots = await load_open_lots(session, material_id)
+        plan, shortage = _plan_fifo(lots, needed_qty)
+
+    if shortage > 0.005:  # всё, что меньше 0.005, считаем нулём
+        raise ValueError(f"Недостаточно материала (id={material_id}) на складе. Не хватает {shortage}")
+
+    total_cost = 0.0
+    out_rows = []
+    pm_rows = []
+    for lot, take in plan:
+        cost = round(take * lot.unit_price, 2)
+        total_cost += cost
+        out_rows.append({
+            "material_id": material_id,
+            "type": 'out',
+            "quantity": take,
+            "unit": lot.unit,
+            "packaging_id": packaging_id,
+            "source_movement_id": lot.id,
+        })
+        pm_rows.append({
+            "packaging_id": packaging_id,
+            "material_id": material_id,
+            "quantity": take,
+            "unit": lot.unit,
+            "cost": cost,
+        })
+
+    if out_rows:
+        # Уменьшаем остаток только у затронутых партий — одной командой на все партии
+        lots_table = MaterialMovement.__table__
+        await session.execute(
+            update(lots_table)
+            .where(lots_table.c.id == bindparam("lot_id"))
+            .values(remaining_quantity=lots_table.c.remaining_quantity - bindparam("take")),
+            [{"lot_id": lot.id, "take": take} for lot, take in plan],
+        )
+        audit_bulk(session, MaterialMovement, "update", [
+            (lot.id, {"remaining_quantity": (lot.remaining, lot.remaining - take)}) for lot, take in plan
+        ])
+        await insert_audited(session, MaterialMovement, out_rows)
+        await insert_audited(session, PackagingMaterial, pm_rows)
+        await apply_stock_delta(session, material_id, -sum(take for _, take in plan), -total_cost)
+
+    # Новое состояние партий попадёт в кэш после коммита. План — начало
+    # списка партий: меняется только последняя затронутая, остальные не копируются
+    left = lots[len(plan):]
+    if plan:
+        lot, take = plan[-1]
+        if lot.remaining - take > LOT_EPSILON:
+            left = [lot._replace(remaining=lot.remaining - take)] + left
+    stage_open_lots(session, material_id, left)
 
     return total_cost
 
 
+async def reverse_material_consumption(session: AsyncSession, packaging_id: int, material_ids=None) -> dict:
+    """Отменяет списание материалов фасовки (всех или только material_ids).
+
+    Остаток возвращается в те партии, из которых материал был списан:
+    одна команда на все партии, одна на удаление расходов и одна на
+    удаление строк PackagingMaterial; стоимость списанного возвращается
+    в стоимость остатка. Новые приходы не создаются — кроме старых
+    FIFO-расходов без ссылки на партию: для них, как раньше, заводится
+    приход по средней цене списания (у материалов со скользящей средней
+    партии не участвуют). Коммит — за вызывающим.
+    Возвращает {material_id: возвращённое количество}.
+    """
+    conditions = [MaterialMovement.packaging_id == packaging_id, MaterialMovement.type == 'out']
+    pm_conditions = [PackagingMaterial.packaging_id == packaging_id]
+    if material_ids is not None:
+        if not material_ids:
+            return {}
+        conditions.append(MaterialMovement.material_id.in_(material_ids))
+        pm_conditions.append(PackagingMaterial.material_id.in_(material_ids))
+
+    rows = (await session.execute(
+        select(MaterialMovement.id, MaterialMovement.material_id, MaterialMovement.quantity,
+               MaterialMovement.unit, MaterialMovement.source_movement_id, Material.valuation_method)
+        .join(Material, Material.id == MaterialMovement.material_id)
+        .where(*conditions)
+    )).all()
+    if not rows:
+        return {}
+    costs = dict((await session.execute(
+        select(PackagingMaterial.material_id, func.sum(PackagingMaterial.cost))
+        .where(*pm_conditions)
+        .group_by(PackagingMaterial.material_id)
+    )).all())
+
+    to_lots: dict[int, float] = {}
+    unlinked: dict[int, list] = {}  # material_id -> [количество, единица]
+    returned: dict[int, float] = {}
+    for _, material_id, quantity, unit, lot_id, method in rows:
+        returned[material_id] = returned.get(material_id, 0.0) + quantity
+        if lot_id is not None:
+            to_lots[lot_id] = to_lots.get(lot_id, 0.0) + quantity
+        elif method != VALUATION_AVERAGE:
+            unlinked.setdefault(material_id, [0.0, unit])[0] += quantity
+
+    if to_lots:
+        lots_table = MaterialMovement.__table__
+        if audit_enabled():
+            before = dict((await session.execute(
+                select(MaterialMovement.id, MaterialMovement.remaining_quantity)
+                .where(MaterialMovement.id.in_(to_lots))
+            )).all())
+            audit_bulk(session, MaterialMovement, "update", [
+                (lot_id, {"remaining_quantity": (before.get(lot_id), (before.get(lot_id) or 0) + quantity)})
+                for lot_id, quantity in to_lots.items()
+            ])
+        await session.execute(
+            update(lots_table)
+            .where(lots_table.c.id == bindparam("lot_id"))
+            .values(remaining_quantity=lots_table.c.remaining_quantity + bindparam("back")),
+            [{"lot_id": lot_id, "back": quantity} for lot_id, quantity in to_lots.items()],
+        )
+    if unlinked:
+        await insert_audited(session, MaterialMovement, [
+            {"material_id": material_id, "type": 'in', "quantity": quantity, "unit": unit,
+             "unit_price": (costs.get(material_id) or 0.0) / returned[material_id], "remaining_quantity": quantity}
+            for material_id, (quantity, unit) in unlinked.items()
+        ])
+
+    if audit_enabled():
+        audit_bulk(session, MaterialMovement, "delete", [
+            (movement_id, {"material_id": material_id, "type": 'out', "quantity": quantity, "unit": unit,
+                           "packaging_id": packaging_id, "source_movement_id": lot_id})
+            for movement_id, material_id, quantity, unit, lot_id, _ in rows
+        ])
+        pm_rows = (await session.execute(
+            select(PackagingMaterial.id, PackagingMaterial.material_id, PackagingMaterial.quantity,
+                   PackagingMaterial.unit, PackagingMaterial.cost)
+            .where(*pm_conditions)
+        )).all()
+        audit_bulk(session, PackagingMaterial, "delete", [
+            (pm_id, {"packaging_id": packaging_id, "material_id": material_id, "quantity": quantity, "unit": unit,
+                     "cost": cost})
+            for pm_id, material_id, quantity, unit, cost in pm_rows
+        ])
+    await session.execute(delete(MaterialMovement).where(MaterialMovement.id.in_([row[0] for row in rows])))
+    await session.execute(delete(PackagingMaterial).where(*pm_conditions))
+    await increment_many(session, MaterialStock, [
+        ({"material_id": material_id}, {"quantity": quantity, "value": round(costs.get(material_id) or 0.0, 2)})
+        for material_id, quantity in returned.items()
+    ])
+    invalidate_open_lots(session, returned)
+    return returned
+
+
 async def purchase_material(
     session: AsyncSession,
     material_id: int,
@@ -85,6 +495,7 @@ async def purchase_material(
     )
     session.add(movement)
     await session.flush()
+    await apply_stock_delta(session, material_id, quantity, quantity * (unit_price or 0))
 
     # Если передана сумма и пользователь, создаём запись в expenses
     if expense_amount and user_id:
@@ -124,4 +535,5 @@ async def return_material(
         packaging_id=packaging_id
     )
     session.add(movement)
+    await apply_stock_delta(session, material_id, quantity, quantity * (unit_price or 0))
     return movement
\ No newline at end of file
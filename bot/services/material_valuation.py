@@ -0,0 +1,256 @@
+"""Пересчёт стоимости списаний материалов по всей истории.
+
+replay_valuation проходит движения материалов одним потоком (по материалу,
+в порядке дат) и заново оценивает каждое списание способом оценки
+материала: FIFO — по партиям, скользящая средняя — по паре (количество,
+стоимость остатка). По результату переписываются PackagingMaterial.cost,
+Packaging.total_material_cost (вместе с дневными сводками), остатки
+партий, ссылки расходов на партии и пара (количество, стоимость) в
+material_stock. Расход, пришедшийся по FIFO на несколько партий,
+разбивается на строки по партиям (как при списании в consume_material),
+чтобы отмена списания вернула в каждую партию её часть. Нужен после смены способа оценки и после правки приходов
+задним числом.
+
+Остатки партий всегда пересчитываются по FIFO, даже для материалов со
+скользящей средней (при списании по средней партии не меняются), поэтому
+после пересчёта материал можно перевести обратно на FIFO.
+"""
+from collections import deque
+from typing import NamedTuple, Optional
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.models.material import Material
+from bot.models.material_movement import MaterialMovement
+from bot.models.material_stock import MaterialStock
+from bot.models.packaging import Packaging, PackagingMaterial
+from bot.models.rollups import DailyProductRollup
+from bot.services.change_tracking import audit_bulk
+from bot.services.counters import increment
+from bot.services.material_lots import LOT_EPSILON, invalidate_open_lots
+from bot.services.material_service import (
+    VALUATION_AVERAGE, VALUATION_METHODS, split_out_row, take_from_lots, write_out_links,
+)
+from bot.services.rollups import RollupDeltas, apply_rollup_deltas, to_day
+
+STREAM_BATCH = 1000  # движений за одно чтение из курсора
+WRITE_BATCH = 500  # строк в одной команде записи
+
+
+class MaterialRevaluation(NamedTuple):
+    material_id: int
+    name: str
+    method: str
+    old_cost: float  # стоимость всех списаний до пересчёта
+    new_cost: float
+
+
+class _Replay:
+    """Состояние одного материала при проходе по его движениям."""
+
+    def __init__(self, method: str):
+        self.method = method
+        self.lots = deque()  # открытые партии по FIFO: [id, остаток, цена]
+        self.remaining = {}  # партия -> остаток после пересчёта
+        self.prices = {}  # партия -> цена
+        self.quantity = 0.0
+        self.value = 0.0
+        self.last_price = 0.0
+
+    def receive(self, lot_id: int, quantity: float, price: float):
+        self.lots.append([lot_id, quantity, price])
+        self.remaining[lot_id] = quantity
+        self.prices[lot_id] = price
+        self.quantity += quantity
+        self.value += quantity * price
+        self.last_price = price
+
+    def consume(self, quantity: float) -> tuple[float, list[tuple]]:
+        """Списывает quantity; возвращает (стоимость, части списания по партиям [(партия, количество), ...])."""
+        pieces = take_from_lots(self.lots, quantity)
+        fifo_cost = 0.0
+        for lot_id, take in pieces:
+            if lot_id is None:
+                fifo_cost += round(take * self.last_price, 2)  # истории не хватает партий — по последней цене
+            else:
+                fifo_cost += round(take * self.prices[lot_id], 2)
+                self.remaining[lot_id] -= take
+
+        if self.method == VALUATION_AVERAGE:
+            if self.quantity - quantity < 0.005:
+                cost = self.value
+            elif self.quantity > LOT_EPSILON:
+                cost = quantity * self.value / self.quantity
+            else:
+                cost = quantity * self.last_price
+            cost, pieces = round(cost, 2), [(None, quantity)]  # расходы по средней к партиям не привязаны
+        else:
+            cost = fifo_cost
+        self.quantity -= quantity
+        self.value -= cost
+        return cost, pieces
+
+
+async def _write(session: AsyncSession, stmt, rows: list):
+    for start in range(0, len(rows), WRITE_BATCH):
+        await session.execute(stmt, rows[start:start + WRITE_BATCH])
+
+
+async def replay_valuation(
+    session: AsyncSession,
+    material_ids: Optional[list[int]] = None,
+    method: Optional[str] = None,
+    dry_run: bool = False,
+) -> list[MaterialRevaluation]:
+    """Пересчитывает стоимость списаний материалов material_ids (по умолчанию всех).
+
+    method — сначала перевести материалы на этот способ оценки.
+    dry_run — только посчитать, ничего не записывая. Иначе коммитит.
+    """
+    if method is not None and method not in VALUATION_METHODS:
+        raise ValueError(f"Неизвестный способ оценки: {method}")
+    materials_query = select(Material.id, Material.name, Material.valuation_method).order_by(Material.id)
+    if material_ids is not None:
+        materials_query = materials_query.where(Material.id.in_(material_ids))
+    current = {
+        material_id: (name, material_method)
+        for material_id, name, material_method in (await session.execute(materials_query)).all()
+    }
+    materials = {
+        material_id: (name, method or current_method) for material_id, (name, current_method) in current.items()
+    }
+    if not materials:
+        return []
+    if method is not None:
+        await session.execute(
+            update(Material).where(Material.id.in_(materials)).values(valuation_method=method)
+        )
+        audit_bulk(session, Material, "update", [
+            (material_id, {"valuation_method": (current_method, method)})
+            for material_id, (_, current_method) in current.items() if current_method != method
+        ])
+
+    # Один проход по движениям
+    costs: dict[tuple, float] = {}  # (фасовка, материал) -> стоимость списаний
+    lot_rows, lot_audit, out_rows, new_out_rows, stock = [], [], [], [], {}
+    state, current_id, stored = None, None, {}
+
+    def finish():
+        for lot_id, remaining in state.remaining.items():
+            remaining = remaining if remaining > LOT_EPSILON else 0
+            if abs(remaining - (stored[lot_id] or 0)) > LOT_EPSILON:
+                lot_rows.append({"lot_id": lot_id, "remaining": remaining})
+                lot_audit.append((lot_id, {"remaining_quantity": (stored[lot_id], remaining)}))
+        stock[current_id] = (state.quantity, round(state.value, 2))
+
+    result = await session.stream(
+        select(
+            MaterialMovement.id, MaterialMovement.material_id, MaterialMovement.type, MaterialMovement.quantity,
+            MaterialMovement.unit_price, MaterialMovement.remaining_quantity, MaterialMovement.packaging_id,
+            MaterialMovement.source_movement_id, MaterialMovement.unit, MaterialMovement.date,
+        )
+        .where(MaterialMovement.material_id.in_(materials))
+        .order_by(MaterialMovement.material_id, MaterialMovement.date, MaterialMovement.id)
+    )
+    async for partition in result.partitions(STREAM_BATCH):
+        for movement_id, material_id, kind, quantity, price, remaining, packaging_id, source_id, unit, day \
+                in partition:
+            if material_id != current_id:
+                if state is not None:
+                    finish()
+                state, current_id, stored = _Replay(materials[material_id][1]), material_id, {}
+            if kind == 'in':
+                state.receive(movement_id, quantity, price or 0.0)
+                stored[movement_id] = remaining
+                continue
+            cost, pieces = state.consume(quantity)
+            if packaging_id is not None:
+                costs[(packaging_id, material_id)] = costs.get((packaging_id, material_id), 0.0) + cost
+            changed, inserted = split_out_row(
+                (movement_id, material_id, quantity, unit, packaging_id, day, source_id), pieces,
+            )
+            if changed:
+                out_rows.append(changed)
+            new_out_rows += inserted
+    if state is not None:
+        finish()
+
+    # Старые и новые стоимости строк PackagingMaterial
+    pm_rows = (await session.execute(
+        select(PackagingMaterial.id, PackagingMaterial.packaging_id, PackagingMaterial.material_id,
+               PackagingMaterial.quantity, PackagingMaterial.cost)
+        .where(PackagingMaterial.material_id.in_(materials))
+    )).all()
+    group_qty: dict[tuple, float] = {}
+    for _, packaging_id, material_id, quantity, _ in pm_rows:
+        group_qty[(packaging_id, material_id)] = group_qty.get((packaging_id, material_id), 0.0) + quantity
+    old_cost, new_cost, cost_rows, cost_audit, touched = {}, {}, [], [], set()
+    for pm_id, packaging_id, material_id, quantity, cost in pm_rows:
+        group = (packaging_id, material_id)
+        old_cost[material_id] = old_cost.get(material_id, 0.0) + (cost or 0)
+        if group not in costs:
+            new_cost[material_id] = new_cost.get(material_id, 0.0) + (cost or 0)
+            continue
+        # Несколько строк одной фасовки и материала — стоимость делится по количеству
+        value = round(costs[group] * quantity / group_qty[group], 2) if group_qty[group] else 0.0
+        new_cost[material_id] = new_cost.get(material_id, 0.0) + value
+        if abs(value - (cost or 0)) >= 0.005:
+            cost_rows.append({"pm_id": pm_id, "cost": value})
+            cost_audit.append((pm_id, {"cost": (cost, value)}))
+            touched.add(packaging_id)
+
+    report = [
+        MaterialRevaluation(material_id, name, material_method,
+                            round(old_cost.get(material_id, 0.0), 2), round(new_cost.get(material_id, 0.0), 2))
+        for material_id, (name, material_method) in materials.items()
+    ]
+    if dry_run:
+        await session.rollback()
+        return report
+
+    movements = MaterialMovement.__table__
+    pm_table = PackagingMaterial.__table__
+    await _write(session, update(movements).where(movements.c.id == bindparam("lot_id"))
+                 .values(remaining_quantity=bindparam("remaining")), lot_rows)
+    audit_bulk(session, MaterialMovement, "update", lot_audit)
+    for start in range(0, max(len(out_rows), len(new_out_rows)), WRITE_BATCH):
+        await write_out_links(session, out_rows[start:start + WRITE_BATCH], new_out_rows[start:start + WRITE_BATCH])
+    await _write(session, update(pm_table).where(pm_table.c.id == bindparam("pm_id"))
+                 .values(cost=bindparam("cost")), cost_rows)
+    audit_bulk(session, PackagingMaterial, "update", cost_audit)
+    await _update_packaging_totals(session, sorted(touched))
+    for material_id, (quantity, value) in stock.items():
+        await increment(session, MaterialStock, keys={"material_id": material_id}, deltas={},
+                        quantity=quantity, value=value)
+    invalidate_open_lots(session, list(materials))
+    await session.commit()
+    return report
+
+
+async def _update_packaging_totals(session: AsyncSession, packaging_ids: list[int]):
+    """Пересчитывает total_material_cost фасовок и поправляет дневные сводки на разницу."""
+    packaging = Packaging.__table__
+    deltas = RollupDeltas()
+    for start in range(0, len(packaging_ids), WRITE_BATCH):
+        chunk = packaging_ids[start:start + WRITE_BATCH]
+        totals = dict((await session.execute(
+            select(PackagingMaterial.packaging_id, func.sum(PackagingMaterial.cost))
+            .where(PackagingMaterial.packaging_id.in_(chunk))
+            .group_by(PackagingMaterial.packaging_id)
+        )).all())
+        rows, audited = [], []
+        for packaging_id, day, product_id, old_total in (await session.execute(
+            select(Packaging.id, Packaging.date, Packaging.product_id, Packaging.total_material_cost)
+            .where(Packaging.id.in_(chunk))
+        )).all():
+            total = round(totals.get(packaging_id) or 0.0, 2)
+            if abs(total - (old_total or 0)) < 0.005:
+                continue
+            rows.append({"packaging_id": packaging_id, "total": total})
+            audited.append((packaging_id, {"total_material_cost": (old_total, total)}))
+            deltas.add(DailyProductRollup, (to_day(day), product_id), material_cost=total - (old_total or 0))
+        await _write(session, update(packaging).where(packaging.c.id == bindparam("packaging_id"))
+                     .values(total_material_cost=bindparam("total")), rows)
+        audit_bulk(session, Packaging, "update", audited)
+    await apply_rollup_deltas(session, deltas)
@@ -1,108 +1,305 @@
-from datetime import datetime
-from typing import Dict, Any, Optional
+"""Уведомления администраторам через очередь notification_outbox.
+
+Обработчики только записывают уведомление в очередь (одна вставка
+INSERT ... SELECT на всех администраторов) и сразу возвращаются. Фоновый
+воркер отправляет сообщения с ограничением частоты — общим на бота и
+отдельным на каждый чат, — объединяет изменения, накопившиеся за
+NOTIFY_DIGEST_SECONDS, в одну сводку для каждого администратора и
+повторяет неудачные отправки с растущей задержкой.
+
+Перед отправкой воркер захватывает строки одной командой UPDATE
+(pending -> sending, в PostgreSQL с FOR UPDATE SKIP LOCKED), поэтому
+несколько экземпляров бота не отправляют одно уведомление дважды.
+Захват действует CLAIM_SECONDS: строки экземпляра, упавшего до отметки
+об отправке, после этого снова берутся в работу (возможен повтор
+сообщения, если процесс упал между отправкой и отметкой).
+"""
+import asyncio
+import logging
+import time
+from contextlib import suppress
+from datetime import datetime, timedelta
+from typing import Dict, Optional
 
 from aiogram import Bot
-from sqlalchemy import select
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from sqlalchemy import select, insert, update, delete, func, literal, and_, or_
 from sqlalchemy.ext.asyncio import AsyncSession
-from bot.models import User  # Новая модель для логов
-from bot.services.db_service import DBService, get_admin_ids
-import logging
+
+from bot.config import (
+    NOTIFY_GLOBAL_RATE, NOTIFY_CHAT_RATE, NOTIFY_CHAT_BURST, NOTIFY_DIGEST_SECONDS,
+    NOTIFY_MAX_ATTEMPTS, NOTIFY_RETRY_BASE_SECONDS, NOTIFY_POLL_SECONDS, NOTIFY_RETENTION_DAYS,
+)
+from bot.constants.roles import ADMIN
+from bot.models import User
+from bot.models.database import async_session
+from bot.models.notification import NotificationOutbox
 
 logger = logging.getLogger(__name__)
 
+MESSAGE_LIMIT = 4096  # максимальная длина сообщения Telegram
+CHANGES_DIGEST = "changes"
+BATCH_SIZE = 500
+PURGE_INTERVAL = 3600  # секунд между очистками отправленных строк
+CLAIM_SECONDS = 600  # сколько строки остаются за захватившим их воркером
+
+
+class TokenBucket:
+    """Ограничитель частоты: rate сообщений в секунду, не больше capacity подряд."""
+
+    def __init__(self, rate: float, capacity: int = 1, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Сколько секунд ждать до следующей отправки (0 — можно сейчас)."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+def build_digest(texts: list[str]) -> list[str]:
+    """Объединяет тексты в сводку, разбитую на сообщения не длиннее MESSAGE_LIMIT."""
+    if len(texts) == 1:
+        return [texts[0][:MESSAGE_LIMIT]]
+    chunks = []
+    current = f"🔔 Изменений: {len(texts)}"
+    for text in texts:
+        if len(current) + 2 + len(text) > MESSAGE_LIMIT:
+            chunks.append(current)
+            current = text[:MESSAGE_LIMIT]
+        else:
+            current += "\n\n" + text
+    chunks.append(current)
+    return chunks
+
+
 class NotificationService:
-    def __init__(self, bot: Optional[Bot] = None):
+    def __init__(self, bot: Optional[Bot] = None, session_factory=async_session, *,
+                 global_rate: float = NOTIFY_GLOBAL_RATE, chat_rate: float = NOTIFY_CHAT_RATE,
+                 chat_burst: int = NOTIFY_CHAT_BURST, digest_seconds: float = NOTIFY_DIGEST_SECONDS,
+                 max_attempts: int = NOTIFY_MAX_ATTEMPTS, retry_base: float = NOTIFY_RETRY_BASE_SECONDS,
+                 poll_seconds: float = NOTIFY_POLL_SECONDS):
         self.bot = bot
-        # self.TRACKED_ENTITIES = {"expense", "arrival"}
+        self.session_factory = session_factory
+        self.global_bucket = TokenBucket(global_rate, max(1, int(global_rate)))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.digest_seconds = digest_seconds
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.poll_seconds = poll_seconds
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._purged_at = 0.0
 
     def set_bot(self, bot: Bot):
         self.bot = bot
 
-    async def _get_admin_ids(self, session: AsyncSession) -> list[int]:
-        """Получаем ID администраторов"""
-        return await get_admin_ids(session)
+    # --- Постановка в очередь ---
 
-    async def send_notification(
+    async def enqueue(
         self,
         session: AsyncSession,
-        user_id: int,
-        message: str  # Принимаем готовое сообщение
-    ):
+        text: str,
+        *,
+        parse_mode: Optional[str] = None,
+        digest_key: Optional[str] = None,
+        chat_ids: Optional[list[int]] = None,
+    ) -> int:
+        """Ставит сообщение в очередь для chat_ids (по умолчанию — всем администраторам).
+
+        Сообщения с digest_key отправляются не раньше чем через digest_seconds
+        и объединяются в сводку. Фиксирует транзакцию сессии; возвращает
+        количество добавленных строк.
+        """
+        statement = self.outbox_insert(text, parse_mode=parse_mode, digest_key=digest_key, chat_ids=chat_ids)
+        if statement is None:
+            return 0
+        result = await session.execute(statement)
+        await session.commit()
+        self.wake()
+        return result.rowcount
+
+    def outbox_insert(self, text: str, *, parse_mode: Optional[str] = None, digest_key: Optional[str] = None,
+                      chat_ids: Optional[list[int]] = None):
+        """INSERT строк очереди для chat_ids или всех администраторов (None, если получателей нет).
+
+        Годится и для синхронного выполнения в обработчиках событий сессии.
+        """
+        now = datetime.utcnow()
+        due = now + timedelta(seconds=self.digest_seconds) if digest_key else now
+        values = {
+            "text": text, "parse_mode": parse_mode, "digest_key": digest_key, "status": "pending",
+            "attempts": 0, "next_attempt_at": due, "created_at": now,
+        }
+        if chat_ids is None:
+            columns = NotificationOutbox.__table__.c
+            recipients = select(
+                *(literal(value, columns[name].type) for name, value in values.items()), User.telegram_id,
+            ).where(User.role == ADMIN)
+            return insert(NotificationOutbox).from_select([*values, "chat_id"], recipients)
+        if chat_ids:
+            return insert(NotificationOutbox).values([{**values, "chat_id": chat_id} for chat_id in chat_ids])
+        return None
+
+    # --- Фоновая отправка ---
+
+    def wake(self):
+        """Будит воркер, чтобы он проверил очередь."""
+        self._wakeup.set()
+
+    async def start(self, bot: Optional[Bot] = None):
+        if bot is not None:
+            self.bot = bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                timeout = await self.dispatch_due()
+            except Exception as e:
+                logger.error(f"Notification worker error: {e}", exc_info=True)
+                timeout = self.poll_seconds
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+
+    async def dispatch_due(self) -> float:
+        """Отправляет подошедшие уведомления; возвращает, через сколько секунд проверить снова."""
         if not self.bot:
             logger.error("Bot instance not set in NotificationService")
-            return
+            return self.poll_seconds
 
-        try:
-            admin_ids = await self._get_admin_ids(session)
-            for admin_id in admin_ids:
-                try:
-                    await self.bot.send_message(admin_id, message)
-                except Exception as e:
-                    logger.error(f"Failed to send to admin {admin_id}: {e}")
-        except Exception as e:
-            logger.error(f"Notification error: {e}", exc_info=True)
+        groups: Dict[tuple, list] = {}
+        for row in await self._claim_due():
+            key = (row.chat_id, row.digest_key, row.parse_mode) if row.digest_key else (row.id,)
+            groups.setdefault(key, []).append(row)
+        for group in groups.values():
+            await self._send_group(sorted(group, key=lambda row: row.id))
 
-    async def _get_admin_ids(self, session: AsyncSession) -> list[int]:
+        await self._purge_sent()
+        async with self.session_factory() as session:
+            next_due = await session.scalar(
+                select(func.min(NotificationOutbox.next_attempt_at)).where(NotificationOutbox.status == "pending")
+            )
+        if next_due is None:
+            return self.poll_seconds
+        return min(self.poll_seconds, max(0.0, (next_due - datetime.utcnow()).total_seconds()))
+
+    async def _claim(self, session: AsyncSession, *conditions) -> list:
+        """Переводит подходящие строки в sending и возвращает их (занятые другим воркером пропускаются)."""
+        now = datetime.utcnow()
+        candidates = (
+            select(NotificationOutbox.id)
+            .where(*conditions)
+            .order_by(NotificationOutbox.id)
+            .limit(BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
         result = await session.execute(
-            select(User).with_only_columns(User.telegram_id).where(User.role == "admin")
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id.in_(candidates), *conditions)
+            .values(status="sending", next_attempt_at=now + timedelta(seconds=CLAIM_SECONDS))
+            .returning(
+                NotificationOutbox.id, NotificationOutbox.chat_id, NotificationOutbox.text,
+                NotificationOutbox.parse_mode, NotificationOutbox.digest_key, NotificationOutbox.attempts,
+            )
         )
-        return [row[0] for row in result.all()] or []
+        return result.all()
 
-    def _format_message(
-        self,
-        user: User,
-        action: str,
-        entity: str,
-        entity_id: int,
-        old_data: Dict,
-        new_data: Dict,
-    ) -> str:
-        """Форматирует сообщение для Telegram"""
-        action_verbs = {
-            "create": "добавил",
-            "update": "изменил",
-            "delete": "удалил",
-        }
-        entity_names = {
-            "arrival": "приход",
-            "expense": "расход",
-            "shipment": "отгрузку",
-            "packaging": "фасовку",
-        }
+    async def _claim_due(self) -> list:
+        """Захватывает строки, срок которых подошёл, и остальные строки их сводок."""
+        now = datetime.utcnow()
+        async with self.session_factory() as session:
+            # Сводка уходит, когда подошёл срок её первой строки; захват упавшего воркера истёк
+            rows = await self._claim(
+                session,
+                NotificationOutbox.status.in_(("pending", "sending")),
+                NotificationOutbox.next_attempt_at <= now,
+            )
+            digests = {(row.chat_id, row.digest_key, row.parse_mode) for row in rows if row.digest_key}
+            if digests:
+                rows += await self._claim(session, NotificationOutbox.status == "pending", or_(*(
+                    and_(
+                        NotificationOutbox.chat_id == chat_id,
+                        NotificationOutbox.digest_key == digest_key,
+                        NotificationOutbox.parse_mode.is_not_distinct_from(parse_mode),
+                    )
+                    for chat_id, digest_key, parse_mode in digests
+                )))
+            await session.commit()
+        return rows
 
-        base_msg = (
-            f"👤 Пользователь **{user.full_name}** (ID: {user.telegram_id})\n"
-            f"⚡ **{action_verbs[action]}** {entity_names[entity]} #{entity_id}\n"
-            f"🕒 {datetime.now().strftime('%d.%m.%Y %H:%M')}\n"
-        )
+    async def _throttle(self, chat_id: int):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        while (wait := max(self.global_bucket.delay(), bucket.delay())) > 0:
+            await asyncio.sleep(wait)
+        self.global_bucket.take()
+        bucket.take()
 
-        if action == "update":
-            changes = "\n".join(
-                f"  - `{field}`: {old_data.get(field)} → **{new_data.get(field)}**"
-                for field in new_data if field in old_data
-            )
-            base_msg += f"📝 Изменения:\n{changes}"
-
-        elif action == "create":
-            fields = "\n".join(f"  - `{k}`: **{v}**" for k, v in new_data.items())
-            base_msg += f"📌 Данные:\n{fields}"
-
-        elif action == "delete":
-            fields = "\n".join(f"  - `{k}`: **{v}**" for k, v in old_data.items())
-            base_msg += f"🗑 Удаленные данные:\n{fields}"
-
-        return base_msg
-
-    # async def _log_to_db(self, session: AsyncSession, user_id: int, action: str, entity: str, entity_id: int, old_data: Dict, new_data: Dict):
-    #     """Сохраняет действие в таблицу AuditLog"""
-    #     log_entry = AuditLog(
-    #         user_id=user_id,
-    #         action=action,
-    #         entity_type=entity,
-    #         entity_id=entity_id,
-    #         old_data=str(old_data) if old_data else None,
-    #         new_data=str(new_data) if new_data else None,
-    #         timestamp=datetime.now(),
-    #     )
-    #     session.add(log_entry)
-    #     await session.commit()
\ No newline at end of file
+    async def _send_group(self, group: list):
+        chat_id, parse_mode = group[0].chat_id, group[0].parse_mode
+        ids = [row.id for row in group]
+        try:
+            for chunk in build_digest([row.text for row in group]):
+                await self._throttle(chat_id)
+                await self.bot.send_message(chat_id, chunk, parse_mode=parse_mode)
+        except TelegramRetryAfter as e:
+            # Telegram сам сообщает, когда можно повторить; попытку не засчитываем
+            await self._mark(ids, status="pending", next_attempt_at=datetime.utcnow() + timedelta(seconds=e.retry_after),
+                             last_error=str(e))
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокирован, чат не найден или сообщение некорректно: повтор не поможет
+            logger.error(f"Failed to send to admin {chat_id}: {e}")
+            await self._mark(ids, status="failed", last_error=str(e))
+        except Exception as e:
+            attempts = max(row.attempts for row in group) + 1
+            logger.error(f"Failed to send to admin {chat_id} (attempt {attempts}): {e}")
+            if attempts >= self.max_attempts:
+                await self._mark(ids, status="failed", attempts=attempts, last_error=str(e))
+            else:
+                delay = self.retry_base * 2 ** (attempts - 1)
+                await self._mark(ids, status="pending", attempts=attempts, last_error=str(e),
+                                 next_attempt_at=datetime.utcnow() + timedelta(seconds=delay))
+        else:
+            await self._mark(ids, status="sent", sent_at=datetime.utcnow())
+
+    async def _mark(self, ids: list[int], **values):
+        async with self.session_factory() as session:
+            await session.execute(update(NotificationOutbox).where(NotificationOutbox.id.in_(ids)).values(**values))
+            await session.commit()
+
+    async def _purge_sent(self):
+        """Раз в час удаляет отправленные уведомления старше NOTIFY_RETENTION_DAYS."""
+        if time.monotonic() - self._purged_at < PURGE_INTERVAL:
+            return
+        self._purged_at = time.monotonic()
+        async with self.session_factory() as session:
+            await session.execute(delete(NotificationOutbox).where(
+                NotificationOutbox.status == "sent",
+                NotificationOutbox.sent_at < datetime.utcnow() - timedelta(days=NOTIFY_RETENTION_DAYS),
+            ))
+            await session.commit()
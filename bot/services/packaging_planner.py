@@ -0,0 +1,278 @@
+"""План фасовки: сколько пачек каждой продукции выпустить из остатка сырья.
+
+План ограничен ресурсами — по одной линейной строке на ресурс: сырьё
+(вес пачки, кг), наклейки (одна на пачку) и прочие материалы, которые
+уходят на пачку (мешки и т.п.). Нормы расхода прочих материалов на пачку
+берутся из истории фасовок этого сырья за PLAN_HISTORY_DAYS дней:
+сумма списанного материала / сумма пачек.
+
+Режимы:
+- пропорция r (например 2/1/1) — пачки строго в пропорции, k·r, где
+  k = min по ресурсам ⌊остаток / расход на одну "партию" r⌋;
+- максимум — наибольший фасованный вес;
+- спрос — как максимум, но по каждой продукции не больше заявленного.
+
+Максимум ищется жадно (сначала тяжёлые пачки — меньше наклеек и мешков
+на килограмм) с последующим перебором: у каждой продукции снимается до
+max(вес) пачек и остаток заполняется заново — так добирается хвост сырья,
+который не делится на вес самой тяжёлой пачки.
+
+Нормы материалов кешируются на PLAN_CACHE_TTL секунд по сырью и набору его
+продукции (id, название, вес); продукция и остатки читаются при каждом
+расчёте, поэтому добавление или правка продукции (в том числе в другом
+процессе — бот и веб) сразу даёт новый ключ кеша.
+"""
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional, Sequence
+
+from cachetools import TTLCache
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.models import Material, MaterialStock, Product, RawMaterialStorage
+from bot.models.packaging import Packaging
+from bot.models.packaging_material import PackagingMaterial
+from bot.services.material_service import STICKER_MATERIAL
+
+PLAN_CACHE_TTL = 300  # секунд
+PLAN_HISTORY_DAYS = 180
+RAW_RESOURCE = "Сырьё"
+EPSILON = 1e-9  # остатки материалов — float
+
+_inputs = TTLCache(maxsize=256, ttl=PLAN_CACHE_TTL)
+
+
+class PlanProduct(NamedTuple):
+    id: int
+    name: str
+    weight: int
+
+
+class MaterialNorm(NamedTuple):
+    """Расход материала на одну пачку каждой продукции (в порядке PlanInput.products)."""
+    material_id: int
+    name: str
+    usage: tuple
+
+
+class PlanInput(NamedTuple):
+    products: tuple
+    materials: tuple
+
+
+class Resource(NamedTuple):
+    name: str
+    available: float
+    usage: tuple
+
+
+class PackPlan(NamedTuple):
+    products: tuple
+    packs: tuple
+    used_raw: int
+    raw_available: int
+    limit: Optional[str]  # ресурс, который закончится первым (None — упёрлись в спрос)
+    resources: tuple  # (название, доступно, потребуется)
+
+    def as_dict(self) -> dict:
+        return {
+            "products": [
+                {"id": product.id, "name": product.name, "weight": product.weight, "packs": packs}
+                for product, packs in zip(self.products, self.packs)
+            ],
+            "used_raw": self.used_raw,
+            "raw_available": self.raw_available,
+            "limit": self.limit,
+            "resources": [
+                {"name": name, "available": available, "required": required}
+                for name, available, required in self.resources
+            ],
+        }
+
+
+def invalidate_plans():
+    """Сбрасывает кеш справочных данных планировщика."""
+    _inputs.clear()
+
+
+def parse_counts(text: str, size: int, what: str = "пропорции") -> tuple:
+    """'2/1/1' -> (2, 1, 1); чисел должно быть столько же, сколько продукции."""
+    try:
+        counts = tuple(int(part) for part in text.replace(" ", "").split("/"))
+    except ValueError:
+        raise ValueError(f"Неверный формат {what}: введите целые числа через /")
+    if len(counts) != size:
+        raise ValueError(f"Неверный формат {what}: нужно {size} чисел через / — по одному на продукцию")
+    if any(count < 0 for count in counts) or not any(counts):
+        raise ValueError(f"Неверный формат {what}: числа не могут быть отрицательными или все нулевыми")
+    return counts
+
+
+def _used(resources: Sequence[Resource], packs: Sequence[int]) -> list:
+    return [sum(rate * count for rate, count in zip(resource.usage, packs)) for resource in resources]
+
+
+def _room(resources: Sequence[Resource], used: Sequence[float], usage: Sequence[float]):
+    """Сколько раз ещё помещается вектор расхода usage и какой ресурс ограничивает."""
+    room, limit = None, None
+    for resource, spent, rate in zip(resources, used, usage):
+        if rate <= 0:
+            continue
+        fits = max(int((resource.available - spent) / rate + EPSILON), 0)
+        if room is None or fits < room:
+            room, limit = fits, resource.name
+    return room, limit
+
+
+def plan_ratio(resources: Sequence[Resource], ratio: Sequence[int]):
+    """Наибольшее k, при котором k·ratio помещается во все ресурсы."""
+    batch = [sum(rate * part for rate, part in zip(resource.usage, ratio)) for resource in resources]
+    batches, limit = _room(resources, [0] * len(resources), batch)
+    return tuple(batches * part for part in ratio), limit
+
+
+def _fill(resources, packs, caps, order):
+    packs = list(packs)
+    used = _used(resources, packs)
+    for index in order:
+        usage = [resource.usage[index] for resource in resources]
+        room, _ = _room(resources, used, usage)
+        add = min(room, caps[index] - packs[index]) if caps else room
+        if add > 0:
+            packs[index] += add
+            used = [spent + rate * add for spent, rate in zip(used, usage)]
+    return packs
+
+
+def plan_max(products: Sequence[PlanProduct], resources: Sequence[Resource], caps: Optional[Sequence[int]] = None):
+    """Наибольший фасованный вес (при caps — не больше caps[i] пачек продукции i)."""
+    weights = [product.weight for product in products]
+    order = sorted(range(len(products)), key=lambda index: -weights[index])
+
+    def output(packs):
+        return sum(weight * count for weight, count in zip(weights, packs))
+
+    best = _fill(resources, [0] * len(products), caps, order)
+    for index in order:
+        tail = [other for other in order if other != index] + [index]
+        for removed in range(1, min(best[index], max(weights)) + 1):
+            start = list(best)
+            start[index] -= removed
+            candidate = _fill(resources, start, caps, tail)
+            if output(candidate) > output(best):
+                best = candidate
+
+    # Ресурс, из-за которого не помещается ещё одна пачка продукции, не упёршейся в спрос
+    limit = None
+    used = _used(resources, best)
+    for index in order:
+        if caps and best[index] >= caps[index]:
+            continue
+        room, name = _room(resources, used, [resource.usage[index] for resource in resources])
+        if room == 0:
+            limit = name
+            break
+    return tuple(best), limit
+
+
+async def _load_products(session: AsyncSession, raw_product_id: int) -> tuple:
+    result = await session.execute(
+        select(Product.id, Product.name, Product.weight)
+        .where(Product.raw_product_id == raw_product_id)
+        .order_by(Product.id)
+    )
+    return tuple(PlanProduct(*row) for row in result.all())
+
+
+async def _load_input(session: AsyncSession, raw_product_id: int, products: tuple) -> PlanInput:
+    position = {product.id: index for index, product in enumerate(products)}
+
+    since = datetime.utcnow() - timedelta(days=PLAN_HISTORY_DAYS)
+    result = await session.execute(
+        select(
+            Packaging.product_id, PackagingMaterial.material_id, Material.name,
+            func.sum(PackagingMaterial.quantity), func.sum(Packaging.amount),
+        )
+        .join(PackagingMaterial, PackagingMaterial.packaging_id == Packaging.id)
+        .join(Material, Material.id == PackagingMaterial.material_id)
+        .where(Packaging.raw_product_id == raw_product_id, Packaging.amount > 0, Packaging.date >= since)
+        .group_by(Packaging.product_id, PackagingMaterial.material_id, Material.name)
+    )
+    usage, names = {}, {}
+    for product_id, material_id, name, quantity, packs in result.all():
+        if product_id in position and quantity and packs:
+            usage.setdefault(material_id, [0.0] * len(products))[position[product_id]] = quantity / packs
+            names[material_id] = name
+
+    # Наклейка списывается на каждую пачку, даже если истории ещё нет
+    sticker_id = await session.scalar(select(Material.id).where(Material.name == STICKER_MATERIAL))
+    if sticker_id is not None:
+        usage[sticker_id] = [1.0] * len(products)
+        names[sticker_id] = STICKER_MATERIAL
+
+    materials = tuple(
+        MaterialNorm(material_id, names[material_id], tuple(usage[material_id])) for material_id in sorted(usage)
+    )
+    return PlanInput(products, materials)
+
+
+async def get_plan_input(session: AsyncSession, raw_product_id: int) -> PlanInput:
+    """Продукция сырья и нормы материалов на пачку (нормы кешируются на PLAN_CACHE_TTL)."""
+    products = await _load_products(session, raw_product_id)
+    key = (raw_product_id, products)
+    plan_input = _inputs.get(key)
+    if plan_input is None:
+        plan_input = _inputs[key] = await _load_input(session, raw_product_id, products)
+    return plan_input
+
+
+async def plan_packaging(
+    session: AsyncSession,
+    raw_product_id: int,
+    ratio: Optional[str] = None,
+    demand: Optional[str] = None,
+) -> PackPlan:
+    """План фасовки из текущих остатков сырья и материалов.
+
+    ratio — пропорция "2/1/1", demand — нужное количество пачек "10/0/5"
+    (по продукции в порядке id); без обоих — максимум выпуска.
+    Ошибки ввода — ValueError с текстом для пользователя.
+    """
+    plan_input = await get_plan_input(session, raw_product_id)
+    products = plan_input.products
+    if not products:
+        raise ValueError("Для данного сырья нет продукции")
+
+    raw_available = await session.scalar(
+        select(RawMaterialStorage.amount).where(RawMaterialStorage.raw_product_id == raw_product_id)
+    ) or 0
+    stock = {}
+    if plan_input.materials:
+        result = await session.execute(
+            select(MaterialStock.material_id, MaterialStock.quantity)
+            .where(MaterialStock.material_id.in_([norm.material_id for norm in plan_input.materials]))
+        )
+        stock = dict(result.all())
+
+    resources = [Resource(RAW_RESOURCE, raw_available, tuple(product.weight for product in products))]
+    resources += [
+        Resource(norm.name, stock.get(norm.material_id) or 0.0, norm.usage) for norm in plan_input.materials
+    ]
+
+    if ratio:
+        packs, limit = plan_ratio(resources, parse_counts(ratio, len(products)))
+    else:
+        caps = parse_counts(demand, len(products), "спроса") if demand else None
+        packs, limit = plan_max(products, resources, caps)
+
+    required = _used(resources, packs)
+    return PackPlan(
+        products=products,
+        packs=packs,
+        used_raw=int(required[0]),
+        raw_available=raw_available,
+        limit=limit,
+        resources=tuple(
+            (resource.name, resource.available, round(spent, 3)) for resource, spent in zip(resources, required)
+        ),
+    )
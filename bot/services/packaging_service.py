@@ -1,11 +1,15 @@
-from datetime import datetime
+from typing import Optional
 
+from sqlalchemy import func, literal, null, or_, union_all
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
-from bot.models import Product, ProductStorage, RawProduct, RawMaterialStorage
-from bot.models.packaging import Packaging
-from bot.models.arrival import Arrival
+from bot.exceptions import InsufficientMaterialError, InsufficientStockError, InvalidDataError
+from bot.models import Material, MaterialStock, Product, ProductStorage, RawProduct, RawMaterialStorage
+from bot.models.packaging import Packaging, PackagingMaterial
+from bot.services.material_service import STICKER_MATERIAL, consume_material, reverse_material_consumption
+from bot.services.stock_ledger import SOURCE_PACKAGING
+from bot.services.storage import change_product_stock, change_raw_stock
 
 
 async def get_raw_materials(session: AsyncSession):
@@ -27,130 +31,150 @@ async def get_products_for_raw_material(session: AsyncSession, raw_product_id: i
     return result.all()
 
 
-async def calculate_packaging_ratio(
-        session: AsyncSession,
-        raw_product_id: int,
-        ratio: str,
-        raw_amount: int
-):
-    """Рассчитываем количество пачек по заданной пропорции"""
-    try:
-        ratio_parts = list(map(int, ratio.split('/')))
-        if len(ratio_parts) != 2:
-            return None, "Неверный формат пропорции. Используйте X/Y"
-
-        products = await get_products_for_raw_material(session, raw_product_id)
-        if len(products) != 2:
-            return None, "Для данного сырья должно быть ровно 2 вида продукции"
-
-        product1, amount1 = products[0]
-        product2, amount2 = products[1]
-
-        # Рассчитываем возможное количество пачек
-        total_ratio = ratio_parts[0] * product1.weight + ratio_parts[1] * product2.weight
-        batches = raw_amount // total_ratio
-
-        packs1 = batches * ratio_parts[0]
-        packs2 = batches * ratio_parts[1]
-
-        return {
-            product1.name: packs1,
-            product2.name: packs2,
-            "used_raw": batches * total_ratio
-        }, None
-    except Exception as e:
-        return None, f"Ошибка расчета: {str(e)}"
+def _availability_query(product_id: int, material_ids: list[int]):
+    """Одним запросом: вес продукта и остаток его сырья, остатки и способ оценки материалов (и наклеек)."""
+    raw = (
+        select(
+            literal("raw").label("kind"), Product.raw_product_id.label("id"), RawProduct.name.label("name"),
+            Product.weight.label("weight"), func.coalesce(RawMaterialStorage.amount, 0).label("available"),
+            null().label("method"),
+        )
+        .join(RawProduct, RawProduct.id == Product.raw_product_id)
+        .outerjoin(RawMaterialStorage, RawMaterialStorage.raw_product_id == Product.raw_product_id)
+        .where(Product.id == product_id)
+    )
+    materials = (
+        select(
+            literal("material"), Material.id, Material.name, null(), func.coalesce(MaterialStock.quantity, 0),
+            Material.valuation_method,
+        )
+        .outerjoin(MaterialStock, MaterialStock.material_id == Material.id)
+        .where(or_(Material.id.in_(material_ids), Material.name == STICKER_MATERIAL))
+    )
+    return union_all(raw, materials)
 
 
-async def save_packaging(
+async def record_packaging(
     session: AsyncSession,
     user_id: int,
     product_id: int,
-    raw_product_id: int,
     amount: int,
-    used_raw: int
-):
-    """Сохраняет информацию об одной фасовке"""
-    packaging = Packaging(
-        product_id=product_id,
-        raw_product_id=raw_product_id,
-        amount=amount,
-        used_raw_material=used_raw,
-        user_id=user_id
-    )
-    session.add(packaging)
-    await session.commit()
-    return packaging
-
-
-async def update_stock_after_packaging(
-        session: AsyncSession,
-        product_id: int,
-        raw_product_id: int,
-        amount: int,
-        used_raw: int
-):
-    """Обновляет складские остатки после фасовки"""
-    from bot.models import ProductStorage, RawMaterialStorage
-
-    # Уменьшаем сырье
-    raw_stock = await session.get(RawMaterialStorage, raw_product_id)
-    raw_stock.amount -= used_raw
-
-    # Увеличиваем готовую продукцию
-    product_stock = await session.execute(
-        select(ProductStorage)
-        .where(ProductStorage.product_id == product_id)
-    )
-    product_stock = product_stock.scalar_one()
-    product_stock.amount += amount
-
-    await session.commit()
-
-
-# async def check_raw_material_available(
-#     session: AsyncSession,
-#     raw_product_id: int,
-#     required_amount: int
-# ) -> bool:
-#     """Проверяет, достаточно ли сырья на складе"""
-#     result = await session.execute(
-#         select(RawMaterialStorage.amount)
-#         .where(RawMaterialStorage.raw_product_id == raw_product_id)
-#     )
-#     current_amount = result.scalar_one_or_none()
-#     return current_amount is not None and current_amount >= required_amount
-
-
-async def update_stock_after_packaging(
-        session: AsyncSession,
-        product_id: int,
-        raw_product_id: int,
-        amount: int,
-        used_raw: int
-):
-    """Обновляет складские остатки после фасовки с проверкой"""
-    # Уменьшаем сырье
-    raw_stock = await session.execute(
-        select(RawMaterialStorage)
-        .where(RawMaterialStorage.raw_product_id == raw_product_id)
-    )
-    raw_stock = raw_stock.scalar_one()
-
-    if raw_stock.amount < used_raw:
-        raise ValueError("Недостаточно сырья на складе для обновления")
+    materials: Optional[dict[int, float]] = None,
+) -> Packaging:
+    """Фасовка одной транзакцией: запись фасовки, списание сырья, приход продукции,
+    списание наклеек (1 на пачку) и материалов materials (material_id -> количество) по FIFO
+    и их стоимость.
+
+    Сырьё и материалы проверяются заранее одним запросом; нехватка —
+    InsufficientStockError (для материалов — InsufficientMaterialError),
+    неизвестный продукт или материал — InvalidDataError.
+    При любой ошибке транзакция откатывается целиком.
+    """
+    if amount <= 0:
+        raise InvalidDataError("Количество пачек должно быть положительным")
+    needed = {material_id: qty for material_id, qty in (materials or {}).items() if qty > 0}
+
+    rows = (await session.execute(_availability_query(product_id, list(needed)))).all()
+    raw = next((row for row in rows if row.kind == "raw"), None)
+    if raw is None:
+        raise InvalidDataError("Продукт не найден")
+    used_raw = amount * raw.weight
+    if raw.available < used_raw:
+        raise InsufficientStockError(raw.name, used_raw, raw.available)
+
+    found = {row.id: row for row in rows if row.kind == "material"}
+    for row in found.values():
+        if row.name == STICKER_MATERIAL:
+            needed[row.id] = needed.get(row.id, 0) + amount
+    for material_id, qty in needed.items():
+        if material_id not in found:
+            raise InvalidDataError(f"Материал id={material_id} не найден")
+        if found[material_id].available + 0.005 < qty:
+            raise InsufficientMaterialError(found[material_id].name, qty, found[material_id].available)
 
-    raw_stock.amount -= used_raw
+    try:
+        packaging = Packaging(
+            product_id=product_id,
+            raw_product_id=raw.id,
+            amount=amount,
+            used_raw_material=used_raw,
+            user_id=user_id,
+        )
+        session.add(packaging)
+        await session.flush()
+        # Проверка выше могла устареть (параллельная фасовка) — списание всё равно атомарное
+        await change_raw_stock(session, raw.id, -used_raw, source=SOURCE_PACKAGING)
+        await change_product_stock(session, product_id, amount, source=SOURCE_PACKAGING)
+
+        total_cost = 0.0
+        for material_id, qty in needed.items():
+            try:
+                total_cost += await consume_material(
+                    session, material_id, qty, packaging.id, method=found[material_id].method,
+                )
+            except ValueError:
+                # Партии уже разобраны другой фасовкой
+                raise InsufficientMaterialError(found[material_id].name, qty, found[material_id].available)
+        packaging.total_material_cost = round(total_cost, 2)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    return packaging
 
-    # Увеличиваем готовую продукцию
-    product_stock = await session.execute(
-        select(ProductStorage)
-        .where(ProductStorage.product_id == product_id)
-    )
-    product_stock = product_stock.scalar_one()
-    product_stock.amount += amount
 
-    await session.commit()
+async def update_packaging_materials(
+    session: AsyncSession,
+    packaging: Packaging,
+    materials: Optional[dict[int, float]] = None,
+) -> float:
+    """Приводит списанные материалы фасовки к новому составу: наклейки — по
+    packaging.amount, остальное — materials (material_id -> количество).
+
+    Отменяется и списывается заново только то, что изменилось; остаток
+    возвращается в исходные партии (reverse_material_consumption), поэтому
+    повторное списание по FIFO берёт те же партии. Нехватка —
+    InsufficientMaterialError. Коммит — за вызывающим.
+    Возвращает новую общую стоимость материалов фасовки.
+    """
+    wanted = {material_id: qty for material_id, qty in (materials or {}).items() if qty > 0}
+    sticker_id = (await session.execute(
+        select(Material.id).where(Material.name == STICKER_MATERIAL)
+    )).scalar_one_or_none()
+    if sticker_id is not None:
+        wanted[sticker_id] = wanted.get(sticker_id, 0) + packaging.amount
+
+    current = {
+        material_id: (qty, cost)
+        for material_id, qty, cost in (await session.execute(
+            select(PackagingMaterial.material_id, func.sum(PackagingMaterial.quantity), func.sum(PackagingMaterial.cost))
+            .where(PackagingMaterial.packaging_id == packaging.id)
+            .group_by(PackagingMaterial.material_id)
+        )).all()
+    }
+    changed = {
+        material_id for material_id in current.keys() | wanted.keys()
+        if abs(current.get(material_id, (0, 0))[0] - wanted.get(material_id, 0)) > 0.005
+    }
+    await reverse_material_consumption(session, packaging.id, changed)
+
+    total_cost = sum(cost for material_id, (_, cost) in current.items() if material_id not in changed)
+    consumed = changed & wanted.keys()
+    methods = dict((await session.execute(
+        select(Material.id, Material.valuation_method).where(Material.id.in_(consumed))
+    )).all()) if consumed else {}
+    for material_id in consumed:
+        try:
+            total_cost += await consume_material(
+                session, material_id, wanted[material_id], packaging.id, method=methods.get(material_id),
+            )
+        except ValueError:
+            material = await session.get(Material, material_id)
+            stock = await session.get(MaterialStock, material_id)
+            raise InsufficientMaterialError(
+                material.name if material else f"id={material_id}", wanted[material_id], stock.quantity if stock else 0
+            )
+    return round(total_cost, 2)
 
 
 async def get_raw_material_availability(
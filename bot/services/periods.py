@@ -0,0 +1,98 @@
+"""Периоды отчётов и условия отбора по дате.
+
+Все условия строятся как полуинтервал column >= start AND column < end:
+столбец не оборачивается в функции (extract, strftime), поэтому работает
+индекс по дате, а месяц всегда сравнивается вместе с годом.
+
+Для группировки по дням и месяцам используются day_bucket и month_bucket —
+они компилируются в функции текущей СУБД (SQLite или PostgreSQL).
+"""
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+
+from sqlalchemy import and_, Date, DateTime, String
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+class Period(NamedTuple):
+    """Полуинтервал дней [start, end)."""
+    start: date
+    end: date
+
+    def where(self, column):
+        """Условие попадания значения столбца в период."""
+        start, end = self.start, self.end
+        if isinstance(column.type, DateTime):
+            start = datetime.combine(start, datetime.min.time())
+            end = datetime.combine(end, datetime.min.time())
+        return and_(column >= start, column < end)
+
+    @property
+    def last_day(self) -> date:
+        """Последний день периода включительно."""
+        return self.end - timedelta(days=1)
+
+
+def today() -> date:
+    """Текущий день (даты в БД хранятся в UTC)."""
+    return datetime.utcnow().date()
+
+
+def month_period(year: int = None, month: int = None) -> Period:
+    """Календарный месяц; по умолчанию текущий."""
+    if year is None or month is None:
+        current = today()
+        year, month = current.year, current.month
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return Period(start, end)
+
+
+def previous_month_period() -> Period:
+    """Последний завершённый календарный месяц."""
+    last_day = today().replace(day=1) - timedelta(days=1)
+    return month_period(last_day.year, last_day.month)
+
+
+def days_period(first_day: date, last_day: date) -> Period:
+    """Период с first_day по last_day включительно."""
+    if isinstance(first_day, datetime):
+        first_day = first_day.date()
+    if isinstance(last_day, datetime):
+        last_day = last_day.date()
+    return Period(first_day, last_day + timedelta(days=1))
+
+
+class day_bucket(FunctionElement):
+    """День значения даты/времени (для GROUP BY по дням)."""
+    type = Date()
+    name = "day_bucket"
+    inherit_cache = True
+
+
+class month_bucket(FunctionElement):
+    """Месяц значения даты/времени в виде строки 'ГГГГ-ММ' (для GROUP BY по месяцам)."""
+    type = String()
+    name = "month_bucket"
+    inherit_cache = True
+
+
+@compiles(day_bucket)
+def _day_bucket_default(element, compiler, **kw):
+    return "CAST(%s AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_bucket, "sqlite")
+def _day_bucket_sqlite(element, compiler, **kw):
+    return "date(%s)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(month_bucket)
+def _month_bucket_default(element, compiler, **kw):
+    return "to_char(%s, 'YYYY-MM')" % compiler.process(element.clauses, **kw)
+
+
+@compiles(month_bucket, "sqlite")
+def _month_bucket_sqlite(element, compiler, **kw):
+    return "strftime('%%Y-%%m', %s)" % compiler.process(element.clauses, **kw)
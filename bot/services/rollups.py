@@ -0,0 +1,308 @@
+"""Дневные сводные таблицы для статистики.
+
+Итоги обновляются автоматически при каждом flush сессии: по изменённым
+Arrival, Packaging, Expense, Shipment и ShipmentItem вычисляются приращения
+(старое значение вычитается, новое прибавляется) и записываются в той же
+транзакции. Вставки в обход ORM (insert(...) списком) должны сами вызывать
+apply_rollup_deltas.
+
+Изменение выпуска, стоимости материалов или расходов увеличивает версию
+"costs" в cache_versions — по ней расчёты себестоимости понимают, что
+данные изменились (cost_service).
+"""
+from collections import defaultdict
+from datetime import date, datetime
+
+from sqlalchemy import event, select, func, delete, insert, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from bot.models.arrival import Arrival
+from bot.models.cache_version import CacheVersion
+from bot.models.expense import Expense
+from bot.models.packaging import Packaging
+from bot.models.rollups import DailyProductRollup, DailyRawRollup, DailyExpenseRollup
+from bot.models.shipment import Shipment, ShipmentItem
+from bot.services.counters import increment, increment_many, increment_many_sync, increment_sync
+from bot.services.periods import day_bucket
+
+ROLLUP_MODELS = (DailyProductRollup, DailyRawRollup, DailyExpenseRollup)
+
+COSTS_VERSION = "costs"
+# Поля сводок, от которых зависит себестоимость
+_COST_FIELDS = {DailyProductRollup: ("used_raw_kg", "material_cost"), DailyExpenseRollup: ("amount",)}
+
+_FIELDS = {
+    Packaging: ("date", "product_id", "raw_product_id", "amount", "used_raw_material", "total_material_cost"),
+    Arrival: ("date", "raw_product_id", "amount"),
+    Expense: ("date", "category", "amount"),
+    ShipmentItem: ("shipment_id", "product_id", "quantity"),
+}
+
+
+class RollupDeltas:
+    """Накопитель приращений: (модель, ключ) -> {поле: приращение}."""
+
+    def __init__(self):
+        self.items = defaultdict(lambda: defaultdict(float))
+
+    def add(self, model, keys: tuple, **deltas):
+        row = self.items[(model, keys)]
+        for name, value in deltas.items():
+            row[name] += value or 0
+
+    def packaging(self, values: dict, sign: int):
+        day = to_day(values["date"])
+        self.add(
+            DailyProductRollup, (day, values["product_id"]),
+            packed_units=sign * (values["amount"] or 0),
+            used_raw_kg=sign * (values["used_raw_material"] or 0),
+            material_cost=sign * (values["total_material_cost"] or 0),
+        )
+        self.add(
+            DailyRawRollup, (day, values["raw_product_id"]),
+            used_kg=sign * (values["used_raw_material"] or 0),
+        )
+
+    def arrival(self, values: dict, sign: int):
+        self.add(
+            DailyRawRollup, (to_day(values["date"]), values["raw_product_id"]),
+            arrived_kg=sign * (values["amount"] or 0),
+            arrivals_count=sign,
+        )
+
+    def expense(self, values: dict, sign: int):
+        self.add(
+            DailyExpenseRollup, (to_day(values["date"]), values["category"] or ""),
+            amount=sign * (values["amount"] or 0),
+            expenses_count=sign,
+        )
+
+    def shipment_item(self, day: date, product_id: int, quantity: int, sign: int):
+        self.add(DailyProductRollup, (day, product_id), shipped_units=sign * (quantity or 0))
+
+
+_KEY_COLUMNS = {
+    DailyProductRollup: ("day", "product_id"),
+    DailyRawRollup: ("day", "raw_product_id"),
+    DailyExpenseRollup: ("day", "category"),
+}
+
+_INT_COLUMNS = {"packed_units", "used_raw_kg", "shipped_units", "arrived_kg", "arrivals_count", "used_kg",
+                "expenses_count"}
+
+
+def _rows(deltas: RollupDeltas):
+    """Ненулевые приращения в виде (модель, ключи, значения)."""
+    for (model, keys), values in deltas.items.items():
+        values = {
+            name: int(round(value)) if name in _INT_COLUMNS else round(value, 2)
+            for name, value in values.items()
+        }
+        if any(values.values()):
+            yield model, dict(zip(_KEY_COLUMNS[model], keys)), values
+
+
+def _by_model(deltas: RollupDeltas) -> dict:
+    rows = defaultdict(list)
+    for model, keys, values in _rows(deltas):
+        rows[model].append((keys, values))
+    return rows
+
+
+def _touches_costs(rows_by_model: dict) -> bool:
+    return any(
+        values.get(name)
+        for model, names in _COST_FIELDS.items()
+        for _, values in rows_by_model.get(model, ())
+        for name in names
+    )
+
+
+async def apply_rollup_deltas(session: AsyncSession, deltas: RollupDeltas):
+    """Записывает накопленные приращения в сводные таблицы (команда на таблицу, а не на строку)."""
+    rows_by_model = _by_model(deltas)
+    for model, rows in rows_by_model.items():
+        await increment_many(session, model, rows)
+    if _touches_costs(rows_by_model):
+        await increment(session, CacheVersion, {"name": COSTS_VERSION}, {"version": 1}, updated_at=datetime.utcnow())
+
+
+def to_day(value) -> date:
+    """День операции; незаполненная или вычисляемая в БД дата — сегодняшний день."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return datetime.utcnow().date()
+
+
+def _committed(obj, name):
+    """Значение атрибута до текущего flush."""
+    history = inspect(obj).attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, name)
+
+
+def _snapshot(obj, committed: bool) -> dict:
+    fields = _FIELDS[type(obj)]
+    if committed:
+        return {name: _committed(obj, name) for name in fields}
+    return {name: getattr(obj, name) for name in fields}
+
+
+def _shipment_day(session, shipments: dict, shipment_id, committed: bool) -> date:
+    shipment = shipments.get(shipment_id)
+    if shipment is None:
+        with session.no_autoflush:
+            shipment = session.get(Shipment, shipment_id)
+    if shipment is None:
+        return to_day(None)
+    return to_day(_committed(shipment, "timestamp") if committed else shipment.timestamp)
+
+
+def _collect(session) -> RollupDeltas:
+    deltas = RollupDeltas()
+    handlers = {
+        Packaging: deltas.packaging,
+        Arrival: deltas.arrival,
+        Expense: deltas.expense,
+    }
+    tracked = (*_FIELDS, Shipment)
+    changes = [(obj, "new") for obj in session.new if isinstance(obj, tracked)]
+    changes += [(obj, "deleted") for obj in session.deleted if isinstance(obj, tracked)]
+    changes += [
+        (obj, "dirty") for obj in session.dirty
+        if isinstance(obj, tracked) and session.is_modified(obj)
+    ]
+
+    shipments = {
+        obj.id: obj for obj, _ in changes if isinstance(obj, Shipment) and obj.id is not None
+    }
+    flushed_items = set()
+
+    for obj, kind in changes:
+        obj_type = type(obj)
+        if obj_type in handlers:
+            handler = handlers[obj_type]
+            if kind != "new":
+                old = _snapshot(obj, committed=True)
+            if kind != "deleted":
+                new = _snapshot(obj, committed=False)
+            if kind == "dirty" and old == new:
+                continue
+            if kind != "new":
+                handler(old, -1)
+            if kind != "deleted":
+                handler(new, 1)
+        elif obj_type is ShipmentItem:
+            flushed_items.add(obj.id)
+            if kind != "new":
+                old = _snapshot(obj, committed=True)
+                day = _shipment_day(session, shipments, old["shipment_id"], committed=True)
+                deltas.shipment_item(day, old["product_id"], old["quantity"], -1)
+            if kind != "deleted":
+                day = _shipment_day(session, shipments, obj.shipment_id, committed=False)
+                deltas.shipment_item(day, obj.product_id, obj.quantity, 1)
+
+    # Перенос даты отгрузки: переносим и позиции, не менявшиеся в этом flush
+    for obj, kind in changes:
+        if not isinstance(obj, Shipment) or kind != "dirty":
+            continue
+        old_day = to_day(_committed(obj, "timestamp"))
+        new_day = to_day(obj.timestamp)
+        if old_day == new_day:
+            continue
+        items = session.execute(
+            select(ShipmentItem.id, ShipmentItem.product_id, ShipmentItem.quantity)
+            .where(ShipmentItem.shipment_id == obj.id)
+        ).all()
+        for item_id, product_id, quantity in items:
+            if item_id in flushed_items:
+                continue
+            deltas.shipment_item(old_day, product_id, quantity, -1)
+            deltas.shipment_item(new_day, product_id, quantity, 1)
+
+    return deltas
+
+
+@event.listens_for(Session, "after_flush")
+def _update_rollups(session, flush_context):
+    rows_by_model = _by_model(_collect(session))
+    for model, rows in rows_by_model.items():
+        increment_many_sync(session, model, rows)
+    if _touches_costs(rows_by_model):
+        increment_sync(session, CacheVersion, {"name": COSTS_VERSION}, {"version": 1}, updated_at=datetime.utcnow())
+
+
+def _as_day(value) -> date:
+    return to_day(str(value) if value is not None else None)
+
+
+async def rebuild_rollups(session: AsyncSession) -> dict:
+    """Полностью пересчитывает сводные таблицы по исходным данным.
+
+    Возвращает количество записанных строк по каждой таблице.
+    """
+    deltas = RollupDeltas()
+
+    packaging_day = day_bucket(Packaging.date)
+    result = await session.execute(
+        select(
+            packaging_day,
+            Packaging.product_id,
+            Packaging.raw_product_id,
+            func.sum(Packaging.amount),
+            func.sum(Packaging.used_raw_material),
+            func.sum(Packaging.total_material_cost),
+        ).group_by(packaging_day, Packaging.product_id, Packaging.raw_product_id)
+    )
+    for day, product_id, raw_product_id, amount, used_raw, cost in result.all():
+        deltas.packaging({
+            "date": _as_day(day), "product_id": product_id, "raw_product_id": raw_product_id,
+            "amount": amount, "used_raw_material": used_raw, "total_material_cost": cost,
+        }, 1)
+
+    arrival_day = day_bucket(Arrival.date)
+    result = await session.execute(
+        select(arrival_day, Arrival.raw_product_id, func.sum(Arrival.amount), func.count(Arrival.id))
+        .group_by(arrival_day, Arrival.raw_product_id)
+    )
+    for day, raw_product_id, amount, count in result.all():
+        deltas.add(DailyRawRollup, (_as_day(day), raw_product_id), arrived_kg=amount, arrivals_count=count)
+
+    expense_day = day_bucket(Expense.date)
+    result = await session.execute(
+        select(expense_day, Expense.category, func.sum(Expense.amount), func.count(Expense.id))
+        .group_by(expense_day, Expense.category)
+    )
+    for day, category, amount, count in result.all():
+        deltas.add(DailyExpenseRollup, (_as_day(day), category or ""), amount=amount, expenses_count=count)
+
+    shipment_day = day_bucket(Shipment.timestamp)
+    result = await session.execute(
+        select(shipment_day, ShipmentItem.product_id, func.sum(ShipmentItem.quantity))
+        .join(Shipment, Shipment.id == ShipmentItem.shipment_id)
+        .group_by(shipment_day, ShipmentItem.product_id)
+    )
+    for day, product_id, quantity in result.all():
+        deltas.shipment_item(_as_day(day), product_id, quantity, 1)
+
+    for model in ROLLUP_MODELS:
+        await session.execute(delete(model))
+
+    rows = defaultdict(list)
+    for model, keys, values in _rows(deltas):
+        empty = {column: 0 for column in model.__table__.columns.keys() if column not in keys}
+        rows[model].append({**empty, **keys, **values})
+    for model, model_rows in rows.items():
+        await session.execute(insert(model.__table__), model_rows)
+    await increment(session, CacheVersion, {"name": COSTS_VERSION}, {"version": 1}, updated_at=datetime.utcnow())
+    await session.commit()
+
+    return {model.__tablename__: len(rows.get(model, [])) for model in ROLLUP_MODELS}
@@ -1,7 +1,9 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from datetime import datetime, time
+from bot.fsm.storage import delete_expired_states
 from bot.handlers.stock_handlers import send_daily_stock_report
 from bot.models.database import async_session
+from bot.services.stock_ledger import fill_snapshots
 
 class SchedulerService:
     def __init__(self, bot):
@@ -17,6 +19,9 @@ class SchedulerService:
             minute=00,
             timezone='Europe/Moscow'
         )
+        self.scheduler.add_job(self._safe_cleanup_fsm, 'interval', hours=1)
+        # Снимок остатков на полночь UTC — с запасом на транзакции, начатые до полуночи
+        self.scheduler.add_job(self._safe_stock_snapshot, 'cron', hour=0, minute=15, timezone='UTC')
         self.scheduler.start()
 
     async def _safe_send_report(self):
@@ -24,4 +29,20 @@ class SchedulerService:
             async with async_session() as session:
                 await send_daily_stock_report(self.bot, session)
         except Exception as e:
-            print(f"Критическая ошибка в планировщике: {str(e)}")
\ No newline at end of file
+            print(f"Критическая ошибка в планировщике: {str(e)}")
+
+    async def _safe_cleanup_fsm(self):
+        """Удаляет брошенные диалоги (состояния FSM старше FSM_STATE_TTL_HOURS)"""
+        try:
+            async with async_session() as session:
+                await delete_expired_states(session)
+        except Exception as e:
+            print(f"Ошибка очистки состояний FSM: {str(e)}")
+
+    async def _safe_stock_snapshot(self):
+        """Сохраняет остатки на начало дня (stock_ledger)"""
+        try:
+            async with async_session() as session:
+                await fill_snapshots(session)
+        except Exception as e:
+            print(f"Ошибка снимка остатков: {str(e)}")
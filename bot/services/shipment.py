@@ -2,51 +2,78 @@ from datetime import datetime
 
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
-async def create_shipment(
-        session: AsyncSession,
-        telegram_id: int,  # Используем telegram_id вместо user_id
-
-):
-    user = await session.execute(select(User).where(User.telegram_id == telegram_id))
-    user = user.scalar_one()
+from sqlalchemy.orm import selectinload
 
-    # Создаем запись об отгрузке
-    shipment = Shipment(
-        user_id=user.id,  # Используем внутренний id пользователя
-        timestamp=datetime.now()
-    )
-    session.add(shipment)
-    await session.flush()
-    await session.commit()
-    return shipment
+from bot.exceptions import InsufficientStockError, InvalidDataError
+from bot.models import Shipment, ShipmentItem, Product, ProductStorage, User
+from bot.services.change_tracking import insert_audited
+from bot.services.rollups import RollupDeltas, apply_rollup_deltas, to_day
+from bot.services.stock_ledger import SOURCE_SHIPMENT
+from bot.services.storage import change_product_stock, change_product_stocks
 
-from sqlalchemy.orm import selectinload
 
+def merge_items(items) -> dict[int, int]:
+    """Позиции [(product_id, quantity), ...] -> {product_id: общее количество} (порядок сохраняется)."""
+    merged = {}
+    for product_id, quantity in items:
+        merged[product_id] = merged.get(product_id, 0) + quantity
+    return merged
 
 
-from bot.models import Shipment, ShipmentItem, Product, ProductStorage, User
+async def create_shipment_with_items(
+        session: AsyncSession,
+        user_id: int,
+        items,
+        timestamp: datetime = None,
+) -> Shipment:
+    """Создаёт отгрузку с позициями items ([(product_id, quantity), ...]) и списывает товар.
+
+    Продукты и остатки читаются одним запросом и проверяются в памяти,
+    позиции вставляются одним пакетом, остатки списываются одной командой
+    UPDATE. Неизвестный продукт — InvalidDataError, нехватка —
+    InsufficientStockError (транзакция откатывается).
+    """
+    quantities = merge_items(items)
+    if not quantities or any(quantity <= 0 for quantity in quantities.values()):
+        raise InvalidDataError("Нет товаров для отгрузки")
 
-async def add_product_to_shipment(
-    session: AsyncSession,
-    shipment_id: int,
-    product_id: int,
-    quantity: int
-) -> ShipmentItem:
-    """Добавляет товар в существующую отгрузку"""
-    shipment_item = ShipmentItem(
-        shipment_id=shipment_id,
-        product_id=product_id,
-        quantity=quantity
+    result = await session.execute(
+        select(Product.id, Product.name, func.coalesce(ProductStorage.amount, 0))
+        .outerjoin(ProductStorage, ProductStorage.product_id == Product.id)
+        .where(Product.id.in_(quantities))
     )
-    session.add(shipment_item)
+    stock = {product_id: (name, amount) for product_id, name, amount in result.all()}
+    for product_id, quantity in quantities.items():
+        if product_id not in stock:
+            raise InvalidDataError(f"Продукт с id {product_id} не найден")
+        name, amount = stock[product_id]
+        if amount < quantity:
+            raise InsufficientStockError(name, quantity, amount)
+
+    try:
+        # Условие в UPDATE защищает от отгрузок, прошедших между проверкой и записью
+        await change_product_stocks(
+            session, {product_id: -quantity for product_id, quantity in quantities.items()}, source=SOURCE_SHIPMENT,
+        )
+    except InsufficientStockError:
+        await session.rollback()
+        raise
+
+    shipment = Shipment(user_id=user_id, timestamp=timestamp or datetime.utcnow())
+    session.add(shipment)
+    await session.flush()
+    # Позиции — одной командой (executemany); вставка в обход ORM, поэтому сводные таблицы и журнал — сами
+    await insert_audited(session, ShipmentItem, [
+        {"shipment_id": shipment.id, "product_id": product_id, "quantity": quantity}
+        for product_id, quantity in quantities.items()
+    ])
+    deltas = RollupDeltas()
+    for product_id, quantity in quantities.items():
+        deltas.shipment_item(to_day(shipment.timestamp), product_id, quantity, 1)
+    await apply_rollup_deltas(session, deltas)
     await session.commit()
-    return shipment_item
+    return shipment
 
-async def complete_shipment(session: AsyncSession, shipment_id: int):
-    """Отмечает отгрузку как завершенную (если нужно)"""
-    # Здесь можно добавить логику, если нужно отметить отгрузку как завершенную
-    # Например, добавить поле completed = True в модель Shipment
-    await session.commit()
 
 async def get_shipment_products(session: AsyncSession, shipment_id: int):
     """Получает все товары в отгрузке"""
@@ -75,32 +102,10 @@ async def save_shipment(
         quantity: int,
         session: AsyncSession
 ):
-    """Создание записи об отгрузке"""
-    # Получаем user_id по telegram_id
+    """Создание записи об отгрузке одного товара"""
     user = await session.execute(select(User).where(User.telegram_id == telegram_id))
     user = user.scalar_one()
-
-    # Создаем запись об отгрузке
-    shipment = Shipment(
-        user_id=user.id,  # Используем внутренний id пользователя
-        timestamp=datetime.now()
-    )
-    session.add(shipment)
-    await session.flush()  # Получаем ID отгрузки
-
-    # Добавляем элементы отгрузки
-    shipment_item = ShipmentItem(
-        shipment_id=shipment.id,
-        product_id=product_id,
-        quantity=quantity
-    )
-    session.add(shipment_item)
-
-    # Обновляем остатки на складе
-    await update_product_stock(product_id, -quantity, session)
-
-    await session.commit()
-    return shipment
+    return await create_shipment_with_items(session, user.id, [(product_id, quantity)])
 
 
 async def update_product_stock(
@@ -108,13 +113,8 @@ async def update_product_stock(
         quantity_delta: int,
         session: AsyncSession
 ):
-    """Обновление остатков продукта на складе"""
-    storage = await session.get(ProductStorage, product_id)
-    if storage:
-        storage.amount += quantity_delta
-        if storage.amount < 0:
-            raise ValueError("Недостаточно товара на складе")
-        await session.commit()
+    """Обновление остатков продукта на складе (InsufficientStockError, если товара не хватает)"""
+    return await change_product_stock(session, product_id, quantity_delta, source=SOURCE_SHIPMENT)
 
 
 async def get_available_products(session: AsyncSession):
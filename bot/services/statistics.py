@@ -1,19 +1,19 @@
 from datetime import datetime, date
 from typing import Dict, List
 
-from sqlalchemy import select, func, and_, extract, case
+from sqlalchemy import select, func, case
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.models import (
     User,
-    Arrival,
-    Packaging,
     Expense,
     Product,
     RawMaterialStorage,
     ProductStorage,
-    RawProduct, ShipmentItem, Shipment
+    RawProduct,
+    DailyProductRollup, DailyRawRollup
 )
+from bot.services.periods import Period, month_period, days_period
 
 
 async def get_stock_info(session: AsyncSession) -> Dict:
@@ -63,24 +63,17 @@ async def get_packaging_stats(
     """
     query = (
         select(
-            func.sum(case((Product.weight == 3, Packaging.amount), else_=0)).label("packs_3kg"),
-            func.sum(case((Product.weight == 5, Packaging.amount), else_=0)).label("packs_5kg")
+            func.sum(case((Product.weight == 3, DailyProductRollup.packed_units), else_=0)).label("packs_3kg"),
+            func.sum(case((Product.weight == 5, DailyProductRollup.packed_units), else_=0)).label("packs_5kg")
         )
-        .select_from(Packaging)
-        .join(Product, Packaging.product_id == Product.id)
+        .select_from(DailyProductRollup)
+        .join(Product, DailyProductRollup.product_id == Product.id)
     )
 
     if period == "month":
-        now = datetime.utcnow()
-        query = query.where(
-            extract("year", Packaging.date) == now.year,
-            extract("month", Packaging.date) == now.month
-        )
+        query = query.where(month_period().where(DailyProductRollup.day))
     elif period == "custom" and start_date and end_date:
-        query = query.where(
-            Packaging.date >= start_date,
-            Packaging.date <= end_date
-        )
+        query = query.where(days_period(start_date, end_date).where(DailyProductRollup.day))
 
     result = await session.execute(query)
     stats = result.first()._asdict()
@@ -94,28 +87,27 @@ async def get_arrivals_stats(
         end_date: date = None
 ) -> Dict[str, float]:
     """
-    Получает статистику приходов сырья по типам
-    Возвращает словарь: {"Тип сырья": количество_кг}
+    Получает статистику приходов сырья по видам сырья
+    Возвращает словарь: {"Сырьё": количество_кг}
     """
-    query = select(
-        Arrival.type,
-        func.sum(Arrival.amount).label("total_amount")
+    query = (
+        select(
+            RawProduct.name,
+            func.sum(DailyRawRollup.arrived_kg).label("total_amount")
+        )
+        .join(RawProduct, RawProduct.id == DailyRawRollup.raw_product_id)
+        .where(DailyRawRollup.arrivals_count > 0)
     )
 
     if period == "month":
-        today = datetime.today()
-        first_day = datetime(today.year, today.month, 1)
-        query = query.where(Arrival.date >= first_day)
+        query = query.where(month_period().where(DailyRawRollup.day))
     elif period == "custom" and start_date and end_date:
-        query = query.where(
-            Arrival.date >= start_date,
-            Arrival.date <= end_date
-        )
+        query = query.where(days_period(start_date, end_date).where(DailyRawRollup.day))
 
-    query = query.group_by(Arrival.type)
+    query = query.group_by(RawProduct.name)
     result = await session.execute(query)
 
-    return {arrival_type: amount for arrival_type, amount in result.all()}
+    return {name: amount for name, amount in result.all()}
 
 
 async def get_user_expenses(session: AsyncSession, user_id: int) -> float:
@@ -184,41 +176,23 @@ async def get_detailed_expenses(session: AsyncSession) -> List[Dict]:
 
 async def get_shipments_month_stats(session: AsyncSession):
     """Получение статистики отгрузок за текущий месяц"""
-    now = datetime.now()
-    start_date = datetime(now.year, now.month, 1)
-    end_date = datetime(now.year, now.month + 1, 1) if now.month < 12 else datetime(now.year + 1, 1, 1)
+    return await _shipped_by_product(session, month_period())
 
-    result = await session.execute(
-        select(
-            Product.name,
-            func.sum(ShipmentItem.quantity).label('total')
-        )
-        .join(ShipmentItem, ShipmentItem.product_id == Product.id)
-        .join(Shipment, Shipment.id == ShipmentItem.shipment_id)
-        .where(and_(
-            Shipment.timestamp >= start_date,
-            Shipment.timestamp < end_date
-        ))
-        .group_by(Product.name)
-    )
 
-    return result.all()
+async def get_shipments_period_stats(session: AsyncSession, start_date: datetime, end_date: datetime):
+    """Получение статистики отгрузок за указанный период (обе даты включительно)"""
+    return await _shipped_by_product(session, days_period(start_date, end_date))
 
 
-async def get_shipments_period_stats(session: AsyncSession, start_date: datetime, end_date: datetime):
-    """Получение статистики отгрузок за указанный период"""
+async def _shipped_by_product(session: AsyncSession, period: Period):
+    """Отгружено по продуктам за период"""
+    total = func.sum(DailyProductRollup.shipped_units).label('total')
     result = await session.execute(
-        select(
-            Product.name,
-            func.sum(ShipmentItem.quantity).label('total')
-        )
-        .join(ShipmentItem, ShipmentItem.product_id == Product.id)
-        .join(Shipment, Shipment.id == ShipmentItem.shipment_id)
-        .where(and_(
-            Shipment.timestamp >= start_date,
-            Shipment.timestamp <= end_date
-        ))
+        select(Product.name, total)
+        .join(DailyProductRollup, DailyProductRollup.product_id == Product.id)
+        .where(period.where(DailyProductRollup.day))
         .group_by(Product.name)
+        .having(total != 0)
     )
 
     return result.all()
@@ -0,0 +1,183 @@
+"""Журнал остатков сырья и продукции и остатки на прошедшую дату.
+
+Каждое изменение остатка записывается в stock_movements (приращение,
+остаток после него и источник): изменения через storage.change_* —
+в тех же функциях, прямые правки строк склада через ORM (таблицы в
+админке) — обработчиком after_flush. Строки журнала не изменяются и не
+удаляются.
+
+Раз в сутки fill_snapshots сохраняет остатки на полночь (UTC) в
+stock_snapshots: предыдущий снимок плюс журнал за прошедшие сутки.
+Остаток на момент M — ближайший снимок не позже M плюс движения журнала
+между снимком и M, поэтому запрос читает не больше суток журнала
+независимо от длины истории.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+from sqlalchemy import event, func, insert, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from bot.models.product import Product
+from bot.models.rawProduct import RawProduct
+from bot.models.stock_ledger import StockMovement, StockSnapshot
+from bot.models.storage import ProductStorage, RawMaterialStorage
+
+RAW = "raw"
+PRODUCT = "product"
+
+SOURCE_ARRIVAL = "arrival"
+SOURCE_PACKAGING = "packaging"
+SOURCE_SHIPMENT = "shipment"
+SOURCE_IMPORT = "import"
+SOURCE_ADMIN = "admin"
+
+_STORAGE = {RawMaterialStorage: (RAW, "raw_product_id"), ProductStorage: (PRODUCT, "product_id")}
+
+
+def _row(kind: str, item_id: int, delta: int, balance: int, source: Optional[str]) -> dict:
+    return {"kind": kind, "item_id": item_id, "delta": delta, "balance": balance, "source": source,
+            "created_at": datetime.utcnow()}
+
+
+async def record_movements(session: AsyncSession, kind: str, changes: dict, source: Optional[str] = None):
+    """Записывает изменения остатков (item_id -> (приращение, новый остаток)) одной командой."""
+    rows = [_row(kind, item_id, delta, balance, source) for item_id, (delta, balance) in changes.items() if delta]
+    if rows:
+        await session.execute(insert(StockMovement), rows)
+
+
+def _committed(obj, name):
+    """Значение атрибута до текущего flush."""
+    history = inspect(obj).attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, name)
+
+
+@event.listens_for(Session, "after_flush")
+def _record_direct_changes(session, flush_context):
+    """Строки склада, изменённые через ORM (а не storage.change_*), тоже попадают в журнал."""
+    rows = []
+    for obj in session.new:
+        if type(obj) in _STORAGE and obj.amount:
+            kind, key = _STORAGE[type(obj)]
+            rows.append(_row(kind, getattr(obj, key), obj.amount, obj.amount, SOURCE_ADMIN))
+    for obj in session.deleted:
+        if type(obj) in _STORAGE and _committed(obj, "amount"):
+            kind, key = _STORAGE[type(obj)]
+            rows.append(_row(kind, _committed(obj, key), -_committed(obj, "amount"), 0, SOURCE_ADMIN))
+    for obj in session.dirty:
+        if type(obj) not in _STORAGE or not session.is_modified(obj):
+            continue
+        kind, key = _STORAGE[type(obj)]
+        old_item, new_item = _committed(obj, key), getattr(obj, key)
+        old_amount, new_amount = _committed(obj, "amount") or 0, obj.amount or 0
+        if old_item != new_item:
+            # Строка склада перенесена на другую позицию
+            if old_amount:
+                rows.append(_row(kind, old_item, -old_amount, 0, SOURCE_ADMIN))
+            if new_amount:
+                rows.append(_row(kind, new_item, new_amount, new_amount, SOURCE_ADMIN))
+        elif old_amount != new_amount:
+            rows.append(_row(kind, new_item, new_amount - old_amount, new_amount, SOURCE_ADMIN))
+    if rows:
+        session.execute(insert(StockMovement), rows)
+
+
+def snapshot_time(day: date) -> datetime:
+    """Момент снимка за день: начало дня (UTC)."""
+    return datetime.combine(day, time.min)
+
+
+async def _balances(session: AsyncSession, moment: datetime) -> dict:
+    """Остатки (вид, позиция) -> количество по движениям с created_at < moment."""
+    base_at = await session.scalar(select(func.max(StockSnapshot.taken_at)).where(StockSnapshot.taken_at <= moment))
+    balances = {}
+    if base_at is not None:
+        result = await session.execute(
+            select(StockSnapshot.kind, StockSnapshot.item_id, StockSnapshot.amount)
+            .where(StockSnapshot.taken_at == base_at)
+        )
+        balances = {(kind, item_id): amount for kind, item_id, amount in result.all()}
+
+    movements = (
+        select(StockMovement.kind, StockMovement.item_id, func.sum(StockMovement.delta))
+        .where(StockMovement.created_at < moment)
+        .group_by(StockMovement.kind, StockMovement.item_id)
+    )
+    if base_at is not None:
+        movements = movements.where(StockMovement.created_at >= base_at)
+    for kind, item_id, delta in (await session.execute(movements)).all():
+        balances[(kind, item_id)] = balances.get((kind, item_id), 0) + (delta or 0)
+    return balances
+
+
+async def take_snapshot(session: AsyncSession, day: Optional[date] = None) -> int:
+    """Сохраняет остатки на начало дня day (по умолчанию сегодняшнего) и коммитит.
+
+    Возвращает количество записанных строк (0 — снимок уже есть).
+    """
+    taken_at = snapshot_time(day or datetime.utcnow().date())
+    exists = await session.scalar(select(StockSnapshot.taken_at).where(StockSnapshot.taken_at == taken_at).limit(1))
+    if exists is not None:
+        return 0
+    balances = await _balances(session, taken_at)
+    rows = [
+        {"taken_at": taken_at, "kind": kind, "item_id": item_id, "amount": amount}
+        for (kind, item_id), amount in sorted(balances.items())
+    ]
+    if rows:
+        await session.execute(insert(StockSnapshot), rows)
+        await session.commit()
+    return len(rows)
+
+
+async def fill_snapshots(session: AsyncSession, until: Optional[date] = None) -> int:
+    """Снимки за все дни после последнего снимка по until (по умолчанию сегодня) включительно.
+
+    Пропущенные дни (бот не работал) досчитываются по одному, чтобы между
+    соседними снимками всегда были сутки журнала. Возвращает количество
+    новых снимков.
+    """
+    until = until or datetime.utcnow().date()
+    last = await session.scalar(select(func.max(StockSnapshot.taken_at)))
+    if last is not None:
+        day = last.date() + timedelta(days=1)
+    else:
+        first = await session.scalar(select(func.min(StockMovement.created_at)))
+        if first is None:
+            return 0
+        day = first.date() + timedelta(days=1)
+    taken = 0
+    while day <= until:
+        if await take_snapshot(session, day):
+            taken += 1
+        day += timedelta(days=1)
+    return taken
+
+
+async def stock_as_of(session: AsyncSession, moment: datetime) -> dict:
+    """Остатки на момент moment в виде get_stock_info: {"raw_materials": {...}, "products": {...}}.
+
+    Позиции, по которым к этому моменту ещё не было движений, не выводятся.
+    """
+    balances = await _balances(session, moment)
+    names = {
+        RAW: dict((await session.execute(select(RawProduct.id, RawProduct.name))).all()),
+        PRODUCT: dict((await session.execute(select(Product.id, Product.name))).all()),
+    }
+    stock = {RAW: {}, PRODUCT: {}}
+    for (kind, item_id), amount in sorted(balances.items()):
+        name = names.get(kind, {}).get(item_id)
+        if name is not None:
+            stock[kind][name] = amount
+    return {"raw_materials": stock[RAW], "products": stock[PRODUCT]}
+
+
+async def stock_on_day(session: AsyncSession, day: date) -> dict:
+    """Остатки на конец дня day (UTC)."""
+    return await stock_as_of(session, snapshot_time(day + timedelta(days=1)))
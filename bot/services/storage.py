@@ -1,8 +1,113 @@
+"""Остатки сырья и готовой продукции.
+
+Все изменения остатков идут через change_raw_stock и change_product_stock:
+одна команда UPDATE ... SET amount = amount + :delta с условием
+amount + :delta >= 0 и RETURNING amount. Остаток не читается в Python и не
+записывается обратно, поэтому параллельные записи бота и веб-панели не
+теряют друг друга, а списание больше остатка отклоняется самой БД.
+
+Каждое изменение записывается в журнал остатков (stock_ledger) в той же
+транзакции; source — источник изменения (stock_ledger.SOURCE_*).
+"""
+from typing import Optional
+
+from sqlalchemy import case, func, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
 
-from bot.models import RawMaterialStorage, RawProduct, Arrival
+from bot.exceptions import InsufficientStockError
+from bot.models import ProductStorage, RawMaterialStorage, RawProduct, Arrival
+from bot.services.counters import increment
+from bot.services.stock_ledger import PRODUCT, RAW, SOURCE_ARRIVAL, record_movements
+
+
+async def _change_stock(session: AsyncSession, model, key_column, key: int, delta: int, item: str) -> int:
+    """Изменяет одну строку склада и возвращает новый остаток (без записи в журнал)."""
+    amount = func.coalesce(model.amount, 0)
+    stmt = (
+        update(model)
+        .where(key_column == key)
+        .values(amount=amount + delta)
+        .returning(model.amount)
+    )
+    if delta < 0:
+        stmt = stmt.where(amount + delta >= 0)
+    new_amount = (await session.execute(stmt)).scalar_one_or_none()
+    if new_amount is not None:
+        return new_amount
+
+    if delta < 0:
+        available = await session.scalar(select(amount).where(key_column == key))
+        raise InsufficientStockError(item, -delta, available or 0)
+    # Строки склада ещё нет — создаём (upsert на случай параллельной вставки)
+    await increment(session, model, {key_column.key: key}, {"amount": delta})
+    return await session.scalar(select(model.amount).where(key_column == key))
+
+
+async def change_raw_stock(session: AsyncSession, raw_product_id: int, delta: int,
+                           source: Optional[str] = None) -> int:
+    """Изменяет остаток сырья на delta (кг) и возвращает новый остаток.
+
+    Списание больше остатка — InsufficientStockError. Коммит — за вызывающим.
+    """
+    balance = await _change_stock(
+        session, RawMaterialStorage, RawMaterialStorage.raw_product_id, raw_product_id, delta,
+        f"сырьё id={raw_product_id}",
+    )
+    await record_movements(session, RAW, {raw_product_id: (delta, balance)}, source)
+    return balance
+
+
+async def change_product_stock(session: AsyncSession, product_id: int, delta: int,
+                               source: Optional[str] = None) -> int:
+    """Изменяет остаток продукции на delta (пачек) и возвращает новый остаток.
+
+    Списание больше остатка — InsufficientStockError. Коммит — за вызывающим.
+    """
+    balance = await _change_stock(
+        session, ProductStorage, ProductStorage.product_id, product_id, delta,
+        f"продукция id={product_id}",
+    )
+    await record_movements(session, PRODUCT, {product_id: (delta, balance)}, source)
+    return balance
+
+
+async def change_product_stocks(session: AsyncSession, deltas: dict[int, int],
+                                source: Optional[str] = None) -> dict[int, int]:
+    """Изменяет остатки нескольких продуктов одной командой UPDATE (product_id -> delta).
+
+    Возвращает новые остатки. Если хоть одного продукта не хватает —
+    InsufficientStockError; остальные строки к этому моменту уже изменены,
+    поэтому транзакцию нужно откатить. Возврат на склад (delta > 0) продукта
+    без строки склада создаёт строку, как change_product_stock.
+    """
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return {}
+    delta = case(deltas, value=ProductStorage.product_id, else_=0)
+    amount = func.coalesce(ProductStorage.amount, 0)
+    result = await session.execute(
+        update(ProductStorage)
+        .where(ProductStorage.product_id.in_(deltas), amount + delta >= 0)
+        .values(amount=amount + delta)
+        .returning(ProductStorage.product_id, ProductStorage.amount)
+    )
+    amounts = dict(result.all())
+    missing = sorted(deltas.keys() - amounts.keys())
+    for product_id in missing:
+        if deltas[product_id] < 0:
+            available = await session.scalar(select(amount).where(ProductStorage.product_id == product_id))
+            raise InsufficientStockError(f"продукция id={product_id}", -deltas[product_id], available or 0)
+    # Строк склада ещё нет — создаём (upsert на случай параллельной вставки)
+    for product_id in missing:
+        await increment(session, ProductStorage, {"product_id": product_id}, {"amount": deltas[product_id]})
+        amounts[product_id] = await session.scalar(
+            select(ProductStorage.amount).where(ProductStorage.product_id == product_id)
+        )
+    await record_movements(
+        session, PRODUCT, {product_id: (deltas[product_id], amount) for product_id, amount in amounts.items()}, source,
+    )
+    return amounts
 
 
 # 🏭 Получить текущий склад (если нет — создать)
@@ -38,19 +143,9 @@ async def get_raw_type_at_raw_product_id(session: AsyncSession, id: int):
 
 async def update_stock_arrival(session: AsyncSession, raw_product_id: int, delta: int):
     """Обновить остаток сырья: положительное delta – приход, отрицательное – расход."""
-    print("=== SERVICE STOCK UPDATE CALLED ===")
-    print(f"DEBUG STOCK: raw_product_id={raw_product_id}, delta={delta}")
-    result = await session.execute(
-        select(RawMaterialStorage).filter(RawMaterialStorage.raw_product_id == raw_product_id)
-    )
-    stock = result.scalar_one_or_none()
+    return await change_raw_stock(session, raw_product_id, delta, source=SOURCE_ARRIVAL)
+
 
-    if stock:
-        stock.amount += delta
-    else:
-        # Если записи на складе ещё нет – создаём
-        new_stock = RawMaterialStorage(raw_product_id=raw_product_id, amount=delta)
-        session.add(new_stock)
 # ➕ Обновить приход пеллет (атомарно)
 # async def update_stock_arrival(session: AsyncSession, type: str, amount: int):
 #     """
@@ -0,0 +1,156 @@
+"""Кеш пользователей и ролей для бота и веб-панели.
+
+В кеше хранятся неизменяемые снимки UserSnapshot, а не ORM-объекты: их
+нельзя случайно изменить или привязать к чужой сессии.
+
+Любое изменение пользователей через ORM увеличивает версию "users" в
+таблице cache_versions (в той же транзакции). Процесс, в котором прошёл
+коммит, сверяет версию при следующем же обращении; остальные процессы —
+не чаще раза в USER_CACHE_VERSION_CHECK_SECONDS. При смене версии кеш
+сбрасывается.
+"""
+import logging
+import time
+from datetime import datetime
+from typing import NamedTuple
+
+from cachetools import TTLCache
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from bot.config import USER_CACHE_TTL, USER_CACHE_VERSION_CHECK_SECONDS
+from bot.constants.roles import ANONYMOUS
+from bot.models.cache_version import CacheVersion
+from bot.models.user import User
+from bot.services.counters import increment_sync
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = "users"
+
+
+class UserSnapshot(NamedTuple):
+    """Данные пользователя, нужные для проверки прав и отображения."""
+    id: int
+    telegram_id: int
+    full_name: str
+    role: str
+    username: str | None
+
+
+_by_telegram_id = TTLCache(maxsize=1000, ttl=USER_CACHE_TTL)
+_by_username = TTLCache(maxsize=1000, ttl=USER_CACHE_TTL)
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+_state = {"version": None, "checked_at": 0.0}
+
+
+def snapshot(user: User) -> UserSnapshot:
+    return UserSnapshot(user.id, user.telegram_id, user.full_name, user.role, user.username)
+
+
+def _remember(user: UserSnapshot):
+    _by_telegram_id[user.telegram_id] = user
+    if user.username:
+        _by_username[user.username] = user
+
+
+def invalidate_users():
+    """Сбрасывает кеш пользователей в текущем процессе."""
+    _by_telegram_id.clear()
+    _by_username.clear()
+    _stats["invalidations"] += 1
+
+
+async def _check_version(session: AsyncSession):
+    """Сверяет версию кеша с БД не чаще раза в USER_CACHE_VERSION_CHECK_SECONDS."""
+    now = time.monotonic()
+    if _state["version"] is not None and now - _state["checked_at"] < USER_CACHE_VERSION_CHECK_SECONDS:
+        return
+    version = await session.scalar(select(CacheVersion.version).where(CacheVersion.name == CACHE_NAME)) or 0
+    if version != _state["version"]:
+        if _state["version"] is not None:
+            logger.info("Версия кеша пользователей изменилась: %s -> %s", _state["version"], version)
+        invalidate_users()
+    _state["version"] = version
+    _state["checked_at"] = now
+
+
+async def _lookup(session: AsyncSession, cache: TTLCache, key, condition) -> UserSnapshot | None:
+    await _check_version(session)
+    cached = cache.get(key)
+    if cached is not None:
+        _stats["hits"] += 1
+        return cached
+    _stats["misses"] += 1
+    user = (await session.execute(select(User).where(condition))).scalars().first()
+    if user is None:
+        return None
+    user = snapshot(user)
+    _remember(user)
+    return user
+
+
+async def get_user_snapshot(session: AsyncSession, telegram_id: int) -> UserSnapshot | None:
+    """Пользователь по Telegram ID (из кеша или БД)."""
+    return await _lookup(session, _by_telegram_id, telegram_id, User.telegram_id == telegram_id)
+
+
+async def get_user_snapshot_by_username(session: AsyncSession, username: str) -> UserSnapshot | None:
+    """Пользователь веб-панели по логину (из кеша или БД)."""
+    return await _lookup(session, _by_username, username, User.username == username)
+
+
+async def get_or_create_user_snapshot(session: AsyncSession, telegram_id: int, full_name: str) -> UserSnapshot:
+    """Пользователь по Telegram ID; неизвестный пользователь создаётся с ролью anonymous."""
+    user = await get_user_snapshot(session, telegram_id)
+    if user is not None:
+        return user
+    new_user = User(telegram_id=telegram_id, full_name=full_name, role=ANONYMOUS)
+    session.add(new_user)
+    await session.flush()
+    user = snapshot(new_user)
+    await session.commit()
+    return user
+
+
+def cache_stats() -> dict:
+    """Счётчики попаданий и промахов кеша пользователей."""
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_rate": round(_stats["hits"] / lookups, 3) if lookups else 0.0,
+        "size": len(_by_telegram_id),
+        "version": _state["version"],
+    }
+
+
+def reset_user_cache():
+    """Полный сброс кеша, версии и счётчиков (для тестов)."""
+    _by_telegram_id.clear()
+    _by_username.clear()
+    _stats.update(hits=0, misses=0, invalidations=0)
+    _state.update(version=None, checked_at=0.0)
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_users_version(session, flush_context):
+    changed = any(
+        isinstance(obj, User) and (obj not in session.dirty or session.is_modified(obj))
+        for obj in (*session.new, *session.dirty, *session.deleted)
+    )
+    if changed:
+        increment_sync(session, CacheVersion, {"name": CACHE_NAME}, {"version": 1}, updated_at=datetime.utcnow())
+        session.info["users_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop("users_changed", False):
+        # Следующее обращение перечитает версию и сбросит кеш
+        _state["checked_at"] = 0.0
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop("users_changed", None)
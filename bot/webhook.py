@@ -0,0 +1,209 @@
+"""Приём обновлений Telegram через webhook (сервер aiohttp).
+
+Запрос Telegram подтверждается сразу (200), а обновление обрабатывается
+в фоне UpdateProcessor'ом с ограничениями: не больше
+WEBHOOK_MAX_CONCURRENT обработчиков на процесс и не больше
+WEBHOOK_CHAT_CONCURRENCY одновременно в одном чате (при 1 — строго по
+порядку поступления). Если в очереди уже WEBHOOK_MAX_PENDING обновлений
+или процесс останавливается, сервер отвечает 503 — Telegram повторит
+доставку позже (возможно, другому процессу).
+
+При остановке новые обновления не принимаются, а начатые обрабатываются
+до конца (не дольше WEBHOOK_DRAIN_SECONDS).
+
+Для каждого обновления замеряется ожидание (от получения запроса до
+начала обработки) и полное время; сводка — GET <WEBHOOK_PATH>/metrics.
+Локально webhook проверяется отправкой синтетических обновлений:
+python -m benchmarks.bench_webhook.
+"""
+import asyncio
+import logging
+import signal
+import time
+from collections import deque
+from contextlib import asynccontextmanager, suppress
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+from aiohttp import web
+from pydantic import ValidationError
+
+from bot.config import (
+    WEBHOOK_CHAT_CONCURRENCY, WEBHOOK_DRAIN_SECONDS, WEBHOOK_HOST, WEBHOOK_MAX_CONCURRENT, WEBHOOK_MAX_PENDING,
+    WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_URL,
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+METRICS_WINDOW = 1000  # последних обновлений в перцентилях
+
+
+class WebhookMetrics:
+    """Счётчики и время обработки последних METRICS_WINDOW обновлений (мс)."""
+
+    def __init__(self):
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_ms = deque(maxlen=METRICS_WINDOW)
+        self.total_ms = deque(maxlen=METRICS_WINDOW)
+
+    @staticmethod
+    def _percentiles(values) -> dict:
+        if not values:
+            return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+        ordered = sorted(values)
+        return {
+            "p50": round(ordered[len(ordered) // 2], 2),
+            "p95": round(ordered[int(len(ordered) * 0.95)], 2),
+            "max": round(ordered[-1], 2),
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "wait_ms": self._percentiles(self.wait_ms),
+            "total_ms": self._percentiles(self.total_ms),
+        }
+
+
+class UpdateProcessor:
+    """Фоновая обработка обновлений с ограничением параллельности."""
+
+    def __init__(self, dp: Dispatcher, bot: Bot, max_concurrent: int = WEBHOOK_MAX_CONCURRENT,
+                 chat_concurrency: int = WEBHOOK_CHAT_CONCURRENCY, max_pending: int = WEBHOOK_MAX_PENDING):
+        self.dp = dp
+        self.bot = bot
+        self.chat_concurrency = chat_concurrency
+        self.max_pending = max_pending
+        self.metrics = WebhookMetrics()
+        self.accepting = True
+        self._global = asyncio.Semaphore(max_concurrent)
+        self._chats: dict[int, list] = {}  # чат -> [Semaphore, число обновлений в работе и в очереди]
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    def submit(self, update: Update, received_at: Optional[float] = None) -> bool:
+        """Ставит обновление в обработку; False — не принято (перегрузка или остановка)."""
+        if not self.accepting or len(self._tasks) >= self.max_pending:
+            self.metrics.rejected += 1
+            return False
+        self.metrics.received += 1
+        task = asyncio.create_task(self._process(update, received_at or time.perf_counter()))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    @asynccontextmanager
+    async def _chat_slot(self, chat_id: Optional[int]):
+        if chat_id is None:
+            yield
+            return
+        holder = self._chats.setdefault(chat_id, [asyncio.Semaphore(self.chat_concurrency), 0])
+        holder[1] += 1
+        try:
+            async with holder[0]:
+                yield
+        finally:
+            holder[1] -= 1
+            if not holder[1]:
+                del self._chats[chat_id]
+
+    async def _process(self, update: Update, received_at: float):
+        chat_id = UserContextMiddleware.resolve_event_context(update).chat_id
+        async with self._chat_slot(chat_id), self._global:
+            self.metrics.wait_ms.append((time.perf_counter() - received_at) * 1000)
+            try:
+                await self.dp.feed_update(self.bot, update)
+                self.metrics.processed += 1
+            except Exception as e:
+                self.metrics.failed += 1
+                logger.error(f"Update {update.update_id} failed: {e}", exc_info=True)
+            finally:
+                self.metrics.total_ms.append((time.perf_counter() - received_at) * 1000)
+
+    async def drain(self, timeout: float = WEBHOOK_DRAIN_SECONDS) -> int:
+        """Перестаёт принимать обновления и ждёт начатые. Возвращает число прерванных по таймауту."""
+        self.accepting = False
+        if not self._tasks:
+            return 0
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        for task in pending:
+            with suppress(asyncio.CancelledError):
+                await task
+        if pending:
+            logger.warning(f"Webhook shutdown: {len(pending)} updates cancelled after {timeout} s")
+        return len(pending)
+
+
+def create_webhook_app(processor: UpdateProcessor, path: str = WEBHOOK_PATH,
+                       secret: Optional[str] = WEBHOOK_SECRET) -> web.Application:
+    """Приложение aiohttp: POST <path> — обновления Telegram, GET <path>/metrics — сводка."""
+
+    def authorized(request: web.Request) -> bool:
+        return not secret or request.headers.get(SECRET_HEADER) == secret
+
+    async def receive_update(request: web.Request) -> web.Response:
+        received_at = time.perf_counter()
+        if not authorized(request):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": processor.bot})
+        except (ValueError, ValidationError):
+            return web.Response(status=400)
+        if not processor.submit(update, received_at):
+            return web.Response(status=503)
+        return web.Response()
+
+    async def metrics(request: web.Request) -> web.Response:
+        if not authorized(request):
+            return web.Response(status=401)
+        return web.json_response({**processor.metrics.as_dict(), "in_flight": processor.in_flight})
+
+    app = web.Application()
+    app.router.add_post(path, receive_update)
+    app.router.add_get(f"{path}/metrics", metrics)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Запускает webhook-сервер и работает до SIGTERM/SIGINT, затем дожидается обработчиков."""
+    if not WEBHOOK_URL:
+        raise RuntimeError("Для BOT_MODE=webhook задайте WEBHOOK_URL")
+    processor = UpdateProcessor(dp, bot)
+    runner = web.AppRunner(create_webhook_app(processor))
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=min(WEBHOOK_MAX_CONCURRENT, 100),
+    )
+    logger.info(f"Webhook listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        with suppress(NotImplementedError):  # Windows
+            loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        logger.info(f"Webhook stopping, {processor.in_flight} updates in flight")
+        await processor.drain()
+        await runner.cleanup()
+        await bot.session.close()
@@ -0,0 +1,42 @@
+"""Массовый импорт истории (приходы сырья, расходы, закупки материалов) из CSV/XLSX.
+
+    python import_history.py arrivals приходы.csv
+    python import_history.py purchases закупки.xlsx --user 123456789 --dry-run
+"""
+import argparse
+import asyncio
+
+from bot.config import ADMIN_IDS
+from bot.models.database import init_db, async_session
+from bot.services.bulk_import import IMPORTS, file_format, import_file
+from bot.services.user_service import get_user
+
+
+async def run(kind: str, path: str, telegram_id: int, dry_run: bool):
+    await init_db()
+    async with async_session() as session:
+        user = await get_user(session, telegram_id)
+        if user is None:
+            print(f"Пользователь с Telegram ID {telegram_id} не найден")
+            return
+        with open(path, "rb") as fileobj:
+            report = await import_file(session, kind, fileobj, file_format(path), user.id, dry_run=dry_run)
+
+    print(f"Проверено строк: {report.rows}")
+    if not report.ok:
+        print("Ошибки (ничего не записано):")
+        for line, message in report.errors:
+            print(f"  строка {line}: {message}")
+        return
+    if not dry_run:
+        print(f"Записано строк: {report.inserted}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Импорт истории операций")
+    parser.add_argument("kind", choices=list(IMPORTS), help="что загружаем")
+    parser.add_argument("path", help="файл CSV или XLSX")
+    parser.add_argument("--user", type=int, default=ADMIN_IDS[0], help="Telegram ID автора записей")
+    parser.add_argument("--dry-run", action="store_true", help="только проверить файл")
+    args = parser.parse_args()
+    asyncio.run(run(args.kind, args.path, args.user, args.dry_run))
@@ -6,12 +6,14 @@ from aiogram.types import BotCommand
 
 from bot.handlers import register_handlers
 from bot.middlewares.db import DBMiddleware  # Импортируем middleware
-from bot.models import create_tables
-from bot.models.database import init_db, async_session
-from bot.config import TOKEN
+from bot.models.database import init_db, close_db, async_session
+from bot.config import TOKEN, FSM_STORAGE, BOT_MODE
 from bot.context import app_context
+from bot.fsm.storage import DatabaseStorage
+from bot.services.audit_log import audit_writer
 from bot.services.notification_service import NotificationService
 from bot.services.role_service import fill_roles
+from bot.webhook import run_webhook
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,9 +28,14 @@ logger = logging.getLogger(__name__)
 async def main():
     print(f'{TOKEN=}')
     bot = Bot(token=TOKEN)
-    dp = Dispatcher()
-
-    await init_db()  # Инициализация БД
+    if FSM_STORAGE == "memory":
+        dp = Dispatcher()
+    else:
+        # Состояния диалогов в БД: переживают перезапуск и общие для нескольких процессов бота
+        storage = DatabaseStorage()
+        dp = Dispatcher(storage=storage, events_isolation=storage.isolation())
+
+    await init_db()  # Проверка схемы БД и миграции
     await on_startup(bot)
     async with async_session() as session:
         await fill_roles(session)
@@ -43,14 +50,23 @@ async def main():
         BotCommand(command="start", description="Запуск бота"),
     ])
 
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await bot.delete_webhook()  # иначе Telegram не отдаёт обновления через getUpdates
+            await dp.start_polling(bot)
+    finally:
+        await app_context.notification_service.stop()
+        await audit_writer.stop()
+        await close_db()
 
 async def on_startup(bot):
-    await create_tables()
     from bot.services.scheduler import SchedulerService
     scheduler = SchedulerService(bot)
     await scheduler.start()
-    app_context.notification_service.set_bot(bot)
+    await app_context.notification_service.start(bot)  # воркер очереди уведомлений
+    await audit_writer.start()  # пакетная запись журнала изменений
 
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+"""Окружение Alembic.
+
+Адрес БД — из DATABASE_URL (или sqlalchemy.url в конфигурации Alembic).
+При вызове из приложения (bot.models.migrations) готовое соединение
+передаётся через config.attributes["connection"].
+"""
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import pool
+from sqlalchemy.engine import Connection
+
+import bot.models  # noqa: F401 — регистрирует все модели в Base.metadata
+from bot.config import DATABASE_URL
+from bot.models.base import Base
+from bot.models.database import create_engine_from_config
+
+config = context.config
+
+if config.config_file_name is not None and "connection" not in config.attributes:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def _url() -> str:
+    return config.get_main_option("sqlalchemy.url") or DATABASE_URL
+
+
+def run_migrations_offline() -> None:
+    """Вывод SQL миграций без подключения к БД (alembic upgrade --sql)."""
+    context.configure(
+        url=_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=_url().startswith("sqlite"),
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection: Connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        # SQLite не умеет ALTER COLUMN — autogenerate пишет batch-операции
+        render_as_batch=connection.dialect.name == "sqlite",
+        # Каждая миграция в своей транзакции: упавшая не откатывает предыдущие
+        transaction_per_migration=True,
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations() -> None:
+    engine = create_engine_from_config(_url(), echo=False, poolclass=pool.NullPool)
+
+    async with engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+
+    await engine.dispose()
+
+
+def run_migrations_online() -> None:
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        do_run_migrations(connection)
+    else:
+        asyncio.run(run_async_migrations())
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
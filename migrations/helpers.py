@@ -0,0 +1,57 @@
+"""Общие функции для миграций данных.
+
+Большие таблицы обрабатываются порциями по диапазонам первичного ключа:
+каждая порция фиксируется отдельно (autocommit_block), поэтому миграция
+не держит блокировку всей таблицы и не копирует её в одной транзакции.
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.schema import CreateColumn
+
+BATCH_SIZE = 5000
+
+
+def column_names(table_name: str) -> set:
+    return {column["name"] for column in sa.inspect(op.get_bind()).get_columns(table_name)}
+
+
+def add_column(table_name: str, column: sa.Column):
+    """op.add_column, допускающий внешний ключ в SQLite.
+
+    Alembic добавляет внешний ключ отдельным ALTER, которого SQLite не умеет;
+    SQLite же принимает REFERENCES прямо в ADD COLUMN.
+    """
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite' or not column.foreign_keys:
+        op.add_column(table_name, column)
+        return
+    sa.Table(table_name, sa.MetaData(), column)
+    ddl = str(CreateColumn(column).compile(dialect=bind.dialect))
+    for foreign_key in column.foreign_keys:
+        target_table, target_column = foreign_key.target_fullname.split('.')
+        ddl += f" REFERENCES {target_table} ({target_column})"
+    bind.execute(sa.text(f"ALTER TABLE {table_name} ADD COLUMN {ddl}"))
+
+
+def id_range(table_name: str):
+    """Минимальный и максимальный id таблицы (None, None для пустой)."""
+    return op.get_bind().execute(sa.text(f"SELECT MIN(id), MAX(id) FROM {table_name}")).one()
+
+
+def run_in_batches(table_name: str, statement: str, batch_size: int = BATCH_SIZE, **params) -> int:
+    """Выполняет statement для каждого диапазона id таблицы.
+
+    statement — SQL с параметрами :start и :stop (полуинтервал id),
+    например "UPDATE t SET x = 0 WHERE id >= :start AND id < :stop AND x IS NULL".
+    Возвращает количество обработанных порций.
+    """
+    first_id, last_id = id_range(table_name)
+    if first_id is None:
+        return 0
+    batches = 0
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        for start in range(first_id, last_id + 1, batch_size):
+            bind.execute(sa.text(statement), {"start": start, "stop": start + batch_size, **params})
+            batches += 1
+    return batches
@@ -0,0 +1,238 @@
+"""baseline schema
+
+Таблицы в том виде, в каком их создавал create_all. Уже существующие
+таблицы пропускаются, поэтому базу, созданную до перехода на миграции,
+можно обновить той же командой (недостающие столбцы старых баз
+добавляет 0002, индексы — 0003).
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 16:25:47.078626
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _create_table(name, *elements):
+    if not sa.inspect(op.get_bind()).has_table(name):
+        op.create_table(name, *elements)
+
+
+def upgrade() -> None:
+    _create_table('cost_calculations',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('period_start', sa.Date(), nullable=False),
+    sa.Column('period_end', sa.Date(), nullable=False),
+    sa.Column('total_material_cost', sa.Float(), nullable=True),
+    sa.Column('total_overhead_cost', sa.Float(), nullable=True),
+    sa.Column('total_produced_kg', sa.Float(), nullable=True),
+    sa.Column('cost_per_kg', sa.Float(), nullable=True),
+    sa.Column('calculated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('daily_expense_rollups',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('category', sa.String(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('expenses_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'category')
+    )
+    _create_table('materials',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    _create_table('raw_products',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    _create_table('roles',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    _create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('telegram_id', sa.Integer(), nullable=False),
+    sa.Column('full_name', sa.String(), nullable=False),
+    sa.Column('role', sa.String(), nullable=True),
+    sa.Column('username', sa.String(), nullable=True),
+    sa.Column('hashed_password', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('telegram_id'),
+    sa.UniqueConstraint('username')
+    )
+    _create_table('arrivals',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('type', sa.String(), nullable=True),
+    sa.Column('raw_product_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['raw_product_id'], ['raw_products.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('daily_raw_rollups',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('raw_product_id', sa.Integer(), nullable=False),
+    sa.Column('arrived_kg', sa.Integer(), nullable=False),
+    sa.Column('arrivals_count', sa.Integer(), nullable=False),
+    sa.Column('used_kg', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['raw_product_id'], ['raw_products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('day', 'raw_product_id')
+    )
+    _create_table('material_stock',
+    sa.Column('material_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['material_id'], ['materials.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('material_id')
+    )
+    _create_table('products',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('weight', sa.Integer(), nullable=False),
+    sa.Column('raw_product_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['raw_product_id'], ['raw_products.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    _create_table('raw_material_storage',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('raw_product_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['raw_product_id'], ['raw_products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('raw_product_id')
+    )
+    _create_table('shipments',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('daily_product_rollups',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('packed_units', sa.Integer(), nullable=False),
+    sa.Column('used_raw_kg', sa.Integer(), nullable=False),
+    sa.Column('material_cost', sa.Float(), nullable=False),
+    sa.Column('shipped_units', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('day', 'product_id')
+    )
+    _create_table('packaging',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('used_raw_material', sa.Integer(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('raw_product_id', sa.Integer(), nullable=False),
+    sa.Column('total_material_cost', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.ForeignKeyConstraint(['raw_product_id'], ['raw_products.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('product_storage',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('product_id')
+    )
+    _create_table('shipment_items',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('shipment_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.ForeignKeyConstraint(['shipment_id'], ['shipments.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('expenses',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('purpose', sa.String(), nullable=False),
+    sa.Column('source', sa.String(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('category', sa.String(), nullable=True),
+    sa.Column('material_id', sa.Integer(), nullable=True),
+    sa.Column('quantity', sa.Float(), nullable=True),
+    sa.Column('unit', sa.String(), nullable=True),
+    sa.Column('employee_id', sa.Integer(), nullable=True),
+    sa.Column('packaging_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['employee_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['material_id'], ['materials.id'], ),
+    sa.ForeignKeyConstraint(['packaging_id'], ['packaging.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('packaging_materials',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('packaging_id', sa.Integer(), nullable=False),
+    sa.Column('material_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Float(), nullable=False),
+    sa.Column('unit', sa.String(), nullable=False),
+    sa.Column('cost', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['material_id'], ['materials.id'], ),
+    sa.ForeignKeyConstraint(['packaging_id'], ['packaging.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _create_table('material_movements',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('material_id', sa.Integer(), nullable=False),
+    sa.Column('type', sa.String(), nullable=False),
+    sa.Column('quantity', sa.Float(), nullable=False),
+    sa.Column('unit', sa.String(), nullable=False),
+    sa.Column('unit_price', sa.Float(), nullable=True),
+    sa.Column('remaining_quantity', sa.Float(), nullable=True),
+    sa.Column('date', sa.DateTime(), nullable=True),
+    sa.Column('expense_id', sa.Integer(), nullable=True),
+    sa.Column('packaging_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['expense_id'], ['expenses.id'], ),
+    sa.ForeignKeyConstraint(['material_id'], ['materials.id'], ),
+    sa.ForeignKeyConstraint(['packaging_id'], ['packaging.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('material_movements')
+    op.drop_table('packaging_materials')
+    op.drop_table('expenses')
+    op.drop_table('shipment_items')
+    op.drop_table('product_storage')
+    op.drop_table('packaging')
+    op.drop_table('daily_product_rollups')
+    op.drop_table('shipments')
+    op.drop_table('raw_material_storage')
+    op.drop_table('products')
+    op.drop_table('material_stock')
+    op.drop_table('daily_raw_rollups')
+    op.drop_table('arrivals')
+    op.drop_table('users')
+    op.drop_table('roles')
+    op.drop_table('raw_products')
+    op.drop_table('materials')
+    op.drop_table('daily_expense_rollups')
+    op.drop_table('cost_calculations')
@@ -0,0 +1,118 @@
+"""legacy columns
+
+Заменяет ручные скрипты migrate_materials.py, bot/migrate_arrival.py и
+bot/migrate_arrival_fix_type.py: добавляет столбцы, которых нет в старых
+базах, заполняет их порциями и снимает NOT NULL с arrivals.type.
+На базах, созданных 0001, ничего не делает.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 16:40:12.512904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import add_column, column_names, id_range, run_in_batches
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+EXPENSE_COLUMNS = [
+    sa.Column('category', sa.String(), nullable=True),
+    sa.Column('material_id', sa.Integer(), sa.ForeignKey('materials.id'), nullable=True),
+    sa.Column('quantity', sa.Float(), nullable=True),
+    sa.Column('unit', sa.String(), nullable=True),
+    sa.Column('employee_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+    sa.Column('packaging_id', sa.Integer(), sa.ForeignKey('packaging.id'), nullable=True),
+]
+
+
+def _add_expense_columns():
+    existing = column_names('expenses')
+    for column in EXPENSE_COLUMNS:
+        if column.name not in existing:
+            add_column('expenses', column)
+
+
+def _add_packaging_cost():
+    if 'total_material_cost' in column_names('packaging'):
+        return
+    op.add_column('packaging', sa.Column('total_material_cost', sa.Float(), nullable=True))
+    run_in_batches(
+        'packaging',
+        "UPDATE packaging SET total_material_cost = 0 "
+        "WHERE id >= :start AND id < :stop AND total_material_cost IS NULL",
+    )
+
+
+def _add_arrival_raw_product():
+    if 'raw_product_id' in column_names('arrivals'):
+        return
+    # Пока без NOT NULL: значения заполняются ниже
+    add_column('arrivals', sa.Column('raw_product_id', sa.Integer(), sa.ForeignKey('raw_products.id')))
+    # Заполняем по соответствию type -> RawProduct.name
+    run_in_batches(
+        'arrivals',
+        "UPDATE arrivals SET raw_product_id = (SELECT id FROM raw_products WHERE name = arrivals.type) "
+        "WHERE id >= :start AND id < :stop AND raw_product_id IS NULL",
+    )
+    missing = op.get_bind().execute(sa.text("SELECT COUNT(*) FROM arrivals WHERE raw_product_id IS NULL")).scalar()
+    if missing:
+        raise RuntimeError(f"Обнаружены приходы без соответствующего сырья ({missing}). Миграция прервана.")
+
+
+def _arrival_type_is_required() -> bool:
+    columns = sa.inspect(op.get_bind()).get_columns('arrivals')
+    return any(column['name'] == 'type' and not column['nullable'] for column in columns)
+
+
+def _rebuild_arrivals_sqlite():
+    """SQLite не умеет менять ограничения столбца: копируем таблицу порциями и подменяем."""
+    bind = op.get_bind()
+    bind.execute(sa.text("DROP TABLE IF EXISTS arrivals_new"))
+    op.create_table(
+        'arrivals_new',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('type', sa.String(), nullable=True),
+        sa.Column('raw_product_id', sa.Integer(), sa.ForeignKey('raw_products.id'), nullable=False),
+        sa.Column('amount', sa.Integer(), nullable=False),
+        sa.Column('date', sa.DateTime(), nullable=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    copy = (
+        "INSERT INTO arrivals_new (id, type, raw_product_id, amount, date, user_id) "
+        "SELECT id, type, raw_product_id, amount, date, user_id FROM arrivals "
+        "WHERE id >= :start AND id < :stop"
+    )
+    _, last_id = id_range('arrivals')
+    run_in_batches('arrivals', copy)
+
+    # Строки, появившиеся во время копирования, и подмена — в одной короткой транзакции
+    bind = op.get_bind()
+    bind.execute(sa.text(copy), {"start": (last_id or 0) + 1, "stop": 2 ** 62})
+    op.drop_table('arrivals')
+    op.rename_table('arrivals_new', 'arrivals')
+
+
+def upgrade() -> None:
+    _add_expense_columns()
+    _add_packaging_cost()
+    _add_arrival_raw_product()
+    if _arrival_type_is_required():
+        if op.get_bind().dialect.name == 'sqlite':
+            _rebuild_arrivals_sqlite()
+        else:
+            op.alter_column('arrivals', 'type', existing_type=sa.String(), nullable=True)
+            op.alter_column('arrivals', 'raw_product_id', existing_type=sa.Integer(), nullable=False)
+
+
+def downgrade() -> None:
+    # Старую схему не восстанавливаем: столбцы используются текущими моделями
+    pass
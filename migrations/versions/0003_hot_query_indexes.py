@@ -0,0 +1,52 @@
+"""hot query indexes
+
+Индексы по датам (отчёты за период), открытым партиям материалов (FIFO)
+и внешним ключам, по которым ищутся строки отгрузок, фасовок и закупок.
+В PostgreSQL индексы строятся CONCURRENTLY — без блокировки записи.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 16:52:31.204117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+OPEN_LOTS = sa.text('remaining_quantity > 0')
+
+INDEXES = [
+    ('ix_arrivals_date', 'arrivals', ['date'], {}),
+    ('ix_packaging_date', 'packaging', ['date'], {}),
+    ('ix_expenses_date', 'expenses', ['date'], {}),
+    ('ix_shipments_timestamp', 'shipments', ['timestamp'], {}),
+    ('ix_material_movements_fifo', 'material_movements', ['material_id', 'type', 'date'],
+     {'sqlite_where': OPEN_LOTS, 'postgresql_where': OPEN_LOTS}),
+    ('ix_shipment_items_shipment_id', 'shipment_items', ['shipment_id'], {}),
+    ('ix_packaging_materials_packaging_id', 'packaging_materials', ['packaging_id'], {}),
+    ('ix_material_movements_expense_id', 'material_movements', ['expense_id'], {}),
+    ('ix_material_movements_packaging_id', 'material_movements', ['packaging_id'], {}),
+]
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+        with op.get_context().autocommit_block():
+            for name, table, columns, kw in INDEXES:
+                op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True, **kw)
+    else:
+        for name, table, columns, kw in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True, **kw)
+
+
+def downgrade() -> None:
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,40 @@
+"""audit log
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 16:39:14.984330
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('audit_log',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('actor_id', sa.BigInteger(), nullable=True),
+    sa.Column('actor_name', sa.String(), nullable=True),
+    sa.Column('action', sa.String(), nullable=False),
+    sa.Column('entity_type', sa.String(), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=True),
+    sa.Column('changes', sa.JSON(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_audit_log_entity', 'audit_log', ['entity_type', 'entity_id', 'timestamp'], unique=False)
+    op.create_index('ix_audit_log_timestamp', 'audit_log', ['timestamp'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_audit_log_timestamp', table_name='audit_log')
+    op.drop_index('ix_audit_log_entity', table_name='audit_log')
+    op.drop_table('audit_log')
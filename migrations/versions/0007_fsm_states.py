@@ -0,0 +1,34 @@
+"""fsm states
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 18:05:41.527113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('fsm_states',
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('state', sa.String(), nullable=True),
+    sa.Column('data', sa.Text(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index('ix_fsm_states_updated_at', 'fsm_states', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_fsm_states_updated_at', table_name='fsm_states')
+    op.drop_table('fsm_states')
@@ -0,0 +1,35 @@
+"""movement source lot
+
+Расход материала ссылается на партию, из которой списан: при изменении
+или удалении фасовки остаток возвращается в исходную партию, а не
+оформляется новым приходом. У старых расходов ссылки нет.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 19:02:14.381620
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import add_column, column_names
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if 'source_movement_id' not in column_names('material_movements'):
+        add_column('material_movements', sa.Column(
+            'source_movement_id', sa.Integer(), sa.ForeignKey('material_movements.id'), nullable=True,
+        ))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('material_movements') as batch_op:
+        batch_op.drop_column('source_movement_id')
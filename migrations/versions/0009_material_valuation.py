@@ -0,0 +1,45 @@
+"""material valuation
+
+Способ оценки списания материала (materials.valuation_method: 'fifo' или
+'average') и стоимость текущего остатка (material_stock.value) — пара
+(количество, стоимость) для скользящей средней. Стоимость остатка
+заполняется по приходам за вычетом стоимости уже списанного.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 19:40:52.118304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import column_names
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if 'valuation_method' not in column_names('materials'):
+        op.add_column('materials', sa.Column('valuation_method', sa.String(), nullable=False, server_default='fifo'))
+    if 'value' not in column_names('material_stock'):
+        op.add_column('material_stock', sa.Column('value', sa.Float(), nullable=False, server_default='0'))
+        op.execute(
+            "UPDATE material_stock SET value = "
+            "COALESCE((SELECT SUM(quantity * COALESCE(unit_price, 0)) FROM material_movements "
+            "WHERE material_movements.material_id = material_stock.material_id AND type = 'in'), 0) - "
+            "COALESCE((SELECT SUM(cost) FROM packaging_materials "
+            "WHERE packaging_materials.material_id = material_stock.material_id), 0)"
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('material_stock') as batch_op:
+        batch_op.drop_column('value')
+    with op.batch_alter_table('materials') as batch_op:
+        batch_op.drop_column('valuation_method')
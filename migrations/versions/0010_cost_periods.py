@@ -0,0 +1,54 @@
+"""cost periods
+
+Закрытие месяцев и распределение себестоимости по продуктам:
+cost_calculations.closed и data_version, таблица cost_allocations.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 20:21:07.645193
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import column_names
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    existing = column_names('cost_calculations')
+    if 'closed' not in existing:
+        op.add_column('cost_calculations', sa.Column('closed', sa.Boolean(), nullable=False, server_default='0'))
+    if 'data_version' not in existing:
+        op.add_column('cost_calculations', sa.Column('data_version', sa.Integer(), nullable=True))
+    op.create_index('ix_cost_calculations_period', 'cost_calculations', ['period_start', 'period_end'],
+                    unique=False, if_not_exists=True)
+    op.create_table('cost_allocations',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('calculation_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('produced_kg', sa.Float(), nullable=False),
+    sa.Column('packed_units', sa.Integer(), nullable=False),
+    sa.Column('material_cost', sa.Float(), nullable=False),
+    sa.Column('overhead_cost', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['calculation_id'], ['cost_calculations.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_cost_allocations_calculation_id', 'cost_allocations', ['calculation_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_cost_allocations_calculation_id', table_name='cost_allocations')
+    op.drop_table('cost_allocations')
+    op.drop_index('ix_cost_calculations_period', table_name='cost_calculations', if_exists=True)
+    with op.batch_alter_table('cost_calculations') as batch_op:
+        batch_op.drop_column('data_version')
+        batch_op.drop_column('closed')
@@ -0,0 +1,64 @@
+"""stock ledger
+
+Журнал изменений остатков сырья и продукции и ежедневные снимки остатков.
+Текущие остатки записываются в журнал начальными строками (source
+"opening"): история до появления журнала не восстанавливается.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18 22:04:51.318402
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0011'
+down_revision: Union[str, None] = '0010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    movements = op.create_table('stock_movements',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('delta', sa.Integer(), nullable=False),
+    sa.Column('balance', sa.Integer(), nullable=False),
+    sa.Column('source', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_movements_created_at', 'stock_movements', ['created_at'], unique=False)
+    op.create_index('ix_stock_movements_item', 'stock_movements', ['kind', 'item_id', 'created_at'], unique=False)
+    op.create_table('stock_snapshots',
+    sa.Column('taken_at', sa.DateTime(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('taken_at', 'kind', 'item_id')
+    )
+
+    # Начальные остатки
+    bind = op.get_bind()
+    now = datetime.utcnow()
+    rows = []
+    for kind, table, key in (('raw', 'raw_material_storage', 'raw_product_id'),
+                             ('product', 'product_storage', 'product_id')):
+        for item_id, amount in bind.execute(sa.text(f"SELECT {key}, amount FROM {table} WHERE amount <> 0")):
+            rows.append({'kind': kind, 'item_id': item_id, 'delta': amount, 'balance': amount,
+                         'source': 'opening', 'created_at': now})
+    if rows:
+        op.bulk_insert(movements, rows)
+
+
+def downgrade() -> None:
+    op.drop_table('stock_snapshots')
+    op.drop_index('ix_stock_movements_item', table_name='stock_movements')
+    op.drop_index('ix_stock_movements_created_at', table_name='stock_movements')
+    op.drop_table('stock_movements')
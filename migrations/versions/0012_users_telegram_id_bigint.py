@@ -0,0 +1,33 @@
+"""users telegram_id bigint
+
+Telegram ID пользователей не помещаются в 32-битный integer. В SQLite
+INTEGER и так 64-битный, меняется только тип в PostgreSQL.
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18 23:12:40.527614
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0012'
+down_revision: Union[str, None] = '0011'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_context().dialect.name == 'postgresql':
+        op.alter_column('users', 'telegram_id', type_=sa.BigInteger(), existing_type=sa.Integer(),
+                        existing_nullable=False)
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name == 'postgresql':
+        op.alter_column('users', 'telegram_id', type_=sa.Integer(), existing_type=sa.BigInteger(),
+                        existing_nullable=False)
@@ -0,0 +1,33 @@
+"""fsm state version
+
+Версия строки состояния FSM: процессы бота записывают состояние с
+проверкой версии (compare-and-set) и не затирают параллельные изменения
+друг друга.
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-18 23:41:08.906217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import column_names
+
+# revision identifiers, used by Alembic.
+revision: str = '0013'
+down_revision: Union[str, None] = '0012'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if 'version' not in column_names('fsm_states'):
+        op.add_column('fsm_states', sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('fsm_states') as batch_op:
+        batch_op.drop_column('version')
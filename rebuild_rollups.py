@@ -0,0 +1,21 @@
+# rebuild_rollups.py
+"""Полный пересчёт дневных сводных таблиц (статистика, дашборд).
+
+    python rebuild_rollups.py
+"""
+import asyncio
+
+from bot.models.database import init_db, async_session
+from bot.services.rollups import rebuild_rollups
+
+
+async def run():
+    await init_db()
+    async with async_session() as session:
+        counts = await rebuild_rollups(session)
+    for table, count in counts.items():
+        print(f"{table}: {count} строк")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
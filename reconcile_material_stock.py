@@ -0,0 +1,32 @@
+# reconcile_material_stock.py
+"""Сверка таблицы material_stock с движениями материалов.
+
+    python reconcile_material_stock.py            # отчёт и перестроение
+    python reconcile_material_stock.py --dry-run  # только отчёт
+"""
+import argparse
+import asyncio
+
+from bot.models.database import init_db, async_session
+from bot.services.material_service import reconcile_material_stock
+
+
+async def run(dry_run: bool):
+    await init_db()
+    async with async_session() as session:
+        drift = await reconcile_material_stock(session, fix=not dry_run)
+
+    if not drift:
+        print("Расхождений нет")
+        return
+    print(f"Расхождений: {len(drift)}")
+    for material_id, name, stored, actual in drift:
+        print(f"  [{material_id}] {name}: в таблице {stored:g}, по движениям {actual:g} ({actual - stored:+g})")
+    if not dry_run:
+        print("Таблица material_stock перестроена")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сверка остатков материалов")
+    parser.add_argument("--dry-run", action="store_true", help="только показать расхождения")
+    asyncio.run(run(parser.parse_args().dry_run))
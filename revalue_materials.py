@@ -0,0 +1,37 @@
+# revalue_materials.py
+"""Пересчёт стоимости списаний материалов по истории движений.
+
+    python revalue_materials.py                          # все материалы, текущий способ оценки
+    python revalue_materials.py --material 3 --method average
+    python revalue_materials.py --dry-run                # только показать разницу
+"""
+import argparse
+import asyncio
+
+from bot.models.database import init_db, async_session
+from bot.services.material_service import VALUATION_METHODS
+from bot.services.material_valuation import replay_valuation
+
+
+async def run(material_ids, method, dry_run: bool):
+    await init_db()
+    async with async_session() as session:
+        report = await replay_valuation(session, material_ids, method=method, dry_run=dry_run)
+
+    if not report:
+        print("Материалы не найдены")
+        return
+    for row in report:
+        print(f"  [{row.material_id}] {row.name} ({row.method}): списано на {row.old_cost:.2f} -> "
+              f"{row.new_cost:.2f} ({row.new_cost - row.old_cost:+.2f})")
+    if not dry_run:
+        print("Стоимость списаний и остатки пересчитаны")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пересчёт стоимости списаний материалов")
+    parser.add_argument("--material", type=int, action="append", help="id материала (можно несколько)")
+    parser.add_argument("--method", choices=VALUATION_METHODS, help="сначала перевести материалы на этот способ")
+    parser.add_argument("--dry-run", action="store_true", help="только показать разницу")
+    args = parser.parse_args()
+    asyncio.run(run(args.material, args.method, args.dry_run))
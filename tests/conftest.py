@@ -65,6 +65,48 @@ async def db_session(session_factory) -> AsyncSession:  # Правильная 
             await session.close()
 
 
+@pytest_asyncio.fixture
+async def memory_session() -> AsyncSession:
+    """Сессия на чистой БД SQLite в памяти (со всеми таблицами)"""
+    from sqlalchemy.pool import StaticPool
+    import bot.models  # noqa: F401 — регистрирует все модели в Base.metadata
+    from bot.services.material_lots import clear_open_lots
+    from bot.services.user_cache import reset_user_cache
+
+    # кэши партий и пользователей привязаны к процессу, а БД у каждого теста своя
+    clear_open_lots()
+    reset_user_cache()
+
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:",
+        poolclass=StaticPool,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    async with factory() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def seeded_session(memory_session) -> AsyncSession:
+    """memory_session со справочником: оператор, сырьё, мешок 15 кг, наклейка (1) и мешок (2)"""
+    from sqlalchemy import insert
+    from bot.models import Material, Product, RawProduct, User
+
+    await memory_session.execute(insert(User), [
+        {"id": 1, "telegram_id": 100, "full_name": "Оператор", "role": "operator"},
+    ])
+    await memory_session.execute(insert(RawProduct), [{"id": 1, "name": "Пеллеты 6мм"}])
+    await memory_session.execute(insert(Product), [
+        {"id": 1, "name": "Мешок 15 кг", "weight": 15, "raw_product_id": 1},
+    ])
+    await memory_session.execute(insert(Material), [{"id": 1, "name": "Наклейка"}, {"id": 2, "name": "Мешок"}])
+    await memory_session.commit()
+    return memory_session
+
+
 # --------------------------
 # Фикстуры для тестирования aiogram
 # --------------------------
@@ -211,6 +253,8 @@ def fake_user():
             self.id = id
             self.telegram_id = telegram_id
             self.fullname = fullname
+            self.full_name = fullname  # как в модели User
+            self.username = None
             self.role = role
 
     return User
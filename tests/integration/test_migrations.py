@@ -0,0 +1,63 @@
+import pytest
+import pytest_asyncio
+from alembic.autogenerate import compare_metadata
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import text, inspect
+
+import bot.models  # noqa: F401 — регистрирует все модели в Base.metadata
+from bot.models.base import Base
+from bot.models.database import create_engine_from_config
+from bot.models.migrations import ensure_schema, get_db_revision, head_revision
+
+
+@pytest_asyncio.fixture
+async def file_engine(tmp_path):
+    engine = create_engine_from_config(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", echo=False)
+    yield engine
+    await engine.dispose()
+
+
+def _schema_diff(sync_conn):
+    return compare_metadata(MigrationContext.configure(sync_conn), Base.metadata)
+
+
+@pytest.mark.asyncio
+async def test_migrations_match_models(file_engine):
+    await ensure_schema(file_engine, auto_migrate=True)
+
+    assert await get_db_revision(file_engine) == head_revision()
+    async with file_engine.connect() as conn:
+        assert await conn.run_sync(_schema_diff) == []
+
+
+@pytest.mark.asyncio
+async def test_outdated_schema_without_auto_migrate(file_engine):
+    with pytest.raises(RuntimeError, match="alembic upgrade head"):
+        await ensure_schema(file_engine, auto_migrate=False)
+
+
+@pytest.mark.asyncio
+async def test_legacy_database_is_upgraded(file_engine):
+    # База в виде до ручных скриптов migrate_*: arrivals.type обязателен, raw_product_id нет
+    async with file_engine.begin() as conn:
+        for statement in (
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, telegram_id INTEGER NOT NULL UNIQUE, "
+            "full_name VARCHAR NOT NULL, role VARCHAR, username VARCHAR UNIQUE, hashed_password VARCHAR)",
+            "CREATE TABLE raw_products (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL UNIQUE)",
+            "CREATE TABLE arrivals (id INTEGER PRIMARY KEY AUTOINCREMENT, type VARCHAR NOT NULL, "
+            "amount INTEGER NOT NULL, date DATETIME, user_id INTEGER NOT NULL REFERENCES users(id))",
+            "INSERT INTO raw_products (id, name) VALUES (1, 'Пеллеты 6мм'), (2, 'Пеллеты 8мм')",
+            "INSERT INTO arrivals (type, amount, date, user_id) VALUES "
+            "('Пеллеты 6мм', 100, '2025-01-10 10:00:00', 1), ('Пеллеты 8мм', 200, '2025-01-11 10:00:00', 1)",
+        ):
+            await conn.execute(text(statement))
+
+    await ensure_schema(file_engine, auto_migrate=True)
+
+    async with file_engine.connect() as conn:
+        rows = (await conn.execute(text("SELECT amount, raw_product_id FROM arrivals ORDER BY id"))).all()
+        columns = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_columns("arrivals"))
+        indexes = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_indexes("arrivals"))
+    assert rows == [(100, 1), (200, 2)]
+    assert next(column for column in columns if column["name"] == "type")["nullable"]
+    assert "ix_arrivals_date" in {index["name"] for index in indexes}
@@ -0,0 +1,94 @@
+"""Работа с PostgreSQL.
+
+Тесты с реальной базой запускаются только при заданном TEST_POSTGRES_URL
+(временный сервер: docker-compose.postgres.yml). База очищается перед тестом,
+схема создаётся миграциями Alembic, как при запуске бота.
+"""
+import os
+from datetime import date, datetime
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, func, column, text, DateTime
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.services.periods import day_bucket, month_bucket
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+def test_buckets_compile_for_each_dialect():
+    value = column("date", DateTime)
+    stmt = select(day_bucket(value), month_bucket(value))
+
+    assert str(stmt.compile(dialect=sqlite.dialect())) == (
+        "SELECT date(date) AS day_bucket_1, strftime('%Y-%m', date) AS month_bucket_1"
+    )
+    assert str(stmt.compile(dialect=postgresql.dialect())) == (
+        "SELECT CAST(date AS DATE) AS day_bucket_1, to_char(date, 'YYYY-MM') AS month_bucket_1"
+    )
+
+
+@pytest_asyncio.fixture
+async def pg_session():
+    if not TEST_POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL не задан")
+    from bot.models.database import create_engine_from_config
+    from bot.models.migrations import upgrade_db
+    from bot.services.material_lots import clear_open_lots
+
+    clear_open_lots()
+    engine = create_engine_from_config(TEST_POSTGRES_URL, echo=False)
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP SCHEMA public CASCADE"))
+        await conn.execute(text("CREATE SCHEMA public"))
+    await upgrade_db(engine)
+    factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    async with factory() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_services_and_rollups_on_postgres(pg_session):
+    from bot.config import DB_POOL_SIZE
+    from bot.models import Arrival, Material, RawProduct, User, DailyRawRollup, DailyExpenseRollup
+    from bot.models.storage import RawMaterialStorage
+    from bot.services.arrival import add_arrival
+    from bot.services.material_service import purchase_material, get_material_stock
+    from bot.services.rollups import rebuild_rollups
+
+    assert pg_session.get_bind().pool.size() == DB_POOL_SIZE
+
+    telegram_id = 5123456789  # реальные Telegram ID больше 2^31
+    user = User(telegram_id=telegram_id, full_name="Тест", role="admin")
+    raw = RawProduct(name="Пеллеты 6мм")
+    material = Material(name="Мешок")
+    pg_session.add_all([user, raw, material])
+    await pg_session.flush()
+    pg_session.add(RawMaterialStorage(raw_product_id=raw.id, amount=0))
+    await pg_session.commit()
+
+    await add_arrival(pg_session, telegram_id, raw.id, 1000)
+    await add_arrival(pg_session, telegram_id, raw.id, 500)
+    await purchase_material(pg_session, material.id, 100, "шт", 12.5, expense_amount=1250.5, user_id=user.id)
+
+    assert (await get_material_stock(pg_session))[0][1] == 100
+
+    # Пересчёт сводных таблиц должен совпасть с обновлениями при записи
+    live = (await pg_session.execute(select(DailyRawRollup.arrived_kg, DailyRawRollup.arrivals_count))).all()
+    await rebuild_rollups(pg_session)
+    rebuilt = (await pg_session.execute(select(DailyRawRollup.arrived_kg, DailyRawRollup.arrivals_count))).all()
+    assert live == rebuilt == [(1500, 2)]
+    assert await pg_session.scalar(select(DailyExpenseRollup.amount)) == 1250.5
+
+    day = day_bucket(Arrival.date)
+    month = month_bucket(Arrival.date)
+    row = (await pg_session.execute(
+        select(day, month, func.sum(Arrival.amount)).group_by(day, month)
+    )).one()
+    today = datetime.utcnow().date()
+    assert row[0] == today and isinstance(row[0], date)
+    assert row[1] == today.strftime("%Y-%m")
+    assert row[2] == 1500
@@ -0,0 +1,88 @@
+"""Параллельные фасовки и отгрузки не теряют изменений остатков.
+
+Каждая операция — отдельная сессия и транзакция, как у бота и веб-панели.
+На SQLite используется файловая база в режиме WAL; на PostgreSQL тест
+запускается при заданном TEST_POSTGRES_URL.
+"""
+import asyncio
+import os
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.exceptions import InsufficientStockError
+from bot.models import Product, ProductStorage, RawMaterialStorage, RawProduct
+from bot.models.base import Base
+from bot.models.database import create_engine_from_config
+from bot.services.storage import change_product_stock, change_raw_stock
+
+RAW_STOCK = 1000
+PACK_WEIGHT = 30  # кг сырья на пачку: сырья хватает на 33 пачки
+PACKAGINGS = 45
+SHIPMENTS = 25
+
+BACKENDS = ["sqlite"] + (["postgresql"] if os.getenv("TEST_POSTGRES_URL") else [])
+
+
+@pytest_asyncio.fixture(params=BACKENDS)
+async def session_factory(request, tmp_path):
+    if request.param == "sqlite":
+        engine = create_engine_from_config(
+            f"sqlite+aiosqlite:///{tmp_path / 'stock.db'}", echo=False,
+            pragmas={"journal_mode": "WAL", "busy_timeout": 30000},
+        )
+    else:
+        engine = create_engine_from_config(os.environ["TEST_POSTGRES_URL"], echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(RawProduct), [{"id": 1, "name": "Пеллеты 6мм"}])
+        await conn.execute(insert(Product), [{"id": 1, "name": "Мешок 30кг", "weight": PACK_WEIGHT, "raw_product_id": 1}])
+        # id строк склада намеренно не совпадают с id сырья и продукции
+        await conn.execute(insert(RawMaterialStorage), [{"id": 7, "raw_product_id": 1, "amount": RAW_STOCK}])
+        await conn.execute(insert(ProductStorage), [{"id": 9, "product_id": 1, "amount": 0}])
+    yield async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    await engine.dispose()
+
+
+async def _packaging(factory) -> bool:
+    async with factory() as session:
+        try:
+            await change_raw_stock(session, 1, -PACK_WEIGHT)
+            await asyncio.sleep(0)  # даём другим задачам вклиниться между командами
+            await change_product_stock(session, 1, 1)
+        except InsufficientStockError:
+            await session.rollback()
+            return False
+        await session.commit()
+        return True
+
+
+async def _shipment(factory) -> bool:
+    async with factory() as session:
+        try:
+            await change_product_stock(session, 1, -1)
+        except InsufficientStockError:
+            await session.rollback()
+            return False
+        await session.commit()
+        return True
+
+
+@pytest.mark.asyncio
+async def test_parallel_packagings_and_shipments_lose_no_updates(session_factory):
+    tasks = [_packaging(session_factory) for _ in range(PACKAGINGS)]
+    tasks += [_shipment(session_factory) for _ in range(SHIPMENTS)]
+    results = await asyncio.gather(*tasks)
+    packed = sum(results[:PACKAGINGS])
+    shipped = sum(results[PACKAGINGS:])
+
+    async with session_factory() as session:
+        raw = await session.scalar(select(RawMaterialStorage.amount))
+        products = await session.scalar(select(ProductStorage.amount))
+
+    assert packed == RAW_STOCK // PACK_WEIGHT
+    assert raw == RAW_STOCK - packed * PACK_WEIGHT
+    assert products == packed - shipped >= 0
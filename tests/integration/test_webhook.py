@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.webhook import SECRET_HEADER, UpdateProcessor, create_webhook_app
+
+SECRET = "test-secret"
+
+
+def _update(update_id: int, chat_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1735689600,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Тест"},
+            "text": f"сообщение {update_id}",
+        },
+    }
+
+
+def _dispatcher(log: list, release: asyncio.Event) -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def handler(message: Message):
+        log.append(("start", message.chat.id, message.message_id))
+        await release.wait()
+        log.append(("end", message.chat.id, message.message_id))
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+@pytest.mark.asyncio
+async def test_webhook_limits_and_drains():
+    log, release = [], asyncio.Event()
+    processor = UpdateProcessor(_dispatcher(log, release), Bot(token="42:TEST"), max_concurrent=2, max_pending=3)
+    async with TestClient(TestServer(create_webhook_app(processor, "/hook", SECRET))) as client:
+        headers = {SECRET_HEADER: SECRET}
+        assert (await client.post("/hook", json=_update(1, 10))).status == 401
+
+        for update_id, chat_id in ((1, 10), (2, 10), (3, 20)):
+            assert (await client.post("/hook", json=_update(update_id, chat_id), headers=headers)).status == 200
+        # Очередь заполнена — Telegram получит 503 и повторит позже
+        assert (await client.post("/hook", json=_update(4, 30), headers=headers)).status == 503
+        await asyncio.sleep(0.05)
+
+        # Второе сообщение чата 10 ждёт первое, другой чат обрабатывается параллельно
+        assert sorted(log) == [("start", 10, 1), ("start", 20, 3)]
+
+        release.set()
+        assert await processor.drain(timeout=5) == 0
+        assert log.index(("end", 10, 1)) < log.index(("start", 10, 2))
+        assert (await client.post("/hook", json=_update(5, 10), headers=headers)).status == 503
+
+        metrics = await (await client.get("/hook/metrics", headers=headers)).json()
+        assert (metrics["received"], metrics["processed"], metrics["rejected"]) == (3, 3, 2)
+        assert metrics["wait_ms"]["max"] >= metrics["wait_ms"]["p50"] > 0
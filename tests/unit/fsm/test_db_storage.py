@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.fsm.shipment import ShipmentStates
+from bot.fsm.storage import DatabaseStorage, delete_expired_states
+from bot.models import FsmState
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+def _storage(session) -> DatabaseStorage:
+    factory = async_sessionmaker(session.bind, expire_on_commit=False, class_=AsyncSession)
+    return DatabaseStorage(session_factory=factory, read_session_factory=factory)
+
+
+@pytest.mark.asyncio
+async def test_one_read_and_one_write_per_event(memory_session):
+    storage = _storage(memory_session)
+    isolation = storage.isolation()
+
+    started = datetime(2025, 3, 1, 9, 30)
+    async with isolation.lock(KEY):
+        await storage.set_state(KEY, ShipmentStates.selecting_product)
+        await storage.update_data(KEY, {"items": [], "started": started})
+        data = await storage.get_data(KEY)
+        data["items"].append([1, 5])  # изменение на месте тоже сохраняется
+        await storage.update_data(KEY, {"selected_product_id": 1})
+    assert storage.stats == {"reads": 1, "writes": 1}
+
+    async with isolation.lock(KEY):
+        await storage.get_state(KEY)
+    assert storage.stats == {"reads": 2, "writes": 1}  # без изменений — без записи
+
+    # Новый экземпляр — как после перезапуска бота
+    restarted = _storage(memory_session)
+    assert await restarted.get_state(KEY) == ShipmentStates.selecting_product.state
+    assert await restarted.get_data(KEY) == {"items": [[1, 5]], "started": started, "selected_product_id": 1}
+
+    async with isolation.lock(KEY):
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+    assert await memory_session.scalar(select(func.count()).select_from(FsmState)) == 0
+
+
+@pytest.mark.asyncio
+async def test_expired_states_are_deleted(memory_session):
+    now = datetime.utcnow()
+    await memory_session.execute(insert(FsmState), [
+        {"key": "fsm:1:1:1:default", "state": "s", "updated_at": now - timedelta(hours=49)},
+        {"key": "fsm:1:2:2:default", "state": "s", "updated_at": now - timedelta(hours=1)},
+    ])
+    await memory_session.commit()
+
+    assert await delete_expired_states(memory_session, ttl_hours=48) == 1
+    assert await memory_session.scalar(select(FsmState.key)) == "fsm:1:2:2:default"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_processes_merge_changes(memory_session):
+    first, second = _storage(memory_session), _storage(memory_session)
+    async with first.isolation().lock(KEY):
+        await first.set_state(KEY, ShipmentStates.selecting_product)
+        await first.update_data(KEY, {"items": [], "note": "старое"})
+
+    # Одно событие чата в каждом процессе: оба прочитали одну и ту же версию
+    async with first.isolation().lock(KEY):
+        await first.update_data(KEY, {"items": [[1, 5]]})
+        async with second.isolation().lock(KEY):
+            await second.set_state(KEY, ShipmentStates.entering_quantity)
+            await second.update_data(KEY, {"note": "новое"})
+
+    assert await first.get_state(KEY) == ShipmentStates.entering_quantity.state
+    assert await first.get_data(KEY) == {"items": [[1, 5]], "note": "новое"}
+    assert await memory_session.scalar(select(FsmState.version)) == 3
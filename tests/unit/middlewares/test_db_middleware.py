@@ -0,0 +1,43 @@
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from bot.middlewares.db import DBMetrics, DBMiddleware
+
+
+@pytest.fixture
+def middleware():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    read_factory = async_sessionmaker(
+        engine.execution_options(isolation_level="AUTOCOMMIT"), expire_on_commit=False, class_=AsyncSession
+    )
+    return DBMiddleware(factory, read_factory, metrics=DBMetrics())
+
+
+@pytest.mark.asyncio
+async def test_session_is_created_on_first_use(middleware):
+    async def close_menu(event, data):
+        return "closed"
+
+    async def read_report(event, data):
+        return (await data["read_session"].execute(select(text("1")))).scalar()
+
+    async def add_record(event, data):
+        session = data["session"]
+        await session.execute(text("CREATE TABLE notes (id INTEGER PRIMARY KEY)"))
+        await session.commit()
+        return data["kwargs"]["session"] is session
+
+    assert await middleware(close_menu, None, {}) == "closed"
+    assert await middleware(read_report, None, {}) == 1
+    assert await middleware(add_record, None, {}) is True
+
+    assert middleware.metrics.as_dict() == {
+        "updates": 3,
+        "sessions_opened": 1,
+        "read_sessions_opened": 1,
+        "db_used": 2,
+        "db_used_ratio": 0.667,
+    }
@@ -79,14 +79,15 @@ async def test_get_arrivals_for_month(mock_db_session):
     # Получаем объект select, который был передан в execute
     query = args[0]
 
-    # Мы проверяем, что фильтрация идет по месяцу и что используется текущий месяц
-    current_month = datetime.utcnow().month
-
-    # Проверяем, что запрос содержит фильтрацию с использованием extract по месяцу
-    # Вместо использования _whereclause, мы сравниваем сам запрос
-    expected_filter = extract('month', Arrival.date) == current_month
+    # Фильтр — диапазон дат [начало месяца, начало следующего), без extract по столбцу
     actual_filter = query._whereclause
-    assert str(expected_filter) in str(actual_filter)
+    assert "arrivals.date >=" in str(actual_filter)
+    assert "arrivals.date <" in str(actual_filter)
+    assert "EXTRACT" not in str(actual_filter).upper()
+
+    params = actual_filter.compile().params
+    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    assert month_start in params.values()
 
 # @pytest.mark.asyncio
 # async def test_get_arrivals_for_month(mock_db_session):
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.models import Arrival, AuditLog, Material, RawProduct, User
+from bot.services.audit_log import audit_writer, get_audit_page
+from bot.services.change_tracking import ACTOR_KEY, ChangeActor
+from bot.services.material_service import consume_material, purchase_material, reverse_material_consumption
+
+
+@pytest_asyncio.fixture
+async def running_writer(memory_session):
+    default_factory = audit_writer.session_factory
+    audit_writer.session_factory = async_sessionmaker(memory_session.bind, expire_on_commit=False, class_=AsyncSession)
+    await audit_writer.start()
+    yield audit_writer
+    await audit_writer.stop()
+    audit_writer.session_factory = default_factory
+
+
+@pytest.mark.asyncio
+async def test_changes_are_written_after_commit(memory_session, running_writer):
+    memory_session.info[ACTOR_KEY] = ChangeActor(100, "Оператор")
+    memory_session.add_all([
+        User(id=1, telegram_id=100, full_name="Оператор", role="operator", hashed_password="secret"),
+        RawProduct(id=1, name="Пеллеты 6мм"),
+    ])
+    arrival = Arrival(raw_product_id=1, amount=100, user_id=1)
+    memory_session.add(arrival)
+    await memory_session.commit()
+    arrival.amount = 120
+    await memory_session.flush()
+    await memory_session.rollback()  # откатанные изменения в журнал не попадают
+    await memory_session.refresh(arrival)
+    arrival.amount = 150
+    await memory_session.commit()
+
+    # Запись журнала не входит в транзакцию пользователя
+    assert await memory_session.scalar(select(AuditLog.id)) is None
+    await running_writer.flush()
+
+    entries, _ = await get_audit_page(memory_session, entity_type="arrivals", entity_id=arrival.id)
+    assert [(e.action, e.actor_name) for e in entries] == [("update", "Оператор"), ("create", "Оператор")]
+    assert entries[0].changes == {"amount": [100, 150]}
+    user_entry, _ = await get_audit_page(memory_session, entity_type="users")
+    assert "hashed_password" not in user_entry[0].changes
+
+
+@pytest.mark.asyncio
+async def test_keyset_pages_cover_log_once(memory_session):
+    start = datetime(2025, 1, 1)
+    await memory_session.execute(insert(AuditLog), [
+        {"timestamp": start + timedelta(minutes=i // 2), "action": "create", "entity_type": "arrivals", "entity_id": i}
+        for i in range(25)
+    ])
+    await memory_session.commit()
+
+    seen, cursor = [], None
+    while True:
+        entries, cursor = await get_audit_page(memory_session, cursor=cursor, limit=10)
+        seen.extend(e.entity_id for e in entries)
+        if cursor is None:
+            break
+    assert seen == sorted(range(25), reverse=True)
+
+
+@pytest.mark.asyncio
+async def test_bulk_writes_are_audited(memory_session, running_writer):
+    memory_session.info[ACTOR_KEY] = ChangeActor(100, "Оператор")
+    memory_session.add(Material(id=1, name="Мешок"))
+    await memory_session.commit()
+    lot = await purchase_material(memory_session, 1, 10, "шт", 2.0)
+    await consume_material(memory_session, 1, 4, packaging_id=7)
+    await memory_session.commit()
+    await reverse_material_consumption(memory_session, 7)
+    await memory_session.commit()
+    await running_writer.flush()
+
+    rows = (await memory_session.execute(
+        select(AuditLog.entity_type, AuditLog.action, AuditLog.entity_id, AuditLog.changes, AuditLog.actor_name)
+        .where(AuditLog.entity_type != "materials").order_by(AuditLog.id)
+    )).all()
+    out_id = rows[2][2]
+    assert [row[:3] for row in rows] == [
+        ("material_movements", "create", lot.id),  # закупка через ORM
+        ("material_movements", "update", lot.id),
+        ("material_movements", "create", out_id),
+        ("packaging_materials", "create", rows[3][2]),
+        ("material_movements", "update", lot.id),
+        ("material_movements", "delete", out_id),
+        ("packaging_materials", "delete", rows[3][2]),
+    ]
+    assert rows[1][3] == {"remaining_quantity": [10, 6]}
+    assert rows[4][3] == {"remaining_quantity": [6, 10]}
+    assert rows[2][3]["source_movement_id"] == lot.id
+    assert {row[4] for row in rows} == {"Оператор"}
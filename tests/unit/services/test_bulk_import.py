@@ -0,0 +1,111 @@
+import io
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from bot.models import (
+    Arrival, DailyExpenseRollup, DailyRawRollup, Expense, MaterialMovement, MaterialStock, RawMaterialStorage,
+)
+from bot.services import bulk_import
+from bot.services.bulk_import import import_file
+from bot.services.material_service import consume_material, purchase_material, reverse_material_consumption
+
+
+def _csv(text: str) -> io.BytesIO:
+    return io.BytesIO(text.encode("utf-8-sig"))
+
+
+@pytest.mark.asyncio
+async def test_errors_reject_whole_file(seeded_session):
+    report = await import_file(seeded_session, "arrivals", _csv(
+        "Дата;Сырьё;Количество, кг\n"
+        "01.02.2021;Пеллеты 6мм;500\n"
+        "31.02.2021;Пеллеты 6мм;500\n"
+        "01.03.2021;Опилки;-5\n"
+    ), "csv", user_id=1)
+
+    assert report.rows == 3
+    assert [line for line, _ in report.errors] == [3, 4]
+    assert await seeded_session.scalar(select(func.count(Arrival.id))) == 0
+
+
+@pytest.mark.asyncio
+async def test_arrivals_and_expenses_update_totals(seeded_session, monkeypatch):
+    monkeypatch.setattr(bulk_import, "IMPORT_CHUNK", 2)
+    report = await import_file(seeded_session, "arrivals", _csv(
+        "Сырьё;Дата;Количество, кг;Автор\n"
+        "пеллеты 6мм;01.02.2021;500;\n"
+        "Пеллеты 6мм;01.02.2021 10:15;250;\n"
+        "Пеллеты 6мм;2021-02-02;100;\n"
+    ), "csv", user_id=1)
+    assert report.ok and report.inserted == 3
+
+    await import_file(seeded_session, "expenses", _csv(
+        "Дата,Сумма,Категория,Назначение\n"
+        "01.02.2021,\"1 200,50\",Топливо,Солярка\n"
+    ), "csv", user_id=1)
+
+    assert await seeded_session.scalar(select(RawMaterialStorage.amount)) == 850
+    raw = (await seeded_session.execute(
+        select(DailyRawRollup.day, DailyRawRollup.arrived_kg, DailyRawRollup.arrivals_count)
+        .order_by(DailyRawRollup.day)
+    )).all()
+    assert raw == [(date(2021, 2, 1), 750, 2), (date(2021, 2, 2), 100, 1)]
+    expense = (await seeded_session.execute(select(Expense.category, Expense.amount, Expense.source))).one()
+    assert expense == ("fuel", 1200.5, "собственные средства")
+    assert await seeded_session.scalar(select(DailyExpenseRollup.amount)) == 1200.5
+
+
+@pytest.mark.asyncio
+async def test_backdated_purchase_takes_fifo_consumption(seeded_session):
+    # Текущая партия: пришло 100, списано 30
+    await seeded_session.execute(insert(MaterialMovement), [{
+        "id": 1, "material_id": 2, "type": "in", "quantity": 100, "unit": "шт", "unit_price": 5,
+        "remaining_quantity": 70, "date": datetime(2024, 1, 1),
+    }])
+    await seeded_session.execute(insert(MaterialStock), [{"material_id": 2, "quantity": 70}])
+    await seeded_session.commit()
+
+    report = await import_file(seeded_session, "purchases", _csv(
+        "Дата;Материал;Количество;Ед.;Цена за ед.;Сумма\n"
+        "01.01.2020;Мешок;20;шт;4;80\n"
+        "01.06.2020;Мешок;50;шт;4,5;\n"
+    ), "csv", user_id=1)
+    assert report.ok
+
+    lots = (await seeded_session.execute(
+        select(MaterialMovement.quantity, MaterialMovement.remaining_quantity)
+        .where(MaterialMovement.type == "in").order_by(MaterialMovement.date)
+    )).all()
+    assert lots == [(20, 0), (50, 40), (100, 100)]
+    assert await seeded_session.scalar(select(MaterialStock.quantity)) == 140
+    assert await seeded_session.scalar(select(func.count(Expense.id))) == 1
+
+
+@pytest.mark.asyncio
+async def test_reversal_after_backdated_purchase_restores_lots(seeded_session):
+    await purchase_material(seeded_session, 2, 10, "шт", 2.0)
+    await consume_material(seeded_session, 2, 5, packaging_id=1)
+    await seeded_session.commit()
+
+    await import_file(seeded_session, "purchases", _csv(
+        "Дата;Материал;Количество;Ед.;Цена за ед.\n"
+        "01.01.2020;Мешок;10;шт;1\n"
+    ), "csv", user_id=1)
+    # Списание перенесено на ранний приход вместе со ссылкой расхода
+    links = (await seeded_session.execute(
+        select(MaterialMovement.source_movement_id, MaterialMovement.quantity).where(MaterialMovement.type == "out")
+    )).all()
+    imported = await seeded_session.scalar(
+        select(MaterialMovement.id).where(MaterialMovement.date < datetime(2021, 1, 1))
+    )
+    assert links == [(imported, 5)]
+
+    await reverse_material_consumption(seeded_session, 1)
+    await seeded_session.commit()
+    lots = (await seeded_session.execute(
+        select(MaterialMovement.quantity, MaterialMovement.remaining_quantity)
+        .where(MaterialMovement.type == "in").order_by(MaterialMovement.date)
+    )).all()
+    assert lots == [(10, 10), (10, 10)]
@@ -0,0 +1,48 @@
+from unittest.mock import MagicMock
+
+import pytest
+from aiogram.types import Message
+from sqlalchemy import event, select
+
+from bot.models import Arrival, NotificationOutbox, RawProduct, User
+from bot.services.wrapers import track_changes
+
+
+@pytest.mark.asyncio
+async def test_one_record_per_flush_without_selects(memory_session):
+    memory_session.add_all([
+        User(id=1, telegram_id=100, full_name="Админ", role="admin"),
+        RawProduct(id=1, name="Пеллеты 6мм"),
+    ])
+    await memory_session.commit()
+
+    message = MagicMock(spec=Message)
+    message.from_user = MagicMock(id=100, full_name="Оператор Иван")
+
+    @track_changes("поступления")
+    async def handler(message: Message, session):
+        arrival = Arrival(raw_product_id=1, amount=100, user_id=1)
+        session.add(arrival)
+        await session.commit()
+        arrival.amount = 150
+        await session.commit()
+        await session.delete(arrival)
+        await session.commit()
+
+    statements = []
+    engine = memory_session.bind.sync_engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        await handler(message, session=memory_session)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert not [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+    texts = (await memory_session.execute(
+        select(NotificationOutbox.text).order_by(NotificationOutbox.id)
+    )).scalars().all()
+    assert len(texts) == 3
+    assert "create поступления #1" in texts[0] and "Оператор Иван" in texts[0]
+    assert "amount: 100 → 150" in texts[1]
+    assert "delete поступления #1" in texts[2]
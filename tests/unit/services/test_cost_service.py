@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from bot.exceptions import InvalidDataError
+from bot.models import CostCalculation, Expense, Packaging, Product
+from bot.services.cost_service import calculate_full_cost, close_month, month_costs, reopen_month
+from bot.services.periods import previous_month_period
+
+
+async def _fill(session):
+    await session.execute(insert(Product), [{"id": 2, "name": "Мешок 5 кг", "weight": 5, "raw_product_id": 1}])
+    month = previous_month_period()
+    day = datetime.combine(month.start, datetime.min.time()) + timedelta(days=3)
+    session.add_all([
+        Packaging(product_id=1, raw_product_id=1, amount=20, used_raw_material=300, total_material_cost=60,
+                  user_id=1, date=day),
+        Packaging(product_id=2, raw_product_id=1, amount=20, used_raw_material=100, total_material_cost=40,
+                  user_id=1, date=day),
+        Expense(amount=200, purpose="Электричество", source="касса", user_id=1, date=day),
+    ])
+    await session.commit()
+    return month
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_are_deduplicated(seeded_session):
+    month = await _fill(seeded_session)
+
+    first = await calculate_full_cost(seeded_session, month.start, month.last_day)
+    second = await calculate_full_cost(seeded_session, month.start, month.last_day)
+    assert second.id == first.id
+    assert (first.total_material_cost, first.total_overhead_cost, first.total_produced_kg) == (100, 200, 400)
+    # Накладные делятся по выпуску: 300 и 100 кг
+    assert [(row.product_id, row.overhead_cost, row.cost_per_unit) for row in first.allocations] == [
+        (1, 150.0, 10.5), (2, 50.0, 4.5),
+    ]
+
+    seeded_session.add(Expense(amount=40, purpose="Ремонт", source="касса", user_id=1,
+                               date=datetime.combine(month.start, datetime.min.time())))
+    await seeded_session.commit()
+    third = await calculate_full_cost(seeded_session, month.start, month.last_day)
+    assert third.id != first.id
+    assert third.total_overhead_cost == 240
+    assert await seeded_session.scalar(select(func.count()).select_from(CostCalculation)) == 2
+
+
+@pytest.mark.asyncio
+async def test_closed_month_is_frozen(seeded_session):
+    month = await _fill(seeded_session)
+    calc = await close_month(seeded_session, month.start.year, month.start.month)
+    with pytest.raises(InvalidDataError):
+        await close_month(seeded_session, month.start.year, month.start.month)
+
+    seeded_session.add(Expense(amount=40, purpose="Ремонт", source="касса", user_id=1,
+                               date=datetime.combine(month.start, datetime.min.time())))
+    await seeded_session.commit()
+
+    totals = await month_costs(seeded_session, month.start.year, month.start.month)
+    assert totals.closed
+    assert (totals.overhead, totals.cost_per_kg) == (200, 0.75)
+    assert (await calculate_full_cost(seeded_session, month.start, month.last_day)).id == calc.id
+
+    assert await reopen_month(seeded_session, calc.id)
+    totals = await month_costs(seeded_session, month.start.year, month.start.month)
+    assert (totals.closed, totals.overhead) == (False, 240)
@@ -0,0 +1,52 @@
+import csv
+import io
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import insert
+
+from bot.models import Material, Packaging, PackagingMaterial
+from bot.services.export import write_export
+from bot.services.periods import days_period
+
+
+async def _fill(session):
+    await session.execute(insert(Material), [{"id": 3, "name": "Нитка"}])
+    await session.execute(insert(Packaging), [
+        {"id": 1, "product_id": 1, "amount": 10, "used_raw_material": 150, "user_id": 1, "raw_product_id": 1,
+         "date": datetime(2025, 3, 1, 9, 30), "total_material_cost": 55.0},
+        {"id": 2, "product_id": 1, "amount": 5, "used_raw_material": 75, "user_id": 1, "raw_product_id": 1,
+         "date": datetime(2025, 4, 1, 9, 30)},
+    ])
+    await session.execute(insert(PackagingMaterial), [
+        {"packaging_id": 1, "material_id": 2, "quantity": 10, "unit": "шт", "cost": 50.0},
+        {"packaging_id": 1, "material_id": 3, "quantity": 2, "unit": "м", "cost": 5.0},
+    ])
+    await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_csv_export_one_row_per_material(seeded_session):
+    await _fill(seeded_session)
+    buffer = io.BytesIO()
+    await write_export(seeded_session, "packaging", "csv", buffer, days_period(date(2025, 3, 1), date(2025, 3, 31)))
+
+    text = buffer.getvalue().decode("utf-8-sig")
+    rows = list(csv.reader(io.StringIO(text), delimiter=";"))
+    assert rows[0][:3] == ["ID", "Дата", "Продукция"]
+    assert [(r[0], r[1], r[8]) for r in rows[1:]] == [
+        ("1", "01.03.2025 09:30", "Мешок"),
+        ("1", "01.03.2025 09:30", "Нитка"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_xlsx_export(seeded_session):
+    openpyxl = pytest.importorskip("openpyxl")
+    await _fill(seeded_session)
+    buffer = io.BytesIO()
+    await write_export(seeded_session, "packaging", "xlsx", buffer)
+
+    buffer.seek(0)
+    sheet = openpyxl.load_workbook(buffer).active
+    assert [row[0] for row in sheet.iter_rows(min_row=2, values_only=True)] == [1, 1, 2]
@@ -0,0 +1,117 @@
+import pytest
+from sqlalchemy import select
+
+from bot.models import Material, MaterialMovement, MaterialStock, PackagingMaterial
+from bot.services.material_lots import get_open_lots
+from bot.services.material_service import (
+    consume_material,
+    get_material_stock,
+    purchase_material,
+    reconcile_material_stock,
+    return_material,
+)
+
+
+async def _add_lots(session, material_id, lots):
+    for quantity, unit_price in lots:
+        session.add(MaterialMovement(
+            material_id=material_id,
+            type='in',
+            quantity=quantity,
+            unit='шт',
+            unit_price=unit_price,
+            remaining_quantity=quantity,
+        ))
+    await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_consume_material_fifo(memory_session):
+    material = Material(name="Наклейка")
+    memory_session.add(material)
+    await memory_session.commit()
+    await _add_lots(memory_session, material.id, [(10, 1.0), (10, 2.0), (10, 3.0)])
+
+    cost = await consume_material(memory_session, material.id, 15, packaging_id=1)
+    await memory_session.commit()
+
+    # 10 шт по 1.0 + 5 шт по 2.0
+    assert cost == pytest.approx(20.0)
+    remaining = (await memory_session.execute(
+        select(MaterialMovement.remaining_quantity)
+        .where(MaterialMovement.type == 'in')
+        .order_by(MaterialMovement.id)
+    )).scalars().all()
+    assert remaining == [0, 5, 10]
+
+    pm_rows = (await memory_session.execute(select(PackagingMaterial))).scalars().all()
+    assert [(pm.quantity, pm.cost) for pm in pm_rows] == [(10, 10.0), (5, 10.0)]
+
+    # После коммита кэш содержит только открытые партии
+    lots, from_cache = await get_open_lots(memory_session, material.id)
+    assert from_cache
+    assert [lot.remaining for lot in lots] == [5, 10]
+
+
+@pytest.mark.asyncio
+async def test_consume_material_not_enough(memory_session):
+    material = Material(name="Пакет")
+    memory_session.add(material)
+    await memory_session.commit()
+    await _add_lots(memory_session, material.id, [(3, 1.0)])
+
+    with pytest.raises(ValueError):
+        await consume_material(memory_session, material.id, 5, packaging_id=1)
+
+    # При нехватке ничего не списывается
+    out_count = (await memory_session.execute(
+        select(MaterialMovement).where(MaterialMovement.type == 'out')
+    )).scalars().all()
+    assert out_count == []
+
+
+@pytest.mark.asyncio
+async def test_consume_material_sees_new_purchase(memory_session):
+    material = Material(name="Коробка")
+    memory_session.add(material)
+    await memory_session.commit()
+    await _add_lots(memory_session, material.id, [(2, 1.0)])
+
+    await consume_material(memory_session, material.id, 2, packaging_id=1)
+    await memory_session.commit()
+
+    # Новая закупка сбрасывает кэш материала
+    await _add_lots(memory_session, material.id, [(4, 2.0)])
+    cost = await consume_material(memory_session, material.id, 3, packaging_id=2)
+    await memory_session.commit()
+    assert cost == pytest.approx(6.0)
+
+
+@pytest.mark.asyncio
+async def test_material_stock_ledger(memory_session):
+    material = Material(name="Наклейка")
+    memory_session.add(material)
+    await memory_session.commit()
+
+    await purchase_material(memory_session, material.id, 10, 'шт', 1.0)
+    await consume_material(memory_session, material.id, 4, packaging_id=1)
+    await return_material(memory_session, material.id, 1, 'шт', 1.0, packaging_id=1)
+    await memory_session.commit()
+
+    [(_, stock)] = await get_material_stock(memory_session)
+    assert stock == pytest.approx(7)
+    assert await reconcile_material_stock(memory_session, fix=False) == []
+
+
+@pytest.mark.asyncio
+async def test_reconcile_material_stock_fixes_drift(memory_session):
+    material = Material(name="Пакет")
+    memory_session.add(material)
+    await memory_session.commit()
+    await _add_lots(memory_session, material.id, [(5, 1.0)])  # в обход purchase_material
+
+    drift = await reconcile_material_stock(memory_session)
+    assert [(row[0], row[2], row[3]) for row in drift] == [(material.id, 0, 5)]
+
+    stock = await memory_session.get(MaterialStock, material.id)
+    assert stock.quantity == pytest.approx(5)
@@ -0,0 +1,94 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert, select
+
+from bot.models import DailyProductRollup, Material, MaterialMovement, MaterialStock, Packaging
+from bot.services.material_service import (
+    VALUATION_AVERAGE, VALUATION_FIFO, consume_material, purchase_material, reverse_material_consumption,
+)
+from bot.services.material_valuation import replay_valuation
+
+
+async def _material(session, method: str, name: str = "Мешок"):
+    material = Material(name=name, valuation_method=method)
+    session.add(material)
+    await session.commit()
+    await purchase_material(session, material.id, 10, "шт", 1.0)
+    await purchase_material(session, material.id, 10, "шт", 2.0)
+    return material
+
+
+@pytest.mark.asyncio
+async def test_average_consumption_uses_running_value(memory_session):
+    material = await _material(memory_session, VALUATION_AVERAGE)
+
+    cost = await consume_material(memory_session, material.id, 4, packaging_id=1)
+    await memory_session.commit()
+
+    assert cost == 6.0  # 30 / 20 за штуку
+    stock = await memory_session.get(MaterialStock, material.id)
+    assert (stock.quantity, stock.value) == (16, 24.0)
+    remaining = (await memory_session.execute(
+        select(MaterialMovement.remaining_quantity).where(MaterialMovement.type == "in")
+    )).scalars().all()
+    assert remaining == [10, 10]  # партии не перебираются
+
+    # Последнее списание забирает всю оставшуюся стоимость
+    assert await consume_material(memory_session, material.id, 16, packaging_id=2) == 24.0
+
+
+@pytest.mark.asyncio
+async def test_replay_switches_method_and_back(seeded_session):
+    material = await _material(seeded_session, VALUATION_FIFO, name="Плёнка")
+    packaging = Packaging(product_id=1, raw_product_id=1, amount=15, used_raw_material=225, user_id=1)
+    seeded_session.add(packaging)
+    await seeded_session.flush()
+    packaging.total_material_cost = await consume_material(seeded_session, material.id, 15, packaging.id)
+    await seeded_session.commit()
+    assert packaging.total_material_cost == 20.0  # 10 по 1.0 + 5 по 2.0
+
+    [report] = await replay_valuation(seeded_session, [material.id], method=VALUATION_AVERAGE)
+    assert (report.old_cost, report.new_cost) == (20.0, 22.5)
+    await seeded_session.refresh(packaging)
+    assert packaging.total_material_cost == 22.5
+    rollup = await seeded_session.scalar(select(DailyProductRollup.material_cost))
+    assert rollup == 22.5
+    stock = await seeded_session.get(MaterialStock, material.id)
+    await seeded_session.refresh(stock)
+    assert (stock.quantity, stock.value) == (5, 7.5)
+
+    [report] = await replay_valuation(seeded_session, [material.id], method=VALUATION_FIFO)
+    assert report.new_cost == 20.0
+    await seeded_session.refresh(stock)
+    assert stock.value == 10.0
+
+
+@pytest.mark.asyncio
+async def test_replay_splits_consumption_across_lots(memory_session):
+    material = Material(name="Мешок")
+    memory_session.add(material)
+    await memory_session.commit()
+    await purchase_material(memory_session, material.id, 10, "шт", 2.0)
+    await consume_material(memory_session, material.id, 5, packaging_id=1)
+    # Приход задним числом, добавленный в обход импорта
+    await memory_session.execute(insert(MaterialMovement), [{
+        "material_id": material.id, "type": "in", "quantity": 3, "unit": "шт", "unit_price": 1.0,
+        "remaining_quantity": 3, "date": datetime(2020, 1, 1),
+    }])
+    await memory_session.commit()
+
+    await replay_valuation(memory_session, [material.id])
+    out = (await memory_session.execute(
+        select(MaterialMovement.quantity, MaterialMovement.packaging_id)
+        .where(MaterialMovement.type == "out").order_by(MaterialMovement.id)
+    )).all()
+    assert out == [(3, 1), (2, 1)]  # по строке расхода на партию
+
+    await reverse_material_consumption(memory_session, 1)
+    await memory_session.commit()
+    lots = (await memory_session.execute(
+        select(MaterialMovement.quantity, MaterialMovement.remaining_quantity)
+        .where(MaterialMovement.type == "in").order_by(MaterialMovement.date)
+    )).all()
+    assert lots == [(3, 3), (10, 10)]
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from aiogram.exceptions import TelegramForbiddenError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.models import NotificationOutbox, User
+from bot.services import notification_service
+from bot.services.notification_service import CHANGES_DIGEST, NotificationService, TokenBucket, build_digest
+
+
+def _service(memory_session, bot, **kwargs):
+    factory = async_sessionmaker(memory_session.bind, expire_on_commit=False, class_=AsyncSession)
+    return NotificationService(bot, factory, digest_seconds=0, global_rate=1000, chat_rate=1000, **kwargs)
+
+
+async def _add_admins(session):
+    session.add_all([
+        User(telegram_id=1, full_name="Админ 1", role="admin"),
+        User(telegram_id=2, full_name="Админ 2", role="admin"),
+        User(telegram_id=3, full_name="Оператор", role="operator"),
+    ])
+    await session.commit()
+
+
+def test_token_bucket_limits_rate():
+    now = [0.0]
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0])
+    bucket.take()
+    bucket.take()
+    assert bucket.delay() == pytest.approx(0.5)
+    now[0] = 0.5
+    assert bucket.delay() == 0.0
+
+
+def test_long_digest_is_split():
+    chunks = build_digest(["x" * 3000, "y" * 3000])
+    assert len(chunks) == 2
+    assert all(len(chunk) <= 4096 for chunk in chunks)
+
+
+@pytest.mark.asyncio
+async def test_changes_are_coalesced_per_admin(memory_session):
+    await _add_admins(memory_session)
+    bot = MagicMock(send_message=AsyncMock())
+    service = _service(memory_session, bot)
+
+    for number in range(3):
+        assert await service.enqueue(memory_session, f"изменение {number}", digest_key=CHANGES_DIGEST) == 2
+    assert await service.enqueue(memory_session, "<b>отчет</b>", parse_mode="HTML", chat_ids=[1]) == 1
+
+    await service.dispatch_due()
+
+    sent = [(call.args[0], call.args[1]) for call in bot.send_message.await_args_list]
+    assert len(sent) == 3  # по сводке каждому администратору и отчет
+    digests = [text for chat_id, text in sent if text.startswith("🔔 Изменений: 3")]
+    assert len(digests) == 2 and "изменение 2" in digests[0]
+    statuses = (await memory_session.execute(select(NotificationOutbox.status))).scalars().all()
+    assert set(statuses) == {"sent"}
+
+
+@pytest.mark.asyncio
+async def test_failed_sends_are_retried_or_dropped(memory_session):
+    bot = MagicMock(send_message=AsyncMock(side_effect=[
+        RuntimeError("network"),
+        TelegramForbiddenError(method=MagicMock(), message="bot was blocked by the user"),
+    ]))
+    service = _service(memory_session, bot, retry_base=60)
+    await service.enqueue(memory_session, "отчет", chat_ids=[1, 2])
+
+    await service.dispatch_due()
+
+    rows = (await memory_session.execute(
+        select(NotificationOutbox).order_by(NotificationOutbox.chat_id)
+    )).scalars().all()
+    retried, blocked = rows
+    assert (retried.status, retried.attempts) == ("pending", 1)
+    assert retried.next_attempt_at > datetime.utcnow()
+    assert blocked.status == "failed"
+
+
+@pytest.mark.asyncio
+async def test_claimed_rows_are_sent_once(memory_session):
+    bot = MagicMock(send_message=AsyncMock())
+    service, other = _service(memory_session, bot), _service(memory_session, bot)
+    await service.enqueue(memory_session, "отчет", chat_ids=[1])
+
+    # Строку уже захватил другой экземпляр бота
+    assert len(await other._claim_due()) == 1
+    await service.dispatch_due()
+
+    bot.send_message.assert_not_awaited()
+    assert await memory_session.scalar(select(NotificationOutbox.status)) == "sending"
+
+
+@pytest.mark.asyncio
+async def test_waiting_digests_do_not_starve_due_rows(memory_session, monkeypatch):
+    monkeypatch.setattr(notification_service, "BATCH_SIZE", 2)
+    bot = MagicMock(send_message=AsyncMock())
+    service = _service(memory_session, bot)
+    later = datetime.utcnow() + timedelta(hours=1)
+    await memory_session.execute(insert(NotificationOutbox), [
+        {"chat_id": 1, "text": f"изменение {n}", "digest_key": CHANGES_DIGEST, "status": "pending",
+         "attempts": 0, "next_attempt_at": later, "created_at": datetime.utcnow()}
+        for n in range(3)
+    ])
+    await memory_session.commit()
+    await service.enqueue(memory_session, "отчет", chat_ids=[2])
+
+    await service.dispatch_due()
+
+    assert [call.args[:2] for call in bot.send_message.await_args_list] == [(2, "отчет")]
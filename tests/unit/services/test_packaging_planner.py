@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import insert
+
+from bot.models import MaterialStock, Product, RawMaterialStorage
+from bot.models.packaging import Packaging
+from bot.models.packaging_material import PackagingMaterial
+from bot.services.packaging_planner import PlanProduct, Resource, invalidate_plans, plan_max, plan_packaging
+
+
+def test_max_uses_raw_tail():
+    products = [PlanProduct(1, "15 кг", 15), PlanProduct(2, "10 кг", 10)]
+    resources = [Resource("Сырьё", 50, (15, 10)), Resource("Наклейка", 100, (1, 1))]
+
+    # Жадно 3×15 оставило бы 5 кг; 2×15 + 2×10 фасует всё сырьё
+    packs, _ = plan_max(products, resources)
+    assert packs == (2, 2)
+
+    packs, limit = plan_max(products, resources, caps=(1, 1))
+    assert (packs, limit) == ((1, 1), None)
+
+
+async def _fill(session):
+    invalidate_plans()
+    await session.execute(insert(RawMaterialStorage), [{"raw_product_id": 1, "amount": 100}])
+    await session.execute(insert(Product), [
+        {"id": 2, "name": "Пачка 5 кг", "weight": 5, "raw_product_id": 1},
+        {"id": 3, "name": "Пачка 3 кг", "weight": 3, "raw_product_id": 1},
+    ])
+    await session.execute(insert(MaterialStock), [
+        {"material_id": 1, "quantity": 12}, {"material_id": 2, "quantity": 2},
+    ])
+    # По истории на мешок 15 кг уходит один мешок
+    await session.execute(insert(Packaging), [
+        {"id": 1, "product_id": 1, "amount": 10, "used_raw_material": 150, "user_id": 1, "raw_product_id": 1},
+    ])
+    await session.execute(insert(PackagingMaterial), [
+        {"packaging_id": 1, "material_id": 2, "quantity": 10, "unit": "шт", "cost": 0},
+    ])
+    await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_plan_respects_stickers_and_bags(seeded_session):
+    await _fill(seeded_session)
+
+    plan = await plan_packaging(seeded_session, 1)
+    # Мешков на два мешка 15 кг, наклеек — на 12 пачек всего
+    assert plan.packs == (2, 10, 0)
+    assert plan.used_raw == 80
+    assert plan.limit == "Наклейка"
+
+    plan = await plan_packaging(seeded_session, 1, ratio="0/1/1")
+    assert (plan.packs, plan.used_raw, plan.limit) == ((0, 6, 6), 48, "Наклейка")
+
+    with pytest.raises(ValueError):
+        await plan_packaging(seeded_session, 1, ratio="2/1")
+
+    # Новая продукция сразу видна в плане, хотя нормы уже в кеше
+    seeded_session.add(Product(id=4, name="Пачка 1 кг", weight=1, raw_product_id=1))
+    await seeded_session.commit()
+    plan = await plan_packaging(seeded_session, 1, ratio="0/0/0/1")
+    assert (plan.packs, plan.used_raw) == ((0, 0, 0, 12), 12)
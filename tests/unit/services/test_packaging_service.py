@@ -0,0 +1,105 @@
+import pytest
+from sqlalchemy import event, func, insert, select
+
+from bot.exceptions import InsufficientMaterialError
+from bot.models import (
+    MaterialMovement, MaterialStock, Packaging, PackagingMaterial, ProductStorage, RawMaterialStorage,
+)
+from bot.services.material_service import reverse_material_consumption
+from bot.services.packaging_service import record_packaging, update_packaging_materials
+
+
+async def _fill(session, bags: float):
+    await session.execute(insert(RawMaterialStorage), [{"raw_product_id": 1, "amount": 1000}])
+    await session.execute(insert(ProductStorage), [{"product_id": 1, "amount": 0}])
+    await session.execute(insert(MaterialMovement), [
+        {"material_id": 1, "type": "in", "quantity": 100, "unit": "шт", "unit_price": 0.5, "remaining_quantity": 100},
+        {"material_id": 2, "type": "in", "quantity": bags, "unit": "шт", "unit_price": 3.0,
+         "remaining_quantity": bags},
+    ])
+    await session.execute(insert(MaterialStock), [
+        {"material_id": 1, "quantity": 100}, {"material_id": 2, "quantity": bags},
+    ])
+    await session.commit()
+
+
+async def _stock(session):
+    raw = await session.scalar(select(RawMaterialStorage.amount))
+    product = await session.scalar(select(ProductStorage.amount))
+    materials = dict((await session.execute(select(MaterialStock.material_id, MaterialStock.quantity))).all())
+    return raw, product, materials
+
+
+@pytest.mark.asyncio
+async def test_record_packaging_commits_once(seeded_session):
+    await _fill(seeded_session, bags=50)
+    commits, statements = [], []
+    event.listen(seeded_session.sync_session, "after_commit", lambda session: commits.append(session))
+    event.listen(seeded_session.bind.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    packaging = await record_packaging(seeded_session, 1, 1, 10, {2: 10})
+
+    assert len(commits) == 1
+    # Способ оценки приходит с проверкой остатков, а не отдельным запросом на материал
+    assert not [statement for statement in statements if statement.startswith("SELECT materials.valuation_method")]
+    assert (packaging.used_raw_material, packaging.total_material_cost) == (150, 35.0)
+    assert await _stock(seeded_session) == (850, 10, {1: 90, 2: 40})
+    used = dict((await seeded_session.execute(
+        select(PackagingMaterial.material_id, PackagingMaterial.quantity)
+    )).all())
+    assert used == {1: 10, 2: 10}
+
+
+@pytest.mark.asyncio
+async def test_material_shortage_changes_nothing(seeded_session):
+    await _fill(seeded_session, bags=5)
+
+    with pytest.raises(InsufficientMaterialError) as error:
+        await record_packaging(seeded_session, 1, 1, 10, {2: 10})
+
+    assert (error.value.item, error.value.available) == ("Мешок", 5)
+    assert await seeded_session.scalar(select(func.count(Packaging.id))) == 0
+    assert await _stock(seeded_session) == (1000, 0, {1: 100, 2: 5})
+
+
+async def _lots(session):
+    return (await session.execute(
+        select(MaterialMovement.material_id, MaterialMovement.remaining_quantity)
+        .where(MaterialMovement.type == "in").order_by(MaterialMovement.id)
+    )).all()
+
+
+@pytest.mark.asyncio
+async def test_reversal_restores_original_lots(seeded_session):
+    await _fill(seeded_session, bags=50)
+    packaging = await record_packaging(seeded_session, 1, 1, 10, {2: 10})
+
+    returned = await reverse_material_consumption(seeded_session, packaging.id)
+    await seeded_session.commit()
+
+    assert returned == {1: 10, 2: 10}
+    assert await _lots(seeded_session) == [(1, 100), (2, 50)]  # новых партий нет
+    assert await _stock(seeded_session) == (850, 10, {1: 100, 2: 50})
+    assert await seeded_session.scalar(select(func.count()).select_from(PackagingMaterial)) == 0
+    assert await seeded_session.scalar(
+        select(func.count()).select_from(MaterialMovement).where(MaterialMovement.type == "out")
+    ) == 0
+
+
+@pytest.mark.asyncio
+async def test_edit_touches_only_changed_materials(seeded_session):
+    await _fill(seeded_session, bags=50)
+    packaging = await record_packaging(seeded_session, 1, 1, 10, {2: 10})
+    sticker_rows = (await seeded_session.execute(
+        select(MaterialMovement.id).where(MaterialMovement.type == "out", MaterialMovement.material_id == 1)
+    )).scalars().all()
+
+    total = await update_packaging_materials(seeded_session, packaging, {2: 4})
+    await seeded_session.commit()
+
+    assert total == 17.0
+    assert await _lots(seeded_session) == [(1, 90), (2, 46)]
+    assert (await seeded_session.execute(
+        select(MaterialMovement.id).where(MaterialMovement.type == "out", MaterialMovement.material_id == 1)
+    )).scalars().all() == sticker_rows  # наклейки не пересписывались
@@ -0,0 +1,86 @@
+from datetime import datetime, date
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+from bot.models import (
+    Arrival, Expense, Packaging, Product, RawProduct, Shipment, ShipmentItem, User,
+    DailyProductRollup, DailyRawRollup, DailyExpenseRollup,
+)
+from bot.services.rollups import rebuild_rollups
+
+
+async def _rollup_rows(session):
+    product = (await session.execute(
+        select(DailyProductRollup.day, DailyProductRollup.product_id, DailyProductRollup.packed_units,
+               DailyProductRollup.used_raw_kg, DailyProductRollup.shipped_units)
+        .where((DailyProductRollup.packed_units != 0) | (DailyProductRollup.shipped_units != 0))
+        .order_by(DailyProductRollup.day, DailyProductRollup.product_id)
+    )).all()
+    raw = (await session.execute(
+        select(DailyRawRollup.day, DailyRawRollup.arrived_kg, DailyRawRollup.arrivals_count, DailyRawRollup.used_kg)
+        .where((DailyRawRollup.arrivals_count != 0) | (DailyRawRollup.used_kg != 0))
+        .order_by(DailyRawRollup.day)
+    )).all()
+    expenses = (await session.execute(
+        select(DailyExpenseRollup.day, DailyExpenseRollup.category, DailyExpenseRollup.amount)
+        .where(DailyExpenseRollup.expenses_count != 0)
+        .order_by(DailyExpenseRollup.day)
+    )).all()
+    return product, raw, expenses
+
+
+@pytest_asyncio.fixture
+async def catalog(memory_session):
+    user = User(telegram_id=1, full_name="Тест", role="admin")
+    raw = RawProduct(name="Пеллеты 6мм")
+    memory_session.add_all([user, raw])
+    await memory_session.flush()
+    product = Product(name="Пачка 3кг", weight=3, raw_product_id=raw.id)
+    memory_session.add(product)
+    await memory_session.commit()
+    return user, raw, product
+
+
+@pytest.mark.asyncio
+async def test_rollups_follow_writes(memory_session, catalog):
+    user, raw, product = catalog
+    day1 = datetime(2025, 3, 10, 12, 0)
+    day2 = datetime(2025, 3, 11, 9, 0)
+
+    arrival = Arrival(raw_product_id=raw.id, amount=1000, user_id=user.id, date=day1)
+    packaging = Packaging(product_id=product.id, raw_product_id=raw.id, amount=10,
+                          used_raw_material=30, user_id=user.id, date=day1)
+    expense = Expense(amount=500, purpose="Топливо", source="касса", category="fuel",
+                      user_id=user.id, date=day1)
+    shipment = Shipment(user_id=user.id, timestamp=day1)
+    memory_session.add_all([arrival, packaging, expense, shipment])
+    await memory_session.flush()
+    memory_session.add(ShipmentItem(shipment_id=shipment.id, product_id=product.id, quantity=4))
+    await memory_session.commit()
+
+    product_rows, raw_rows, expense_rows = await _rollup_rows(memory_session)
+    assert product_rows == [(date(2025, 3, 10), product.id, 10, 30, 4)]
+    assert raw_rows == [(date(2025, 3, 10), 1000, 1, 30)]
+    assert expense_rows == [(date(2025, 3, 10), "fuel", 500)]
+
+    # Правки переносят итоги: количество и дата меняются, удаление вычитает
+    packaging.amount = 12
+    packaging.used_raw_material = 36
+    shipment.timestamp = day2
+    await memory_session.delete(expense)
+    await memory_session.commit()
+
+    product_rows, raw_rows, expense_rows = await _rollup_rows(memory_session)
+    assert product_rows == [
+        (date(2025, 3, 10), product.id, 12, 36, 0),
+        (date(2025, 3, 11), product.id, 0, 0, 4),
+    ]
+    assert raw_rows == [(date(2025, 3, 10), 1000, 1, 36)]
+    assert expense_rows == []
+
+    # Полный пересчёт даёт те же итоги
+    incremental = await _rollup_rows(memory_session)
+    await rebuild_rollups(memory_session)
+    assert await _rollup_rows(memory_session) == incremental
@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import event, func, insert, select
+
+from bot.exceptions import InsufficientStockError
+from bot.models import DailyProductRollup, Product, ProductStorage, Shipment, ShipmentItem
+from bot.services.shipment import create_shipment_with_items
+
+
+async def _fill(session, products: int):
+    await session.execute(insert(Product), [
+        {"id": i, "name": f"Мешок {i}", "weight": 15, "raw_product_id": 1} for i in range(2, products + 1)
+    ])
+    # id строк склада намеренно не совпадают с id продукции
+    await session.execute(insert(ProductStorage), [
+        {"id": 100 + i, "product_id": i, "amount": 10} for i in range(1, products + 1)
+    ])
+    await session.commit()
+
+
+def _count_statements(session):
+    statements = []
+    event.listen(session.bind.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+@pytest.mark.asyncio
+async def test_statements_do_not_grow_with_items(seeded_session):
+    await _fill(seeded_session, products=6)
+    statements = _count_statements(seeded_session)
+
+    await create_shipment_with_items(seeded_session, 1, [(1, 2)])
+    single = len(statements)
+    statements.clear()
+    await create_shipment_with_items(seeded_session, 1, [(2, 1), (3, 4), (4, 1), (5, 2), (6, 3), (2, 1)])
+
+    assert len(statements) == single
+    amounts = dict((await seeded_session.execute(select(ProductStorage.product_id, ProductStorage.amount))).all())
+    assert amounts == {1: 8, 2: 8, 3: 6, 4: 9, 5: 8, 6: 7}
+    assert await seeded_session.scalar(select(func.count(ShipmentItem.id))) == 6
+    assert await seeded_session.scalar(select(func.sum(DailyProductRollup.shipped_units))) == 14
+
+
+@pytest.mark.asyncio
+async def test_shortage_rejects_whole_shipment(seeded_session):
+    await _fill(seeded_session, products=2)
+
+    with pytest.raises(InsufficientStockError) as error:
+        await create_shipment_with_items(seeded_session, 1, [(1, 5), (2, 11)])
+
+    assert (error.value.item, error.value.available) == ("Мешок 2", 10)
+    assert await seeded_session.scalar(select(func.count(Shipment.id))) == 0
+    assert await seeded_session.scalar(select(func.sum(ProductStorage.amount))) == 20
@@ -0,0 +1,83 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, func, insert, select
+
+from bot.models import (
+    MaterialMovement, MaterialStock, ProductStorage, RawMaterialStorage, StockMovement, StockSnapshot,
+)
+from bot.services.arrival import add_arrival, update_arrival_amount
+from bot.services.packaging_service import record_packaging
+from bot.services.shipment import create_shipment_with_items
+from bot.services.stock_ledger import fill_snapshots, snapshot_time, stock_as_of, stock_on_day
+
+
+async def _fill(session):
+    await session.execute(insert(MaterialMovement), [
+        {"material_id": 1, "type": "in", "quantity": 100, "unit": "шт", "unit_price": 0.5, "remaining_quantity": 100},
+    ])
+    await session.execute(insert(MaterialStock), [{"material_id": 1, "quantity": 100}])
+    # Строки склада через ORM, как в админке — попадают в журнал обработчиком flush
+    session.add_all([RawMaterialStorage(raw_product_id=1, amount=100), ProductStorage(product_id=1, amount=0)])
+    await session.commit()
+
+
+async def _counters(session):
+    raw = await session.scalar(select(RawMaterialStorage.amount))
+    product = await session.scalar(select(ProductStorage.amount))
+    return {"raw_materials": {"Пеллеты 6мм": raw}, "products": {"Мешок 15 кг": product}}
+
+
+@pytest.mark.asyncio
+async def test_every_write_path_is_recorded(seeded_session):
+    await _fill(seeded_session)
+    arrival = await add_arrival(seeded_session, 100, 1, 500)
+    await update_arrival_amount(seeded_session, arrival.id, 400)
+    await record_packaging(seeded_session, 1, 1, 10, {})
+    await create_shipment_with_items(seeded_session, 1, [(1, 4)])
+    storage = await seeded_session.scalar(select(RawMaterialStorage))
+    storage.amount -= 5  # ручная правка остатка
+    await seeded_session.commit()
+
+    rows = (await seeded_session.execute(
+        select(StockMovement.kind, StockMovement.delta, StockMovement.balance, StockMovement.source)
+        .order_by(StockMovement.id)
+    )).all()
+    assert rows == [
+        ("raw", 100, 100, "admin"),
+        ("raw", 500, 600, "arrival"),
+        ("raw", -100, 500, "arrival"),
+        ("raw", -150, 350, "packaging"),
+        ("product", 10, 10, "packaging"),
+        ("product", -4, 6, "shipment"),
+        ("raw", -5, 345, "admin"),
+    ]
+    now = datetime.utcnow() + timedelta(seconds=1)
+    assert await stock_as_of(seeded_session, now) == await _counters(seeded_session)
+
+
+@pytest.mark.asyncio
+async def test_as_of_reads_nearest_snapshot(seeded_session):
+    start = date(2026, 3, 1)
+    # Месяц истории: каждый день +10 кг в полдень
+    await seeded_session.execute(insert(StockMovement), [
+        {"kind": "raw", "item_id": 1, "delta": 10, "balance": 10 * (n + 1), "source": "arrival",
+         "created_at": snapshot_time(start + timedelta(days=n)) + timedelta(hours=12)}
+        for n in range(31)
+    ])
+    await seeded_session.commit()
+
+    assert await fill_snapshots(seeded_session, until=date(2026, 4, 1)) == 31
+    assert await fill_snapshots(seeded_session, until=date(2026, 4, 1)) == 0
+    assert (await stock_on_day(seeded_session, date(2026, 3, 31)))["raw_materials"] == {"Пеллеты 6мм": 310}
+    assert (await stock_on_day(seeded_session, date(2026, 3, 10)))["raw_materials"] == {"Пеллеты 6мм": 100}
+    midday = snapshot_time(date(2026, 3, 10)) + timedelta(hours=13)
+    assert (await stock_as_of(seeded_session, midday))["raw_materials"] == {"Пеллеты 6мм": 100}
+
+    # Запрос читает снимок и журнал только после него: ранние строки ему не нужны
+    await seeded_session.execute(
+        delete(StockMovement).where(StockMovement.created_at < snapshot_time(date(2026, 3, 20)))
+    )
+    await seeded_session.commit()
+    assert (await stock_on_day(seeded_session, date(2026, 3, 25)))["raw_materials"] == {"Пеллеты 6мм": 250}
+    assert await seeded_session.scalar(select(func.count()).select_from(StockSnapshot)) == 31
@@ -0,0 +1,57 @@
+import pytest
+from sqlalchemy import select, update
+
+from bot.models import CacheVersion, User
+from bot.services import user_cache
+from bot.services.auth import update_user_role
+from bot.services.user_cache import (
+    cache_stats, get_or_create_user_snapshot, get_user_snapshot, get_user_snapshot_by_username,
+)
+
+
+@pytest.mark.asyncio
+async def test_snapshots_are_cached_and_immutable(memory_session):
+    created = await get_or_create_user_snapshot(memory_session, 10, "Иван")
+    assert created.role == "anonymous"
+
+    first = await get_user_snapshot(memory_session, 10)
+    second = await get_user_snapshot(memory_session, 10)
+    assert first is second == created
+    with pytest.raises(AttributeError):
+        first.role = "admin"
+
+    stats = cache_stats()
+    assert stats["misses"] == 2  # поиск при создании и первый поиск после него
+    assert stats["hits"] == 1
+    assert await memory_session.scalar(select(CacheVersion.version).where(CacheVersion.name == "users")) == 1
+
+
+@pytest.mark.asyncio
+async def test_role_change_invalidates_cache(memory_session):
+    memory_session.add(User(telegram_id=20, full_name="Пётр", role="anonymous", username="petr"))
+    await memory_session.commit()
+    assert (await get_user_snapshot_by_username(memory_session, "petr")).role == "anonymous"
+
+    # Изменение через ORM в этом процессе видно сразу
+    assert await update_user_role(memory_session, 20, "manager")
+    assert (await get_user_snapshot(memory_session, 20)).role == "manager"
+    assert (await get_user_snapshot_by_username(memory_session, "petr")).role == "manager"
+
+
+@pytest.mark.asyncio
+async def test_version_from_other_process(memory_session, monkeypatch):
+    memory_session.add(User(telegram_id=30, full_name="Анна", role="operator"))
+    await memory_session.commit()
+    assert (await get_user_snapshot(memory_session, 30)).role == "operator"
+
+    # Другой процесс поменял роль и версию; до следующей сверки версия не перечитывается
+    await memory_session.execute(update(User).where(User.telegram_id == 30).values(role="admin"))
+    await memory_session.execute(
+        update(CacheVersion).where(CacheVersion.name == "users").values(version=CacheVersion.version + 1)
+    )
+    await memory_session.commit()
+    assert (await get_user_snapshot(memory_session, 30)).role == "operator"
+
+    monkeypatch.setattr(user_cache, "USER_CACHE_VERSION_CHECK_SECONDS", 0)
+    assert (await get_user_snapshot(memory_session, 30)).role == "admin"
+    assert cache_stats()["invalidations"] >= 2
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select
+
+from bot.models import Arrival
+from web.pagination import cached_count, keyset_page
+
+
+@pytest.mark.asyncio
+async def test_pages_forward_and_back_with_equal_dates(memory_session):
+    start = datetime(2025, 1, 1)
+    # По три прихода на одну и ту же дату: порядок внутри даты задаёт id
+    await memory_session.execute(insert(Arrival), [
+        {"raw_product_id": 1, "amount": i, "user_id": 1, "date": start + timedelta(days=i // 3)}
+        for i in range(10)
+    ])
+    await memory_session.commit()
+    query = select(Arrival)
+    key = (Arrival.date, Arrival.id)
+
+    pages, after = [], None
+    while True:
+        page = await keyset_page(memory_session, query, key, after=after, limit=4)
+        pages.append([a.amount for a in page.items])
+        if page.next_cursor is None:
+            break
+        after = page.next_cursor
+    assert pages == [[9, 8, 7, 6], [5, 4, 3, 2], [1, 0]]
+
+    back = await keyset_page(memory_session, query, key, before=page.prev_cursor, limit=4)
+    assert [a.amount for a in back.items] == [5, 4, 3, 2]
+    assert back.prev_cursor is not None and back.next_cursor is not None
+    assert await cached_count(memory_session, Arrival) == 10
@@ -0,0 +1,26 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import delete, func, select
+
+from bot.models import ProductStorage, Shipment, StockMovement
+from bot.services.shipment import create_shipment_with_items
+from web.shipments import delete_shipment
+
+
+@pytest.mark.asyncio
+async def test_delete_returns_stock_without_storage_row(seeded_session):
+    seeded_session.add(ProductStorage(product_id=1, amount=10))
+    await seeded_session.commit()
+    shipment = await create_shipment_with_items(seeded_session, 1, [(1, 4)])
+    # Строку склада удалили в админке после отгрузки
+    await seeded_session.execute(delete(ProductStorage))
+    await seeded_session.commit()
+
+    response = await delete_shipment(shipment.id, db=seeded_session, current_user=SimpleNamespace(role="admin"))
+
+    assert response.status_code == 302
+    assert await seeded_session.scalar(select(ProductStorage.amount)) == 4
+    assert await seeded_session.scalar(select(func.count(Shipment.id))) == 0
+    last = await seeded_session.scalar(select(StockMovement).order_by(StockMovement.id.desc()).limit(1))
+    assert (last.delta, last.balance, last.source) == (4, 4, "shipment")
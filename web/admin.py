@@ -1,18 +1,24 @@
 import os
 from fastapi import APIRouter, Depends, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func
+from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from jinja2 import Environment, FileSystemLoader
 import bcrypt
 from datetime import datetime, date
+from typing import Optional
+from urllib.parse import urlencode
 
 from bot.models.user import User
 from bot.services.db_service import DBService
 from bot.services.auth import get_all_users
 from bot.services.storage import update_stock_arrival   # если понадобится
+from bot.services.audit_log import get_audit_page
+from bot.services.change_tracking import AUDITED_MODELS
+from bot.services.user_cache import cache_stats
 from .dependencies import get_db, get_current_user, role_required
+from .pagination import keyset_page, cached_count
 
 router = APIRouter()
 env = Environment(
@@ -68,26 +74,89 @@ async def admin_home(request: Request, current_user=Depends(role_required(["admi
     return HTMLResponse(template.render({"request": request, "user": current_user}))
 
 
+@router.get("/api/admin/user-cache")
+async def user_cache_stats(current_user=Depends(role_required(["admin"]))):
+    """Попадания и промахи кеша пользователей в процессе веб-панели."""
+    return JSONResponse(cache_stats())
+
+
+# ================== ЖУРНАЛ ИЗМЕНЕНИЙ ==================
+AUDIT_PAGE_SIZE = 50
+
+
+async def _audit_page(db: AsyncSession, entity_type, entity_id, cursor, limit):
+    try:
+        return await get_audit_page(db, entity_type or None, entity_id, cursor or None, limit)
+    except ValueError:
+        raise HTTPException(400, "Некорректный курсор")
+
+
+@router.get("/admin/audit")
+async def audit_view(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(role_required(["admin"])),
+    entity_type: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+):
+    entries, next_cursor = await _audit_page(db, entity_type, entity_id, cursor, AUDIT_PAGE_SIZE)
+    filters = urlencode({k: v for k, v in (("entity_type", entity_type), ("entity_id", entity_id)) if v})
+    template = env.get_template("admin_audit.html")
+    return HTMLResponse(template.render(
+        request=request, user=current_user, entries=entries, next_cursor=next_cursor, cursor=cursor,
+        entity_type=entity_type, entity_id=entity_id, filters=filters,
+        entity_types=sorted(model.__tablename__ for model in AUDITED_MODELS),
+    ))
+
+
+@router.get("/api/admin/audit")
+async def audit_api(
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(role_required(["admin"])),
+    entity_type: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = AUDIT_PAGE_SIZE,
+):
+    """Журнал изменений от новых к старым; следующая страница — по next_cursor."""
+    entries, next_cursor = await _audit_page(db, entity_type, entity_id, cursor, min(max(limit, 1), 500))
+    return JSONResponse({
+        "items": [
+            {
+                "id": e.id,
+                "timestamp": e.timestamp.isoformat(),
+                "actor_id": e.actor_id,
+                "actor_name": e.actor_name,
+                "action": e.action,
+                "entity_type": e.entity_type,
+                "entity_id": e.entity_id,
+                "changes": e.changes,
+            }
+            for e in entries
+        ],
+        "next_cursor": next_cursor,
+    })
+
+
 # ================== ПОЛЬЗОВАТЕЛИ ==================
 @router.get("/admin/users")
 async def users_list(
     request: Request,
     db: AsyncSession = Depends(get_db),
     current_user=Depends(role_required(["admin"])),
-    page: int = 1
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ):
-    offset = (page - 1) * PAGE_SIZE
-    total = (await db.execute(select(func.count(User.id)))).scalar()
-    total_pages = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
-    result = await db.execute(
-        select(User).order_by(User.id).offset(offset).limit(PAGE_SIZE)
+    pagination = await keyset_page(
+        db, select(User), (User.id,), after=after, before=before, limit=PAGE_SIZE, descending=False
     )
-    users = result.scalars().all()
+    pagination.total = await cached_count(db, User)
 
     template = env.get_template("admin_users.html")
     return HTMLResponse(template.render(
         request=request, user=current_user,
-        users=users, page=page, total_pages=total_pages
+        users=pagination.items, pagination=pagination, page_url="/admin/users?"
     ))
 
 
@@ -220,18 +289,14 @@ async def view_table(
     request: Request,
     db: AsyncSession = Depends(get_db),
     current_user=Depends(role_required(["admin"])),
-    page: int = 1
+    after: Optional[str] = None,
+    before: Optional[str] = None,
 ):
     if table_name not in DBService.MODELS:
         raise HTTPException(404, "Таблица не найдена")
     model = DBService.MODELS[table_name]
-    offset = (page - 1) * PAGE_SIZE
-    total = (await db.execute(select(func.count(model.id)))).scalar()
-    total_pages = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
-    result = await db.execute(
-        select(model).order_by(desc(model.id)).offset(offset).limit(PAGE_SIZE)
-    )
-    records = result.scalars().all()
+    pagination = await keyset_page(db, select(model), (model.id,), after=after, before=before, limit=PAGE_SIZE)
+    pagination.total = await cached_count(db, model)
 
     # Получаем названия колонок
     columns = [col.name for col in model.__table__.columns]
@@ -239,8 +304,8 @@ async def view_table(
     template = env.get_template("admin_table_view.html")
     return HTMLResponse(template.render(
         request=request, user=current_user,
-        table_name=table_name, records=records,
-        columns=columns, page=page, total_pages=total_pages
+        table_name=table_name, records=pagination.items, columns=columns,
+        pagination=pagination, page_url=f"/admin/tables/{table_name}?"
     ))
 
 
@@ -2,7 +2,7 @@ import os
 from fastapi import APIRouter, Depends, Request, Form, HTTPException, status
 from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, desc
+from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from jinja2 import Environment, FileSystemLoader
 from datetime import datetime
@@ -10,8 +10,9 @@ from datetime import datetime
 from bot.models.arrival import Arrival
 from bot.models.rawProduct import RawProduct
 from bot.services.arrival import add_arrival, delete_arrival, update_arrival_amount, get_arrival_by_id
-from bot.services.storage import update_stock_arrival
+from bot.exceptions import InsufficientStockError
 from .dependencies import get_db, get_current_user, role_required
+from .pagination import keyset_page, cached_count
 
 router = APIRouter()
 env = Environment(
@@ -24,34 +25,25 @@ PAGE_SIZE = 15
 @router.get("/arrivals")
 async def list_arrivals(
     request: Request,
-    page: int = 1,
+    after: str = None,
+    before: str = None,
     db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    # Пагинация
-    offset = (page - 1) * PAGE_SIZE
-    # Получаем общее количество
-    total_count = (await db.execute(select(func.count(Arrival.id)))).scalar()
-    total_pages = max(1, (total_count + PAGE_SIZE - 1) // PAGE_SIZE)
-
-    # Загружаем приходы с подгрузкой связанного сырья
-    result = await db.execute(
-        select(Arrival)
-        .options(selectinload(Arrival.raw_product))
-        .order_by(desc(Arrival.date))
-        .offset(offset)
-        .limit(PAGE_SIZE)
+    # Загружаем приходы с подгрузкой связанного сырья (постранично по дате и id)
+    pagination = await keyset_page(
+        db, select(Arrival).options(selectinload(Arrival.raw_product)), (Arrival.date, Arrival.id),
+        after=after, before=before, limit=PAGE_SIZE,
     )
-    arrivals = result.scalars().all()
+    pagination.total = await cached_count(db, Arrival)
 
     template = env.get_template("arrivals.html")
     html = template.render({
         "request": request,
         "user": current_user,
-        "arrivals": arrivals,
-        "page": page,
-        "total_pages": total_pages,
-        "total_count": total_count
+        "arrivals": pagination.items,
+        "pagination": pagination,
+        "page_url": "/arrivals?",
     })
     return HTMLResponse(html)
 
@@ -112,7 +104,10 @@ async def edit_arrival_submit(
 ):
     if current_user.role not in ("admin", "manager"):
         raise HTTPException(status_code=403)
-    await update_arrival_amount(db, arrival_id, amount)
+    try:
+        await update_arrival_amount(db, arrival_id, amount)
+    except InsufficientStockError:
+        return RedirectResponse(url=f"/arrivals/{arrival_id}/edit?error=insufficient_raw", status_code=302)
     return RedirectResponse(url="/arrivals", status_code=302)
 
 # Удаление прихода
@@ -124,5 +119,8 @@ async def delete_arrival_handler(
 ):
     if current_user.role not in ("admin", "manager"):
         raise HTTPException(status_code=403)
-    await delete_arrival(db, arrival_id)
+    try:
+        await delete_arrival(db, arrival_id)
+    except InsufficientStockError:
+        return RedirectResponse(url="/arrivals?error=insufficient_raw", status_code=302)
     return RedirectResponse(url="/arrivals", status_code=302)
\ No newline at end of file
@@ -6,7 +6,11 @@ from jinja2 import Environment, FileSystemLoader
 from datetime import date
 
 from .dependencies import get_db, get_current_user, role_required
-from bot.services.cost_service import calculate_full_cost
+from bot.exceptions import InvalidDataError
+from bot.models.cost_calculation import CostCalculation
+from bot.services.cost_service import (
+    MONTH_ALREADY_CLOSED, calculate_full_cost, close_month, get_closed_months, reopen_month,
+)
 
 router = APIRouter()
 env = Environment(
@@ -15,9 +19,15 @@ env = Environment(
 )
 
 @router.get("/cost-calculation")
-async def cost_calculation_page(request: Request, current_user=Depends(role_required(["admin", "manager"]))):
+async def cost_calculation_page(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(role_required(["admin", "manager"]))
+):
     template = env.get_template("cost_calculation.html")
-    return HTMLResponse(template.render({"request": request, "user": current_user}))
+    return HTMLResponse(template.render({
+        "request": request, "user": current_user, "closed_months": await get_closed_months(db)
+    }))
 
 @router.post("/cost-calculation")
 async def cost_calculation_submit(
@@ -27,16 +37,42 @@ async def cost_calculation_submit(
     period_start: date = Form(...),
     period_end: date = Form(...)
 ):
+    # Тот же период по тем же данным не пересчитывается — вернётся прежний расчёт
     result = await calculate_full_cost(db, period_start, period_end)
     if not result:
         return RedirectResponse(url="/cost-calculation?error=no_production", status_code=302)
     return RedirectResponse(url=f"/cost-calculation/result/{result.id}", status_code=302)
 
+@router.post("/cost-calculation/close")
+async def close_month_submit(
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(role_required(["admin"])),
+    month: str = Form(...)  # ГГГГ-ММ
+):
+    try:
+        year, month_number = (int(part) for part in month.split("-"))
+        calc = await close_month(db, year, month_number)
+    except ValueError:
+        return RedirectResponse(url="/cost-calculation?error=invalid_month", status_code=302)
+    except InvalidDataError as e:
+        error = "already_closed" if str(e) == MONTH_ALREADY_CLOSED else "month_not_finished"
+        return RedirectResponse(url=f"/cost-calculation?error={error}", status_code=302)
+    return RedirectResponse(url=f"/cost-calculation/result/{calc.id}", status_code=302)
+
+@router.post("/cost-calculation/{calc_id}/reopen")
+async def reopen_month_submit(
+    calc_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(role_required(["admin"]))
+):
+    if not await reopen_month(db, calc_id):
+        raise HTTPException(status_code=404)
+    return RedirectResponse(url="/cost-calculation", status_code=302)
+
 @router.get("/cost-calculation/result/{calc_id}")
 async def cost_result(calc_id: int, request: Request, db: AsyncSession = Depends(get_db), current_user=Depends(role_required(["admin", "manager"]))):
-    from bot.models.cost_calculation import CostCalculation
     calc = await db.get(CostCalculation, calc_id)
     if not calc:
         raise HTTPException(status_code=404)
     template = env.get_template("cost_result.html")
-    return HTMLResponse(template.render({"request": request, "user": current_user, "calc": calc}))
\ No newline at end of file
+    return HTMLResponse(template.render({"request": request, "user": current_user, "calc": calc}))
@@ -3,13 +3,12 @@ from sqlalchemy.orm import selectinload
 from fastapi import APIRouter, Depends, Request
 from fastapi.responses import HTMLResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, extract
+from sqlalchemy import select, func
 from jinja2 import Environment, FileSystemLoader
 from bot.models.storage import RawMaterialStorage, ProductStorage
 from .dependencies import get_db, get_current_user
-from datetime import datetime
-from bot.models.arrival import Arrival
-from bot.models.shipment import Shipment, ShipmentItem
+from bot.models.rollups import DailyProductRollup, DailyRawRollup
+from bot.services.periods import month_period
 router = APIRouter()
 
 env = Environment(
@@ -32,20 +31,19 @@ async def dashboard(request: Request, db: AsyncSession = Depends(get_db), curren
     )
     product_stocks = prod_result.scalars().all()
 
-    from datetime import datetime
-    current_month = datetime.utcnow().month
+    current_month = month_period()
 
     raw_total = sum(s.amount for s in raw_stocks)
     product_total = sum(s.amount for s in product_stocks)
 
     arrivals_count = (await db.execute(
-        select(func.count(Arrival.id)).where(extract('month', Arrival.date) == current_month)
+        select(func.coalesce(func.sum(DailyRawRollup.arrivals_count), 0))
+        .where(current_month.where(DailyRawRollup.day))
     )).scalar()
 
     shipments_total = (await db.execute(
-        select(func.coalesce(func.sum(ShipmentItem.quantity), 0))
-        .join(Shipment)
-        .where(extract('month', Shipment.timestamp) == current_month)
+        select(func.coalesce(func.sum(DailyProductRollup.shipped_units), 0))
+        .where(current_month.where(DailyProductRollup.day))
     )).scalar()
 
     template = env.get_template("dashboard.html")
@@ -2,7 +2,8 @@ from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from bot.models.database import async_session
-from bot.models.user import User
+from bot.services.change_tracking import ACTOR_KEY, ChangeActor
+from bot.services.user_cache import UserSnapshot, get_user_snapshot_by_username
 import jwt
 
 
@@ -14,7 +15,7 @@ async def get_db():
     async with async_session() as session:
         yield session
 
-async def get_current_user(request: Request, db: AsyncSession = Depends(get_db)):
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_db)) -> UserSnapshot:
     token = request.cookies.get("access_token")
     if not token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
@@ -24,17 +25,17 @@ async def get_current_user(request: Request, db: AsyncSession = Depends(get_db))
         username: str = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
-        from sqlalchemy import select
-        result = await db.execute(select(User).where(User.username == username))
-        user = result.scalar_one_or_none()
+        user = await get_user_snapshot_by_username(db, username)
         if user is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        # Автор изменений для журнала (сессия общая с обработчиком запроса)
+        db.info[ACTOR_KEY] = ChangeActor(user.telegram_id, user.full_name)
         return user
     except jwt.PyJWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
 def role_required(roles: list):
-    async def role_checker(current_user: User = Depends(get_current_user)):
+    async def role_checker(current_user: UserSnapshot = Depends(get_current_user)):
         if current_user.role not in roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав")
         return current_user
@@ -0,0 +1,63 @@
+import tempfile
+from datetime import date
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from bot.models.database import async_session
+from bot.services.export import EXPORTS, export_filename, iter_csv, write_xlsx, xlsx_available
+from bot.services.periods import days_period, today
+from .dependencies import role_required
+
+router = APIRouter()
+
+FILE_CHUNK = 64 * 1024
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+async def _csv_chunks(kind, period):
+    # Своя сессия: ответ отдаётся после выхода из обработчика и зависимостей
+    async with async_session() as session:
+        async for chunk in iter_csv(session, kind, period):
+            yield chunk
+
+
+async def _xlsx_chunks(kind, period):
+    # XLSX собирается целиком (zip-архив), поэтому пишется во временный файл, а не в память
+    with tempfile.TemporaryFile() as tmp:
+        async with async_session() as session:
+            await write_xlsx(session, kind, tmp, period)
+        tmp.seek(0)
+        while chunk := tmp.read(FILE_CHUNK):
+            yield chunk
+
+
+@router.get("/export/{kind}")
+async def export_history(
+    kind: str,
+    format: str = "csv",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    current_user=Depends(role_required(["admin", "manager"])),
+):
+    """Выгрузка истории операций за период [start, end] (даты включительно, по умолчанию — вся история)."""
+    if kind not in EXPORTS:
+        raise HTTPException(404, "Неизвестная выгрузка")
+    if format not in MEDIA_TYPES:
+        raise HTTPException(400, "Формат должен быть csv или xlsx")
+    if format == "xlsx" and not xlsx_available():
+        raise HTTPException(501, "Выгрузка в XLSX недоступна: не установлен openpyxl")
+    period = days_period(start or date(2000, 1, 1), end or today()) if start or end else None
+
+    chunks = _xlsx_chunks(kind, period) if format == "xlsx" else _csv_chunks(kind, period)
+    filename = export_filename(kind, format, period)
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"},
+    )
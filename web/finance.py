@@ -2,18 +2,22 @@ import os
 from fastapi import APIRouter, Depends, Request, Form, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func, case
+from sqlalchemy import select, func, case
 from sqlalchemy.orm import selectinload
 from jinja2 import Environment, FileSystemLoader
 from datetime import datetime
+from urllib.parse import urlencode
 
 from bot.models.expense import Expense
 from bot.models.material import Material
 from bot.models.material_movement import MaterialMovement
 from bot.models.user import User
 from bot.models.packaging import Packaging
+from bot.services.expense import EXPENSE_CATEGORIES
+from bot.services.material_service import apply_stock_delta
 from bot.services.user_service import get_user
 from .dependencies import get_db, get_current_user, role_required
+from .pagination import keyset_page, cached_count
 
 router = APIRouter()
 env = Environment(
@@ -21,28 +25,18 @@ env = Environment(
     auto_reload=True
 )
 
-CATEGORIES = [
-    ("", "Все категории"),
-    ("raw_material_purchase", "Закупка сырья (опилки)"),
-    ("packaging_material", "Упаковочные материалы"),
-    ("fuel", "Топливо"),
-    ("salary", "Зарплата"),
-    ("rent", "Аренда"),
-    ("electricity", "Электричество"),
-    ("repair", "Ремонт/модернизация"),
-    ("other", "Прочее"),
-]
+CATEGORIES = [("", "Все категории"), *EXPENSE_CATEGORIES]
 
 PAGE_SIZE = 20
 
 def get_expense_query(category: str = None):
-    """Возвращает базовый запрос с подгрузкой связей."""
+    """Возвращает базовый запрос с подгрузкой связей (порядок задаёт пагинация)."""
     q = select(Expense).options(
         selectinload(Expense.user),
         selectinload(Expense.material),
         selectinload(Expense.employee),
         selectinload(Expense.packaging)
-    ).order_by(desc(Expense.date))
+    )
     if category:
         q = q.where(Expense.category == category)
     return q
@@ -51,7 +45,8 @@ def get_expense_query(category: str = None):
 async def list_expenses(
     request: Request,
     category: str = "",
-    page: int = 1,
+    after: str = None,
+    before: str = None,
     db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
@@ -59,16 +54,12 @@ async def list_expenses(
     if current_user.role not in ("admin", "manager", "operator"):
         raise HTTPException(status_code=403)
 
-    offset = (page - 1) * PAGE_SIZE
     base_q = get_expense_query(category if category else None)
-    count_q = select(func.count()).select_from(Expense)
-    if category:
-        count_q = count_q.where(Expense.category == category)
-    total_count = (await db.execute(count_q)).scalar()
-    total_pages = max(1, (total_count + PAGE_SIZE - 1) // PAGE_SIZE)
-
-    result = await db.execute(base_q.offset(offset).limit(PAGE_SIZE))
-    expenses = result.scalars().all()
+    pagination = await keyset_page(
+        db, base_q, (Expense.date, Expense.id), after=after, before=before, limit=PAGE_SIZE
+    )
+    criteria = (Expense.category == category,) if category else ()
+    pagination.total = await cached_count(db, Expense, *criteria, cache_key=category)
 
     # Общая сумма расходов по текущему фильтру
     sum_q = select(func.coalesce(func.sum(Expense.amount), 0))
@@ -82,13 +73,13 @@ async def list_expenses(
     html = template.render({
         "request": request,
         "user": current_user,
-        "expenses": expenses,
+        "expenses": pagination.items,
         "categories": CATEGORIES,
         "current_category": category,
         "total_amount": total_amount,
         "category_labels": category_labels,
-        "page": page,
-        "total_pages": total_pages
+        "pagination": pagination,
+        "page_url": f"/finance?{urlencode({'category': category})}&",
     })
     return HTMLResponse(html)
 
@@ -231,17 +222,19 @@ async def edit_expense_submit(
         result = await db.execute(stmt)
         movement = result.scalar_one_or_none()
         if movement:
+            old_qty = movement.quantity
+            old_value = old_qty * (movement.unit_price or 0)
             movement.quantity = quantity if quantity else movement.quantity
             movement.unit = unit if unit else movement.unit
             # Пересчёт remaining_quantity: разница между старым и новым количеством
-            old_qty = movement.quantity  # уже обновили
-            # Но нужно сохранить пропорцию оставшегося остатка. Упростим: если количество изменилось, скорректируем remaining.
             if quantity and old_qty:
                 old_remaining = movement.remaining_quantity
                 movement.remaining_quantity = max(0, old_remaining + (quantity - old_qty))
             # Обновим цену за единицу в movement, если она была
             if quantity and quantity > 0:
                 movement.unit_price = amount / quantity
+            await apply_stock_delta(db, movement.material_id, movement.quantity - old_qty,
+                                    movement.quantity * (movement.unit_price or 0) - old_value)
             # unit не меняем, если передали
 
     await db.commit()
@@ -269,6 +262,8 @@ async def delete_expense(
                 # Частично использован – запретим удаление
                 return RedirectResponse(f"/finance/{expense_id}/edit?error=partially_used", status_code=302)
             await db.delete(movement)
+            await apply_stock_delta(db, movement.material_id, -movement.quantity,
+                                    -movement.quantity * (movement.unit_price or 0))
 
     await db.delete(expense)
     await db.commit()
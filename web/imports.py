@@ -0,0 +1,55 @@
+import os
+
+from fastapi import APIRouter, Depends, File, Form, Request, UploadFile
+from fastapi.responses import HTMLResponse
+from jinja2 import Environment, FileSystemLoader
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.services.bulk_import import IMPORTS, file_format, import_file
+from bot.services.export import xlsx_available
+from bot.services.user_service import get_user
+from .dependencies import get_db, role_required
+
+router = APIRouter()
+env = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), "templates")),
+    auto_reload=True
+)
+
+
+def _render(request: Request, current_user, **context):
+    template = env.get_template("import.html")
+    return HTMLResponse(template.render({
+        "request": request,
+        "user": current_user,
+        "imports": IMPORTS,
+        "xlsx": xlsx_available(),
+        **context,
+    }))
+
+
+@router.get("/import")
+async def import_form(request: Request, current_user=Depends(role_required(["admin"]))):
+    return _render(request, current_user)
+
+
+@router.post("/import")
+async def import_submit(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(role_required(["admin"])),
+    kind: str = Form(...),
+    file: UploadFile = File(...),
+    dry_run: bool = Form(False),
+):
+    """Импорт истории из CSV/XLSX: сначала проверка всего файла, затем запись порциями."""
+    if kind not in IMPORTS:
+        return _render(request, current_user, error="Неизвестный вид импорта")
+    fmt = file_format(file.filename or "")
+    if fmt == "xlsx" and not xlsx_available():
+        return _render(request, current_user, kind=kind, error="Импорт XLSX недоступен: не установлен openpyxl")
+
+    user = await get_user(db, current_user.telegram_id)
+    # UploadFile хранит большой файл на диске, поэтому его можно читать повторно
+    report = await import_file(db, kind, file.file, fmt, user.id, dry_run=dry_run)
+    return _render(request, current_user, kind=kind, report=report, dry_run=dry_run)
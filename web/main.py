@@ -16,6 +16,8 @@ from .cost_calc import router as costs_router
 from .materials import router as materials_router
 from .finance import router as finance_router
 from .stats import router as stats_router
+from .exports import router as exports_router
+from .imports import router as imports_router
 
 class LoginRedirectMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
@@ -39,6 +41,8 @@ app.include_router(costs_router)
 app.include_router(materials_router)
 app.include_router(finance_router)
 app.include_router(stats_router)
+app.include_router(exports_router)
+app.include_router(imports_router)
 
 
 @app.get("/")
@@ -48,6 +52,16 @@ async def root():
 
 @app.on_event("startup")
 async def startup():
-    # Инициализация БД, если нужно
+    # Проверка схемы БД (при необходимости применяются миграции)
     from bot.models.database import init_db
-    await init_db()
\ No newline at end of file
+    from bot.services.audit_log import audit_writer
+    await init_db()
+    await audit_writer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    from bot.models.database import close_db
+    from bot.services.audit_log import audit_writer
+    await audit_writer.stop()
+    await close_db()
\ No newline at end of file
@@ -8,10 +8,10 @@ from jinja2 import Environment, FileSystemLoader
 from bot.models import Expense
 from bot.models.material import Material
 from bot.models.material_movement import MaterialMovement
-from bot.services.material_service import purchase_material
+from bot.services.material_service import VALUATION_METHODS, purchase_material, apply_stock_delta, get_material_stock
+from bot.services.material_valuation import replay_valuation
 from bot.services.user_service import get_user
 from .dependencies import get_db, get_current_user, role_required
-from sqlalchemy import case
 from sqlalchemy.orm import selectinload
 
 router = APIRouter()
@@ -26,22 +26,8 @@ async def list_materials(
     db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
-    # Получаем все материалы с подсчётом текущего остатка
-    q = select(
-        Material,
-        func.coalesce(
-            func.sum(
-                case(
-                    (MaterialMovement.type == 'in', MaterialMovement.quantity),
-                    else_=-MaterialMovement.quantity
-                )
-            ), 0
-        ).label("stock")
-    ).join(MaterialMovement, Material.id == MaterialMovement.material_id, isouter=True) \
-     .group_by(Material.id)
-
-    result = await db.execute(q)
-    rows = result.all()  # список кортежей (Material, stock)
+    # Остатки берём из material_stock, без пересчёта движений
+    rows = await get_material_stock(db)  # список кортежей (Material, stock)
 
     template = env.get_template("materials.html")
     return HTMLResponse(template.render({
@@ -96,7 +82,8 @@ async def edit_material_submit(
     request: Request,
     db: AsyncSession = Depends(get_db),
     current_user=Depends(role_required(["admin", "manager"])),
-    name: str = Form(...)
+    name: str = Form(...),
+    valuation_method: str = Form(None)
 ):
     material = await db.get(Material, material_id)
     if not material:
@@ -107,6 +94,9 @@ async def edit_material_submit(
         return RedirectResponse(f"/materials/{material_id}/edit?error=exists", status_code=302)
     material.name = name
     await db.commit()
+    # Смена способа оценки пересчитывает прошлые списания материала
+    if valuation_method in VALUATION_METHODS and valuation_method != material.valuation_method:
+        await replay_valuation(db, [material_id], method=valuation_method)
     return RedirectResponse("/materials", status_code=302)
 
 @router.post("/materials/{material_id}/delete")
@@ -240,6 +230,7 @@ async def edit_movement_submit(
         raise HTTPException(status_code=404)
 
     old_qty = movement.quantity
+    old_value = old_qty * (movement.unit_price or 0)
     # Обновляем остаток с учётом нового количества
     if old_qty > 0:
         movement.remaining_quantity = max(0, movement.remaining_quantity + (quantity - old_qty))
@@ -247,6 +238,7 @@ async def edit_movement_submit(
         movement.remaining_quantity = quantity
     movement.quantity = quantity
     movement.unit_price = unit_price
+    await apply_stock_delta(db, movement.material_id, quantity - old_qty, quantity * unit_price - old_value)
 
     # Если с этой закупкой связан расход, обновляем его
     if movement.expense_id:
@@ -286,5 +278,6 @@ async def delete_movement(
             await db.delete(expense)
 
     await db.delete(movement)
+    await apply_stock_delta(db, material_id, -movement.quantity, -movement.quantity * (movement.unit_price or 0))
     await db.commit()
     return RedirectResponse(f"/materials/{material_id}/movements", status_code=302)
\ No newline at end of file
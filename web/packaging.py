@@ -2,26 +2,30 @@ import os
 from fastapi import APIRouter, Depends, Request, Form, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func
+from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from jinja2 import Environment, FileSystemLoader
 from datetime import datetime
 
-from bot.models import RawMaterialStorage, ProductStorage, Material
+from bot.exceptions import InsufficientMaterialError, InsufficientStockError, InvalidDataError
+from bot.models import Material
 from bot.models.packaging import Packaging, PackagingMaterial
 from bot.models.material_movement import MaterialMovement
 from bot.models.rawProduct import RawProduct
 from bot.models.product import Product
-from bot.services.material_service import consume_material, return_material
+from bot.services.material_service import STICKER_MATERIAL, reverse_material_consumption
+from bot.services.stock_ledger import SOURCE_PACKAGING
+from bot.services.storage import change_product_stock, change_raw_stock
+from bot.services.packaging_planner import plan_packaging
 from bot.services.packaging_service import (
     get_raw_materials,
     get_products_for_raw_material,
-    save_packaging,
-    update_stock_after_packaging,
-    get_raw_material_availability,
+    record_packaging,
+    update_packaging_materials,
 )
 from bot.services.user_service import get_user
 from .dependencies import get_db, get_current_user, role_required
+from .pagination import keyset_page, cached_count
 
 router = APIRouter()
 env = Environment(
@@ -31,39 +35,46 @@ env = Environment(
 
 PAGE_SIZE = 15
 
+
+def _form_materials(form) -> dict[int, float]:
+    """Материалы из формы: material_id -> количество (повторы складываются)."""
+    materials = {}
+    for mat_id_str, qty_str in zip(form.getlist("material_id"), form.getlist("material_quantity")):
+        try:
+            mat_id, qty = int(mat_id_str), float(qty_str)
+        except ValueError:
+            continue
+        if qty > 0:
+            materials[mat_id] = materials.get(mat_id, 0) + qty
+    return materials
+
+
 # ------------------- СПИСОК ФАСОВОК -------------------
 @router.get("/packaging")
 async def list_packaging(
     request: Request,
-    page: int = 1,
+    after: str = None,
+    before: str = None,
     db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_user),
 ):
-    offset = (page - 1) * PAGE_SIZE
-    total_count = (await db.execute(select(func.count(Packaging.id)))).scalar()
-    total_pages = max(1, (total_count + PAGE_SIZE - 1) // PAGE_SIZE)
-
-    result = await db.execute(
-        select(Packaging)
-        .options(
-            selectinload(Packaging.user),
-            selectinload(Packaging.raw_product),
-            selectinload(Packaging.product),
-        )
-        .order_by(desc(Packaging.date))
-        .offset(offset)
-        .limit(PAGE_SIZE)
+    query = select(Packaging).options(
+        selectinload(Packaging.user),
+        selectinload(Packaging.raw_product),
+        selectinload(Packaging.product),
+    )
+    pagination = await keyset_page(
+        db, query, (Packaging.date, Packaging.id), after=after, before=before, limit=PAGE_SIZE
     )
-    packagings = result.scalars().all()
+    pagination.total = await cached_count(db, Packaging)
 
     template = env.get_template("packaging.html")
     return HTMLResponse(template.render({
         "request": request,
         "user": current_user,
-        "packagings": packagings,
-        "page": page,
-        "total_pages": total_pages,
-        "total_count": total_count,
+        "packagings": pagination.items,
+        "pagination": pagination,
+        "page_url": "/packaging?",
     }))
 
 
@@ -103,11 +114,29 @@ async def get_products_for_raw(
     return [{"id": p.id, "name": p.name, "weight": p.weight, "stock": amt} for p, amt in products]
 
 
+@router.get("/api/packaging-plan/{raw_product_id}")
+async def get_packaging_plan(
+    raw_product_id: int,
+    ratio: str = None,
+    demand: str = None,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    """План фасовки: ratio=2/1/1 — по пропорции, demand=10/0/5 — под спрос, без них — максимум выпуска.
+
+    Числа идут в порядке id продукции (как в ответе).
+    """
+    try:
+        plan = await plan_packaging(db, raw_product_id, ratio=ratio, demand=demand)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return plan.as_dict()
+
+
 # ------------------- СОХРАНЕНИЕ НОВОЙ ФАСОВКИ -------------------
 @router.post("/packaging/add")
 async def add_packaging_submit(
     request: Request,
-    raw_product_id: int = Form(...),
     product_id: int = Form(...),
     amount: int = Form(...),
     db: AsyncSession = Depends(get_db),
@@ -116,52 +145,18 @@ async def add_packaging_submit(
     if current_user.role not in ("admin", "manager", "operator"):
         raise HTTPException(status_code=403)
 
-    product = await db.get(Product, product_id)
-    if not product:
-        raise HTTPException(status_code=404, detail="Продукт не найден")
-
-    required_raw = amount * product.weight
-    _, is_available, _ = await get_raw_material_availability(
-        db, raw_product_id, product_weight=product.weight, required_amount=required_raw
-    )
-    if not is_available:
-        return RedirectResponse(url="/packaging/add?error=insufficient_raw", status_code=302)
-
-    user = await get_user(db, current_user.telegram_id)
-    packaging = await save_packaging(db, user.id, product.id, raw_product_id, amount, required_raw)
-    await update_stock_after_packaging(db, product.id, raw_product_id, amount, required_raw)
-
-    # Списание материалов
     form = await request.form()
-    material_ids = form.getlist("material_id")
-    material_quantities = form.getlist("material_quantity")
-    total_material_cost = 0.0
-
-    # Наклейки автоматически
-    sticker = (await db.execute(select(Material).where(Material.name == "Наклейка"))).scalar_one_or_none()
-    if sticker:
-        try:
-            cost_stickers = await consume_material(db, sticker.id, amount, packaging.id)
-            total_material_cost += cost_stickers
-        except ValueError:
-            pass  # недостаточно наклеек — игнорируем (можно добавить обработку)
-
-    # Остальные материалы
-    for mat_id_str, qty_str in zip(material_ids, material_quantities):
-        if not mat_id_str or not qty_str:
-            continue
-        try:
-            mat_id = int(mat_id_str)
-            qty = float(qty_str)
-            if qty <= 0:
-                continue
-            cost_mat = await consume_material(db, mat_id, qty, packaging.id)
-            total_material_cost += cost_mat
-        except ValueError:
-            continue
-
-    packaging.total_material_cost = total_material_cost
-    await db.commit()
+    user = await get_user(db, current_user.telegram_id)
+    try:
+        # Фасовка, остатки, наклейки и материалы — одной транзакцией
+        await record_packaging(db, user.id, product_id, amount, _form_materials(form))
+    except InvalidDataError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except InsufficientMaterialError as e:
+        error = "insufficient_stickers" if e.item == STICKER_MATERIAL else "material_not_enough"
+        return RedirectResponse(url=f"/packaging/add?error={error}", status_code=302)
+    except InsufficientStockError:
+        return RedirectResponse(url="/packaging/add?error=insufficient_raw", status_code=302)
 
     return RedirectResponse(url="/packaging", status_code=302)
 
@@ -254,63 +249,29 @@ async def edit_packaging_submit(
     delta_product = new_amount - old_amount
     delta_raw = old_used_raw - new_used_raw
 
-    # Проверка сырья
-    raw_stock = (await db.execute(
-        select(RawMaterialStorage).where(RawMaterialStorage.raw_product_id == packaging.raw_product_id)
-    )).scalar_one()
-    if raw_stock.amount + delta_raw < 0:
+    # Обновляем сырьё и продукцию (списание больше остатка отклоняется)
+    try:
+        await change_raw_stock(db, packaging.raw_product_id, delta_raw, source=SOURCE_PACKAGING)
+    except InsufficientStockError:
+        await db.rollback()
         return RedirectResponse(url=f"/packaging/{packaging_id}/edit?error=insufficient_raw", status_code=302)
-
-    # Обновляем сырьё и продукцию
+    try:
+        await change_product_stock(db, packaging.product_id, delta_product, source=SOURCE_PACKAGING)
+    except InsufficientStockError:
+        await db.rollback()
+        return RedirectResponse(url=f"/packaging/{packaging_id}/edit?error=insufficient_product", status_code=302)
     packaging.amount = new_amount
     packaging.used_raw_material = new_used_raw
-    product_stock = (await db.execute(
-        select(ProductStorage).where(ProductStorage.product_id == packaging.product_id)
-    )).scalar_one()
-    product_stock.amount += delta_product
-    raw_stock.amount += delta_raw
 
     # --- 2. Обработка материалов ---
-    # Удаляем все старые записи материалов и возвращаем их на склад
-    old_materials = (await db.execute(
-        select(PackagingMaterial).where(PackagingMaterial.packaging_id == packaging_id)
-    )).scalars().all()
-    for pm in old_materials:
-        # Возвращаем материал на склад (создаём приходную запись)
-        # Используем среднюю цену из стоимости списания
-        unit_price = pm.cost / pm.quantity if pm.quantity > 0 else 0.0
-        await return_material(db, pm.material_id, pm.quantity, pm.unit, unit_price, packaging_id)
-        await db.delete(pm)
-
-    # Получаем новые материалы из формы
-    material_ids = form.getlist("material_id")
-    material_quantities = form.getlist("material_quantity")
-    total_material_cost = 0.0
-
-    # Наклейки (автоматически, 1 на пачку)
-    sticker = (await db.execute(select(Material).where(Material.name == "Наклейка"))).scalar_one_or_none()
-    if sticker:
-        try:
-            cost_stickers = await consume_material(db, sticker.id, new_amount, packaging_id)
-            total_material_cost += cost_stickers
-        except ValueError:
-            return RedirectResponse(url=f"/packaging/{packaging_id}/edit?error=insufficient_stickers", status_code=302)
-
-    # Остальные материалы из формы
-    for mat_id_str, qty_str in zip(material_ids, material_quantities):
-        if not mat_id_str or not qty_str:
-            continue
-        try:
-            mat_id = int(mat_id_str)
-            qty = float(qty_str)
-            if qty <= 0:
-                continue
-            cost_mat = await consume_material(db, mat_id, qty, packaging_id)
-            total_material_cost += cost_mat
-        except ValueError:
-            return RedirectResponse(url=f"/packaging/{packaging_id}/edit?error=material_not_enough", status_code=302)
-
-    packaging.total_material_cost = total_material_cost
+    # Списание пересчитывается только для изменившихся материалов, остаток
+    # возвращается в исходные партии
+    try:
+        packaging.total_material_cost = await update_packaging_materials(db, packaging, _form_materials(form))
+    except InsufficientMaterialError as e:
+        await db.rollback()
+        error = "insufficient_stickers" if e.item == STICKER_MATERIAL else "material_not_enough"
+        return RedirectResponse(url=f"/packaging/{packaging_id}/edit?error={error}", status_code=302)
     await db.commit()
 
     return RedirectResponse(url="/packaging", status_code=302)
@@ -331,30 +292,16 @@ async def delete_packaging_handler(
         raise HTTPException(status_code=404, detail="Фасовка не найдена")
 
     # Возврат сырья
-    raw_stock = (await db.execute(
-        select(RawMaterialStorage).where(RawMaterialStorage.raw_product_id == packaging.raw_product_id)
-    )).scalar_one_or_none()
-    if raw_stock:
-        raw_stock.amount += packaging.used_raw_material
-
-    # Возврат продукции
-    product_stock = (await db.execute(
-        select(ProductStorage).where(ProductStorage.product_id == packaging.product_id)
-    )).scalar_one_or_none()
-    if product_stock:
-        product_stock.amount -= packaging.amount
-        if product_stock.amount < 0:
-            product_stock.amount = 0
-
-    # Возврат материалов на склад
-    old_materials = (await db.execute(
-        select(PackagingMaterial).where(PackagingMaterial.packaging_id == packaging_id)
-    )).scalars().all()
-
-    for pm in old_materials:
-        unit_price = pm.cost / pm.quantity if pm.quantity > 0 else 0.0
-        await return_material(db, pm.material_id, pm.quantity, pm.unit, unit_price, packaging_id)
-        await db.delete(pm)
+    await change_raw_stock(db, packaging.raw_product_id, packaging.used_raw_material, source=SOURCE_PACKAGING)
+
+    # Возврат продукции (если часть уже отгружена — списываем только остаток)
+    try:
+        await change_product_stock(db, packaging.product_id, -packaging.amount, source=SOURCE_PACKAGING)
+    except InsufficientStockError as e:
+        await change_product_stock(db, packaging.product_id, -e.available, source=SOURCE_PACKAGING)
+
+    # Возврат материалов в исходные партии
+    await reverse_material_consumption(db, packaging_id)
 
     # Удаление фасовки
     await db.delete(packaging)
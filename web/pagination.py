@@ -0,0 +1,129 @@
+"""Постраничный вывод списков по ключу (keyset) вместо OFFSET.
+
+Страница выбирается условием по ключу сортировки последней показанной
+строки — (date, id) или просто id — поэтому её стоимость не зависит от
+того, насколько далеко она от начала: база сразу переходит по индексу
+к нужному месту, а не пропускает OFFSET строк.
+
+Курсор — значения ключа, записанные через "~". Ссылка "Дальше" передаёт
+after=<курсор последней строки>, ссылка "Назад" — before=<курсор первой>.
+Общее количество строк необязательно: считается COUNT(*) и кешируется на
+COUNT_CACHE_TTL секунд, а на PostgreSQL для таблицы без фильтра берётся
+оценка планировщика (pg_class.reltuples).
+
+Строки с NULL в столбцах ключа в выдачу по курсору не попадают: столбцы
+дат в моделях заполняются по умолчанию.
+"""
+from datetime import date, datetime
+from typing import Optional, Sequence
+
+from cachetools import TTLCache
+from fastapi import HTTPException
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+COUNT_CACHE_TTL = 60  # секунд
+SEPARATOR = "~"
+
+_counts = TTLCache(maxsize=256, ttl=COUNT_CACHE_TTL)
+
+
+class Page:
+    """Строки страницы и курсоры соседних страниц (None — соседней страницы нет)."""
+
+    def __init__(self, items: list, next_cursor: Optional[str], prev_cursor: Optional[str],
+                 total: Optional[int] = None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+
+def _encode(values) -> str:
+    return SEPARATOR.join(value.isoformat() if isinstance(value, (datetime, date)) else str(value)
+                          for value in values)
+
+
+def _decode(cursor: str, columns: Sequence) -> tuple:
+    parts = cursor.split(SEPARATOR)
+    if len(parts) != len(columns):
+        raise HTTPException(400, "Некорректный курсор")
+    values = []
+    try:
+        for part, column in zip(parts, columns):
+            python_type = column.type.python_type
+            if python_type is datetime:
+                values.append(datetime.fromisoformat(part))
+            elif python_type is date:
+                values.append(date.fromisoformat(part))
+            else:
+                values.append(python_type(part))
+    except (ValueError, NotImplementedError):
+        raise HTTPException(400, "Некорректный курсор")
+    return tuple(values)
+
+
+def _key(item, columns: Sequence) -> tuple:
+    return tuple(getattr(item, column.key) for column in columns)
+
+
+async def keyset_page(
+    db: AsyncSession,
+    query,
+    columns: Sequence,
+    *,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = 20,
+    descending: bool = True,
+) -> Page:
+    """Страница запроса query, упорядоченного по columns (последний — уникальный, обычно id).
+
+    after — курсор строки, после которой начинается страница (движение
+    вперёд), before — курсор строки, перед которой она заканчивается (назад).
+    """
+    backwards = before is not None
+    cursor = before if backwards else after
+    # При движении назад строки читаются в обратном порядке и затем разворачиваются
+    read_descending = descending != backwards
+    if cursor:
+        key, values = tuple_(*columns), tuple_(*_decode(cursor, columns))
+        query = query.where(key < values if read_descending else key > values)
+    query = query.order_by(*(column.desc() if read_descending else column.asc() for column in columns))
+
+    items = list((await db.execute(query.limit(limit + 1))).scalars())
+    has_more = len(items) > limit
+    items = items[:limit]
+    if backwards:
+        items.reverse()
+    if not items:
+        return Page(items, None, None)
+
+    first, last = _encode(_key(items[0], columns)), _encode(_key(items[-1], columns))
+    if backwards:
+        return Page(items, next_cursor=last, prev_cursor=first if has_more else None)
+    return Page(items, next_cursor=last if has_more else None, prev_cursor=first if after else None)
+
+
+async def cached_count(db: AsyncSession, model, *criteria, cache_key: str = "") -> int:
+    """Количество строк model (с условиями criteria), кешированное на COUNT_CACHE_TTL секунд.
+
+    cache_key должен различать разные criteria (например, значение фильтра).
+    """
+    key = (model.__tablename__, cache_key)
+    total = _counts.get(key)
+    if total is not None:
+        return total
+    total = None
+    if not criteria and db.bind.dialect.name == "postgresql":
+        # Оценка по статистике планировщика; -1 — таблица ещё не анализировалась
+        estimate = await db.scalar(
+            text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"),
+            {"table": model.__tablename__},
+        )
+        if estimate is not None and estimate >= 0:
+            total = int(estimate)
+    if total is None:
+        total = await db.scalar(select(func.count()).select_from(model).where(*criteria))
+    _counts[key] = total
+    return total
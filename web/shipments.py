@@ -2,17 +2,20 @@ import os
 from fastapi import APIRouter, Depends, Request, Form, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func
+from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from jinja2 import Environment, FileSystemLoader
 from datetime import datetime
 
-from bot.models import ProductStorage
+from bot.exceptions import InsufficientStockError, InvalidDataError
 from bot.models.shipment import Shipment, ShipmentItem
 from bot.models.product import Product
-from bot.models.user import User
-from bot.services.shipment import get_available_products  # для формы добавления
+from bot.services.shipment import create_shipment_with_items, get_available_products, merge_items
+from bot.services.stock_ledger import SOURCE_SHIPMENT
+from bot.services.storage import change_product_stocks
+from bot.services.user_service import get_user
 from .dependencies import get_db, get_current_user
+from .pagination import keyset_page, cached_count
 
 router = APIRouter()
 env = Environment(
@@ -27,35 +30,28 @@ PAGE_SIZE = 15
 @router.get("/shipments")
 async def list_shipments(
     request: Request,
-    page: int = 1,
+    after: str = None,
+    before: str = None,
     db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
-    offset = (page - 1) * PAGE_SIZE
-    total_count = (await db.execute(select(func.count(Shipment.id)))).scalar()
-    total_pages = max(1, (total_count + PAGE_SIZE - 1) // PAGE_SIZE)
-
     # Загружаем отгрузки с пользователем и элементами
-    result = await db.execute(
-        select(Shipment)
-        .options(
-            selectinload(Shipment.user),
-            selectinload(Shipment.shipment_items).selectinload(ShipmentItem.product)
-        )
-        .order_by(desc(Shipment.timestamp))
-        .offset(offset)
-        .limit(PAGE_SIZE)
+    query = select(Shipment).options(
+        selectinload(Shipment.user),
+        selectinload(Shipment.shipment_items).selectinload(ShipmentItem.product)
+    )
+    pagination = await keyset_page(
+        db, query, (Shipment.timestamp, Shipment.id), after=after, before=before, limit=PAGE_SIZE
     )
-    shipments = result.scalars().all()
+    pagination.total = await cached_count(db, Shipment)
 
     template = env.get_template("shipments.html")
     html = template.render({
         "request": request,
         "user": current_user,
-        "shipments": shipments,
-        "page": page,
-        "total_pages": total_pages,
-        "total_count": total_count
+        "shipments": pagination.items,
+        "pagination": pagination,
+        "page_url": "/shipments?",
     })
     return HTMLResponse(html)
 
@@ -111,48 +107,16 @@ async def add_shipment_submit(
     if not items:
         return RedirectResponse(url="/shipments/add?error=no_items", status_code=302)
 
+    user = await get_user(db, current_user.telegram_id)
     try:
-        # Проверяем наличие на складе и создаём отгрузку
-        # Найдём пользователя по telegram_id
-        user_result = await db.execute(select(User).where(User.telegram_id == current_user.telegram_id))
-        user = user_result.scalar_one()
-
-        # Создаём отгрузку
-        shipment = Shipment(user_id=user.id, timestamp=datetime.utcnow())
-        db.add(shipment)
-        await db.flush()  # получаем shipment.id
-
-        for item in items:
-            product = await db.get(Product, item["product_id"])
-            if not product:
-                raise HTTPException(status_code=400, detail=f"Продукт с id {item['product_id']} не найден")
-
-            # Проверяем остаток
-            storage = await db.get(ProductStorage, item["product_id"])
-            if not storage or storage.amount < item["quantity"]:
-                raise HTTPException(status_code=400, detail=f"Недостаточно товара '{product.name}' на складе")
-
-            # Создаём элемент отгрузки
-            shipment_item = ShipmentItem(
-                shipment_id=shipment.id,
-                product_id=item["product_id"],
-                quantity=item["quantity"]
-            )
-            db.add(shipment_item)
-
-            # Списываем со склада
-            storage.amount -= item["quantity"]
-
-        await db.commit()
-        return RedirectResponse(url="/shipments", status_code=302)
-
-    except HTTPException as e:
-        await db.rollback()
-        # Можно добавить flash-сообщение, но для простоты редиректим с ошибкой
-        return RedirectResponse(url=f"/shipments/add?error={e.detail}", status_code=302)
-    except Exception as e:
-        await db.rollback()
-        return RedirectResponse(url="/shipments/add?error=unknown", status_code=302)
+        await create_shipment_with_items(
+            db, user.id, [(item["product_id"], item["quantity"]) for item in items]
+        )
+    except InsufficientStockError as e:
+        return RedirectResponse(url=f"/shipments/add?error=Недостаточно товара '{e.item}' на складе", status_code=302)
+    except InvalidDataError as e:
+        return RedirectResponse(url=f"/shipments/add?error={e}", status_code=302)
+    return RedirectResponse(url="/shipments", status_code=302)
 
 
 # ====================== ДЕТАЛИ ОТГРУЗКИ ======================
@@ -205,11 +169,8 @@ async def delete_shipment(
     items = items_result.scalars().all()
 
     # Возвращаем товары на склад
+    await change_product_stocks(db, merge_items((item.product_id, item.quantity) for item in items), source=SOURCE_SHIPMENT)
     for item in items:
-        storage = await db.get(ProductStorage, item.product_id)
-        if storage:
-            storage.amount += item.quantity
-        # Удаляем сам элемент отгрузки
         await db.delete(item)
 
     # Теперь спокойно удаляем отгрузку (связанных элементов уже нет)
@@ -356,15 +317,12 @@ async def edit_shipment_submit(
 
     # Применяем изменения к складу
     try:
-        for product_id, delta in changes.items():
-            if delta == 0:
-                continue
-            storage = await db.get(ProductStorage, product_id)
-            if not storage:
-                raise HTTPException(status_code=400, detail=f"Складская запись для продукта {product_id} не найдена")
-            if storage.amount - delta < 0:
-                raise HTTPException(status_code=400, detail=f"Недостаточно продукта на складе (product_id={product_id})")
-            storage.amount -= delta
+        # Все изменения остатков — одной командой UPDATE
+        try:
+            await change_product_stocks(db, {product_id: -delta for product_id, delta in changes.items()},
+                                        source=SOURCE_SHIPMENT)
+        except InsufficientStockError as e:
+            raise HTTPException(status_code=400, detail=f"Недостаточно продукта на складе ({e.item})")
 
         # Обновляем дату отгрузки
         shipment.timestamp = new_timestamp
@@ -3,12 +3,14 @@ from datetime import date, timedelta
 from fastapi import APIRouter, Depends, Request, Query
 from fastapi.responses import HTMLResponse, JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, extract, and_
+from sqlalchemy import select, func
 from jinja2 import Environment, FileSystemLoader
 
-from bot.models.packaging import Packaging
-from bot.models.expense import Expense
+from bot.models.rollups import DailyProductRollup, DailyExpenseRollup
 from bot.models.storage import RawMaterialStorage, ProductStorage
+from bot.services.cost_service import month_costs
+from bot.services.periods import days_period, month_bucket, month_period, previous_month_period, today
+from bot.services.stock_ledger import stock_on_day
 from .dependencies import get_db, get_current_user
 
 router = APIRouter()
@@ -27,24 +29,20 @@ async def stats_page(request: Request, current_user=Depends(get_current_user)):
 async def monthly_output_api(db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
     """Выпуск продукции по месяцам (кг) за последние 12 месяцев."""
     # Берём последние 12 месяцев от текущего
-    today = date.today()
-    start_month = today.replace(day=1)
-    # сдвигаемся на 12 месяцев назад
-    start_month = (start_month - timedelta(days=365)).replace(day=1)
+    last_day = today()
+    start_month = (last_day.replace(day=1) - timedelta(days=365)).replace(day=1)
+    period = days_period(start_month, last_day)
 
-    # SQLite: группировка по году и месяцу
+    month = month_bucket(DailyProductRollup.day)
     result = await db.execute(
-        select(
-            func.strftime('%Y-%m', Packaging.date).label('month'),
-            func.coalesce(func.sum(Packaging.used_raw_material), 0).label('total_kg')
-        )
-        .where(and_(Packaging.date >= start_month, Packaging.date <= today))
-        .group_by('month')
-        .order_by('month')
+        select(month.label('month'), func.sum(DailyProductRollup.used_raw_kg).label('total_kg'))
+        .where(period.where(DailyProductRollup.day))
+        .group_by(month)
+        .order_by(month)
     )
-    rows = result.all()
-    labels = [row.month for row in rows]
-    values = [int(row.total_kg) for row in rows]
+    months = {row.month: row.total_kg for row in result.all() if row.total_kg}
+    labels = list(months)
+    values = [int(total) for total in months.values()]
 
     return JSONResponse({"labels": labels, "values": values})
 
@@ -57,27 +55,17 @@ async def expenses_by_category_api(
     month: int = Query(None)
 ):
     """Затраты по категориям за указанный месяц (по умолчанию – последний полный месяц)."""
-    today = date.today()
-    if year is None or month is None:
-        # последний завершённый месяц
-        first_of_this_month = today.replace(day=1)
-        last_month = first_of_this_month - timedelta(days=1)
-        year = last_month.year
-        month = last_month.month
-
-    start_date = date(year, month, 1)
-    if month == 12:
-        end_date = date(year + 1, 1, 1) - timedelta(days=1)
-    else:
-        end_date = date(year, month + 1, 1) - timedelta(days=1)
+    # по умолчанию — последний завершённый месяц
+    period = month_period(year, month) if year and month else previous_month_period()
 
     result = await db.execute(
         select(
-            Expense.category,
-            func.coalesce(func.sum(Expense.amount), 0).label('total')
+            DailyExpenseRollup.category,
+            func.coalesce(func.sum(DailyExpenseRollup.amount), 0).label('total')
         )
-        .where(and_(Expense.date >= start_date, Expense.date <= end_date))
-        .group_by(Expense.category)
+        .where(period.where(DailyExpenseRollup.day))
+        .group_by(DailyExpenseRollup.category)
+        .having(func.sum(DailyExpenseRollup.expenses_count) > 0)
     )
     rows = result.all()
     data = [{"category": row.category or "other", "total": round(row.total, 2)} for row in rows]
@@ -98,6 +86,21 @@ async def current_stock_api(db: AsyncSession = Depends(get_db), current_user=Dep
     return JSONResponse({"raw": raw_items, "products": prod_items})
 
 
+@router.get("/api/stats/stock-as-of")
+async def stock_as_of_api(
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user),
+    day: date = Query(None, alias="date")
+):
+    """Остатки сырья (кг) и продукции (шт.) на конец дня date (ГГГГ-ММ-ДД, по умолчанию сегодня).
+
+    Берутся из ближайшего снимка остатков и журнала за один день (stock_ledger).
+    """
+    day = day or today()
+    stock = await stock_on_day(db, day)
+    return JSONResponse({"date": day.isoformat(), **stock})
+
+
 @router.get("/api/stats/totals")
 async def totals_api(
     db: AsyncSession = Depends(get_db),
@@ -105,48 +108,19 @@ async def totals_api(
     year: int = Query(None),
     month: int = Query(None)
 ):
-    """Общие итоги за месяц: выпуск (кг), затраты, себестоимость."""
-    today = date.today()
-    if year is None or month is None:
-        first_of_this_month = today.replace(day=1)
-        last_month = first_of_this_month - timedelta(days=1)
-        year = last_month.year
-        month = last_month.month
-    start_date = date(year, month, 1)
-    if month == 12:
-        end_date = date(year + 1, 1, 1) - timedelta(days=1)
-    else:
-        end_date = date(year, month + 1, 1) - timedelta(days=1)
-
-    # Выпуск кг
-    prod_result = await db.execute(
-        select(func.coalesce(func.sum(Packaging.used_raw_material), 0))
-        .where(and_(Packaging.date >= start_date, Packaging.date <= end_date))
-    )
-    total_kg = int(prod_result.scalar())
-
-    # Материальные затраты из фасовок
-    mat_cost_result = await db.execute(
-        select(func.coalesce(func.sum(Packaging.total_material_cost), 0))
-        .where(and_(Packaging.date >= start_date, Packaging.date <= end_date))
-    )
-    material_cost = round(mat_cost_result.scalar(), 2)
-
-    # Общие расходы (накладные)
-    overhead_result = await db.execute(
-        select(func.coalesce(func.sum(Expense.amount), 0))
-        .where(and_(Expense.date >= start_date, Expense.date <= end_date))
-    )
-    overhead = round(overhead_result.scalar(), 2)
+    """Общие итоги за месяц: выпуск (кг), затраты, себестоимость.
 
-    total_cost = material_cost + overhead
-    cost_per_kg = (total_cost / total_kg) if total_kg > 0 else 0
+    Закрытый месяц — из сохранённого расчёта, открытый — по сводкам (cost_service).
+    """
+    period = month_period(year, month) if year and month else previous_month_period()
+    totals = await month_costs(db, period.start.year, period.start.month)
 
     return JSONResponse({
-        "period": f"{year}-{month:02d}",
-        "total_kg": total_kg,
-        "material_cost": material_cost,
-        "overhead": overhead,
-        "total_cost": total_cost,
-        "cost_per_kg": round(cost_per_kg, 2)
+        "period": period.start.strftime("%Y-%m"),
+        "total_kg": int(totals.produced_kg),
+        "material_cost": totals.material_cost,
+        "overhead": totals.overhead,
+        "total_cost": round(totals.total_cost, 2),
+        "cost_per_kg": round(totals.cost_per_kg, 2),
+        "closed": totals.closed,
     })
\ No newline at end of file